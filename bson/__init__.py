@@ -31,7 +31,16 @@ from bson.binary import (Binary, OLD_UUID_SUBTYPE,
                          JAVA_LEGACY, CSHARP_LEGACY,
                          UUIDLegacy)
 from bson.code import Code
-from bson.codec_options import CodecOptions, DEFAULT_CODEC_OPTIONS
+from bson.columns import (Column,
+                          BOOL,
+                          DATETIME_MS,
+                          FLOAT64,
+                          INT64,
+                          OBJECTID)
+from bson.codec_options import (CodecOptions,
+                                DEFAULT_CODEC_OPTIONS,
+                                _RAW_BSON_DOCUMENT_MARKER,
+                                _raw_document_class)
 from bson.dbref import DBRef
 from bson.errors import (InvalidBSON,
                          InvalidDocument,
@@ -42,6 +51,7 @@ from bson.min_key import MinKey
 from bson.objectid import ObjectId
 from bson.py3compat import (b,
                             PY3,
+                            integer_types,
                             iteritems,
                             text_type,
                             string_type,
@@ -58,6 +68,13 @@ try:
 except ImportError:
     _USE_C = False
 
+try:
+    memoryview
+    _HAS_MEMORYVIEW = True
+except NameError:
+    # Python 2.6
+    _HAS_MEMORYVIEW = False
+
 
 EPOCH_AWARE = datetime.datetime.fromtimestamp(0, utc)
 EPOCH_NAIVE = datetime.datetime.utcfromtimestamp(0)
@@ -85,17 +102,38 @@ BSONMIN = b"\xFF" # Min key
 BSONMAX = b"\x7F" # Max key
 
 
-_UNPACK_FLOAT = struct.Struct("<d").unpack
-_UNPACK_INT = struct.Struct("<i").unpack
-_UNPACK_LENGTH_SUBTYPE = struct.Struct("<iB").unpack
-_UNPACK_LONG = struct.Struct("<q").unpack
-_UNPACK_TIMESTAMP = struct.Struct("<II").unpack
+# Indexing BSON data gives a single byte as an int in Python 3 and as a one
+# character string in Python 2. The decoder reads element types and single
+# byte values that way, instead of slicing them out of the data, so these
+# are the same bytes in whichever form indexing returns.
+_EOO = b"\x00"[0]
+_TRUE = b"\x01"[0]
+_BSONOBJ_CODE = BSONOBJ[0]
+_BSONARR_CODE = BSONARR[0]
+_BSONUND_CODE = BSONUND[0]
+_BSONNUL_CODE = BSONNUL[0]
+_BSONRGX_CODE = BSONRGX[0]
+_BSONINT_CODE = BSONINT[0]
+_BSONLON_CODE = BSONLON[0]
+
+
+def _by_type_code(table):
+    """Key `table`, a dict keyed by BSON element type, by type code."""
+    return dict((element_type[0], value)
+                for element_type, value in iteritems(table))
+
+
+# Values are unpacked in place, without slicing them out of the data.
+_UNPACK_FLOAT = struct.Struct("<d").unpack_from
+_UNPACK_INT = struct.Struct("<i").unpack_from
+_UNPACK_LENGTH_SUBTYPE = struct.Struct("<iB").unpack_from
+_UNPACK_LONG = struct.Struct("<q").unpack_from
+_UNPACK_TIMESTAMP = struct.Struct("<II").unpack_from
 
 
 def _get_int(data, position, dummy0, dummy1):
     """Decode a BSON int32 to python int."""
-    end = position + 4
-    return _UNPACK_INT(data[position:end])[0], end
+    return _UNPACK_INT(data, position)[0], position + 4
 
 
 def _get_c_string(data, position):
@@ -106,30 +144,32 @@ def _get_c_string(data, position):
 
 def _get_float(data, position, dummy0, dummy1):
     """Decode a BSON double to python float."""
-    end = position + 8
-    return _UNPACK_FLOAT(data[position:end])[0], end
+    return _UNPACK_FLOAT(data, position)[0], position + 8
 
 
 def _get_string(data, position, obj_end, dummy):
     """Decode a BSON string to python unicode string."""
-    length = _UNPACK_INT(data[position:position + 4])[0]
+    length = _UNPACK_INT(data, position)[0]
     position += 4
     if length < 1 or obj_end - position < length:
         raise InvalidBSON("invalid string length")
     end = position + length - 1
-    if data[end:end + 1] != b"\x00":
+    if data[end] != _EOO:
         raise InvalidBSON("invalid end of string")
     return _utf_8_decode(data[position:end], None, True)[0], end + 1
 
 
 def _get_object(data, position, obj_end, opts):
     """Decode a BSON subdocument to opts.document_class or bson.dbref.DBRef."""
-    obj_size = _UNPACK_INT(data[position:position + 4])[0]
+    obj_size = _UNPACK_INT(data, position)[0]
     end = position + obj_size - 1
-    if data[end:position + obj_size] != b"\x00":
-        raise InvalidBSON("bad eoo")
-    if end >= obj_end:
+    if obj_size < 5 or end >= obj_end:
         raise InvalidBSON("invalid object length")
+    if data[end] != _EOO:
+        raise InvalidBSON("bad eoo")
+    if _raw_document_class(opts.document_class):
+        return (opts.document_class(data[position:end + 1], opts),
+                position + obj_size)
     obj = _elements_to_dict(data, position + 4, end, opts)
 
     position += obj_size
@@ -141,9 +181,11 @@ def _get_object(data, position, obj_end, opts):
 
 def _get_array(data, position, obj_end, opts):
     """Decode a BSON array to python list."""
-    size = _UNPACK_INT(data[position:position + 4])[0]
+    size = _UNPACK_INT(data, position)[0]
     end = position + size - 1
-    if data[end:end + 1] != b"\x00":
+    if size < 5 or end >= obj_end:
+        raise InvalidBSON("invalid array length")
+    if data[end] != _EOO:
         raise InvalidBSON("bad eoo")
     position += 4
     end -= 1
@@ -155,7 +197,7 @@ def _get_array(data, position, obj_end, opts):
     getter = _ELEMENT_GETTER
 
     while position < end:
-        element_type = data[position:position + 1]
+        element_type = data[position]
         # Just skip the keys.
         position = index(b'\x00', position) + 1
         value, position = getter[element_type](data, position, obj_end, opts)
@@ -165,10 +207,10 @@ def _get_array(data, position, obj_end, opts):
 
 def _get_binary(data, position, dummy, opts):
     """Decode a BSON binary to bson.binary.Binary or python UUID."""
-    length, subtype = _UNPACK_LENGTH_SUBTYPE(data[position:position + 5])
+    length, subtype = _UNPACK_LENGTH_SUBTYPE(data, position)
     position += 5
     if subtype == 2:
-        length2 = _UNPACK_INT(data[position:position + 4])[0]
+        length2 = _UNPACK_INT(data, position)[0]
         position += 4
         if length2 != length - 4:
             raise InvalidBSON("invalid binary (st 2) - lengths don't match!")
@@ -187,6 +229,9 @@ def _get_binary(data, position, dummy, opts):
         else:
             value = uuid.UUID(bytes=data[position:end])
         return value, end
+    if subtype == 0 and opts.binary_as_memoryview:
+        # A slice of the data being decoded, no copy is made.
+        return memoryview(data)[position:end], end
     # Python3 special case. Decode subtype 0 to 'bytes'.
     if PY3 and subtype == 0:
         value = data[position:end]
@@ -203,23 +248,18 @@ def _get_oid(data, position, dummy0, dummy1):
 
 def _get_boolean(data, position, dummy0, dummy1):
     """Decode a BSON true/false to python True/False."""
-    end = position + 1
-    return data[position:end] == b"\x01", end
+    return data[position] == _TRUE, position + 1
 
 
 def _get_date(data, position, dummy, opts):
     """Decode a BSON datetime to python datetime.datetime."""
+    millis = _UNPACK_LONG(data, position)[0]
     end = position + 8
-    millis = _UNPACK_LONG(data[position:end])[0]
-    diff = ((millis % 1000) + 1000) % 1000
-    seconds = (millis - diff) / 1000
-    micros = diff * 1000
+    if opts.datetime_as_millis:
+        return millis, end
     if opts.tz_aware:
-        return EPOCH_AWARE + datetime.timedelta(
-            seconds=seconds, microseconds=micros), end
-    else:
-        return EPOCH_NAIVE + datetime.timedelta(
-            seconds=seconds, microseconds=micros), end
+        return EPOCH_AWARE + datetime.timedelta(milliseconds=millis), end
+    return EPOCH_NAIVE + datetime.timedelta(milliseconds=millis), end
 
 
 def _get_code(data, position, obj_end, opts):
@@ -252,15 +292,13 @@ def _get_ref(data, position, obj_end, opts):
 
 def _get_timestamp(data, position, dummy0, dummy1):
     """Decode a BSON timestamp to bson.timestamp.Timestamp."""
-    end = position + 8
-    inc, timestamp = _UNPACK_TIMESTAMP(data[position:end])
-    return Timestamp(timestamp, inc), end
+    inc, timestamp = _UNPACK_TIMESTAMP(data, position)
+    return Timestamp(timestamp, inc), position + 8
 
 
 def _get_int64(data, position, dummy0, dummy1):
     """Decode a BSON int64 to bson.int64.Int64."""
-    end = position + 8
-    return Int64(_UNPACK_LONG(data[position:end])[0]), end
+    return Int64(_UNPACK_LONG(data, position)[0]), position + 8
 
 
 # Each decoder function's signature is:
@@ -268,7 +306,7 @@ def _get_int64(data, position, dummy0, dummy1):
 #   - position: int, beginning of object in 'data' to decode
 #   - obj_end: int, end of object to decode in 'data' if variable-length type
 #   - opts: a CodecOptions
-_ELEMENT_GETTER = {
+_ELEMENT_GETTER = _by_type_code({
     BSONNUM: _get_float,
     BSONSTR: _get_string,
     BSONOBJ: _get_object,
@@ -288,40 +326,70 @@ _ELEMENT_GETTER = {
     BSONTIM: _get_timestamp,
     BSONLON: _get_int64,
     BSONMIN: lambda w, x, y, z: (MinKey(), x),
-    BSONMAX: lambda w, x, y, z: (MaxKey(), x)}
-
-
-def _element_to_dict(data, position, obj_end, opts):
-    """Decode a single key, value pair."""
-    element_type = data[position:position + 1]
-    position += 1
-    element_name, position = _get_c_string(data, position)
-    value, position = _ELEMENT_GETTER[element_type](data,
-                                                    position, obj_end, opts)
-    return element_name, value, position
+    BSONMAX: lambda w, x, y, z: (MaxKey(), x)})
 
 
 def _elements_to_dict(data, position, obj_end, opts):
     """Decode a BSON document."""
-    result = opts.document_class()
     end = obj_end - 1
+
+    # Avoid doing global and attibute lookups in the loop.
+    index = data.index
+    decode = _utf_8_decode
+    getter = _ELEMENT_GETTER
+
+    if hasattr(opts.document_class, '_from_bson_items'):
+        items = []
+        append = items.append
+        while position < end:
+            element_type = data[position]
+            name_end = index(b"\x00", position + 1)
+            key = decode(data[position + 1:name_end], None, True)[0]
+            value, position = getter[element_type](data, name_end + 1,
+                                                   obj_end, opts)
+            append((key, value))
+        return opts.document_class._from_bson_items(items)
+    result = opts.document_class()
     while position < end:
-        (key, value, position) = _element_to_dict(data, position, obj_end, opts)
+        element_type = data[position]
+        name_end = index(b"\x00", position + 1)
+        key = decode(data[position + 1:name_end], None, True)[0]
+        value, position = getter[element_type](data, name_end + 1,
+                                               obj_end, opts)
         result[key] = value
     return result
 
 
+def _to_bytes(data):
+    """Return the bytes-like object `data` as bytes.
+
+    Only copies `data` if it isn't already bytes (e.g. a bytearray or a
+    memoryview).
+    """
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, bytearray):
+        return bytes(data)
+    return memoryview(data).tobytes()
+
+
 def _bson_to_dict(data, opts):
     """Decode a BSON string to document_class."""
+    data = _to_bytes(data)
     try:
-        obj_size = _UNPACK_INT(data[:4])[0]
+        obj_size = _UNPACK_INT(data)[0]
     except struct.error as exc:
         raise InvalidBSON(str(exc))
     if obj_size != len(data):
         raise InvalidBSON("invalid object size")
     if data[obj_size - 1:obj_size] != b"\x00":
         raise InvalidBSON("bad eoo")
+    if _raw_document_class(opts.document_class):
+        return opts.document_class(data, opts)
     try:
+        if opts.decode_fields is not None:
+            return _filtered_elements_to_dict(
+                data, 4, obj_size - 1, opts, _field_tree(opts.decode_fields))
         return _elements_to_dict(data, 4, obj_size - 1, opts)
     except InvalidBSON:
         raise
@@ -333,6 +401,188 @@ if _USE_C:
     _bson_to_dict = _cbson._bson_to_dict
 
 
+# Size in bytes of the values of fixed length BSON types.
+_FIXED_VALUE_SIZE = _by_type_code({
+    BSONNUM: 8,
+    BSONUND: 0,
+    BSONOID: 12,
+    BSONBOO: 1,
+    BSONDAT: 8,
+    BSONNUL: 0,
+    BSONINT: 4,
+    BSONTIM: 8,
+    BSONLON: 8,
+    BSONMIN: 0,
+    BSONMAX: 0})
+
+# Size in bytes of the parts of length prefixed BSON values that the length
+# doesn't count.
+_UNCOUNTED_VALUE_SIZE = _by_type_code({
+    BSONOBJ: 0,
+    BSONARR: 0,
+    BSONCWS: 0,
+    BSONSTR: 4,
+    BSONCOD: 4,
+    BSONSYM: 4,
+    BSONBIN: 5,
+    BSONREF: 16})
+
+
+def _value_size(data, position, element_type):
+    """Get the size of the BSON value at `position` without decoding it.
+
+    `element_type` is the type code, as indexing `data` returns it.
+    """
+    try:
+        return _FIXED_VALUE_SIZE[element_type]
+    except KeyError:
+        pass
+    if element_type == _BSONRGX_CODE:
+        # Pattern and flags, two C strings.
+        end = data.index(b"\x00", data.index(b"\x00", position) + 1)
+        return end + 1 - position
+    try:
+        uncounted = _UNCOUNTED_VALUE_SIZE[element_type]
+    except KeyError:
+        raise InvalidBSON("no decoder for element type %r" % (element_type,))
+    return _UNPACK_INT(data, position)[0] + uncounted
+
+
+def _find_element(data, name, opts):
+    """Decode the value of the top level element `name` in a BSON string.
+
+    Elements that come before `name` are skipped without being decoded.
+    `name` is the UTF-8 encoded key. Raises KeyError if there is no such
+    element.
+    """
+    try:
+        obj_size = _UNPACK_INT(data)[0]
+    except struct.error as exc:
+        raise InvalidBSON(str(exc))
+    if obj_size != len(data):
+        raise InvalidBSON("invalid object size")
+    if data[obj_size - 1:obj_size] != b"\x00":
+        raise InvalidBSON("bad eoo")
+    end = obj_size - 1
+    position = 4
+    index = data.index
+    try:
+        while position < end:
+            element_type = data[position]
+            name_end = index(b"\x00", position + 1)
+            element_name = data[position + 1:name_end]
+            position = name_end + 1
+            if element_name == name:
+                return _ELEMENT_GETTER[element_type](data, position,
+                                                    end, opts)[0]
+            position += _value_size(data, position, element_type)
+    except InvalidBSON:
+        raise
+    except Exception:
+        # Change exception type to InvalidBSON but preserve traceback.
+        _, exc_value, exc_tb = sys.exc_info()
+        reraise(InvalidBSON, exc_value, exc_tb)
+    if position != end:
+        raise InvalidBSON("bad object or element length")
+    raise KeyError(name)
+if _USE_C:
+    _find_element = _cbson._find_element
+
+
+def _field_tree(decode_fields):
+    """Build the tree of fields selected by CodecOptions.decode_fields.
+
+    Maps each selected field name, as UTF-8 bytes, to None if the whole value
+    is selected or to the tree of fields selected from that value.
+    """
+    tree = {}
+    for field in decode_fields:
+        if isinstance(field, text_type):
+            field = _utf_8_encode(field)[0]
+        names = field.split(b".")
+        level = tree
+        for name in names[:-1]:
+            if name in level and level[name] is None:
+                # The whole value is already selected.
+                break
+            level = level.setdefault(name, {})
+        else:
+            level[names[-1]] = None
+    return tree
+
+
+def _get_filtered(data, position, element_type, opts, fields):
+    """Decode the fields selected by `fields` from the BSON subdocument or
+    array at `position`.
+    """
+    obj_size = _UNPACK_INT(data, position)[0]
+    end = position + obj_size - 1
+    if obj_size < 5:
+        raise InvalidBSON("invalid object length")
+    if data[end] != _EOO:
+        raise InvalidBSON("bad eoo")
+    if element_type == _BSONOBJ_CODE:
+        value = _filtered_elements_to_dict(data, position + 4, end, opts,
+                                           fields)
+    else:
+        value = _filtered_array(data, position + 4, end, opts, fields)
+    return value, position + obj_size
+
+
+def _filtered_array(data, position, obj_end, opts, fields):
+    """Decode the fields selected by `fields` from the documents in a BSON
+    array. Elements that aren't documents or arrays are skipped.
+    """
+    result = []
+    index = data.index
+    while position < obj_end:
+        element_type = data[position]
+        position = index(b"\x00", position + 1) + 1
+        if element_type in (_BSONOBJ_CODE, _BSONARR_CODE):
+            value, position = _get_filtered(data, position, element_type,
+                                            opts, fields)
+            result.append(value)
+        else:
+            position += _value_size(data, position, element_type)
+    return result
+
+
+def _filtered_elements_to_dict(data, position, obj_end, opts, fields):
+    """Decode the fields selected by `fields` from a BSON document.
+
+    Other elements are skipped by reading their length, without being
+    decoded.
+    """
+    items = []
+    index = data.index
+    while position < obj_end:
+        element_type = data[position]
+        name_end = index(b"\x00", position + 1)
+        name = data[position + 1:name_end]
+        position = name_end + 1
+        if name in fields:
+            subfields = fields[name]
+            if subfields is None:
+                value, position = _ELEMENT_GETTER[element_type](
+                    data, position, obj_end, opts)
+                items.append((_utf_8_decode(name, None, True)[0], value))
+                continue
+            elif element_type in (_BSONOBJ_CODE, _BSONARR_CODE):
+                value, position = _get_filtered(data, position, element_type,
+                                                opts, subfields)
+                items.append((_utf_8_decode(name, None, True)[0], value))
+                continue
+        position += _value_size(data, position, element_type)
+    if position != obj_end:
+        raise InvalidBSON("bad object or element length")
+    if hasattr(opts.document_class, '_from_bson_items'):
+        return opts.document_class._from_bson_items(items)
+    result = opts.document_class()
+    for key, value in items:
+        result[key] = value
+    return result
+
+
 _PACK_FLOAT = struct.Struct("<d").pack
 _PACK_INT = struct.Struct("<i").pack
 _PACK_LENGTH_SUBTYPE = struct.Struct("<iB").pack
@@ -429,6 +679,11 @@ def _encode_mapping(name, value, check_keys, opts):
     return b"\x03" + name + _PACK_INT(len(data) + 5) + data + b"\x00"
 
 
+def _encode_raw_document(name, value, dummy0, dummy1):
+    """Encode bson.raw_bson.RawBSONDocument."""
+    return b"\x03" + name + _to_bytes(value.raw)
+
+
 def _encode_dbref(name, value, check_keys, opts):
     """Encode bson.dbref.DBRef."""
     buf = bytearray(b"\x03" + name + b"\x00\x00\x00\x00")
@@ -472,6 +727,12 @@ def _encode_binary(name, value, dummy0, dummy1):
     return b"\x05" + name + _PACK_LENGTH_SUBTYPE(len(value), subtype) + value
 
 
+def _encode_memoryview(name, value, dummy0, dummy1):
+    """Encode a memoryview as BSON binary subtype 0."""
+    value = value.tobytes()
+    return b"\x05" + name + _PACK_INT(len(value)) + b"\x00" + value
+
+
 def _encode_uuid(name, value, dummy, opts):
     """Encode uuid.UUID."""
     uuid_representation = opts.uuid_representation
@@ -631,12 +892,15 @@ _MARKERS = {
     17: _encode_timestamp,
     18: _encode_long,
     100: _encode_dbref,
+    _RAW_BSON_DOCUMENT_MARKER: _encode_raw_document,
     127: _encode_maxkey,
     255: _encode_minkey,
 }
 
 if not PY3:
     _ENCODERS[long] = _encode_long
+if _HAS_MEMORYVIEW:
+    _ENCODERS[memoryview] = _encode_memoryview
 
 
 def _name_value_to_bson(name, value, check_keys, opts):
@@ -672,23 +936,55 @@ def _name_value_to_bson(name, value, check_keys, opts):
                           type(value))
 
 
-def _element_to_bson(key, value, check_keys, opts):
-    """Encode a single key, value pair."""
+# The element names of keys that pass the check_keys checks, by key. Most
+# documents share their keys with many others, so each key is only checked
+# and encoded the first time it is seen.
+_CHECKED_NAMES = {}
+_MAX_CHECKED_NAMES = 1024
+
+
+def _make_checked_name(key, check_keys):
+    """Make the element name for `key`, checking it if `check_keys`."""
     if not isinstance(key, string_type):
         raise InvalidDocument("documents must have only string keys, "
                               "key was %r" % (key,))
-    if check_keys:
-        if key.startswith("$"):
+    if key.startswith("$"):
+        if check_keys:
             raise InvalidDocument("key %r must not start with '$'" % (key,))
-        if "." in key:
+        return _make_name(key)
+    if "." in key:
+        if check_keys:
             raise InvalidDocument("key %r must not contain '.'" % (key,))
+        return _make_name(key)
 
     name = _make_name(key)
+    if len(_CHECKED_NAMES) >= _MAX_CHECKED_NAMES:
+        _CHECKED_NAMES.clear()
+    _CHECKED_NAMES[key] = name
+    return name
+
+
+def _element_to_bson(key, value, check_keys, opts):
+    """Encode a single key, value pair."""
+    try:
+        name = _CHECKED_NAMES[key]
+    except (KeyError, TypeError):
+        name = _make_checked_name(key, check_keys)
     return _name_value_to_bson(name, value, check_keys, opts)
 
 
 def _dict_to_bson(doc, check_keys, opts, top_level=True):
     """Encode a document to BSON."""
+    if _raw_document_class(doc):
+        # Already BSON, keys and all.
+        return _to_bytes(doc.raw)
+    encoder = opts.compiled_encoder
+    if (top_level and encoder is not None and
+            (encoder._valid_keys or not check_keys)):
+        encoded = _encode_compiled(doc, encoder._keys, encoder._names,
+                                   check_keys, opts)
+        if encoded is not None:
+            return encoded
     try:
         elements = []
         if top_level and "_id" in doc:
@@ -707,6 +1003,130 @@ if _USE_C:
     _dict_to_bson = _cbson._dict_to_bson
 
 
+def _size_of_text(value, dummy):
+    """Size of an encoded python unicode (python 2.x) / str (python 3.x)."""
+    return len(_utf_8_encode(value)[0]) + 5
+
+
+def _size_of_bytes(value, dummy):
+    """Size of encoded python bytes, a string in python 2.x and binary
+    subtype 0 in python 3.x."""
+    return len(value) + 5
+
+
+def _size_of_int(value, opts):
+    """Size of an encoded python int."""
+    if -2147483648 <= value <= 2147483647:
+        return 4
+    return _size_of_long(value, opts)
+
+
+def _size_of_long(value, opts):
+    """Size of an encoded python long (python 2.x) or bson.int64.Int64."""
+    if -9223372036854775808 <= value <= 9223372036854775807:
+        return 8
+    # Raises OverflowError.
+    return _size_of_other(value, opts)
+
+
+def _size_of_binary(value, dummy):
+    """Size of an encoded bson.binary.Binary."""
+    if value.subtype == 2:
+        return len(value) + 9
+    return len(value) + 5
+
+
+def _size_of_raw_document(value, dummy):
+    """Size of an encoded bson.raw_bson.RawBSONDocument."""
+    return len(value.raw)
+
+
+def _size_of_list(value, opts):
+    """Size of an encoded list/tuple."""
+    size = 5
+    for index, item in enumerate(value):
+        # Type byte, name and its NUL terminator.
+        size += len(str(index)) + 2 + _size_of_value(item, opts)
+    return size
+
+
+def _size_of_other(value, opts):
+    """Size of a value of any other type, found by encoding it."""
+    # Minus the type byte and the empty name.
+    return len(_name_value_to_bson(b"\x00", value, False, opts)) - 2
+
+
+# The size of each type's encoded value, without the type byte and name.
+# Either a number of bytes or a function returning it. Types missing here
+# are encoded to find their size.
+_SIZERS = {
+    bool: 1,
+    bytes: _size_of_bytes,
+    datetime.datetime: 8,
+    float: 8,
+    int: _size_of_int,
+    list: _size_of_list,
+    text_type: _size_of_text,
+    tuple: _size_of_list,
+    type(None): 0,
+    Binary: _size_of_binary,
+    Int64: _size_of_long,
+    MaxKey: 0,
+    MinKey: 0,
+    ObjectId: 12,
+    Timestamp: 8,
+}
+
+
+_SIZE_MARKERS = {
+    5: _size_of_binary,
+    7: 12,
+    17: 8,
+    18: _size_of_long,
+    _RAW_BSON_DOCUMENT_MARKER: _size_of_raw_document,
+    127: 0,
+    255: 0,
+}
+
+if not PY3:
+    _SIZERS[long] = _size_of_long
+
+
+def _size_of_value(value, opts):
+    """Size of an encoded value, without its type byte and name."""
+    sizer = _SIZERS.get(type(value))
+    if sizer is None:
+        marker = getattr(value, "_type_marker", None)
+        if isinstance(marker, int):
+            sizer = _SIZE_MARKERS.get(marker)
+    if sizer is not None:
+        if isinstance(sizer, int):
+            return sizer
+        return sizer(value, opts)
+    if isinstance(value, collections.Mapping):
+        return _encoded_size(value, opts)
+    return _size_of_other(value, opts)
+
+
+def _encoded_size(doc, opts):
+    """Size of an encoded document."""
+    if _raw_document_class(doc):
+        return len(doc.raw)
+    size = 5
+    try:
+        for (key, value) in iteritems(doc):
+            if not isinstance(key, string_type):
+                raise InvalidDocument("documents must have only string keys, "
+                                      "key was %r" % (key,))
+            # Type byte, then the name with its NUL terminator.
+            size += 1 + len(_make_name(key)) + _size_of_value(value, opts)
+    except AttributeError:
+        raise TypeError("encoder expected a mapping type but got: %r" % (doc,))
+    return size
+if _USE_C:
+    _encoded_size = _cbson._encoded_size
+
+
 _CODEC_OPTIONS_TYPE_ERROR = TypeError(
     "codec_options must be an instance of CodecOptions")
 
@@ -714,14 +1134,20 @@ _CODEC_OPTIONS_TYPE_ERROR = TypeError(
 def decode_all(data, codec_options=DEFAULT_CODEC_OPTIONS):
     """Decode BSON data to multiple documents.
 
-    `data` must be a string of concatenated, valid, BSON-encoded
-    documents.
+    `data` must be a bytes-like object (:class:`str` in python 2,
+    :class:`bytes`, :class:`bytearray` or :class:`memoryview`) of
+    concatenated, valid, BSON-encoded documents. When the C extension is
+    available documents are decoded directly from `data` without copying it,
+    so a :class:`memoryview` can be used to decode part of a larger buffer.
 
     :Parameters:
       - `data`: BSON data
       - `codec_options` (optional): An instance of
         :class:`~bson.codec_options.CodecOptions`.
 
+    .. versionchanged:: 3.1
+       Accept any bytes-like object, not only :class:`bytes`.
+
     .. versionchanged:: 3.0
        Removed `compile_re` option: PyMongo now always represents BSON regular
        expressions as :class:`~bson.regex.Regex` objects. Use
@@ -743,21 +1169,36 @@ def decode_all(data, codec_options=DEFAULT_CODEC_OPTIONS):
     if not isinstance(codec_options, CodecOptions):
         raise _CODEC_OPTIONS_TYPE_ERROR
 
+    data = _to_bytes(data)
     docs = []
     position = 0
     end = len(data) - 1
+    use_raw = _raw_document_class(codec_options.document_class)
+    fields = None
+    if codec_options.decode_fields is not None:
+        fields = _field_tree(codec_options.decode_fields)
     try:
         while position < end:
-            obj_size = _UNPACK_INT(data[position:position + 4])[0]
+            obj_size = _UNPACK_INT(data, position)[0]
             if len(data) - position < obj_size:
                 raise InvalidBSON("invalid object size")
             obj_end = position + obj_size - 1
             if data[obj_end:position + obj_size] != b"\x00":
                 raise InvalidBSON("bad eoo")
-            docs.append(_elements_to_dict(data,
-                                          position + 4,
-                                          obj_end,
-                                          codec_options))
+            if use_raw:
+                docs.append(codec_options.document_class(
+                    data[position:obj_end + 1], codec_options))
+            elif fields is not None:
+                docs.append(_filtered_elements_to_dict(data,
+                                                       position + 4,
+                                                       obj_end,
+                                                       codec_options,
+                                                       fields))
+            else:
+                docs.append(_elements_to_dict(data,
+                                              position + 4,
+                                              obj_end,
+                                              codec_options))
             position += obj_size
         return docs
     except InvalidBSON:
@@ -778,14 +1219,18 @@ def decode_iter(data, codec_options=DEFAULT_CODEC_OPTIONS):
     Works similarly to the decode_all function, but yields one document at a
     time.
 
-    `data` must be a string of concatenated, valid, BSON-encoded
-    documents.
+    `data` must be a bytes-like object (:class:`str` in python 2,
+    :class:`bytes`, :class:`bytearray` or :class:`memoryview`) of
+    concatenated, valid, BSON-encoded documents.
 
     :Parameters:
       - `data`: BSON data
       - `codec_options` (optional): An instance of
         :class:`~bson.codec_options.CodecOptions`.
 
+    .. versionchanged:: 3.1
+       Accept any bytes-like object, not only :class:`bytes`.
+
     .. versionchanged:: 3.0
        Replaced `as_class`, `tz_aware`, and `uuid_subtype` options with
        `codec_options`.
@@ -795,10 +1240,15 @@ def decode_iter(data, codec_options=DEFAULT_CODEC_OPTIONS):
     if not isinstance(codec_options, CodecOptions):
         raise _CODEC_OPTIONS_TYPE_ERROR
 
+    if _USE_C and _HAS_MEMORYVIEW:
+        # Slicing a memoryview doesn't copy the document.
+        data = memoryview(data)
+    elif not _USE_C:
+        data = _to_bytes(data)
     position = 0
     end = len(data) - 1
     while position < end:
-        obj_size = _UNPACK_INT(data[position:position + 4])[0]
+        obj_size = _UNPACK_INT(data, position)[0]
         elements = data[position:position + obj_size]
         position += obj_size
 
@@ -834,6 +1284,382 @@ def decode_file_iter(file_obj, codec_options=DEFAULT_CODEC_OPTIONS):
         yield _bson_to_dict(elements, codec_options)
 
 
+# Column type of each BSON type decode_columns can decode.
+_COLUMN_TYPES = _by_type_code({
+    BSONNUM: FLOAT64,
+    BSONINT: INT64,
+    BSONLON: INT64,
+    BSONBOO: BOOL,
+    BSONDAT: DATETIME_MS,
+    BSONOID: OBJECTID})
+
+
+def _pack_column(field, values, count):
+    """Pack the (row, element_type, raw value) tuples in `values` into the
+    (dtype, data, mask) of a column of `count` rows.
+    """
+    dtypes = set(_COLUMN_TYPES[element_type] for _, element_type, _ in values)
+    if not dtypes or dtypes == set([FLOAT64, INT64]):
+        dtype = FLOAT64
+    elif len(dtypes) == 1:
+        dtype = dtypes.pop()
+    else:
+        raise ValueError("field %r has values of BSON types that can't be "
+                         "stored in one column" % (field,))
+    size = 1 if dtype == BOOL else 12 if dtype == OBJECTID else 8
+    data = bytearray(count * size)
+    mask = bytearray(b"\x01" * count)
+    for row, element_type, raw in values:
+        if element_type == _BSONINT_CODE:
+            value = _UNPACK_INT(raw)[0]
+            raw = _PACK_FLOAT(value) if dtype == FLOAT64 else _PACK_LONG(value)
+        elif element_type == _BSONLON_CODE and dtype == FLOAT64:
+            raw = _PACK_FLOAT(_UNPACK_LONG(raw)[0])
+        data[row * size:(row + 1) * size] = raw
+        mask[row] = 0
+    return dtype, data, mask
+
+
+def _decode_columns(data, fields):
+    """Decode `fields` of the documents in `data` to a list of
+    (dtype, data, mask) tuples, one per field.
+    """
+    data = _to_bytes(data)
+    names = {}
+    for index, field in enumerate(fields):
+        if isinstance(field, text_type):
+            field = _utf_8_encode(field)[0]
+        names[field] = index
+    values = [[] for _ in fields]
+    count = 0
+    position = 0
+    end = len(data)
+    index = data.index
+    try:
+        while position < end:
+            obj_size = _UNPACK_INT(data, position)[0]
+            obj_end = position + obj_size - 1
+            if obj_size < 5 or obj_end >= end:
+                raise InvalidBSON("invalid object size")
+            if data[obj_end:obj_end + 1] != b"\x00":
+                raise InvalidBSON("bad eoo")
+            position += 4
+            while position < obj_end:
+                element_type = data[position]
+                name_end = index(b"\x00", position + 1)
+                column = names.get(data[position + 1:name_end])
+                position = name_end + 1
+                size = _value_size(data, position, element_type)
+                # Null and undefined values are left masked.
+                if (column is not None and
+                        element_type not in (_BSONNUL_CODE, _BSONUND_CODE)):
+                    if element_type not in _COLUMN_TYPES:
+                        raise ValueError(
+                            "field %r has a value of a BSON type that can't "
+                            "be decoded to a column" % (fields[column],))
+                    values[column].append(
+                        (count, element_type,
+                         data[position:position + size]))
+                position += size
+            if position != obj_end:
+                raise InvalidBSON("bad object or element length")
+            position += 1
+            count += 1
+    except (InvalidBSON, ValueError):
+        raise
+    except Exception:
+        # Change exception type to InvalidBSON but preserve traceback.
+        _, exc_value, exc_tb = sys.exc_info()
+        reraise(InvalidBSON, exc_value, exc_tb)
+    return [_pack_column(field, field_values, count)
+            for field, field_values in zip(fields, values)]
+if _USE_C:
+    _decode_columns = _cbson._decode_columns
+
+
+def _validate_column_fields(fields):
+    """Validate the field names given to decode_columns, returning a tuple.
+    """
+    if isinstance(fields, string_type):
+        raise TypeError("fields must be a list of field names, not a string")
+    fields = tuple(fields)
+    for field in fields:
+        if not isinstance(field, string_type):
+            raise TypeError("each field must be an instance of %s"
+                            % (string_type.__name__,))
+    if len(set(fields)) != len(fields):
+        raise ValueError("fields must not contain duplicates")
+    return fields
+
+
+def decode_columns(data, fields, codec_options=DEFAULT_CODEC_OPTIONS):
+    """Decode fields of many BSON documents to columns.
+
+    Decodes the top level `fields` of each of the concatenated BSON
+    documents in `data` straight into a :class:`~bson.columns.Column` for
+    each field, without creating a document for each BSON document. Doubles
+    and integers are stored as 64-bit numbers, booleans as bytes, datetimes
+    as 64-bit milliseconds since the epoch, and ObjectIds as 12-byte
+    records. Each column has a mask of the documents where the field is
+    missing or null.
+
+    Raises :class:`ValueError` if a field has a value that isn't one of
+    these types (or is null), or has values of different types that can't
+    be stored in one column. Integers mixed with doubles are stored as
+    doubles.
+
+    Returns a :class:`dict` mapping each field name to its column.
+
+    :Parameters:
+      - `data`: a bytes-like object of concatenated BSON documents
+      - `fields`: a list of the names of the fields to decode
+      - `codec_options` (optional): An instance of
+        :class:`~bson.codec_options.CodecOptions`.
+
+    .. versionadded:: 3.1
+    """
+    if not isinstance(codec_options, CodecOptions):
+        raise _CODEC_OPTIONS_TYPE_ERROR
+    fields = _validate_column_fields(fields)
+    columns = _decode_columns(data, fields)
+    return dict((field, Column(*column))
+                for field, column in zip(fields, columns))
+
+
+def _encode_many(docs, check_keys, opts):
+    """Encode an iterable of documents to concatenated BSON."""
+    encoded = []
+    offsets = [0]
+    for doc in docs:
+        encoded.append(_dict_to_bson(doc, check_keys, opts))
+        offsets.append(offsets[-1] + len(encoded[-1]))
+    return b"".join(encoded), offsets
+if _USE_C:
+    _encode_many = _cbson._encode_many
+
+
+def encode_many(docs, check_keys=False, codec_options=DEFAULT_CODEC_OPTIONS):
+    """Encode many documents to one buffer of concatenated BSON.
+
+    Encodes each document of the iterable `docs` like
+    :meth:`BSON.encode`. When the C extension is available every document
+    is written to the same growing buffer, rather than being encoded to a
+    separate string and copied again.
+
+    Returns a tuple ``(data, offsets)`` of the concatenated BSON documents
+    and a list with one more offset than there are documents: document
+    ``i`` is ``data[offsets[i]:offsets[i + 1]]``.
+
+    :Parameters:
+      - `docs`: an iterable of mapping types representing documents
+      - `check_keys` (optional): check if keys start with '$' or
+        contain '.', raising :class:`~bson.errors.InvalidDocument` in
+        either case
+      - `codec_options` (optional): An instance of
+        :class:`~bson.codec_options.CodecOptions`.
+
+    .. versionadded:: 3.1
+    """
+    if not isinstance(codec_options, CodecOptions):
+        raise _CODEC_OPTIONS_TYPE_ERROR
+    return _encode_many(docs, check_keys, codec_options)
+
+
+def encoded_size(document, codec_options=DEFAULT_CODEC_OPTIONS):
+    """Return the size in bytes of `document` encoded to BSON.
+
+    Walks `document` and adds up the sizes of its elements without building
+    the encoded document, so the size of a document can be checked (for
+    example against :attr:`~pymongo.mongo_client.MongoClient.max_bson_size`)
+    before encoding it. Values of uncommon types, such as
+    :class:`~bson.code.Code` or :class:`~bson.regex.Regex`, are encoded on
+    their own to find their size.
+
+    Key names are not checked, as with :meth:`BSON.encode` and
+    ``check_keys=False``. Raises the same errors as :meth:`BSON.encode` for
+    values that can't be encoded.
+
+    :Parameters:
+      - `document`: mapping type representing a document
+      - `codec_options` (optional): An instance of
+        :class:`~bson.codec_options.CodecOptions`.
+
+    .. versionadded:: 3.1
+    """
+    if not isinstance(codec_options, CodecOptions):
+        raise _CODEC_OPTIONS_TYPE_ERROR
+    return _encoded_size(document, codec_options)
+
+
+def _encode_compiled(doc, keys, names, check_keys, opts):
+    """Encode a dict whose keys other than _id are `keys`, in order.
+
+    `names` are `keys` made into BSON element names. Returns None if `doc`
+    is not a dict with those keys.
+    """
+    if type(doc) is not dict:
+        return None
+    has_id = "_id" in doc
+    if len(doc) - has_id != len(keys):
+        return None
+    elements = []
+    if has_id:
+        elements.append(_name_value_to_bson(b"_id\x00", doc["_id"],
+                                            check_keys, opts))
+    i = 0
+    for key, value in iteritems(doc):
+        if key == "_id":
+            continue
+        if key != keys[i]:
+            return None
+        elements.append(_name_value_to_bson(names[i], value,
+                                            check_keys, opts))
+        i += 1
+    encoded = b"".join(elements)
+    return _PACK_INT(len(encoded) + 5) + encoded + b"\x00"
+if _USE_C:
+    _encode_compiled = _cbson._encode_compiled
+
+
+class _CompiledEncoder(object):
+    """An encoder for documents shaped like a template document.
+
+    Created by :func:`compile_encoder`.
+    """
+
+    __slots__ = ('_keys', '_names', '_valid_keys')
+
+    def __init__(self, template):
+        keys = []
+        for key in template:
+            if not isinstance(key, string_type):
+                raise InvalidDocument("documents must have only string keys, "
+                                      "key was %r" % (key,))
+            if key != "_id":
+                keys.append(key)
+        self._keys = tuple(keys)
+        self._names = tuple(_make_name(key) for key in keys)
+        self._valid_keys = not any(
+            key.startswith("$") or "." in key for key in keys)
+
+    @property
+    def keys(self):
+        """The keys of the template, other than ``"_id"``, in order."""
+        return list(self._keys)
+
+    def encode(self, document, check_keys=False,
+               codec_options=DEFAULT_CODEC_OPTIONS):
+        """Encode `document` to BSON bytes.
+
+        Returns the same bytes as :meth:`BSON.encode`. Documents that are not
+        a :class:`dict` with the keys of the template are encoded by
+        :meth:`BSON.encode`.
+
+        :Parameters:
+          - `document`: mapping type representing a document
+          - `check_keys` (optional): check if keys start with '$' or
+            contain '.', raising :class:`~bson.errors.InvalidDocument` in
+            either case
+          - `codec_options` (optional): An instance of
+            :class:`~bson.codec_options.CodecOptions`.
+        """
+        if not isinstance(codec_options, CodecOptions):
+            raise _CODEC_OPTIONS_TYPE_ERROR
+        if self._valid_keys or not check_keys:
+            encoded = _encode_compiled(document, self._keys, self._names,
+                                       check_keys, codec_options)
+            if encoded is not None:
+                return encoded
+        return _dict_to_bson(document, check_keys, codec_options)
+
+    def __repr__(self):
+        return "CompiledEncoder(keys=%r)" % (list(self._keys),)
+
+
+def compile_encoder(template):
+    """Compile an encoder for documents with the same keys as `template`.
+
+    The key names of `template` are encoded to BSON once. The returned
+    encoder then only encodes the values of each document that has the same
+    keys in the same order, except for ``"_id"``, which may be present or
+    not. Other documents are encoded by :meth:`BSON.encode`, so the encoder
+    works for any document::
+
+      >>> encoder = bson.compile_encoder({'x': 0, 'y': ''})
+      >>> encoder.encode({'x': 1, 'y': 'a'}) == BSON.encode({'x': 1, 'y': 'a'})
+      True
+
+    Register the encoder with the `compiled_encoder` option of
+    :class:`~bson.codec_options.CodecOptions` to use it for the documents
+    inserted by :meth:`~pymongo.collection.Collection.insert_many` and bulk
+    writes.
+
+    :Parameters:
+      - `template`: mapping type representing a document with the keys of the
+        documents to encode
+
+    .. versionadded:: 3.1
+    """
+    return _CompiledEncoder(template)
+
+
+# Options to check documents by decoding them in pure Python. Any BSON
+# datetime can be decoded to millis.
+_VALIDATE_CODEC_OPTIONS = CodecOptions(datetime_as_millis=True)
+
+
+def _validate_all(data):
+    """Check concatenated BSON documents and get their offsets."""
+    data = _to_bytes(data)
+    offsets = [0]
+    position = 0
+    end = len(data)
+    while position < end:
+        try:
+            obj_size = _UNPACK_INT(data, position)[0]
+            _bson_to_dict(data[position:position + obj_size],
+                          _VALIDATE_CODEC_OPTIONS)
+        except (struct.error, InvalidBSON) as exc:
+            raise InvalidBSON("invalid document at offset %d: %s"
+                              % (position, exc))
+        position += obj_size
+        offsets.append(position)
+    return offsets
+if _USE_C:
+    _validate_all = _cbson._validate_all
+
+
+def validate_all(data):
+    """Check that `data` is valid concatenated BSON documents, without
+    decoding them.
+
+    Checks the length and type of every element, and that strings are
+    valid UTF-8, without creating any Python object for the values. The C
+    extension releases the GIL while it checks the documents, so large
+    dumps can be checked in parallel threads.
+
+    Returns a list with one more offset than there are documents: document
+    ``i`` is ``data[offsets[i]:offsets[i + 1]]``, like with
+    :func:`encode_many`. Raises :class:`~bson.errors.InvalidBSON`, with the
+    offset of the first invalid document, if `data` is not valid.
+
+    To check a dump file without reading it into memory, on Python 3::
+
+      >>> with open('dump.bson', 'rb') as f:
+      ...     data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      ...     offsets = bson.validate_all(data)
+      >>> count = len(offsets) - 1
+
+    :Parameters:
+      - `data`: a bytes-like object (:class:`str` in python 2,
+        :class:`bytes`, :class:`bytearray`, :class:`memoryview` or
+        :class:`mmap.mmap`) of concatenated BSON documents
+
+    .. versionadded:: 3.1
+    """
+    return _validate_all(data)
+
+
 def is_valid(bson):
     """Check that the given string represents valid :class:`BSON` data.
 
@@ -843,14 +1669,16 @@ def is_valid(bson):
 
     :Parameters:
       - `bson`: the data to be validated
+
+    .. versionchanged:: 3.1
+       Checks the data with :func:`validate_all` instead of decoding it.
     """
     if not isinstance(bson, bytes):
         raise TypeError("BSON data must be an instance of a subclass of bytes")
 
     try:
-        _bson_to_dict(bson, DEFAULT_CODEC_OPTIONS)
-        return True
-    except Exception:
+        return len(_validate_all(bson)) == 2
+    except InvalidBSON:
         return False
 
 
@@ -937,3 +1765,45 @@ def has_c():
     """Is the C extension installed?
     """
     return _USE_C
+
+
+_MAX_KEY_CACHE_SIZE = 2 ** 20
+
+
+def set_key_cache_size(size):
+    """Set the number of entries in the C extension's key cache.
+
+    The C extension caches the strings it decodes document keys to, keyed
+    by their raw bytes, so that documents with the same field names share
+    the same key objects. This saves both decoding time and memory when
+    many documents with the same shape are decoded. `size` is rounded up to
+    a power of 2. Only keys up to 32 bytes long are cached. A `size` of
+    ``0`` disables the cache. The default size is 1024.
+
+    Does nothing if the C extension is not installed.
+
+    :Parameters:
+      - `size`: the maximum number of cached keys, at most 2**20
+
+    .. versionadded:: 3.1
+    """
+    if not isinstance(size, integer_types):
+        raise TypeError("size must be an integer")
+    if not 0 <= size <= _MAX_KEY_CACHE_SIZE:
+        raise ValueError("size must be between 0 and %d"
+                         % (_MAX_KEY_CACHE_SIZE,))
+    if _USE_C:
+        _cbson.set_key_cache_size(size)
+
+
+def get_key_cache_size():
+    """Get the number of entries in the C extension's key cache.
+
+    Returns ``0`` if the cache is disabled or the C extension is not
+    installed. See :func:`set_key_cache_size`.
+
+    .. versionadded:: 3.1
+    """
+    if _USE_C:
+        return _cbson.get_key_cache_size()
+    return 0
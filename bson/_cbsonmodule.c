@@ -23,6 +23,14 @@
 #include "Python.h"
 #include "datetime.h"
 
+#include <time.h>
+#ifdef _WIN32
+#include <process.h>
+#define getpid _getpid
+#else
+#include <unistd.h>
+#endif
+
 #include "buffer.h"
 #include "time64.h"
 #include "encoding_helpers.h"
@@ -37,6 +45,20 @@
  * which references the following pep:
  * http://www.python.org/dev/peps/pep-3121/
  * */
+/* Keys up to this many bytes long can be stored in the key cache. */
+#define KEY_CACHE_MAX_KEY_LENGTH 32
+
+/* Default and maximum number of entries in the key cache. */
+#define DEFAULT_KEY_CACHE_SIZE 1024
+#define MAX_KEY_CACHE_SIZE (1 << 20)
+
+/* A decoded document key, and the UTF-8 bytes it was decoded from. */
+typedef struct key_cache_entry {
+    PyObject* key;
+    size_t length;
+    char bytes[KEY_CACHE_MAX_KEY_LENGTH];
+} key_cache_entry_t;
+
 struct module_state {
     PyObject* Binary;
     PyObject* Code;
@@ -51,6 +73,23 @@ struct module_state {
     PyTypeObject* REType;
     PyObject* BSONInt64;
     PyObject* Mapping;
+    PyObject* SON;
+    /* Two way set associative cache of decoded keys, so that documents with
+     * the same keys share the key strings. The size is a power of 2 (at
+     * least 2), or 0 if the cache is disabled. */
+    key_cache_entry_t* key_cache;
+    unsigned key_cache_size;
+    /* Size of the last document encoded by _dict_to_bson, and by
+     * _encode_compiled, used to size the buffer for the next one. This is a
+     * last-document heuristic: it only fits when consecutive documents are
+     * alike, which compiled encoders are made for. */
+    int last_encoded_size;
+    int last_compiled_size;
+    /* ObjectId generation: the machine bytes and the next counter value,
+     * copied from the ObjectId class on first use. */
+    int oid_initialized;
+    char oid_machine[3];
+    unsigned long oid_counter;
 };
 
 /* The Py_TYPE macro was introduced in CPython 2.6 */
@@ -76,6 +115,9 @@ static struct module_state _state;
 #define JAVA_LEGACY   5
 #define CSHARP_LEGACY 6
 
+/* The _type_marker of bson.raw_bson.RawBSONDocument. */
+#define RAW_BSON_DOCUMENT_MARKER 101
+
 #define BSON_MAX_SIZE 2147483647
 /* The smallest possible BSON document, i.e. "{}" */
 #define BSON_MIN_SIZE 5
@@ -110,22 +152,119 @@ _downcast_and_check(Py_ssize_t size, int extra) {
     return (int)size + extra;
 }
 
+/* Get the _type_marker from an Object.
+ *
+ * Return the type marker, 0 if there is no marker, or -1 on failure.
+ */
+static long _type_marker(PyObject* object) {
+    PyObject* type_marker = NULL;
+    long type = 0;
+
+    if (PyObject_HasAttrString(object, "_type_marker")) {
+        type_marker = PyObject_GetAttrString(object, "_type_marker");
+        if (type_marker == NULL) {
+            return -1;
+        }
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (type_marker && PyLong_CheckExact(type_marker)) {
+        type = PyLong_AsLong(type_marker);
+#else
+    if (type_marker && PyInt_CheckExact(type_marker)) {
+        type = PyInt_AsLong(type_marker);
+#endif
+        Py_DECREF(type_marker);
+        /*
+         * Py(Long|Int)_AsLong returns -1 for error but -1 is a valid value
+         * so we call PyErr_Occurred to differentiate.
+         */
+        if (type == -1 && PyErr_Occurred()) {
+            return -1;
+        }
+    } else {
+        Py_XDECREF(type_marker);
+    }
+    return type;
+}
+
 /* Fill out a codec_options_t* from a CodecOptions object. Use with the "O&"
  * format spec in PyArg_ParseTuple.
  *
- * Return 1 on success. options->document_class is a new reference.
+ * Return 1 on success. options->document_class, options->options_obj,
+ * and options->from_items, options->compiled_keys and
+ * options->compiled_names if not NULL, are new references.
+ * options->binary_base is NULL until set by _set_binary_base.
  * Return 0 on failure.
  */
 int convert_codec_options(PyObject* options_obj, void* p) {
     codec_options_t* options = (codec_options_t*)p;
-    if (!PyArg_ParseTuple(options_obj, "Obb",
+    PyObject* compiled_encoder;
+    long type_marker;
+    options->from_items = NULL;
+    options->compiled_keys = NULL;
+    options->compiled_names = NULL;
+    options->binary_base = NULL;
+    options->binary_base_start = NULL;
+    if (!PyArg_ParseTuple(options_obj, "ObbObOb",
                           &options->document_class,
                           &options->tz_aware,
-                          &options->uuid_rep)) {
+                          &options->uuid_rep,
+                          &options->decode_fields,
+                          &options->datetime_as_millis,
+                          &compiled_encoder,
+                          &options->binary_as_memoryview)) {
         return 0;
     }
 
+    /* dict, the default, has neither attribute. */
+    if (options->document_class == (PyObject*)&PyDict_Type) {
+        type_marker = 0;
+    } else {
+        type_marker = _type_marker(options->document_class);
+        if (type_marker < 0) {
+            return 0;
+        }
+    }
+
+    if (options->document_class != (PyObject*)&PyDict_Type &&
+        PyObject_HasAttrString(options->document_class, "_from_bson_items")) {
+        options->from_items = PyObject_GetAttrString(options->document_class,
+                                                     "_from_bson_items");
+        if (!options->from_items) {
+            return 0;
+        }
+    }
+
+    options->compiled_valid_keys = 0;
+    if (compiled_encoder != Py_None) {
+        PyObject* valid_keys;
+        options->compiled_keys = PyObject_GetAttrString(compiled_encoder,
+                                                        "_keys");
+        options->compiled_names = PyObject_GetAttrString(compiled_encoder,
+                                                         "_names");
+        valid_keys = PyObject_GetAttrString(compiled_encoder, "_valid_keys");
+        if (!options->compiled_keys || !options->compiled_names ||
+            !valid_keys ||
+            !PyTuple_Check(options->compiled_keys) ||
+            !PyTuple_Check(options->compiled_names)) {
+            Py_CLEAR(options->compiled_keys);
+            Py_CLEAR(options->compiled_names);
+            Py_XDECREF(valid_keys);
+            Py_CLEAR(options->from_items);
+            if (!PyErr_Occurred()) {
+                PyErr_SetString(PyExc_TypeError, "invalid compiled_encoder");
+            }
+            return 0;
+        }
+        options->compiled_valid_keys = (unsigned char)PyObject_IsTrue(
+            valid_keys);
+        Py_DECREF(valid_keys);
+    }
+
     Py_INCREF(options->document_class);
+    options->options_obj = options_obj;
+    Py_INCREF(options->options_obj);
+    options->is_raw_bson = (RAW_BSON_DOCUMENT_MARKER == type_marker);
     return 1;
 }
 
@@ -137,22 +276,92 @@ void default_codec_options(codec_options_t* options) {
     // TODO: set to "1". PYTHON-526, setting tz_aware=True by default.
     options->tz_aware = 0;
     options->uuid_rep = PYTHON_LEGACY;
+    options->options_obj = NULL;
+    options->is_raw_bson = 0;
+    options->decode_fields = Py_None;
+    options->datetime_as_millis = 0;
+    options->from_items = NULL;
+    options->compiled_keys = NULL;
+    options->compiled_names = NULL;
+    options->compiled_valid_keys = 0;
+    options->binary_as_memoryview = 0;
+    options->binary_base = NULL;
+    options->binary_base_start = NULL;
 }
 
 void destroy_codec_options(codec_options_t* options) {
     Py_CLEAR(options->document_class);
+    Py_CLEAR(options->options_obj);
+    Py_CLEAR(options->from_items);
+    Py_CLEAR(options->compiled_keys);
+    Py_CLEAR(options->compiled_names);
+    Py_CLEAR(options->binary_base);
+}
+
+/* With options->binary_as_memoryview, keep a memoryview of `data`, whose
+ * first byte is at `start`, for binary values to be decoded as slices of.
+ *
+ * Return 1 on success, 0 on failure.
+ */
+static int _set_binary_base(codec_options_t* options, PyObject* data,
+                            const char* start) {
+    if (!options->binary_as_memoryview) {
+        return 1;
+    }
+#if PY_MAJOR_VERSION >= 3 || PY_MINOR_VERSION >= 7
+    options->binary_base = PyMemoryView_FromObject(data);
+    if (!options->binary_base) {
+        return 0;
+    }
+    options->binary_base_start = start;
+    return 1;
+#else
+    PyErr_SetString(PyExc_ValueError,
+                    "binary_as_memoryview requires Python 2.7 or later");
+    return 0;
+#endif
 }
 
 static PyObject* elements_to_dict(PyObject* self, const char* string,
                                   unsigned max, const codec_options_t* options);
 
+static int _value_size(const char* buffer, unsigned position,
+                       unsigned char type, unsigned max);
+
 static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
                                     int type_byte, PyObject* value,
                                     unsigned char check_keys,
                                     const codec_options_t* options);
 
 /* Date stuff */
-static PyObject* datetime_from_millis(long long millis) {
+/* Days between 0000-03-01 and 1970-01-01, in the proleptic Gregorian
+ * calendar. */
+#define DAYS_TO_EPOCH 719468
+
+/* Fill in year, month and day for a count of days since the epoch. This is
+ * Howard Hinnant's civil_from_days algorithm: it works on 400 year eras
+ * and on years starting in March, so that the leap day comes last. */
+static void civil_from_days(long long days, long long* year,
+                            int* month, int* day) {
+    long long era;
+    unsigned day_of_era, year_of_era, day_of_year, month_index;
+
+    days += DAYS_TO_EPOCH;
+    era = (days >= 0 ? days : days - 146096) / 146097;
+    day_of_era = (unsigned)(days - era * 146097);
+    year_of_era = (day_of_era - day_of_era / 1460 + day_of_era / 36524 -
+                   day_of_era / 146096) / 365;
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era / 4 -
+                                year_of_era / 100);
+    month_index = (5 * day_of_year + 2) / 153;
+    *day = (int)(day_of_year - (153 * month_index + 2) / 5 + 1);
+    *month = (int)(month_index < 10 ? month_index + 3 : month_index - 9);
+    *year = (long long)year_of_era + era * 400 + (*month <= 2);
+}
+
+/* Create a datetime for a BSON datetime, with the tzinfo `tzinfo`, which
+ * may be Py_None. */
+static PyObject* datetime_from_millis(long long millis, PyObject* tzinfo) {
     /* To encode a datetime instance like datetime(9999, 12, 31, 23, 59, 59, 999999)
      * we follow these steps:
      * 1. Calculate a timestamp in seconds:       253402300799
@@ -183,17 +392,23 @@ static PyObject* datetime_from_millis(long long millis) {
      */
     int diff = (int)(((millis % 1000) + 1000) % 1000);
     int microseconds = diff * 1000;
-    Time64_T seconds = (millis - diff) / 1000;
-    struct TM timeinfo;
-    gmtime64_r(&seconds, &timeinfo);
-
-    return PyDateTime_FromDateAndTime(timeinfo.tm_year + 1900,
-                                      timeinfo.tm_mon + 1,
-                                      timeinfo.tm_mday,
-                                      timeinfo.tm_hour,
-                                      timeinfo.tm_min,
-                                      timeinfo.tm_sec,
-                                      microseconds);
+    long long seconds = (millis - diff) / 1000;
+    /* Split the seconds the same way, rounding the days down. */
+    int seconds_of_day = (int)(((seconds % 86400) + 86400) % 86400);
+    long long days = (seconds - seconds_of_day) / 86400;
+    long long year;
+    int month, day;
+
+    civil_from_days(days, &year, &month, &day);
+    /* The range of datetime.datetime. */
+    if (year < 1 || year > 9999) {
+        PyErr_SetString(PyExc_ValueError, "year is out of range");
+        return NULL;
+    }
+    return PyDateTimeAPI->DateTime_FromDateAndTime(
+        (int)year, month, day,
+        seconds_of_day / 3600, seconds_of_day % 3600 / 60, seconds_of_day % 60,
+        microseconds, tzinfo, PyDateTimeAPI->DateTimeType);
 }
 
 static long long millis_from_datetime(PyObject* datetime) {
@@ -369,7 +584,8 @@ static int _load_python_objects(PyObject* module) {
         _load_object(&state->Regex, "bson.regex", "Regex") ||
         _load_object(&state->BSONInt64, "bson.int64", "Int64") ||
         _load_object(&state->UUID, "uuid", "UUID") ||
-        _load_object(&state->Mapping, "collections", "Mapping")) {
+        _load_object(&state->Mapping, "collections", "Mapping") ||
+        _load_object(&state->SON, "bson.son", "SON")) {
         return 1;
     }
     /* Reload our REType hack too. */
@@ -402,6 +618,162 @@ static int _load_python_objects(PyObject* module) {
     return 0;
 }
 
+/* Create an instance of `cls`, ObjectId or a subclass, holding the 12
+ * bytes at `data`, without calling ObjectId.__init__.
+ *
+ * Returns a new reference or NULL on failure. */
+static PyObject* _new_object_id(PyObject* cls, const char* data) {
+    PyObject* oid;
+    PyObject* binary;
+    if (!PyType_Check(cls)) {
+        PyErr_SetString(PyExc_TypeError, "cls must be a type");
+        return NULL;
+    }
+    oid = ((PyTypeObject*)cls)->tp_alloc((PyTypeObject*)cls, 0);
+    if (!oid) {
+        return NULL;
+    }
+#if PY_MAJOR_VERSION >= 3
+    binary = PyBytes_FromStringAndSize(data, 12);
+#else
+    binary = PyString_FromStringAndSize(data, 12);
+#endif
+    if (!binary) {
+        Py_DECREF(oid);
+        return NULL;
+    }
+    if (PyObject_SetAttrString(oid, "_ObjectId__id", binary) < 0) {
+        Py_DECREF(binary);
+        Py_DECREF(oid);
+        return NULL;
+    }
+    Py_DECREF(binary);
+    return oid;
+}
+
+/* Load the machine bytes and counter of the ObjectId class.
+ *
+ * Returns 0 on failure. */
+static int _init_oid_state(struct module_state* state) {
+    PyObject* objectid_type;
+    PyObject* machine;
+    PyObject* inc;
+    const char* data;
+    unsigned long counter;
+
+    if (state->oid_initialized) {
+        return 1;
+    }
+    objectid_type = _get_object(state->ObjectId, "bson.objectid", "ObjectId");
+    if (!objectid_type) {
+        return 0;
+    }
+    machine = PyObject_GetAttrString(objectid_type, "_machine_bytes");
+    inc = PyObject_GetAttrString(objectid_type, "_inc");
+    Py_DECREF(objectid_type);
+    if (!machine || !inc) {
+        Py_XDECREF(machine);
+        Py_XDECREF(inc);
+        return 0;
+    }
+#if PY_MAJOR_VERSION >= 3
+    data = PyBytes_AsString(machine);
+#else
+    data = PyString_AsString(machine);
+#endif
+    counter = PyLong_AsUnsignedLongMask(inc);
+    if (!data || PyErr_Occurred()) {
+        Py_DECREF(machine);
+        Py_DECREF(inc);
+        return 0;
+    }
+    memcpy(state->oid_machine, data, 3);
+    state->oid_counter = counter % 0xFFFFFF;
+    state->oid_initialized = 1;
+    Py_DECREF(machine);
+    Py_DECREF(inc);
+    return 1;
+}
+
+/* Write the time, machine and process id bytes of a new ObjectId to the
+ * first 9 bytes of `oid`. */
+static void _oid_prefix(struct module_state* state, char* oid) {
+    unsigned long now = (unsigned long)time(NULL);
+    unsigned long pid = (unsigned long)getpid() % 0xFFFF;
+    oid[0] = (char)(now >> 24);
+    oid[1] = (char)(now >> 16);
+    oid[2] = (char)(now >> 8);
+    oid[3] = (char)now;
+    memcpy(oid + 4, state->oid_machine, 3);
+    oid[7] = (char)(pid >> 8);
+    oid[8] = (char)pid;
+}
+
+/* Write the 3 byte `counter` to the last bytes of `oid`. */
+static void _oid_counter(char* oid, unsigned long counter) {
+    oid[9] = (char)(counter >> 16);
+    oid[10] = (char)(counter >> 8);
+    oid[11] = (char)counter;
+}
+
+static PyObject* _cbson_generate_oid(PyObject* self, PyObject* args) {
+    struct module_state *state = GETSTATE(self);
+    char oid[12];
+
+    /* The GIL protects the counter, no lock is needed. */
+    if (!_init_oid_state(state)) {
+        return NULL;
+    }
+    _oid_prefix(state, oid);
+    _oid_counter(oid, state->oid_counter);
+    state->oid_counter = (state->oid_counter + 1) % 0xFFFFFF;
+#if PY_MAJOR_VERSION >= 3
+    return PyBytes_FromStringAndSize(oid, 12);
+#else
+    return PyString_FromStringAndSize(oid, 12);
+#endif
+}
+
+static PyObject* _cbson_generate_oids(PyObject* self, PyObject* args) {
+    struct module_state *state = GETSTATE(self);
+    PyObject* cls;
+    PyObject* result;
+    Py_ssize_t n;
+    Py_ssize_t i;
+    unsigned long start;
+    char oid[12];
+
+    if (!PyArg_ParseTuple(args, "On", &cls, &n)) {
+        return NULL;
+    }
+    if (n < 0) {
+        PyErr_SetString(PyExc_ValueError, "n must be non-negative");
+        return NULL;
+    }
+    if (!_init_oid_state(state)) {
+        return NULL;
+    }
+    /* Reserve the counter range up front. */
+    start = state->oid_counter;
+    state->oid_counter = (start + (unsigned long)n) % 0xFFFFFF;
+
+    if (!(result = PyList_New(n))) {
+        return NULL;
+    }
+    _oid_prefix(state, oid);
+    for (i = 0; i < n; i++) {
+        PyObject* value;
+        _oid_counter(oid, (start + (unsigned long)i) % 0xFFFFFF);
+        if (!(value = _new_object_id(cls, oid))) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        /* Steals the reference. */
+        PyList_SET_ITEM(result, i, value);
+    }
+    return result;
+}
+
 static int write_element_to_buffer(PyObject* self, buffer_t buffer,
                                    int type_byte, PyObject* value,
                                    unsigned char check_keys,
@@ -463,11 +835,72 @@ _set_cannot_encode(PyObject* value) {
     }
 }
 
+/* Copy the bytes of a RawBSONDocument, which are already BSON, to `buffer`.
+ *
+ * Sets exception and returns 0 on failure.
+ */
+static int write_raw_doc(buffer_t buffer, PyObject* raw_doc) {
+    Py_buffer view;
+    int ok;
+    PyObject* raw = PyObject_GetAttrString(raw_doc, "raw");
+    if (!raw) {
+        return 0;
+    }
+    if (PyObject_GetBuffer(raw, &view, PyBUF_SIMPLE) < 0) {
+        Py_DECREF(raw);
+        return 0;
+    }
+    if (view.len < BSON_MIN_SIZE || view.len > BSON_MAX_SIZE) {
+        PyObject* InvalidDocument = _error("InvalidDocument");
+        if (InvalidDocument) {
+            PyErr_SetString(InvalidDocument,
+                            "raw BSON document has an invalid size");
+            Py_DECREF(InvalidDocument);
+        }
+        ok = 0;
+    } else {
+        ok = buffer_write_bytes(buffer, (const char*)view.buf, (int)view.len);
+    }
+    PyBuffer_Release(&view);
+    Py_DECREF(raw);
+    return ok;
+}
+
 /*
  * Encode a builtin Python regular expression or our custom Regex class.
  *
  * Sets exception and returns 0 on failure.
  */
+#if PY_MAJOR_VERSION >= 3 || PY_MINOR_VERSION >= 7
+/* Write a memoryview, like those decoded with binary_as_memoryview, as BSON
+ * binary subtype 0.
+ */
+static int _write_memoryview_to_buffer(
+    buffer_t buffer, int type_byte, PyObject* value) {
+    Py_buffer view;
+    int size;
+    char subtype = 0;
+    int result = 0;
+
+    if (PyObject_GetBuffer(value, &view, PyBUF_SIMPLE) == -1) {
+        return 0;
+    }
+    if ((size = _downcast_and_check(view.len, 0)) == -1) {
+        goto done;
+    }
+    *(buffer_get_buffer(buffer) + type_byte) = 0x05;
+    if (!buffer_write_bytes(buffer, (const char*)&size, 4) ||
+        !buffer_write_bytes(buffer, &subtype, 1) ||
+        !buffer_write_bytes(buffer, (const char*)view.buf, size)) {
+        goto done;
+    }
+    result = 1;
+done:
+    PyBuffer_Release(&view);
+    return result;
+}
+#endif
+
 static int _write_regex_to_buffer(
     buffer_t buffer, int type_byte, PyObject* value) {
 
@@ -586,6 +1019,27 @@ static int _write_regex_to_buffer(
     return 1;
 }
 
+/* Is `value` an instance of one of the builtin types encoded below, and
+ * not of a subclass? Such values can't have a _type_marker attribute, so
+ * looking it up, which raises and clears an AttributeError, is skipped. */
+static int _is_builtin_value(PyObject* value) {
+    return (value == Py_None ||
+            PyBool_Check(value) ||
+            PyFloat_CheckExact(value) ||
+#if PY_MAJOR_VERSION < 3
+            PyInt_CheckExact(value) ||
+            PyString_CheckExact(value) ||
+#else
+            PyBytes_CheckExact(value) ||
+#endif
+            PyLong_CheckExact(value) ||
+            PyUnicode_CheckExact(value) ||
+            PyDict_CheckExact(value) ||
+            PyList_CheckExact(value) ||
+            PyTuple_CheckExact(value) ||
+            PyDateTime_CheckExact(value));
+}
+
 /* TODO our platform better be little-endian w/ 4-byte ints! */
 /* Write a single value to the buffer (also write its type_byte, for which
  * space has already been reserved.
@@ -605,7 +1059,8 @@ static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
      * problems with python sub interpreters. Our custom types should
      * have a _type_marker attribute, which we can switch on instead.
      */
-    if (PyObject_HasAttrString(value, "_type_marker")) {
+    if (!_is_builtin_value(value) &&
+        PyObject_HasAttrString(value, "_type_marker")) {
         type_marker = PyObject_GetAttrString(value, "_type_marker");
         if (type_marker == NULL) {
             return 0;
@@ -830,6 +1285,12 @@ static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
                 *(buffer_get_buffer(buffer) + type_byte) = 0x12;
                 return 1;
             }
+        case RAW_BSON_DOCUMENT_MARKER:
+            {
+                /* RawBSONDocument, copied verbatim. */
+                *(buffer_get_buffer(buffer) + type_byte) = 0x03;
+                return write_raw_doc(buffer, value);
+            }
         case 100:
             {
                 /* DBRef */
@@ -1065,6 +1526,10 @@ static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
         return buffer_write_bytes(buffer, (const char*)&millis, 8);
     } else if (PyObject_TypeCheck(value, state->REType)) {
         return _write_regex_to_buffer(buffer, type_byte, value);
+#if PY_MAJOR_VERSION >= 3 || PY_MINOR_VERSION >= 7
+    } else if (PyMemoryView_Check(value)) {
+        return _write_memoryview_to_buffer(buffer, type_byte, value);
+#endif
     }
     
     /* 
@@ -1242,11 +1707,23 @@ int decode_and_write_pair(PyObject* self, buffer_t buffer,
     const char* data;
     int size;
     if (PyUnicode_Check(key)) {
+#if PY_VERSION_HEX >= 0x03030000
+        /* Python caches the UTF-8 form on the key, so a key shared by many
+         * documents isn't encoded to a new bytes object for each of them. */
+        Py_ssize_t utf8_size;
+        if (!(data = PyUnicode_AsUTF8AndSize(key, &utf8_size))) {
+            return 0;
+        }
+        if ((size = _downcast_and_check(utf8_size, 1)) == -1) {
+            return 0;
+        }
+        encoded = key;
+        Py_INCREF(encoded);
+#elif PY_MAJOR_VERSION >= 3
         encoded = PyUnicode_AsUTF8String(key);
         if (!encoded) {
             return 0;
         }
-#if PY_MAJOR_VERSION >= 3
         if (!(data = PyBytes_AS_STRING(encoded))) {
             Py_DECREF(encoded);
             return 0;
@@ -1256,6 +1733,10 @@ int decode_and_write_pair(PyObject* self, buffer_t buffer,
             return 0;
         }
 #else
+        encoded = PyUnicode_AsUTF8String(key);
+        if (!encoded) {
+            return 0;
+        }
         if (!(data = PyString_AS_STRING(encoded))) {
             Py_DECREF(encoded);
             return 0;
@@ -1359,6 +1840,134 @@ int decode_and_write_pair(PyObject* self, buffer_t buffer,
     return 1;
 }
 
+/* Is `key` the string "_id"? */
+static int _is_id_key(PyObject* key) {
+#if PY_MAJOR_VERSION >= 3
+    return PyUnicode_Check(key) &&
+        PyUnicode_CompareWithASCIIString(key, "_id") == 0;
+#else
+    if (PyString_Check(key)) {
+        return PyString_GET_SIZE(key) == 3 &&
+            !memcmp(PyString_AS_STRING(key), "_id", 3);
+    }
+    if (PyUnicode_Check(key)) {
+        Py_UNICODE* data = PyUnicode_AS_UNICODE(key);
+        return PyUnicode_GET_SIZE(key) == 3 &&
+            data[0] == '_' && data[1] == 'i' && data[2] == 'd';
+    }
+    return 0;
+#endif
+}
+
+/* Write `dict` using the element names of a compiled encoder.
+ *
+ * `keys` is the tuple of keys, other than _id, that `dict` must have in
+ * order and `names` the tuple of those keys encoded as BSON element names.
+ *
+ * Returns 1 on success, 0 on failure and -1, without an exception set, if
+ * `dict` doesn't have those keys. */
+static int write_compiled_dict(PyObject* self, buffer_t buffer,
+                               PyObject* dict, PyObject* keys,
+                               PyObject* names, unsigned char check_keys,
+                               const codec_options_t* options) {
+    PyObject* key;
+    PyObject* value;
+    PyObject* _id;
+    Py_ssize_t pos = 0;
+    Py_ssize_t i = 0;
+    Py_ssize_t count = PyTuple_GET_SIZE(keys);
+    char zero = 0;
+    int length;
+    int length_location;
+
+    if (!PyDict_CheckExact(dict) || PyTuple_GET_SIZE(names) != count) {
+        return -1;
+    }
+    /* PyDict_GetItemString returns a borrowed reference. */
+    _id = PyDict_GetItemString(dict, "_id");
+    if (PyDict_Size(dict) - (_id ? 1 : 0) != count) {
+        return -1;
+    }
+
+    length_location = buffer_save_space(buffer, 4);
+    if (length_location == -1) {
+        PyErr_NoMemory();
+        return 0;
+    }
+    if (_id && !write_pair(self, buffer, "_id", 3,
+                           _id, check_keys, options, 1)) {
+        return 0;
+    }
+    while (PyDict_Next(dict, &pos, &key, &value)) {
+        PyObject* expected;
+        PyObject* name;
+        int type_byte;
+        int equal;
+
+        if (i == count) {
+            if (_id && _is_id_key(key)) {
+                continue;
+            }
+            return -1;
+        }
+        expected = PyTuple_GET_ITEM(keys, i);
+        equal = (key == expected);
+        if (!equal) {
+            equal = PyObject_RichCompareBool(key, expected, Py_EQ);
+            if (equal < 0) {
+                return 0;
+            }
+        }
+        if (!equal) {
+            if (_id && _is_id_key(key)) {
+                continue;
+            }
+            return -1;
+        }
+
+        name = PyTuple_GET_ITEM(names, i++);
+#if PY_MAJOR_VERSION >= 3
+        if (!PyBytes_Check(name)) {
+#else
+        if (!PyString_Check(name)) {
+#endif
+            PyErr_SetString(PyExc_TypeError, "names must be bytes");
+            return 0;
+        }
+        type_byte = buffer_save_space(buffer, 1);
+        if (type_byte == -1) {
+            PyErr_NoMemory();
+            return 0;
+        }
+#if PY_MAJOR_VERSION >= 3
+        if (!buffer_write_bytes(buffer, PyBytes_AS_STRING(name),
+                                (int)PyBytes_GET_SIZE(name))) {
+#else
+        if (!buffer_write_bytes(buffer, PyString_AS_STRING(name),
+                                (int)PyString_GET_SIZE(name))) {
+#endif
+            return 0;
+        }
+        /* PyDict_Next returns a borrowed reference. Hold on to it in case
+         * encoding the value changes the dict. */
+        Py_INCREF(value);
+        if (!write_element_to_buffer(self, buffer, type_byte,
+                                     value, check_keys, options)) {
+            Py_DECREF(value);
+            return 0;
+        }
+        Py_DECREF(value);
+    }
+
+    /* write null byte and fill in length */
+    if (!buffer_write_bytes(buffer, &zero, 1)) {
+        return 0;
+    }
+    length = buffer_get_position(buffer) - length_location;
+    memcpy(buffer_get_buffer(buffer) + length_location, &length, 4);
+    return 1;
+}
+
 /* returns 0 on failure */
 int write_dict(PyObject* self, buffer_t buffer,
                PyObject* dict, unsigned char check_keys,
@@ -1369,9 +1978,12 @@ int write_dict(PyObject* self, buffer_t buffer,
     int length;
     int length_location;
     struct module_state *state = GETSTATE(self);
-    PyObject* mapping_type = _get_object(state->Mapping,
-                                         "collections", "Mapping");
+    PyObject* mapping_type = NULL;
 
+    /* A dict is a Mapping, skip the slow isinstance check on the ABC. */
+    if (!PyDict_Check(dict)) {
+        mapping_type = _get_object(state->Mapping, "collections", "Mapping");
+    }
     if (mapping_type) {
         if (!PyObject_IsInstance(dict, mapping_type)) {
             PyObject* repr;
@@ -1417,6 +2029,31 @@ int write_dict(PyObject* self, buffer_t buffer,
         }
     }
 
+    /* Raw documents are already BSON, keys and all. */
+    if (!PyDict_Check(dict)) {
+        long type_marker = _type_marker(dict);
+        if (type_marker < 0) {
+            return 0;
+        }
+        if (type_marker == RAW_BSON_DOCUMENT_MARKER) {
+            return write_raw_doc(buffer, dict);
+        }
+    }
+
+    /* Use the compiled encoder of the codec options if the keys match. */
+    if (top_level && options->compiled_keys &&
+        (options->compiled_valid_keys || !check_keys)) {
+        int start = buffer_get_position(buffer);
+        int status = write_compiled_dict(self, buffer, dict,
+                                         options->compiled_keys,
+                                         options->compiled_names,
+                                         check_keys, options);
+        if (status != -1) {
+            return status;
+        }
+        buffer_update_position(buffer, start);
+    }
+
     length_location = buffer_save_space(buffer, 4);
     if (length_location == -1) {
         PyErr_NoMemory();
@@ -1487,10 +2124,379 @@ int write_dict(PyObject* self, buffer_t buffer,
     return 1;
 }
 
-static PyObject* _cbson_dict_to_bson(PyObject* self, PyObject* args) {
-    PyObject* dict;
-    PyObject* result;
-    unsigned char check_keys;
+static long _encoded_size(PyObject* self, PyObject* dict,
+                          const codec_options_t* options);
+
+/* Get the length of `unicode` encoded to UTF-8.
+ *
+ * Returns -1 on failure. */
+static Py_ssize_t _utf8_size(PyObject* unicode) {
+#if PY_MAJOR_VERSION >= 3 && PY_MINOR_VERSION >= 3
+    Py_ssize_t size;
+    if (!PyUnicode_AsUTF8AndSize(unicode, &size)) {
+        return -1;
+    }
+    return size;
+#else
+    Py_ssize_t size;
+    PyObject* encoded = PyUnicode_AsUTF8String(unicode);
+    if (!encoded) {
+        return -1;
+    }
+#if PY_MAJOR_VERSION >= 3
+    size = PyBytes_GET_SIZE(encoded);
+#else
+    size = PyString_GET_SIZE(encoded);
+#endif
+    Py_DECREF(encoded);
+    return size;
+#endif
+}
+
+/* Get the size of a value of a type that _value_encoded_size doesn't know,
+ * by encoding it to a scratch buffer.
+ *
+ * Returns -1 on failure. */
+static long _other_encoded_size(PyObject* self, PyObject* value,
+                                const codec_options_t* options) {
+    long size;
+    int type_byte;
+    buffer_t buffer = buffer_new();
+    if (!buffer) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    type_byte = buffer_save_space(buffer, 1);
+    if (type_byte == -1) {
+        PyErr_NoMemory();
+        buffer_free(buffer);
+        return -1;
+    }
+    if (!write_element_to_buffer(self, buffer, type_byte, value, 0, options)) {
+        buffer_free(buffer);
+        return -1;
+    }
+    /* Don't count the type byte. */
+    size = buffer_get_position(buffer) - 1;
+    buffer_free(buffer);
+    return size;
+}
+
+/* Get the size of `value` encoded to BSON, without its type byte and name.
+ *
+ * Returns -1 on failure. */
+static long _value_encoded_size(PyObject* self, PyObject* value,
+                                const codec_options_t* options) {
+    struct module_state *state = GETSTATE(self);
+    PyObject* mapping_type;
+    long type_marker;
+    int is_mapping;
+
+    /* Exact checks only: subclasses, like Int64, may be encoded differently
+     * from their base type. */
+    if (PyBool_Check(value)) {
+        return 1;
+    } else if (PyFloat_CheckExact(value)) {
+        return 8;
+    } else if (value == Py_None) {
+        return 0;
+#if PY_MAJOR_VERSION >= 3
+    } else if (PyLong_CheckExact(value)) {
+        int overflow;
+        long long long_long_value = PyLong_AsLongLongAndOverflow(value,
+                                                                 &overflow);
+        if (long_long_value == -1 && PyErr_Occurred()) {
+            return -1;
+        }
+        if (overflow) {
+            /* Raises OverflowError. */
+            return _other_encoded_size(self, value, options);
+        }
+        if (long_long_value >= INT_MIN && long_long_value <= INT_MAX) {
+            return 4;
+        }
+        return 8;
+    } else if (PyBytes_CheckExact(value)) {
+        /* Binary subtype 0. */
+        return (long)PyBytes_GET_SIZE(value) + 5;
+#else
+    } else if (PyInt_CheckExact(value)) {
+        long long_value = PyInt_AS_LONG(value);
+        if (long_value >= INT_MIN && long_value <= INT_MAX) {
+            return 4;
+        }
+        return 8;
+    } else if (PyLong_CheckExact(value)) {
+        /* Raises OverflowError if the value doesn't fit. */
+        return _other_encoded_size(self, value, options);
+    } else if (PyString_CheckExact(value)) {
+        return (long)PyString_GET_SIZE(value) + 5;
+#endif
+    } else if (PyUnicode_CheckExact(value)) {
+        Py_ssize_t size = _utf8_size(value);
+        if (size == -1) {
+            return -1;
+        }
+        return (long)size + 5;
+    } else if (PyDict_CheckExact(value)) {
+        return _encoded_size(self, value, options);
+    } else if (PyList_CheckExact(value) || PyTuple_CheckExact(value)) {
+        Py_ssize_t items;
+        Py_ssize_t i;
+        long size = 5;
+        char name[16];
+        items = PySequence_Size(value);
+        for (i = 0; i < items; i++) {
+            long item_size;
+            /* Borrowed reference. */
+            PyObject* item = PySequence_Fast_GET_ITEM(value, i);
+            if (Py_EnterRecursiveCall(" while sizing an object as BSON ")) {
+                return -1;
+            }
+            item_size = _value_encoded_size(self, item, options);
+            Py_LeaveRecursiveCall();
+            if (item_size == -1) {
+                return -1;
+            }
+            /* Type byte, then the index as a name. */
+            INT2STRING(name, (int)i);
+            size += 2 + (long)strlen(name) + item_size;
+        }
+        return size;
+    } else if (PyDateTime_CheckExact(value)) {
+        return 8;
+    }
+
+    type_marker = _type_marker(value);
+    if (type_marker < 0) {
+        return -1;
+    }
+    switch (type_marker) {
+    case 5:
+        {
+            /* Binary */
+            long subtype;
+            Py_ssize_t size;
+            PyObject* subtype_object = PyObject_GetAttrString(value, "subtype");
+            if (!subtype_object) {
+                return -1;
+            }
+#if PY_MAJOR_VERSION >= 3
+            subtype = PyLong_AsLong(subtype_object);
+#else
+            subtype = PyInt_AsLong(subtype_object);
+#endif
+            Py_DECREF(subtype_object);
+            if (subtype == -1 && PyErr_Occurred()) {
+                return -1;
+            }
+            if ((size = PyObject_Size(value)) == -1) {
+                return -1;
+            }
+            /* The old binary subtype repeats the length. */
+            return (long)size + (subtype == 2 ? 9 : 5);
+        }
+    case 7:
+        /* ObjectId */
+        return 12;
+    case 17:
+    case 18:
+        /* Timestamp, Int64 */
+        return 8;
+    case 127:
+    case 255:
+        /* MaxKey, MinKey */
+        return 0;
+    case RAW_BSON_DOCUMENT_MARKER:
+        return _encoded_size(self, value, options);
+    }
+
+    mapping_type = _get_object(state->Mapping, "collections", "Mapping");
+    if (!mapping_type) {
+        return -1;
+    }
+    is_mapping = PyObject_IsInstance(value, mapping_type);
+    Py_DECREF(mapping_type);
+    if (is_mapping == -1) {
+        return -1;
+    }
+    if (is_mapping) {
+        return _encoded_size(self, value, options);
+    }
+    return _other_encoded_size(self, value, options);
+}
+
+/* Get the size of a key name encoded to BSON, with its NUL terminator.
+ *
+ * Returns -1 on failure. */
+static long _key_encoded_size(PyObject* key) {
+    if (PyUnicode_Check(key)) {
+        Py_ssize_t size = _utf8_size(key);
+        if (size == -1) {
+            return -1;
+        }
+        return (long)size + 1;
+#if PY_MAJOR_VERSION < 3
+    } else if (PyString_Check(key)) {
+        return (long)PyString_GET_SIZE(key) + 1;
+#endif
+    } else {
+        PyObject* InvalidDocument = _error("InvalidDocument");
+        if (InvalidDocument) {
+            PyObject* repr = PyObject_Repr(key);
+            if (repr) {
+#if PY_MAJOR_VERSION >= 3
+                PyObject* errmsg = PyUnicode_FromFormat(
+                    "documents must have only string keys, key was %U", repr);
+#else
+                PyObject* errmsg = PyString_FromFormat(
+                    "documents must have only string keys, key was %s",
+                    PyString_AS_STRING(repr));
+#endif
+                if (errmsg) {
+                    PyErr_SetObject(InvalidDocument, errmsg);
+                    Py_DECREF(errmsg);
+                }
+                Py_DECREF(repr);
+            }
+            Py_DECREF(InvalidDocument);
+        }
+        return -1;
+    }
+}
+
+/* Get the size of the document `dict` encoded to BSON, without encoding it.
+ *
+ * Returns -1 on failure. */
+static long _encoded_size(PyObject* self, PyObject* dict,
+                          const codec_options_t* options) {
+    struct module_state *state = GETSTATE(self);
+    PyObject* key;
+    PyObject* value;
+    PyObject* iter;
+    PyObject* mapping_type;
+    long type_marker;
+    int is_mapping;
+    long size = 5;
+
+    if (PyDict_Check(dict)) {
+        Py_ssize_t pos = 0;
+        /* Borrowed references. */
+        while (PyDict_Next(dict, &pos, &key, &value)) {
+            long key_size;
+            long value_size;
+            if ((key_size = _key_encoded_size(key)) == -1) {
+                return -1;
+            }
+            if (Py_EnterRecursiveCall(" while sizing an object as BSON ")) {
+                return -1;
+            }
+            value_size = _value_encoded_size(self, value, options);
+            Py_LeaveRecursiveCall();
+            if (value_size == -1) {
+                return -1;
+            }
+            size += 1 + key_size + value_size;
+        }
+        return size;
+    }
+
+    type_marker = _type_marker(dict);
+    if (type_marker < 0) {
+        return -1;
+    }
+    if (type_marker == RAW_BSON_DOCUMENT_MARKER) {
+        Py_ssize_t raw_size;
+        PyObject* raw = PyObject_GetAttrString(dict, "raw");
+        if (!raw) {
+            return -1;
+        }
+        raw_size = PyObject_Size(raw);
+        Py_DECREF(raw);
+        return (long)raw_size;
+    }
+
+    mapping_type = _get_object(state->Mapping, "collections", "Mapping");
+    if (!mapping_type) {
+        return -1;
+    }
+    is_mapping = PyObject_IsInstance(dict, mapping_type);
+    Py_DECREF(mapping_type);
+    if (is_mapping == -1) {
+        return -1;
+    }
+    if (!is_mapping) {
+        /* Let write_dict raise the right error. */
+        buffer_t buffer = buffer_new();
+        if (!buffer) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        write_dict(self, buffer, dict, 0, options, 1);
+        buffer_free(buffer);
+        return -1;
+    }
+
+    iter = PyObject_GetIter(dict);
+    if (iter == NULL) {
+        return -1;
+    }
+    while ((key = PyIter_Next(iter)) != NULL) {
+        long key_size;
+        long value_size;
+        if ((key_size = _key_encoded_size(key)) == -1) {
+            Py_DECREF(key);
+            Py_DECREF(iter);
+            return -1;
+        }
+        value = PyObject_GetItem(dict, key);
+        Py_DECREF(key);
+        if (!value) {
+            Py_DECREF(iter);
+            return -1;
+        }
+        if (Py_EnterRecursiveCall(" while sizing an object as BSON ")) {
+            Py_DECREF(value);
+            Py_DECREF(iter);
+            return -1;
+        }
+        value_size = _value_encoded_size(self, value, options);
+        Py_LeaveRecursiveCall();
+        Py_DECREF(value);
+        if (value_size == -1) {
+            Py_DECREF(iter);
+            return -1;
+        }
+        size += 1 + key_size + value_size;
+    }
+    Py_DECREF(iter);
+    if (PyErr_Occurred()) {
+        return -1;
+    }
+    return size;
+}
+
+static PyObject* _cbson_encoded_size(PyObject* self, PyObject* args) {
+    PyObject* dict;
+    codec_options_t options;
+    long size;
+
+    if (!PyArg_ParseTuple(args, "OO&", &dict,
+                          convert_codec_options, &options)) {
+        return NULL;
+    }
+    size = _encoded_size(self, dict, &options);
+    destroy_codec_options(&options);
+    if (size == -1) {
+        return NULL;
+    }
+    return PyLong_FromLong(size);
+}
+
+static PyObject* _cbson_dict_to_bson(PyObject* self, PyObject* args) {
+    PyObject* dict;
+    PyObject* result;
+    unsigned char check_keys;
     unsigned char top_level = 1;
     codec_options_t options;
     buffer_t buffer;
@@ -1499,7 +2505,7 @@ static PyObject* _cbson_dict_to_bson(PyObject* self, PyObject* args) {
                           convert_codec_options, &options, &top_level)) {
         return NULL;
     }
-    buffer = buffer_new();
+    buffer = buffer_new_with_size(GETSTATE(self)->last_encoded_size);
     if (!buffer) {
         destroy_codec_options(&options);
         PyErr_NoMemory();
@@ -1511,6 +2517,7 @@ static PyObject* _cbson_dict_to_bson(PyObject* self, PyObject* args) {
         buffer_free(buffer);
         return NULL;
     }
+    GETSTATE(self)->last_encoded_size = buffer_get_position(buffer);
 
     /* objectify buffer */
 #if PY_MAJOR_VERSION >= 3
@@ -1525,6 +2532,140 @@ static PyObject* _cbson_dict_to_bson(PyObject* self, PyObject* args) {
     return result;
 }
 
+static PyObject* _cbson_encode_many(PyObject* self, PyObject* args) {
+    PyObject* docs;
+    PyObject* iter;
+    PyObject* doc;
+    PyObject* offsets;
+    PyObject* offset;
+    PyObject* result = NULL;
+    unsigned char check_keys;
+    codec_options_t options;
+    buffer_t buffer;
+    int last_size = 0;
+
+    if (!PyArg_ParseTuple(args, "ObO&", &docs, &check_keys,
+                          convert_codec_options, &options)) {
+        return NULL;
+    }
+    if (!(iter = PyObject_GetIter(docs))) {
+        destroy_codec_options(&options);
+        return NULL;
+    }
+    if (!(offsets = PyList_New(0))) {
+        Py_DECREF(iter);
+        destroy_codec_options(&options);
+        return NULL;
+    }
+    buffer = buffer_new();
+    if (!buffer) {
+        PyErr_NoMemory();
+        goto fail;
+    }
+
+    /* The offset of the first document, and then of the end of each. */
+    if (!(offset = Py_BuildValue("i", 0))) {
+        goto fail;
+    }
+    if (PyList_Append(offsets, offset) < 0) {
+        Py_DECREF(offset);
+        goto fail;
+    }
+    Py_DECREF(offset);
+    while ((doc = PyIter_Next(iter))) {
+        int start = buffer_get_position(buffer);
+        int ok;
+        /* Make room for a document as large as the previous one. */
+        if (buffer_reserve(buffer, last_size)) {
+            Py_DECREF(doc);
+            PyErr_NoMemory();
+            goto fail;
+        }
+        ok = write_dict(self, buffer, doc, check_keys, &options, 1);
+        Py_DECREF(doc);
+        if (!ok) {
+            goto fail;
+        }
+        last_size = buffer_get_position(buffer) - start;
+        if (!(offset = Py_BuildValue("i", buffer_get_position(buffer)))) {
+            goto fail;
+        }
+        ok = PyList_Append(offsets, offset);
+        Py_DECREF(offset);
+        if (ok < 0) {
+            goto fail;
+        }
+    }
+    if (PyErr_Occurred()) {
+        goto fail;
+    }
+
+#if PY_MAJOR_VERSION >= 3
+    result = Py_BuildValue("y#O", buffer_get_buffer(buffer),
+                           buffer_get_position(buffer), offsets);
+#else
+    result = Py_BuildValue("s#O", buffer_get_buffer(buffer),
+                           buffer_get_position(buffer), offsets);
+#endif
+
+fail:
+    if (buffer) {
+        buffer_free(buffer);
+    }
+    Py_DECREF(offsets);
+    Py_DECREF(iter);
+    destroy_codec_options(&options);
+    return result;
+}
+
+static PyObject* _cbson_encode_compiled(PyObject* self, PyObject* args) {
+    PyObject* dict;
+    PyObject* keys;
+    PyObject* names;
+    PyObject* result;
+    unsigned char check_keys;
+    codec_options_t options;
+    buffer_t buffer;
+    int status;
+
+    if (!PyArg_ParseTuple(args, "OO!O!bO&", &dict, &PyTuple_Type, &keys,
+                          &PyTuple_Type, &names, &check_keys,
+                          convert_codec_options, &options)) {
+        return NULL;
+    }
+    buffer = buffer_new_with_size(GETSTATE(self)->last_compiled_size);
+    if (!buffer) {
+        destroy_codec_options(&options);
+        PyErr_NoMemory();
+        return NULL;
+    }
+
+    status = write_compiled_dict(self, buffer, dict, keys, names,
+                                 check_keys, &options);
+    if (status == 0) {
+        destroy_codec_options(&options);
+        buffer_free(buffer);
+        return NULL;
+    }
+    if (status == -1) {
+        destroy_codec_options(&options);
+        buffer_free(buffer);
+        Py_RETURN_NONE;
+    }
+    GETSTATE(self)->last_compiled_size = buffer_get_position(buffer);
+
+#if PY_MAJOR_VERSION >= 3
+    result = Py_BuildValue("y#", buffer_get_buffer(buffer),
+                           buffer_get_position(buffer));
+#else
+    result = Py_BuildValue("s#", buffer_get_buffer(buffer),
+                           buffer_get_position(buffer));
+#endif
+    destroy_codec_options(&options);
+    buffer_free(buffer);
+    return result;
+}
+
 static PyObject* get_value(PyObject* self, const char* buffer,
                            unsigned* position, unsigned char type,
                            unsigned max, const codec_options_t* options) {
@@ -1582,6 +2723,17 @@ static PyObject* get_value(PyObject* self, const char* buffer,
             if (buffer[*position + size - 1]) {
                 goto invalid;
             }
+            /* Raw documents are decoded lazily, by the document itself. */
+            if (options->is_raw_bson) {
+                value = PyObject_CallFunction(
+                    options->document_class, BYTES_FORMAT_STRING "O",
+                    buffer + *position, size, options->options_obj);
+                if (!value) {
+                    goto invalid;
+                }
+                *position += size;
+                break;
+            }
             value = elements_to_dict(self, buffer + *position + 4,
                                      size - 5, options);
             if (!value) {
@@ -1714,8 +2866,20 @@ static PyObject* get_value(PyObject* self, const char* buffer,
             if (subtype == 2 && length < 4) {
                 goto invalid;
             }
-#if PY_MAJOR_VERSION >= 3
-            /* Python3 special case. Decode BSON binary subtype 0 to bytes. */
+            /* A slice of the data being decoded, no copy is made. */
+            if (subtype == 0 && options->binary_base) {
+                Py_ssize_t start = (buffer + *position -
+                                    options->binary_base_start);
+                value = PySequence_GetSlice(options->binary_base,
+                                            start, start + length);
+                if (!value) {
+                    goto invalid;
+                }
+                *position += length;
+                break;
+            }
+#if PY_MAJOR_VERSION >= 3
+            /* Python3 special case. Decode BSON binary subtype 0 to bytes. */
             if (subtype == 0) {
                 value = PyBytes_FromStringAndSize(buffer + *position, length);
                 *position += length;
@@ -1837,11 +3001,7 @@ static PyObject* get_value(PyObject* self, const char* buffer,
                 goto invalid;
             }
             if ((objectid_type = _get_object(state->ObjectId, "bson.objectid", "ObjectId"))) {
-#if PY_MAJOR_VERSION >= 3
-                value = PyObject_CallFunction(objectid_type, "y#", buffer + *position, 12);
-#else
-                value = PyObject_CallFunction(objectid_type, "s#", buffer + *position, 12);
-#endif
+                value = _new_object_id(objectid_type, buffer + *position);
                 Py_DECREF(objectid_type);
             }
             *position += 12;
@@ -1855,55 +3015,27 @@ static PyObject* get_value(PyObject* self, const char* buffer,
         }
     case 9:
         {
-            PyObject* utc_type;
-            PyObject* naive;
-            PyObject* replace;
-            PyObject* args;
-            PyObject* kwargs;
             long long millis;
             if (max < 8) {
                 goto invalid;
             }
             memcpy(&millis, buffer + *position, 8);
-            naive = datetime_from_millis(millis);
             *position += 8;
-            if (!options->tz_aware) { /* In the naive case, we're done here. */
-                value = naive;
-                break;
-            }
-
-            if (!naive) {
-                goto invalid;
-            }
-            replace = PyObject_GetAttrString(naive, "replace");
-            Py_DECREF(naive);
-            if (!replace) {
-                goto invalid;
-            }
-            args = PyTuple_New(0);
-            if (!args) {
-                Py_DECREF(replace);
-                goto invalid;
-            }
-            kwargs = PyDict_New();
-            if (!kwargs) {
-                Py_DECREF(replace);
-                Py_DECREF(args);
-                goto invalid;
-            }
-            utc_type = _get_object(state->UTC, "bson.tz_util", "utc");
-            if (!utc_type || PyDict_SetItemString(kwargs, "tzinfo", utc_type) == -1) {
-                Py_DECREF(replace);
-                Py_DECREF(args);
-                Py_DECREF(kwargs);
-                Py_XDECREF(utc_type);
-                goto invalid;
+            if (options->datetime_as_millis) {
+#if PY_MAJOR_VERSION >= 3
+                value = PyLong_FromLongLong(millis);
+#else
+                /* An int when it fits, like the pure Python decoder. */
+                if (millis >= LONG_MIN && millis <= LONG_MAX) {
+                    value = PyInt_FromLong((long)millis);
+                } else {
+                    value = PyLong_FromLongLong(millis);
+                }
+#endif
+            } else {
+                value = datetime_from_millis(
+                    millis, options->tz_aware ? state->UTC : Py_None);
             }
-            Py_XDECREF(utc_type);
-            value = PyObject_Call(replace, args, kwargs);
-            Py_DECREF(replace);
-            Py_DECREF(args);
-            Py_DECREF(kwargs);
             break;
         }
     case 11:
@@ -1988,11 +3120,7 @@ static PyObject* get_value(PyObject* self, const char* buffer,
             *position += coll_length;
 
             if ((objectid_type = _get_object(state->ObjectId, "bson.objectid", "ObjectId"))) {
-#if PY_MAJOR_VERSION >= 3
-                id = PyObject_CallFunction(objectid_type, "y#", buffer + *position, 12);
-#else
-                id = PyObject_CallFunction(objectid_type, "s#", buffer + *position, 12);
-#endif
+                id = _new_object_id(objectid_type, buffer + *position);
                 Py_DECREF(objectid_type);
             }
             if (!id) {
@@ -2238,11 +3366,194 @@ static PyObject* get_value(PyObject* self, const char* buffer,
     return NULL;
 }
 
+static void _free_key_cache(struct module_state* state) {
+    unsigned i;
+    key_cache_entry_t* cache = state->key_cache;
+    unsigned size = state->key_cache_size;
+    state->key_cache = NULL;
+    state->key_cache_size = 0;
+    for (i = 0; i < size; i++) {
+        Py_XDECREF(cache[i].key);
+    }
+    free(cache);
+}
+
+/* Replace the key cache with an empty cache of `size` entries, a power of 2
+ * or 0 to disable the cache.
+ *
+ * Returns 0 and sets MemoryError on failure.
+ */
+static int _reset_key_cache(struct module_state* state, unsigned size) {
+    key_cache_entry_t* cache = NULL;
+    if (size) {
+        cache = (key_cache_entry_t*)calloc(size, sizeof(key_cache_entry_t));
+        if (!cache) {
+            PyErr_NoMemory();
+            return 0;
+        }
+    }
+    _free_key_cache(state);
+    state->key_cache = cache;
+    state->key_cache_size = size;
+    return 1;
+}
+
+/* Decode the UTF-8 key of a BSON element, returning a new reference.
+ *
+ * Short keys are looked up in the key cache by their raw bytes, so that
+ * decoding the same keys over and over only creates one string object for
+ * each of them.
+ */
+static PyObject* _decode_key(PyObject* self, const char* name,
+                             size_t length) {
+    struct module_state *state = GETSTATE(self);
+    key_cache_entry_t* entry;
+    PyObject* key;
+    unsigned hash = 2166136261u;
+    size_t i;
+
+    if (!state->key_cache_size || length > KEY_CACHE_MAX_KEY_LENGTH) {
+        return PyUnicode_DecodeUTF8(name, length, "strict");
+    }
+    /* FNV-1a */
+    for (i = 0; i < length; i++) {
+        hash = (hash ^ (unsigned char)name[i]) * 16777619u;
+    }
+    /* Each key can go in either entry of a pair of entries. */
+    entry = &state->key_cache[hash & (state->key_cache_size - 1) & ~1u];
+    for (i = 0; i < 2; i++) {
+        if (entry[i].key && entry[i].length == length &&
+                !memcmp(entry[i].bytes, name, length)) {
+            Py_INCREF(entry[i].key);
+            return entry[i].key;
+        }
+    }
+    key = PyUnicode_DecodeUTF8(name, length, "strict");
+    if (!key) {
+        return NULL;
+    }
+    /* Evict the least recently added key of the pair. */
+    Py_XDECREF(entry[1].key);
+    entry[1] = entry[0];
+    Py_INCREF(key);
+    entry[0].key = key;
+    entry[0].length = length;
+    memcpy(entry[0].bytes, name, length);
+    return key;
+}
+
+/* Create an empty document to decode a BSON document into.
+ *
+ * dict, SON and OrderedDict (when it is implemented in C) documents are
+ * filled directly by _set_item. If the document class has a
+ * _from_bson_items method, the document is a list of (key, value) tuples
+ * which _finish_document passes to that method. Other document classes are
+ * called with no arguments and filled with PyObject_SetItem.
+ *
+ * For SON, *son_keys is set to a new reference to its list of keys. The
+ * SON is created without calling SON.__new__ or SON.__init__.
+ *
+ * Returns a new reference or NULL on failure. */
+static PyObject* _new_document(PyObject* self,
+                               const codec_options_t* options,
+                               PyObject** son_keys) {
+    PyObject* document_class = options->document_class;
+    PyObject* document;
+    PyObject* empty;
+
+    *son_keys = NULL;
+    if (options->from_items) {
+        return PyList_New(0);
+    }
+    if (document_class == (PyObject*)&PyDict_Type) {
+        return PyDict_New();
+    }
+#if PY_VERSION_HEX >= 0x03050000
+    if (document_class == (PyObject*)&PyODict_Type) {
+        return PyODict_New();
+    }
+#endif
+    if (document_class != GETSTATE(self)->SON) {
+        return PyObject_CallObject(document_class, NULL);
+    }
+
+    empty = PyTuple_New(0);
+    if (!empty) {
+        return NULL;
+    }
+    document = PyDict_Type.tp_new((PyTypeObject*)document_class, empty, NULL);
+    Py_DECREF(empty);
+    if (!document) {
+        return NULL;
+    }
+    *son_keys = PyList_New(0);
+    if (!*son_keys ||
+        PyObject_SetAttrString(document, "_SON__keys", *son_keys) < 0) {
+        Py_CLEAR(*son_keys);
+        Py_DECREF(document);
+        return NULL;
+    }
+    return document;
+}
+
+/* Set `name` to `value` in a document created by _new_document.
+ *
+ * Returns 0 on success or -1 on failure. */
+static int _set_item(PyObject* document, PyObject* son_keys,
+                     const codec_options_t* options,
+                     PyObject* name, PyObject* value) {
+    if (options->from_items) {
+        int result;
+        PyObject* item = PyTuple_Pack(2, name, value);
+        if (!item) {
+            return -1;
+        }
+        result = PyList_Append(document, item);
+        Py_DECREF(item);
+        return result;
+    }
+    if (son_keys) {
+        int contains = PyDict_Contains(document, name);
+        if (contains < 0 ||
+            (!contains && PyList_Append(son_keys, name) < 0)) {
+            return -1;
+        }
+        return PyDict_SetItem(document, name, value);
+    }
+    if (PyDict_CheckExact(document)) {
+        return PyDict_SetItem(document, name, value);
+    }
+#if PY_VERSION_HEX >= 0x03050000
+    if (PyODict_CheckExact(document)) {
+        return PyODict_SetItem(document, name, value);
+    }
+#endif
+    return PyObject_SetItem(document, name, value);
+}
+
+/* Return the decoded document for a document filled by _set_item.
+ *
+ * Steals the references to `document` and `son_keys`. Returns a new
+ * reference or NULL on failure. */
+static PyObject* _finish_document(PyObject* document, PyObject* son_keys,
+                                  const codec_options_t* options) {
+    PyObject* result;
+    Py_XDECREF(son_keys);
+    if (!options->from_items) {
+        return document;
+    }
+    result = PyObject_CallFunctionObjArgs(options->from_items, document,
+                                          NULL);
+    Py_DECREF(document);
+    return result;
+}
+
 static PyObject* _elements_to_dict(PyObject* self, const char* string,
                                    unsigned max,
                                    const codec_options_t* options) {
     unsigned position = 0;
-    PyObject* dict = PyObject_CallObject(options->document_class, NULL);
+    PyObject* son_keys;
+    PyObject* dict = _new_document(self, options, &son_keys);
     if (!dict) {
         return NULL;
     }
@@ -2258,11 +3569,13 @@ static PyObject* _elements_to_dict(PyObject* self, const char* string,
                 PyErr_SetNone(InvalidBSON);
                 Py_DECREF(InvalidBSON);
             }
+            Py_XDECREF(son_keys);
             Py_DECREF(dict);
             return NULL;
         }
-        name = PyUnicode_DecodeUTF8(string + position, name_length, "strict");
+        name = _decode_key(self, string + position, name_length);
         if (!name) {
+            Py_XDECREF(son_keys);
             Py_DECREF(dict);
             return NULL;
         }
@@ -2271,15 +3584,22 @@ static PyObject* _elements_to_dict(PyObject* self, const char* string,
                           max - position, options);
         if (!value) {
             Py_DECREF(name);
+            Py_XDECREF(son_keys);
             Py_DECREF(dict);
             return NULL;
         }
 
-        PyObject_SetItem(dict, name, value);
+        if (_set_item(dict, son_keys, options, name, value) < 0) {
+            Py_DECREF(name);
+            Py_DECREF(value);
+            Py_XDECREF(son_keys);
+            Py_DECREF(dict);
+            return NULL;
+        }
         Py_DECREF(name);
         Py_DECREF(value);
     }
-    return dict;
+    return _finish_document(dict, son_keys, options);
 }
 
 static PyObject* elements_to_dict(PyObject* self, const char* string,
@@ -2293,34 +3613,353 @@ static PyObject* elements_to_dict(PyObject* self, const char* string,
     return result;
 }
 
+/* A field selected by CodecOptions.decode_fields. */
+typedef struct field_node {
+    char* name;
+    size_t name_length;
+    /* Nonzero if the whole value is selected, not only `children`. */
+    unsigned char whole;
+    /* The fields selected from this field's value. */
+    struct field_node* children;
+    struct field_node* next;
+} field_node_t;
+
+static void free_field_tree(field_node_t* node) {
+    while (node) {
+        field_node_t* next = node->next;
+        free_field_tree(node->children);
+        free(node->name);
+        free(node);
+        node = next;
+    }
+}
+
+/* Add the dotted field name `path` to the tree of selected fields.
+ *
+ * Returns 0 and sets MemoryError on failure.
+ */
+static int _add_field_path(field_node_t** tree,
+                           const char* path, size_t length) {
+    field_node_t** level = tree;
+    while (1) {
+        const char* dot = memchr(path, '.', length);
+        size_t name_length = dot ? (size_t)(dot - path) : length;
+        field_node_t* node = *level;
+        while (node && (node->name_length != name_length ||
+                        memcmp(node->name, path, name_length))) {
+            node = node->next;
+        }
+        if (!node) {
+            node = (field_node_t*)calloc(1, sizeof(field_node_t));
+            if (!node) {
+                PyErr_NoMemory();
+                return 0;
+            }
+            /* Avoid malloc(0) for an empty name. */
+            node->name = (char*)malloc(name_length + 1);
+            if (!node->name) {
+                free(node);
+                PyErr_NoMemory();
+                return 0;
+            }
+            memcpy(node->name, path, name_length);
+            node->name_length = name_length;
+            node->next = *level;
+            *level = node;
+        }
+        if (node->whole) {
+            return 1;
+        }
+        if (!dot) {
+            node->whole = 1;
+            free_field_tree(node->children);
+            node->children = NULL;
+            return 1;
+        }
+        level = &node->children;
+        path = dot + 1;
+        length -= name_length + 1;
+    }
+}
+
+/* Build the tree of fields selected by `decode_fields`, a tuple of dotted
+ * field names.
+ *
+ * Returns 0 on failure. On success the caller must free `*tree` with
+ * free_field_tree.
+ */
+static int build_field_tree(PyObject* decode_fields, field_node_t** tree) {
+    Py_ssize_t i;
+    *tree = NULL;
+    if (!PyTuple_Check(decode_fields)) {
+        PyErr_SetString(PyExc_TypeError, "decode_fields must be a tuple");
+        return 0;
+    }
+    for (i = 0; i < PyTuple_GET_SIZE(decode_fields); i++) {
+        PyObject* field = PyTuple_GET_ITEM(decode_fields, i);
+        PyObject* encoded;
+        int ok;
+        if (PyUnicode_Check(field)) {
+            encoded = PyUnicode_AsUTF8String(field);
+            if (!encoded) {
+                goto fail;
+            }
+#if PY_MAJOR_VERSION < 3
+        } else if (PyString_Check(field)) {
+            Py_INCREF(field);
+            encoded = field;
+#endif
+        } else {
+            PyErr_SetString(PyExc_TypeError,
+                            "decode_fields must contain field names");
+            goto fail;
+        }
+#if PY_MAJOR_VERSION >= 3
+        ok = _add_field_path(tree, PyBytes_AS_STRING(encoded),
+                             (size_t)PyBytes_GET_SIZE(encoded));
+#else
+        ok = _add_field_path(tree, PyString_AS_STRING(encoded),
+                             (size_t)PyString_GET_SIZE(encoded));
+#endif
+        Py_DECREF(encoded);
+        if (!ok) {
+            goto fail;
+        }
+    }
+    return 1;
+
+fail:
+    free_field_tree(*tree);
+    *tree = NULL;
+    return 0;
+}
+
+static PyObject* filtered_elements_to_dict(PyObject* self, const char* string,
+                                           unsigned max,
+                                           const codec_options_t* options,
+                                           const field_node_t* fields);
+
+static PyObject* _filtered_array(PyObject* self, const char* string,
+                                 unsigned max, const codec_options_t* options,
+                                 const field_node_t* fields);
+
+static void _set_invalid_length(void) {
+    PyObject* InvalidBSON = _error("InvalidBSON");
+    if (InvalidBSON) {
+        PyErr_SetString(InvalidBSON, "bad object or element length");
+        Py_DECREF(InvalidBSON);
+    }
+}
+
+/* Decode the fields selected by `fields` from the subdocument or array
+ * (`type` 3 or 4) at `buffer + *position`.
+ */
+static PyObject* get_filtered_value(PyObject* self, const char* buffer,
+                                    unsigned* position, unsigned char type,
+                                    unsigned max,
+                                    const codec_options_t* options,
+                                    const field_node_t* fields) {
+    unsigned size;
+    PyObject* value;
+    if (max < 4) {
+        _set_invalid_length();
+        return NULL;
+    }
+    memcpy(&size, buffer + *position, 4);
+    if (size < BSON_MIN_SIZE || max < size || buffer[*position + size - 1]) {
+        _set_invalid_length();
+        return NULL;
+    }
+    if (Py_EnterRecursiveCall(" while decoding a BSON document")) {
+        return NULL;
+    }
+    if (type == 3) {
+        value = filtered_elements_to_dict(self, buffer + *position + 4,
+                                          size - 5, options, fields);
+    } else {
+        value = _filtered_array(self, buffer + *position + 4,
+                                size - 5, options, fields);
+    }
+    Py_LeaveRecursiveCall();
+    if (value) {
+        *position += size;
+    }
+    return value;
+}
+
+/* Decode the fields selected by `fields` from each document, or nested
+ * array, in a BSON array. Other elements are skipped.
+ */
+static PyObject* _filtered_array(PyObject* self, const char* string,
+                                 unsigned max, const codec_options_t* options,
+                                 const field_node_t* fields) {
+    unsigned position = 0;
+    PyObject* list = PyList_New(0);
+    if (!list) {
+        return NULL;
+    }
+    while (position < max) {
+        unsigned char type = (unsigned char)string[position++];
+        size_t key_length = strlen(string + position);
+        if (key_length > BSON_MAX_SIZE || position + key_length >= max) {
+            goto invalid;
+        }
+        position += (unsigned)key_length + 1;
+        if (type == 3 || type == 4) {
+            int ok;
+            PyObject* value = get_filtered_value(self, string, &position,
+                                                 type, max - position,
+                                                 options, fields);
+            if (!value) {
+                Py_DECREF(list);
+                return NULL;
+            }
+            ok = PyList_Append(list, value);
+            Py_DECREF(value);
+            if (ok < 0) {
+                Py_DECREF(list);
+                return NULL;
+            }
+        } else {
+            int value_size = _value_size(string, position, type,
+                                         max - position);
+            if (value_size < 0) {
+                goto invalid;
+            }
+            position += (unsigned)value_size;
+        }
+    }
+    if (position != max) {
+        goto invalid;
+    }
+    return list;
+
+invalid:
+    _set_invalid_length();
+    Py_DECREF(list);
+    return NULL;
+}
+
+/* Decode the fields selected by `fields` from a BSON document.
+ *
+ * Other elements are skipped by reading their length, without creating
+ * Python objects for them.
+ */
+static PyObject* filtered_elements_to_dict(PyObject* self, const char* string,
+                                           unsigned max,
+                                           const codec_options_t* options,
+                                           const field_node_t* fields) {
+    unsigned position = 0;
+    PyObject* son_keys;
+    PyObject* dict = _new_document(self, options, &son_keys);
+    if (!dict) {
+        return NULL;
+    }
+    while (position < max) {
+        PyObject* name;
+        PyObject* value;
+        const field_node_t* node = fields;
+        unsigned char type = (unsigned char)string[position++];
+        size_t name_length = strlen(string + position);
+        if (name_length > BSON_MAX_SIZE || position + name_length >= max) {
+            goto invalid;
+        }
+        while (node && (node->name_length != name_length ||
+                        memcmp(node->name, string + position, name_length))) {
+            node = node->next;
+        }
+        if (!node || (!node->whole && type != 3 && type != 4)) {
+            int value_size;
+            position += (unsigned)name_length + 1;
+            value_size = _value_size(string, position, type, max - position);
+            if (value_size < 0) {
+                goto invalid;
+            }
+            position += (unsigned)value_size;
+            continue;
+        }
+        name = _decode_key(self, string + position, name_length);
+        if (!name) {
+            goto fail;
+        }
+        position += (unsigned)name_length + 1;
+        if (node->whole) {
+            value = get_value(self, string, &position, type,
+                              max - position, options);
+        } else {
+            value = get_filtered_value(self, string, &position, type,
+                                       max - position, options,
+                                       node->children);
+        }
+        if (!value) {
+            Py_DECREF(name);
+            goto fail;
+        }
+
+        if (_set_item(dict, son_keys, options, name, value) < 0) {
+            Py_DECREF(name);
+            Py_DECREF(value);
+            goto fail;
+        }
+        Py_DECREF(name);
+        Py_DECREF(value);
+    }
+    if (position != max) {
+        goto invalid;
+    }
+    return _finish_document(dict, son_keys, options);
+
+invalid:
+    _set_invalid_length();
+fail:
+    Py_XDECREF(son_keys);
+    Py_DECREF(dict);
+    return NULL;
+}
+
+/* Get a read-only, contiguous view of the bytes-like object `obj`.
+ *
+ * Sets TypeError and returns 0 if `obj` doesn't support the buffer
+ * protocol. On success the caller must release `view` with PyBuffer_Release.
+ */
+static int _get_buffer(PyObject* obj, Py_buffer* view, const char* func_name) {
+    if (!PyObject_CheckBuffer(obj)) {
+        PyErr_Format(PyExc_TypeError,
+#if PY_MAJOR_VERSION >= 3
+                     "argument to %s must be a bytes-like object",
+#else
+                     "argument to %s must be a string or bytes-like object",
+#endif
+                     func_name);
+        return 0;
+    }
+    return PyObject_GetBuffer(obj, view, PyBUF_SIMPLE) != -1;
+}
+
 static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
     int size;
     Py_ssize_t total_size;
     const char* string;
     PyObject* bson;
+    Py_buffer view;
     codec_options_t options;
-    PyObject* result;
+    PyObject* result = NULL;
 
     if (!PyArg_ParseTuple(
             args, "OO&", &bson, convert_codec_options, &options)) {
         return NULL;
     }
 
-#if PY_MAJOR_VERSION >= 3
-    if (!PyBytes_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to _bson_to_dict must be a bytes object");
-#else
-    if (!PyString_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to _bson_to_dict must be a string");
-#endif
+    if (!_get_buffer(bson, &view, "_bson_to_dict")) {
         destroy_codec_options(&options);
         return NULL;
     }
-#if PY_MAJOR_VERSION >= 3
-    total_size = PyBytes_Size(bson);
-#else
-    total_size = PyString_Size(bson);
-#endif
+    total_size = view.len;
+    string = (const char*)view.buf;
+    if (!_set_binary_base(&options, bson, string)) {
+        goto done;
+    }
+
     if (total_size < BSON_MIN_SIZE) {
         PyObject* InvalidBSON = _error("InvalidBSON");
         if (InvalidBSON) {
@@ -2328,18 +3967,7 @@ static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
                             "not enough data for a BSON document");
             Py_DECREF(InvalidBSON);
         }
-        destroy_codec_options(&options);
-        return NULL;
-    }
-
-#if PY_MAJOR_VERSION >= 3
-    string = PyBytes_AsString(bson);
-#else
-    string = PyString_AsString(bson);
-#endif
-    if (!string) {
-        destroy_codec_options(&options);
-        return NULL;
+        goto done;
     }
 
     memcpy(&size, string, 4);
@@ -2349,8 +3977,7 @@ static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
             PyErr_SetString(InvalidBSON, "invalid message size");
             Py_DECREF(InvalidBSON);
         }
-        destroy_codec_options(&options);
-        return NULL;
+        goto done;
     }
 
     if (total_size < size || total_size > BSON_MAX_SIZE) {
@@ -2359,8 +3986,7 @@ static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
             PyErr_SetString(InvalidBSON, "objsize too large");
             Py_DECREF(InvalidBSON);
         }
-        destroy_codec_options(&options);
-        return NULL;
+        goto done;
     }
 
     if (size != total_size || string[size - 1]) {
@@ -2369,58 +3995,615 @@ static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
             PyErr_SetString(InvalidBSON, "bad eoo");
             Py_DECREF(InvalidBSON);
         }
-        destroy_codec_options(&options);
-        return NULL;
+        goto done;
     }
 
-    result = elements_to_dict(self, string + 4, (unsigned)size - 5, &options);
+    /* No need to decode fields if using RawBSONDocument */
+    if (options.is_raw_bson) {
+        result = PyObject_CallFunction(
+            options.document_class, BYTES_FORMAT_STRING "O", string, size,
+            options.options_obj);
+    } else if (options.decode_fields != Py_None) {
+        field_node_t* fields;
+        if (build_field_tree(options.decode_fields, &fields)) {
+            result = filtered_elements_to_dict(
+                self, string + 4, (unsigned)size - 5, &options, fields);
+            free_field_tree(fields);
+        }
+    } else {
+        result = elements_to_dict(self, string + 4, (unsigned)size - 5,
+                                  &options);
+    }
+done:
+    PyBuffer_Release(&view);
     destroy_codec_options(&options);
     return result;
 }
 
-static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
-    int size;
-    Py_ssize_t total_size;
-    const char* string;
+/* Get the size of the BSON value of type `type` at `buffer + position`,
+ * without decoding it. `max` is the number of bytes available.
+ *
+ * Returns -1 if the value is invalid or too long. Doesn't set an exception.
+ */
+static int _value_size(const char* buffer, unsigned position,
+                       unsigned char type, unsigned max) {
+    unsigned size;
+    switch (type) {
+    case 6:
+    case 10:
+    case 127:
+    case 255:
+        return 0;
+    case 8:
+        size = 1;
+        break;
+    case 16:
+        size = 4;
+        break;
+    case 1:
+    case 9:
+    case 17:
+    case 18:
+        size = 8;
+        break;
+    case 7:
+        size = 12;
+        break;
+    case 2:
+    case 13:
+    case 14:
+        if (max < 4) {
+            return -1;
+        }
+        memcpy(&size, buffer + position, 4);
+        if (!size || size > BSON_MAX_SIZE - 4) {
+            return -1;
+        }
+        size += 4;
+        break;
+    case 3:
+    case 4:
+    case 15:
+        if (max < 4) {
+            return -1;
+        }
+        memcpy(&size, buffer + position, 4);
+        if (size < BSON_MIN_SIZE || size > BSON_MAX_SIZE) {
+            return -1;
+        }
+        break;
+    case 5:
+        if (max < 5) {
+            return -1;
+        }
+        memcpy(&size, buffer + position, 4);
+        if (size > BSON_MAX_SIZE - 5) {
+            return -1;
+        }
+        size += 5;
+        break;
+    case 11:
+        {
+            /* Pattern and flags, two C strings. */
+            const char* end = memchr(buffer + position, 0, max);
+            if (!end) {
+                return -1;
+            }
+            end = memchr(end + 1, 0, max - (end + 1 - (buffer + position)));
+            if (!end) {
+                return -1;
+            }
+            size = (unsigned)(end + 1 - (buffer + position));
+            break;
+        }
+    case 12:
+        if (max < 4) {
+            return -1;
+        }
+        memcpy(&size, buffer + position, 4);
+        if (!size || size > BSON_MAX_SIZE - 16) {
+            return -1;
+        }
+        size += 16;
+        break;
+    default:
+        return -1;
+    }
+    if (size > max) {
+        return -1;
+    }
+    return (int)size;
+}
+
+/* Documents nested deeper than this are rejected by _validate_document. */
+#define MAX_VALIDATION_DEPTH 1000
+
+/* Is the `length` bytes long string at `string` UTF-8 that
+ * PyUnicode_DecodeUTF8 accepts?
+ */
+static int _is_valid_utf8(const unsigned char* string, unsigned length) {
+    const unsigned char* end = string + length;
+    while (string < end) {
+        unsigned char c = *string;
+        if (c < 0x80) {
+            /* Skip ASCII 8 bytes at a time. */
+            unsigned long long chunk;
+            while (end - string >= 8) {
+                memcpy(&chunk, string, 8);
+                if (chunk & 0x8080808080808080ULL) {
+                    break;
+                }
+                string += 8;
+            }
+            while (string < end && *string < 0x80) {
+                string++;
+            }
+            continue;
+        }
+        if (c < 0xC2) {
+            /* A continuation byte, or an overlong 2 byte sequence. */
+            return 0;
+        } else if (c < 0xE0) {
+            if (end - string < 2 || (string[1] & 0xC0) != 0x80) {
+                return 0;
+            }
+            string += 2;
+        } else if (c < 0xF0) {
+            if (end - string < 3 || (string[1] & 0xC0) != 0x80 ||
+                    (string[2] & 0xC0) != 0x80) {
+                return 0;
+            }
+            if (c == 0xE0 && string[1] < 0xA0) {
+                return 0;
+            }
+#if PY_MAJOR_VERSION >= 3
+            /* Surrogates. */
+            if (c == 0xED && string[1] >= 0xA0) {
+                return 0;
+            }
+#endif
+            string += 3;
+        } else if (c < 0xF5) {
+            if (end - string < 4 || (string[1] & 0xC0) != 0x80 ||
+                    (string[2] & 0xC0) != 0x80 ||
+                    (string[3] & 0xC0) != 0x80) {
+                return 0;
+            }
+            if ((c == 0xF0 && string[1] < 0x90) ||
+                    (c == 0xF4 && string[1] >= 0x90)) {
+                return 0;
+            }
+            string += 4;
+        } else {
+            return 0;
+        }
+    }
+    return 1;
+}
+
+/* Check a BSON string (int32 length, UTF-8 bytes and a NUL) at `buffer`,
+ * with `max` bytes available. Returns its size, or 0 if it is invalid.
+ */
+static unsigned _validate_string(const char* buffer, unsigned max) {
+    unsigned length;
+    if (max < 4) {
+        return 0;
+    }
+    memcpy(&length, buffer, 4);
+    if (!length || length > max - 4 || buffer[4 + length - 1] ||
+            !_is_valid_utf8((const unsigned char*)buffer + 4, length - 1)) {
+        return 0;
+    }
+    return 4 + length;
+}
+
+/* Check the BSON document or array at `buffer`, with `max` bytes available,
+ * without creating any Python objects, so that it can run without the GIL.
+ * `kind` is the type of the value, 3 or 4, or 0 for a top level document or
+ * the scope of code.
+ *
+ * On success stores the size of the document in `*size` and returns NULL.
+ * Otherwise returns a message describing the first problem found.
+ */
+static const char* _validate_document(const char* buffer, unsigned max,
+                                      int kind, int depth, unsigned* size) {
+    unsigned position = 4;
+    unsigned end;
+    /* The types of the "$ref" and "$db" elements, decoded to a DBRef. */
+    unsigned char ref_type = 0;
+    unsigned char db_type = 0;
+    if (max < BSON_MIN_SIZE) {
+        return "not enough data for a BSON document";
+    }
+    memcpy(&end, buffer, 4);
+    if (end < BSON_MIN_SIZE || end > max) {
+        return "invalid object size";
+    }
+    if (buffer[end - 1]) {
+        return "bad eoo";
+    }
+    if (depth > MAX_VALIDATION_DEPTH) {
+        return "documents nested too deeply";
+    }
+    *size = end;
+    end -= 1;
+    while (position < end) {
+        const char* msg;
+        unsigned value_size = 0;
+        unsigned remaining;
+        unsigned char type = (unsigned char)buffer[position++];
+        const char* key_end = memchr(buffer + position, 0, end - position);
+        if (!key_end) {
+            return "invalid element name";
+        }
+        /* Array keys aren't decoded. */
+        if (kind != 4 && !_is_valid_utf8(
+                (const unsigned char*)buffer + position,
+                (unsigned)(key_end - (buffer + position)))) {
+            return "invalid UTF-8 in element name";
+        }
+        if (kind == 3 && buffer[position] == '$') {
+            if (!strcmp(buffer + position, "$ref")) {
+                ref_type = type;
+            } else if (!strcmp(buffer + position, "$db")) {
+                db_type = type;
+            }
+        }
+        position = (unsigned)(key_end + 1 - buffer);
+        remaining = end - position;
+        switch (type) {
+        case 6:
+        case 10:
+        case 127:
+        case 255:
+            break;
+        case 8:
+            value_size = 1;
+            break;
+        case 16:
+            value_size = 4;
+            break;
+        case 1:
+        case 9:
+        case 17:
+        case 18:
+            value_size = 8;
+            break;
+        case 7:
+            value_size = 12;
+            break;
+        case 2:
+        case 13:
+        case 14:
+            if (!(value_size = _validate_string(buffer + position,
+                                                remaining))) {
+                return "invalid string";
+            }
+            break;
+        case 3:
+        case 4:
+            msg = _validate_document(buffer + position, remaining,
+                                     type, depth + 1, &value_size);
+            if (msg) {
+                return msg;
+            }
+            break;
+        case 5:
+            {
+                unsigned length;
+                unsigned char subtype;
+                if (remaining < 5) {
+                    return "invalid binary length";
+                }
+                memcpy(&length, buffer + position, 4);
+                if (length > remaining - 5) {
+                    return "invalid binary length";
+                }
+                subtype = (unsigned char)buffer[position + 4];
+                if ((subtype == 2 && length < 4) ||
+                        ((subtype == 3 || subtype == 4) && length != 16)) {
+                    return "invalid binary length";
+                }
+                value_size = 5 + length;
+                break;
+            }
+        case 11:
+            {
+                /* Pattern and flags, two C strings. */
+                const char* pattern = buffer + position;
+                const char* flags_end;
+                const char* pattern_end = memchr(pattern, 0, remaining);
+                if (!pattern_end || !(flags_end = memchr(
+                        pattern_end + 1, 0,
+                        remaining - (unsigned)(pattern_end + 1 - pattern)))) {
+                    return "invalid regular expression";
+                }
+                if (!_is_valid_utf8((const unsigned char*)pattern,
+                                    (unsigned)(pattern_end - pattern))) {
+                    return "invalid UTF-8 in regular expression";
+                }
+                value_size = (unsigned)(flags_end + 1 - pattern);
+                break;
+            }
+        case 12:
+            if (!(value_size = _validate_string(buffer + position,
+                                                remaining)) ||
+                    remaining - value_size < 12) {
+                return "invalid DBPointer";
+            }
+            value_size += 12;
+            break;
+        case 15:
+            {
+                unsigned code_size;
+                unsigned scope_size;
+                if (remaining < 4) {
+                    return "invalid code with scope";
+                }
+                memcpy(&value_size, buffer + position, 4);
+                if (value_size < 4 + 5 + BSON_MIN_SIZE ||
+                        value_size > remaining) {
+                    return "invalid code with scope";
+                }
+                if (!(code_size = _validate_string(buffer + position + 4,
+                                                   value_size - 4))) {
+                    return "invalid code with scope";
+                }
+                msg = _validate_document(
+                    buffer + position + 4 + code_size,
+                    value_size - 4 - code_size, 0, depth + 1, &scope_size);
+                if (msg) {
+                    return msg;
+                }
+                if (4 + code_size + scope_size != value_size) {
+                    return "invalid code with scope";
+                }
+                break;
+            }
+        default:
+            return "unknown element type";
+        }
+        if (value_size > remaining) {
+            return "invalid length";
+        }
+        position += value_size;
+    }
+    /* Embedded documents with "$ref" are decoded to DBRefs, which need a
+     * string collection and a string or null database. */
+    if (ref_type && ((ref_type != 2 && ref_type != 14) ||
+                     (db_type && db_type != 2 && db_type != 14 &&
+                      db_type != 10))) {
+        return "invalid DBRef";
+    }
+    return NULL;
+}
+
+static PyObject* _cbson_validate_all(PyObject* self, PyObject* args) {
     PyObject* bson;
-    PyObject* dict;
-    PyObject* result;
-    codec_options_t options;
+    Py_buffer view;
+    const char* string;
+    Py_ssize_t total_size;
+    Py_ssize_t position = 0;
+    Py_ssize_t count = 0;
+    Py_ssize_t capacity = 0;
+    Py_ssize_t* starts = NULL;
+    Py_ssize_t i;
+    const char* error = NULL;
+    int no_memory = 0;
+    PyObject* offsets;
+
+    if (!PyArg_ParseTuple(args, "O", &bson)) {
+        return NULL;
+    }
+    if (!_get_buffer(bson, &view, "validate_all")) {
+        return NULL;
+    }
+    string = (const char*)view.buf;
+    total_size = view.len;
+
+    /* Check every document and record where each starts without the GIL.
+     * The offsets are never read from the buffer again: a bytearray or
+     * mmap can be changed by another thread once it has been checked. */
+    Py_BEGIN_ALLOW_THREADS
+    while (position < total_size) {
+        unsigned size;
+        Py_ssize_t available = total_size - position;
+        error = _validate_document(
+            string + position,
+            available > BSON_MAX_SIZE ? BSON_MAX_SIZE : (unsigned)available,
+            0, 0, &size);
+        if (error) {
+            break;
+        }
+        if (count == capacity) {
+            Py_ssize_t* grown;
+            capacity = capacity ? capacity * 2 : 64;
+            grown = (Py_ssize_t*)realloc(starts,
+                                         capacity * sizeof(Py_ssize_t));
+            if (!grown) {
+                no_memory = 1;
+                break;
+            }
+            starts = grown;
+        }
+        starts[count++] = position;
+        position += size;
+    }
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&view);
 
-    if (!PyArg_ParseTuple(
-            args, "O|O&",
-            &bson, convert_codec_options, &options)) {
+    if (no_memory) {
+        free(starts);
+        return PyErr_NoMemory();
+    }
+    if (error) {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_Format(InvalidBSON, "invalid document at offset %zd: %s",
+                         position, error);
+            Py_DECREF(InvalidBSON);
+        }
+        free(starts);
         return NULL;
     }
 
-    if (PyTuple_GET_SIZE(args) < 2) {
-        default_codec_options(&options);
+    if (!(offsets = PyList_New(count + 1))) {
+        free(starts);
+        return NULL;
+    }
+    for (i = 0; i <= count; i++) {
+        /* The last offset is the end of the last document. */
+        PyObject* offset = Py_BuildValue("n",
+                                         i < count ? starts[i] : position);
+        if (!offset) {
+            Py_DECREF(offsets);
+            free(starts);
+            return NULL;
+        }
+        PyList_SET_ITEM(offsets, i, offset);
+    }
+    free(starts);
+    return offsets;
+}
+
+static PyObject* _cbson_find_element(PyObject* self, PyObject* args) {
+    int size;
+    Py_ssize_t total_size;
+    const char* string;
+    const char* name;
+    Py_ssize_t name_length;
+    unsigned position = 0;
+    unsigned max;
+    PyObject* bson;
+    PyObject* py_name;
+    codec_options_t options;
+    PyObject* result = NULL;
+
+    if (!PyArg_ParseTuple(
+            args, "OOO&", &bson, &py_name, convert_codec_options, &options)) {
+        return NULL;
     }
 
 #if PY_MAJOR_VERSION >= 3
-    if (!PyBytes_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to decode_all must be a bytes object");
+    if (!PyBytes_Check(bson) || !PyBytes_Check(py_name)) {
+        PyErr_SetString(PyExc_TypeError,
+                        "arguments to _find_element must be bytes objects");
 #else
-    if (!PyString_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to decode_all must be a string");
+    if (!PyString_Check(bson) || !PyString_Check(py_name)) {
+        PyErr_SetString(PyExc_TypeError,
+                        "arguments to _find_element must be strings");
 #endif
+        destroy_codec_options(&options);
         return NULL;
     }
 #if PY_MAJOR_VERSION >= 3
-    total_size = PyBytes_Size(bson);
-    string = PyBytes_AsString(bson);
+    total_size = PyBytes_GET_SIZE(bson);
+    string = PyBytes_AS_STRING(bson);
+    name_length = PyBytes_GET_SIZE(py_name);
+    name = PyBytes_AS_STRING(py_name);
 #else
-    total_size = PyString_Size(bson);
-    string = PyString_AsString(bson);
+    total_size = PyString_GET_SIZE(bson);
+    string = PyString_AS_STRING(bson);
+    name_length = PyString_GET_SIZE(py_name);
+    name = PyString_AS_STRING(py_name);
 #endif
-    if (!string) {
+    if (!_set_binary_base(&options, bson, string)) {
+        destroy_codec_options(&options);
         return NULL;
     }
 
-    if (!(result = PyList_New(0))) {
+    if (total_size < BSON_MIN_SIZE || total_size > BSON_MAX_SIZE) {
+        goto invalid;
+    }
+    memcpy(&size, string, 4);
+    if (size != total_size || string[size - 1]) {
+        goto invalid;
+    }
+
+    string += 4;
+    max = (unsigned)size - 5;
+    while (position < max) {
+        int value_size;
+        unsigned char type = (unsigned char)string[position++];
+        size_t key_length = strlen(string + position);
+        if (key_length > BSON_MAX_SIZE || position + key_length >= max) {
+            goto invalid;
+        }
+        if (key_length == (size_t)name_length &&
+                !memcmp(string + position, name, key_length)) {
+            position += (unsigned)key_length + 1;
+            result = get_value(self, string, &position, type,
+                               max - position, &options);
+            destroy_codec_options(&options);
+            return result;
+        }
+        position += (unsigned)key_length + 1;
+        value_size = _value_size(string, position, type, max - position);
+        if (value_size < 0) {
+            goto invalid;
+        }
+        position += (unsigned)value_size;
+    }
+    if (position != max) {
+        goto invalid;
+    }
+    PyErr_SetObject(PyExc_KeyError, py_name);
+    destroy_codec_options(&options);
+    return NULL;
+
+invalid:
+    {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "bad object or element length");
+            Py_DECREF(InvalidBSON);
+        }
+    }
+    destroy_codec_options(&options);
+    return NULL;
+}
+
+static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
+    int size;
+    Py_ssize_t total_size;
+    const char* string;
+    PyObject* bson;
+    Py_buffer view;
+    PyObject* dict;
+    PyObject* result = NULL;
+    field_node_t* fields = NULL;
+    codec_options_t options;
+
+    if (!PyArg_ParseTuple(
+            args, "O|O&",
+            &bson, convert_codec_options, &options)) {
+        return NULL;
+    }
+
+    if (PyTuple_GET_SIZE(args) < 2) {
+        default_codec_options(&options);
+    }
+
+    /* Decode straight out of the caller's buffer, so that a memoryview over
+     * part of a reply doesn't need to be copied to a new bytes object. */
+    if (!_get_buffer(bson, &view, "decode_all")) {
         destroy_codec_options(&options);
         return NULL;
     }
+    total_size = view.len;
+    string = (const char*)view.buf;
+    if (!_set_binary_base(&options, bson, string)) {
+        goto fail;
+    }
+
+    if (options.decode_fields != Py_None && !options.is_raw_bson &&
+            !build_field_tree(options.decode_fields, &fields)) {
+        goto fail;
+    }
+
+    if (!(result = PyList_New(0))) {
+        goto fail;
+    }
 
     while (total_size > 0) {
         if (total_size < BSON_MIN_SIZE) {
@@ -2430,9 +4613,7 @@ static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
                                 "not enough data for a BSON document");
                 Py_DECREF(InvalidBSON);
             }
-            destroy_codec_options(&options);
-            Py_DECREF(result);
-            return NULL;
+            goto fail;
         }
 
         memcpy(&size, string, 4);
@@ -2442,9 +4623,7 @@ static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
                 PyErr_SetString(InvalidBSON, "invalid message size");
                 Py_DECREF(InvalidBSON);
             }
-            destroy_codec_options(&options);
-            Py_DECREF(result);
-            return NULL;
+            goto fail;
         }
 
         if (total_size < size) {
@@ -2453,9 +4632,7 @@ static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
                 PyErr_SetString(InvalidBSON, "objsize too large");
                 Py_DECREF(InvalidBSON);
             }
-            destroy_codec_options(&options);
-            Py_DECREF(result);
-            return NULL;
+            goto fail;
         }
 
         if (string[size - 1]) {
@@ -2464,16 +4641,24 @@ static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
                 PyErr_SetString(InvalidBSON, "bad eoo");
                 Py_DECREF(InvalidBSON);
             }
-            destroy_codec_options(&options);
-            Py_DECREF(result);
-            return NULL;
+            goto fail;
         }
 
-        dict = elements_to_dict(self, string + 4, (unsigned)size - 5, &options);
+        /* No need to decode fields if using RawBSONDocument */
+        if (options.is_raw_bson) {
+            dict = PyObject_CallFunction(
+                options.document_class, BYTES_FORMAT_STRING "O", string, size,
+                options.options_obj);
+        } else if (options.decode_fields != Py_None) {
+            dict = filtered_elements_to_dict(self, string + 4,
+                                             (unsigned)size - 5, &options,
+                                             fields);
+        } else {
+            dict = elements_to_dict(self, string + 4, (unsigned)size - 5,
+                                    &options);
+        }
         if (!dict) {
-            Py_DECREF(result);
-            destroy_codec_options(&options);
-            return NULL;
+            goto fail;
         }
         PyList_Append(result, dict);
         Py_DECREF(dict);
@@ -2481,8 +4666,368 @@ static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
         total_size -= size;
     }
 
+    free_field_tree(fields);
+    PyBuffer_Release(&view);
     destroy_codec_options(&options);
     return result;
+
+fail:
+    Py_XDECREF(result);
+    free_field_tree(fields);
+    PyBuffer_Release(&view);
+    destroy_codec_options(&options);
+    return NULL;
+}
+
+/* A column being filled in by _cbson_decode_columns. */
+typedef struct column {
+    const char* name;
+    size_t name_length;
+    /* 0 until a value is found, then the type of the column: 'f' (double),
+     * 'i' (int64), 'b' (bool), 'M' (datetime), or 'O' (ObjectId). */
+    char kind;
+    unsigned itemsize;
+    char* data;
+    PyObject* data_obj;
+    char* mask;
+    PyObject* mask_obj;
+} column_t;
+
+static void _column_error(const column_t* column, const char* message) {
+    PyObject* field = PyUnicode_DecodeUTF8(column->name, column->name_length,
+                                           "replace");
+    if (field) {
+        PyObject* repr = PyObject_Repr(field);
+        if (repr) {
+#if PY_MAJOR_VERSION >= 3
+            PyObject* bytes = PyUnicode_AsUTF8String(repr);
+            if (bytes) {
+                PyErr_Format(PyExc_ValueError, "field %s %s",
+                             PyBytes_AS_STRING(bytes), message);
+                Py_DECREF(bytes);
+            }
+#else
+            PyErr_Format(PyExc_ValueError, "field %s %s",
+                         PyString_AS_STRING(repr), message);
+#endif
+            Py_DECREF(repr);
+        }
+        Py_DECREF(field);
+    }
+}
+
+/* Store the value of BSON type `type` at `buffer` in row `row` of
+ * `column`, a column of `count` rows.
+ *
+ * Returns 0 and sets an exception if the value can't be stored in the
+ * column.
+ */
+static int _set_column_value(column_t* column, const char* buffer,
+                             unsigned char type, Py_ssize_t row,
+                             Py_ssize_t count) {
+    char kind;
+    switch (type) {
+    case 1:
+        kind = 'f';
+        break;
+    case 16:
+    case 18:
+        kind = 'i';
+        break;
+    case 8:
+        kind = 'b';
+        break;
+    case 9:
+        kind = 'M';
+        break;
+    case 7:
+        kind = 'O';
+        break;
+    default:
+        _column_error(column, "has a value of a BSON type that can't be "
+                      "decoded to a column");
+        return 0;
+    }
+
+    if (!column->kind) {
+        column->kind = kind;
+        column->itemsize = (kind == 'b') ? 1 : (kind == 'O') ? 12 : 8;
+        column->data_obj = PyByteArray_FromStringAndSize(
+            NULL, count * column->itemsize);
+        if (!column->data_obj) {
+            return 0;
+        }
+        column->data = PyByteArray_AS_STRING(column->data_obj);
+        memset(column->data, 0, count * column->itemsize);
+    } else if (column->kind == 'i' && kind == 'f') {
+        /* Integers mixed with doubles, convert the integers so far. */
+        Py_ssize_t i;
+        for (i = 0; i < row; i++) {
+            if (!column->mask[i]) {
+                long long as_int;
+                double as_double;
+                memcpy(&as_int, column->data + i * 8, 8);
+                as_double = (double)as_int;
+                memcpy(column->data + i * 8, &as_double, 8);
+            }
+        }
+        column->kind = 'f';
+    } else if (column->kind != kind && !(column->kind == 'f' && kind == 'i')) {
+        _column_error(column, "has values of BSON types that can't be "
+                      "stored in one column");
+        return 0;
+    }
+
+    if (type == 16) {
+        int as_int32;
+        long long as_int;
+        memcpy(&as_int32, buffer, 4);
+        as_int = as_int32;
+        if (column->kind == 'f') {
+            double as_double = (double)as_int;
+            memcpy(column->data + row * 8, &as_double, 8);
+        } else {
+            memcpy(column->data + row * 8, &as_int, 8);
+        }
+    } else if (type == 18 && column->kind == 'f') {
+        long long as_int;
+        double as_double;
+        memcpy(&as_int, buffer, 8);
+        as_double = (double)as_int;
+        memcpy(column->data + row * 8, &as_double, 8);
+    } else {
+        memcpy(column->data + row * column->itemsize, buffer,
+               column->itemsize);
+    }
+    column->mask[row] = 0;
+    return 1;
+}
+
+static PyObject* _cbson_decode_columns(PyObject* self, PyObject* args) {
+    PyObject* bson;
+    PyObject* fields;
+    PyObject* names = NULL;
+    PyObject* result = NULL;
+    Py_buffer view;
+    column_t* columns = NULL;
+    Py_ssize_t ncolumns;
+    Py_ssize_t count = 0;
+    Py_ssize_t row;
+    Py_ssize_t i;
+    Py_ssize_t total_size;
+    Py_ssize_t offset;
+    const char* string;
+
+    if (!PyArg_ParseTuple(args, "OO", &bson, &fields)) {
+        return NULL;
+    }
+    if (!PyTuple_Check(fields)) {
+        PyErr_SetString(PyExc_TypeError, "fields must be a tuple");
+        return NULL;
+    }
+    if (!_get_buffer(bson, &view, "decode_columns")) {
+        return NULL;
+    }
+    total_size = view.len;
+    string = (const char*)view.buf;
+
+    /* Count the documents, so each column is allocated once. */
+    offset = 0;
+    while (offset < total_size) {
+        int size;
+        if (total_size - offset < BSON_MIN_SIZE) {
+            goto invalid;
+        }
+        memcpy(&size, string + offset, 4);
+        if (size < BSON_MIN_SIZE || total_size - offset < size ||
+                string[offset + size - 1]) {
+            goto invalid;
+        }
+        offset += size;
+        count++;
+    }
+
+    ncolumns = PyTuple_GET_SIZE(fields);
+    /* Keeps the encoded field names alive. */
+    if (!(names = PyList_New(0))) {
+        goto done;
+    }
+    columns = (column_t*)calloc(ncolumns ? ncolumns : 1, sizeof(column_t));
+    if (!columns) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    for (i = 0; i < ncolumns; i++) {
+        PyObject* field = PyTuple_GET_ITEM(fields, i);
+        PyObject* encoded;
+        int ok;
+        if (PyUnicode_Check(field)) {
+            if (!(encoded = PyUnicode_AsUTF8String(field))) {
+                goto done;
+            }
+#if PY_MAJOR_VERSION < 3
+        } else if (PyString_Check(field)) {
+            Py_INCREF(field);
+            encoded = field;
+#endif
+        } else {
+            PyErr_SetString(PyExc_TypeError, "fields must be field names");
+            goto done;
+        }
+        ok = PyList_Append(names, encoded);
+        Py_DECREF(encoded);
+        if (ok < 0) {
+            goto done;
+        }
+#if PY_MAJOR_VERSION >= 3
+        columns[i].name = PyBytes_AS_STRING(encoded);
+        columns[i].name_length = PyBytes_GET_SIZE(encoded);
+#else
+        columns[i].name = PyString_AS_STRING(encoded);
+        columns[i].name_length = PyString_GET_SIZE(encoded);
+#endif
+        columns[i].mask_obj = PyByteArray_FromStringAndSize(NULL, count);
+        if (!columns[i].mask_obj) {
+            goto done;
+        }
+        columns[i].mask = PyByteArray_AS_STRING(columns[i].mask_obj);
+        memset(columns[i].mask, 1, count);
+    }
+
+    offset = 0;
+    for (row = 0; row < count; row++) {
+        int size;
+        unsigned position = 4;
+        unsigned max;
+        const char* doc = string + offset;
+        memcpy(&size, doc, 4);
+        max = (unsigned)size - 1;
+        while (position < max) {
+            int value_size;
+            column_t* column = NULL;
+            unsigned char type = (unsigned char)doc[position++];
+            size_t name_length = strlen(doc + position);
+            if (name_length > BSON_MAX_SIZE || position + name_length >= max) {
+                goto invalid;
+            }
+            for (i = 0; i < ncolumns; i++) {
+                if (columns[i].name_length == name_length &&
+                        !memcmp(columns[i].name, doc + position,
+                                name_length)) {
+                    column = &columns[i];
+                    break;
+                }
+            }
+            position += (unsigned)name_length + 1;
+            value_size = _value_size(doc, position, type, max - position);
+            if (value_size < 0) {
+                goto invalid;
+            }
+            /* Null and undefined values are left masked. */
+            if (column && type != 10 && type != 6 &&
+                    !_set_column_value(column, doc + position, type,
+                                       row, count)) {
+                goto done;
+            }
+            position += (unsigned)value_size;
+        }
+        if (position != max) {
+            goto invalid;
+        }
+        offset += size;
+    }
+
+    if (!(result = PyList_New(ncolumns))) {
+        goto done;
+    }
+    for (i = 0; i < ncolumns; i++) {
+        const char* dtype;
+        PyObject* column;
+        switch (columns[i].kind) {
+        case 'i':
+            dtype = "<i8";
+            break;
+        case 'b':
+            dtype = "?";
+            break;
+        case 'M':
+            dtype = "<M8[ms]";
+            break;
+        case 'O':
+            dtype = "V12";
+            break;
+        case 'f':
+            dtype = "<f8";
+            break;
+        default:
+            /* Every value is null. */
+            dtype = "<f8";
+            columns[i].data_obj = PyByteArray_FromStringAndSize(NULL,
+                                                                count * 8);
+            if (!columns[i].data_obj) {
+                Py_CLEAR(result);
+                goto done;
+            }
+            memset(PyByteArray_AS_STRING(columns[i].data_obj), 0, count * 8);
+        }
+        column = Py_BuildValue("sOO", dtype, columns[i].data_obj,
+                               columns[i].mask_obj);
+        if (!column) {
+            Py_CLEAR(result);
+            goto done;
+        }
+        PyList_SET_ITEM(result, i, column);
+    }
+    goto done;
+
+invalid:
+    {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "bad object or element length");
+            Py_DECREF(InvalidBSON);
+        }
+    }
+done:
+    if (columns) {
+        for (i = 0; i < ncolumns; i++) {
+            Py_XDECREF(columns[i].data_obj);
+            Py_XDECREF(columns[i].mask_obj);
+        }
+        free(columns);
+    }
+    Py_XDECREF(names);
+    PyBuffer_Release(&view);
+    return result;
+}
+
+static PyObject* _cbson_set_key_cache_size(PyObject* self, PyObject* args) {
+    Py_ssize_t size;
+    unsigned cache_size = 0;
+    if (!PyArg_ParseTuple(args, "n", &size)) {
+        return NULL;
+    }
+    if (size < 0 || size > MAX_KEY_CACHE_SIZE) {
+        PyErr_Format(PyExc_ValueError,
+                     "key cache size must be between 0 and %d",
+                     MAX_KEY_CACHE_SIZE);
+        return NULL;
+    }
+    if (size) {
+        /* Round up to a power of 2, the cache holds pairs of entries. */
+        cache_size = 2;
+        while (cache_size < (unsigned)size) {
+            cache_size <<= 1;
+        }
+    }
+    if (!_reset_key_cache(GETSTATE(self), cache_size)) {
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject* _cbson_get_key_cache_size(PyObject* self, PyObject* args) {
+    return Py_BuildValue("I", GETSTATE(self)->key_cache_size);
 }
 
 static PyMethodDef _CBSONMethods[] = {
@@ -2492,6 +5037,26 @@ static PyMethodDef _CBSONMethods[] = {
      "convert a BSON string to a SON object."},
     {"decode_all", _cbson_decode_all, METH_VARARGS,
      "convert binary data to a sequence of documents."},
+    {"_validate_all", _cbson_validate_all, METH_VARARGS,
+     "check concatenated BSON documents and get their offsets"},
+    {"_find_element", _cbson_find_element, METH_VARARGS,
+     "decode a single top level element of a BSON string."},
+    {"_encode_many", _cbson_encode_many, METH_VARARGS,
+     "convert a sequence of documents to concatenated BSON."},
+    {"_encoded_size", _cbson_encoded_size, METH_VARARGS,
+     "get the size of a document encoded to BSON."},
+    {"_encode_compiled", _cbson_encode_compiled, METH_VARARGS,
+     "convert a dictionary to BSON using pre-encoded key names."},
+    {"_generate_oid", _cbson_generate_oid, METH_NOARGS,
+     "generate the bytes of a new ObjectId."},
+    {"_generate_oids", _cbson_generate_oids, METH_VARARGS,
+     "generate many new ObjectIds."},
+    {"_decode_columns", _cbson_decode_columns, METH_VARARGS,
+     "decode fields of many BSON documents to columns."},
+    {"set_key_cache_size", _cbson_set_key_cache_size, METH_VARARGS,
+     "set the number of entries in the decoded key cache."},
+    {"get_key_cache_size", _cbson_get_key_cache_size, METH_NOARGS,
+     "get the number of entries in the decoded key cache."},
     {NULL, NULL, 0, NULL}
 };
 
@@ -2509,6 +5074,7 @@ static int _cbson_traverse(PyObject *m, visitproc visit, void *arg) {
     Py_VISIT(GETSTATE(m)->MaxKey);
     Py_VISIT(GETSTATE(m)->UTC);
     Py_VISIT(GETSTATE(m)->REType);
+    Py_VISIT(GETSTATE(m)->SON);
     return 0;
 }
 
@@ -2524,6 +5090,8 @@ static int _cbson_clear(PyObject *m) {
     Py_CLEAR(GETSTATE(m)->MaxKey);
     Py_CLEAR(GETSTATE(m)->UTC);
     Py_CLEAR(GETSTATE(m)->REType);
+    Py_CLEAR(GETSTATE(m)->SON);
+    _free_key_cache(GETSTATE(m));
     return 0;
 }
 
@@ -2584,7 +5152,8 @@ init_cbson(void)
     }
 
     /* Import several python objects */
-    if (_load_python_objects(m)) {
+    if (_load_python_objects(m) ||
+            !_reset_key_cache(GETSTATE(m), DEFAULT_KEY_CACHE_SIZE)) {
         Py_DECREF(c_api_object);
 #if PY_MAJOR_VERSION >= 3
         Py_DECREF(m);
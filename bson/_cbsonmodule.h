@@ -52,10 +52,30 @@ typedef int Py_ssize_t;
 #define STRCAT(dest, n, src) strcat((dest), (src))
 #endif
 
+#if PY_MAJOR_VERSION >= 3
+#define BYTES_FORMAT_STRING "y#"
+#else
+#define BYTES_FORMAT_STRING "s#"
+#endif
+
 typedef struct codec_options_t {
     PyObject* document_class;
     unsigned char tz_aware;
     unsigned char uuid_rep;
+    PyObject* options_obj;
+    unsigned char is_raw_bson;
+    PyObject* decode_fields; /* Borrowed from options_obj, or Py_None. */
+    unsigned char datetime_as_millis;
+    PyObject* from_items; /* document_class._from_bson_items, or NULL. */
+    /* The keys and element names of the compiled_encoder, or NULL. */
+    PyObject* compiled_keys;
+    PyObject* compiled_names;
+    unsigned char compiled_valid_keys;
+    unsigned char binary_as_memoryview;
+    /* With binary_as_memoryview, a memoryview of the data being decoded and
+     * the address of its first byte, or NULL. */
+    PyObject* binary_base;
+    const char* binary_base_start;
 } codec_options_t;
 
 /* C API functions */
@@ -21,24 +21,66 @@
 
 #define INITIAL_BUFFER_SIZE 256
 
+/* How many released buffers are kept for reuse. */
+#define BUFFER_POOL_SIZE 8
+
+/* Pooled buffers that grew larger than this are shrunk back to it, so the
+ * pool never holds more than BUFFER_POOL_SIZE * MAX_POOLED_BUFFER_SIZE bytes.
+ */
+#define MAX_POOLED_BUFFER_SIZE (64 * 1024)
+
 struct buffer {
     char* buffer;
     int size;
     int position;
 };
 
+/* Released buffers, ready for reuse. Each extension module compiled with
+ * this file has its own pool. There is no locking: the pool is only used
+ * while holding the GIL. */
+static buffer_t buffer_pool[BUFFER_POOL_SIZE];
+static int buffer_pool_count = 0;
+
+static int buffer_grow(buffer_t buffer, int min_length);
+
 /* Allocate and return a new buffer.
  * Return NULL on allocation failure. */
 buffer_t buffer_new(void) {
+    return buffer_new_with_size(INITIAL_BUFFER_SIZE);
+}
+
+/* Allocate and return a new buffer with room for at least `size_hint` bytes,
+ * or MAX_POOLED_BUFFER_SIZE bytes if the hint is larger.
+ * Return NULL on allocation failure. */
+buffer_t buffer_new_with_size(int size_hint) {
     buffer_t buffer;
+    /* A hint from a large document doesn't grow a buffer past the size it is
+     * shrunk back to when released. Larger documents grow it as they are
+     * written. */
+    if (size_hint > MAX_POOLED_BUFFER_SIZE) {
+        size_hint = MAX_POOLED_BUFFER_SIZE;
+    }
+    if (buffer_pool_count > 0) {
+        buffer = buffer_pool[--buffer_pool_count];
+        buffer->position = 0;
+        if (buffer_grow(buffer, size_hint) != 0) {
+            buffer_free(buffer);
+            return NULL;
+        }
+        return buffer;
+    }
+
     buffer = (buffer_t)malloc(sizeof(struct buffer));
     if (buffer == NULL) {
         return NULL;
     }
 
-    buffer->size = INITIAL_BUFFER_SIZE;
+    if (size_hint < INITIAL_BUFFER_SIZE) {
+        size_hint = INITIAL_BUFFER_SIZE;
+    }
+    buffer->size = size_hint;
     buffer->position = 0;
-    buffer->buffer = (char*)malloc(sizeof(char) * INITIAL_BUFFER_SIZE);
+    buffer->buffer = (char*)malloc(sizeof(char) * size_hint);
     if (buffer->buffer == NULL) {
         free(buffer);
         return NULL;
@@ -47,12 +89,26 @@ buffer_t buffer_new(void) {
     return buffer;
 }
 
-/* Free the memory allocated for `buffer`.
+/* Release `buffer`, keeping it for reuse if the pool isn't full.
  * Return non-zero on failure. */
 int buffer_free(buffer_t buffer) {
     if (buffer == NULL) {
         return 1;
     }
+    if (buffer_pool_count < BUFFER_POOL_SIZE) {
+        if (buffer->size > MAX_POOLED_BUFFER_SIZE) {
+            char* smaller = (char*)realloc(
+                buffer->buffer, sizeof(char) * MAX_POOLED_BUFFER_SIZE);
+            if (smaller != NULL) {
+                buffer->buffer = smaller;
+                buffer->size = MAX_POOLED_BUFFER_SIZE;
+            }
+        }
+        if (buffer->size <= MAX_POOLED_BUFFER_SIZE) {
+            buffer_pool[buffer_pool_count++] = buffer;
+            return 0;
+        }
+    }
     free(buffer->buffer);
     free(buffer);
     return 0;
@@ -78,8 +134,8 @@ static int buffer_grow(buffer_t buffer, int min_length) {
     }
     buffer->buffer = (char*)realloc(buffer->buffer, sizeof(char) * size);
     if (buffer->buffer == NULL) {
-        free(old_buffer);
-        free(buffer);
+        /* Leave `buffer` as it was, the caller frees it. */
+        buffer->buffer = old_buffer;
         return 1;
     }
     buffer->size = size;
@@ -106,6 +162,13 @@ buffer_position buffer_save_space(buffer_t buffer, int size) {
     return position;
 }
 
+/* Make sure `buffer` has room for `size` more bytes, so that writing them
+ * doesn't reallocate.
+ * Return non-zero on allocation failure. */
+int buffer_reserve(buffer_t buffer, int size) {
+    return buffer_assure_space(buffer, size);
+}
+
 /* Write `size` bytes from `data` to `buffer` (and grow if needed).
  * Return non-zero on allocation failure. */
 int buffer_write(buffer_t buffer, const char* data, int size) {
@@ -124,7 +187,6 @@ int buffer_write(buffer_t buffer, const char* data, int size) {
 int buffer_write_at_position(buffer_t buffer, buffer_position position,
                              const char* data, int size) {
     if (position + size > buffer->size) {
-        buffer_free(buffer);
         return 1;
     }
 
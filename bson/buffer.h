@@ -17,8 +17,12 @@
 #ifndef BUFFER_H
 #define BUFFER_H
 
-/* Note: if any of these functions return a failure condition then the buffer
- * has already been freed. */
+/* Note: if any of these functions return a failure condition the buffer is
+ * left as it was and must still be freed by the caller.
+ *
+ * Freed buffers are kept in a small pool and handed out again by buffer_new,
+ * so encoding many documents doesn't allocate a new buffer for each one.
+ * The pool isn't thread safe: callers must hold the GIL. */
 
 /* A buffer */
 typedef struct buffer* buffer_t;
@@ -29,10 +33,21 @@ typedef int buffer_position;
  * Return NULL on allocation failure. */
 buffer_t buffer_new(void);
 
-/* Free the memory allocated for `buffer`.
+/* Allocate and return a new buffer with room for at least `size_hint` bytes,
+ * e.g. the size of the previous document of the same shape. Hints over
+ * 64 KiB, the most a pooled buffer keeps, are capped to that.
+ * Return NULL on allocation failure. */
+buffer_t buffer_new_with_size(int size_hint);
+
+/* Release `buffer`, keeping it for reuse if the pool isn't full.
  * Return non-zero on failure. */
 int buffer_free(buffer_t buffer);
 
+/* Make sure `buffer` has room for `size` more bytes, so that writing them
+ * doesn't reallocate.
+ * Return non-zero on allocation failure. */
+int buffer_reserve(buffer_t buffer, int size);
+
 /* Save `size` bytes from the current position in `buffer` (and grow if needed).
  * Return offset for writing, or -1 on allocation failure. */
 buffer_position buffer_save_space(buffer_t buffer, int size);
@@ -14,15 +14,49 @@
 
 """Tools for specifying BSON codec options."""
 
+import sys
+
 from collections import MutableMapping, namedtuple
 
 from bson.binary import (ALL_UUID_REPRESENTATIONS,
                          PYTHON_LEGACY,
                          UUID_REPRESENTATION_NAMES)
-
+from bson.py3compat import string_type
+
+
+_RAW_BSON_DOCUMENT_MARKER = 101
+
+
+def _raw_document_class(document_class):
+    """Determine if a document_class is a RawBSONDocument class."""
+    marker = getattr(document_class, '_type_marker', None)
+    return marker == _RAW_BSON_DOCUMENT_MARKER
+
+
+def _validate_decode_fields(decode_fields):
+    """Validate CodecOptions.decode_fields, returning a tuple of fields."""
+    if decode_fields is None:
+        return None
+    if isinstance(decode_fields, string_type):
+        raise TypeError("decode_fields must be a list of field names, "
+                        "not a string")
+    try:
+        fields = tuple(decode_fields)
+    except TypeError:
+        raise TypeError("decode_fields must be None or a list of field names")
+    for field in fields:
+        if not isinstance(field, string_type):
+            raise TypeError("each field in decode_fields must be an "
+                            "instance of %s" % (string_type.__name__,))
+        if not all(field.split(".")):
+            raise ValueError("invalid field name in decode_fields: %r"
+                             % (field,))
+    return fields
 
 _options_base = namedtuple(
-    'CodecOptions', ('document_class', 'tz_aware', 'uuid_representation'))
+    'CodecOptions', ('document_class', 'tz_aware', 'uuid_representation',
+                     'decode_fields', 'datetime_as_millis',
+                     'compiled_encoder', 'binary_as_memoryview'))
 
 
 class CodecOptions(_options_base):
@@ -31,28 +65,84 @@ class CodecOptions(_options_base):
     :Parameters:
       - `document_class`: BSON documents returned in queries will be decoded
         to an instance of this class. Must be a subclass of
-        :class:`~collections.MutableMapping`. Defaults to :class:`dict`.
+        :class:`~collections.MutableMapping` or
+        :class:`~bson.raw_bson.RawBSONDocument`. Defaults to :class:`dict`.
+        If the class has a ``_from_bson_items`` classmethod, each document is
+        created by calling it with a list of its ``(key, value)`` pairs, in
+        document order, instead of setting the items one at a time.
       - `tz_aware`: If ``True``, BSON datetimes will be decoded to timezone
         aware instances of :class:`~datetime.datetime`. Otherwise they will be
         naive. Defaults to ``False``.
       - `uuid_representation`: The BSON representation to use when encoding
         and decoding instances of :class:`~uuid.UUID`. Defaults to
         :data:`~bson.binary.PYTHON_LEGACY`.
+      - `decode_fields`: A list of field names, possibly in dot notation,
+        that BSON documents are decoded with. Other fields are skipped over
+        without being decoded, so that only the values the application needs
+        are turned into Python objects. ``"a.b"`` selects field ``b`` of the
+        embedded document ``a``, or of each embedded document in the array
+        ``a``. Use a projection instead if the server can do the filtering.
+        Ignored when `document_class` is
+        :class:`~bson.raw_bson.RawBSONDocument`. Defaults to ``None``,
+        decoding every field.
+      - `datetime_as_millis`: If ``True``, BSON datetimes will be decoded to
+        an :class:`int`, the number of milliseconds since the Unix epoch,
+        instead of a :class:`~datetime.datetime`. `tz_aware` is then
+        ignored. Defaults to ``False``.
+      - `compiled_encoder`: An encoder returned by
+        :func:`bson.compile_encoder`, used to encode the top level documents
+        that have the keys of its template, such as the documents inserted
+        by :meth:`~pymongo.collection.Collection.insert_many`. Other
+        documents are encoded as usual. Defaults to ``None``.
+      - `binary_as_memoryview`: If ``True``, BSON binary values of subtype 0
+        will be decoded to a :class:`memoryview` of the data being decoded,
+        instead of being copied to :class:`bytes` (or, in Python 2, a
+        :class:`~bson.binary.Binary`). Such a :class:`memoryview` keeps all
+        of that data alive: every document of a query's batch while it is
+        decoded from a reply. Copy the values that are kept for long with
+        ``bytes(value)``. Memoryviews are encoded as binary subtype 0.
+        Not supported in Python 2.6. Defaults to ``False``.
+
+    .. versionchanged:: 3.1
+       Added the `decode_fields`, `datetime_as_millis`, `compiled_encoder`
+       and `binary_as_memoryview` options. A `document_class` can define
+       ``_from_bson_items``.
     """
 
     def __new__(cls, document_class=dict,
-                tz_aware=False, uuid_representation=PYTHON_LEGACY):
-        if not issubclass(document_class, MutableMapping):
-            raise TypeError("document_class must be dict, bson.son.SON, or "
-                            "another subclass of collections.MutableMapping")
+                tz_aware=False, uuid_representation=PYTHON_LEGACY,
+                decode_fields=None, datetime_as_millis=False,
+                compiled_encoder=None, binary_as_memoryview=False):
+        if not (issubclass(document_class, MutableMapping) or
+                _raw_document_class(document_class)):
+            raise TypeError("document_class must be dict, bson.son.SON, "
+                            "bson.raw_bson.RawBSONDocument, or a "
+                            "subclass of collections.MutableMapping")
         if not isinstance(tz_aware, bool):
             raise TypeError("tz_aware must be True or False")
+        if not isinstance(datetime_as_millis, bool):
+            raise TypeError("datetime_as_millis must be True or False")
+        if not isinstance(binary_as_memoryview, bool):
+            raise TypeError("binary_as_memoryview must be True or False")
+        if binary_as_memoryview and sys.version_info[:2] < (2, 7):
+            raise ValueError("binary_as_memoryview requires Python 2.7 "
+                             "or later")
         if uuid_representation not in ALL_UUID_REPRESENTATIONS:
             raise ValueError("uuid_representation must be a value "
                              "from bson.binary.ALL_UUID_REPRESENTATIONS")
 
+        if compiled_encoder is not None and not all(
+                hasattr(compiled_encoder, attr)
+                for attr in ('_keys', '_names', '_valid_keys')):
+            raise TypeError("compiled_encoder must be None or an encoder "
+                            "returned by bson.compile_encoder")
+
+        decode_fields = _validate_decode_fields(decode_fields)
+
         return tuple.__new__(
-            cls, (document_class, tz_aware, uuid_representation))
+            cls, (document_class, tz_aware, uuid_representation,
+                  decode_fields, datetime_as_millis, compiled_encoder,
+                  binary_as_memoryview))
 
     def __repr__(self):
         document_class_repr = (
@@ -62,9 +152,20 @@ class CodecOptions(_options_base):
         uuid_rep_repr = UUID_REPRESENTATION_NAMES.get(self.uuid_representation,
                                                       self.uuid_representation)
 
+        extra_repr = ''
+        if self.decode_fields is not None:
+            extra_repr += ', decode_fields=%r' % (self.decode_fields,)
+        if self.datetime_as_millis:
+            extra_repr += ', datetime_as_millis=True'
+        if self.compiled_encoder is not None:
+            extra_repr += ', compiled_encoder=%r' % (self.compiled_encoder,)
+        if self.binary_as_memoryview:
+            extra_repr += ', binary_as_memoryview=True'
+
         return (
             'CodecOptions(document_class=%s, tz_aware=%r, uuid_representation='
-            '%s)' % (document_class_repr, self.tz_aware, uuid_rep_repr))
+            '%s%s)' % (document_class_repr, self.tz_aware, uuid_rep_repr,
+                       extra_repr))
 
 
 DEFAULT_CODEC_OPTIONS = CodecOptions()
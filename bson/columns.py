@@ -0,0 +1,186 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tools for representing fields of many BSON documents as columns.
+
+:func:`bson.decode_columns` and
+:meth:`~pymongo.cursor.Cursor.to_columns` decode scalar fields straight
+into packed, typed buffers without creating a document for each BSON
+document. The buffers are :class:`bytearray` objects, so they can be
+wrapped without copying, for instance with NumPy::
+
+  >>> columns = bson.decode_columns(data, ["price", "when"])
+  >>> price = columns["price"]
+  >>> values = numpy.frombuffer(price.data, dtype=price.dtype)
+  >>> nulls = numpy.frombuffer(price.mask, dtype=bool)
+
+.. versionadded:: 3.1
+"""
+
+import struct
+
+from bson.objectid import ObjectId
+
+FLOAT64 = "<f8"
+"""Column type of BSON doubles, and of integers mixed with doubles."""
+
+INT64 = "<i8"
+"""Column type of BSON 32-bit and 64-bit integers."""
+
+BOOL = "?"
+"""Column type of BSON booleans, one byte per value."""
+
+DATETIME_MS = "<M8[ms]"
+"""Column type of BSON datetimes, milliseconds since the epoch as 64-bit
+integers."""
+
+OBJECTID = "V12"
+"""Column type of ObjectIds, the 12 bytes of each ObjectId."""
+
+# struct format and size in bytes of a value of each column type.
+_FORMATS = {
+    FLOAT64: ("<d", 8),
+    INT64: ("<q", 8),
+    BOOL: ("?", 1),
+    DATETIME_MS: ("<q", 8),
+    OBJECTID: ("12s", 12),
+}
+
+
+class Column(object):
+    """The values of one field of many BSON documents.
+
+    Values are packed in :attr:`data` in the little-endian type
+    :attr:`dtype`, a NumPy compatible type string, one of
+    :data:`FLOAT64`, :data:`INT64`, :data:`BOOL`, :data:`DATETIME_MS` or
+    :data:`OBJECTID`. :attr:`mask` holds a byte for each document, ``1`` if
+    the field is missing or null in that document and ``0`` otherwise. The
+    value of a null field is stored as zero bytes.
+
+    A column in which every value is null has the type :data:`FLOAT64`.
+    """
+
+    __slots__ = ('__dtype', '__data', '__mask')
+
+    def __init__(self, dtype, data, mask):
+        if dtype not in _FORMATS:
+            raise ValueError("unknown column type %r" % (dtype,))
+        if len(data) != len(mask) * _FORMATS[dtype][1]:
+            raise ValueError("column data and mask lengths don't match")
+        self.__dtype = dtype
+        self.__data = data
+        self.__mask = mask
+
+    @property
+    def dtype(self):
+        """The type of the values in this column."""
+        return self.__dtype
+
+    @property
+    def data(self):
+        """A :class:`bytearray` of the packed values in this column."""
+        return self.__data
+
+    @property
+    def mask(self):
+        """A :class:`bytearray` with a byte for each value, ``1`` if the
+        value is null or missing."""
+        return self.__mask
+
+    @property
+    def itemsize(self):
+        """The size in bytes of each value in :attr:`data`."""
+        return _FORMATS[self.__dtype][1]
+
+    def __len__(self):
+        return len(self.__mask)
+
+    def __getitem__(self, index):
+        """Get a value, ``None`` if null. Datetimes are returned as
+        milliseconds since the epoch and ObjectIds as
+        :class:`~bson.objectid.ObjectId`."""
+        length = len(self.__mask)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("column index out of range")
+        if self.__mask[index]:
+            return None
+        fmt, size = _FORMATS[self.__dtype]
+        value = struct.unpack_from(fmt, self.__data, index * size)[0]
+        if self.__dtype == OBJECTID:
+            return ObjectId(value)
+        return value
+
+    def tolist(self):
+        """Get the values of this column as a list, see :meth:`__getitem__`.
+        """
+        data = bytes(self.__data)
+        if self.__dtype == OBJECTID:
+            values = [ObjectId(data[i:i + 12])
+                      for i in range(0, len(data), 12)]
+        else:
+            fmt = _FORMATS[self.__dtype][0]
+            values = struct.unpack("<%d%s" % (len(self), fmt[-1]), data)
+        mask = self.__mask
+        return [None if mask[i] else value for i, value in enumerate(values)]
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __eq__(self, other):
+        if isinstance(other, Column):
+            return ((self.__dtype, self.__data, self.__mask) ==
+                    (other.dtype, other.data, other.mask))
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Column(%r, %r)" % (self.__dtype, self.tolist())
+
+
+def _all_null(column):
+    return column.mask.find(b"\x00") == -1
+
+
+def _concat_columns(columns):
+    """Join columns of the same field decoded from consecutive batches."""
+    dtypes = set(col.dtype for col in columns if not _all_null(col))
+    if not dtypes:
+        dtype = FLOAT64
+    elif dtypes == set([INT64, FLOAT64]):
+        dtype = FLOAT64
+    elif len(dtypes) == 1:
+        dtype = dtypes.pop()
+    else:
+        raise ValueError("field has values of types %s, which can't be "
+                         "stored in one column" % (", ".join(sorted(dtypes)),))
+    size = _FORMATS[dtype][1]
+    data = bytearray()
+    mask = bytearray()
+    for col in columns:
+        if _all_null(col):
+            data += bytearray(len(col) * size)
+        elif col.dtype != dtype:
+            # Integers mixed with doubles.
+            count = len(col)
+            data += struct.pack("<%dd" % (count,),
+                                *struct.unpack("<%dq" % (count,),
+                                               bytes(col.data)))
+        else:
+            data += col.data
+        mask += col.mask
+    return Column(dtype, data, mask)
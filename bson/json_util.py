@@ -47,6 +47,10 @@ It won't handle :class:`~bson.binary.Binary` and :class:`~bson.code.Code`
 instances (as they are extended strings you can't provide custom defaults),
 but it will be faster as there is less recursion.
 
+.. versionchanged:: 3.1
+   Added :func:`dump_iter` and :func:`load_iter` to export and import
+   newline-delimited files one document at a time.
+
 .. versionchanged:: 2.8
    The output format for :class:`~bson.timestamp.Timestamp` has changed from
    '{"t": <int>, "i": <int>}' to '{"$timestamp": {"t": <int>, "i": <int>}}'.
@@ -87,7 +91,8 @@ from bson.regex import Regex
 from bson.timestamp import Timestamp
 from bson.tz_util import utc
 
-from bson.py3compat import PY3, iteritems, string_type, text_type
+from bson.py3compat import (PY3, integer_types, iteritems, string_type,
+                            text_type)
 
 
 _RE_OPT_TABLE = {
@@ -122,6 +127,133 @@ def loads(s, *args, **kwargs):
     return json.loads(s, *args, **kwargs)
 
 
+def dump_iter(documents, fp):
+    """Write documents to a file as newline-delimited JSON.
+
+    Each document is written on its own line, the same as :func:`dumps`
+    would encode it, in the format read by :func:`load_iter` and written by
+    ``mongoexport``. Unlike :func:`dumps`, documents are not first copied to
+    convert their BSON types, and only one document at a time is held in
+    memory, so a whole collection can be exported from a cursor::
+
+      >>> with open('export.json', 'w') as fp:
+      ...     json_util.dump_iter(db.test.find(), fp)
+
+    Returns the number of documents written.
+
+    :Parameters:
+      - `documents`: an iterable of documents, such as a
+        :class:`~pymongo.cursor.Cursor`
+      - `fp`: a file-like object opened for writing text
+
+    .. versionadded:: 3.1
+    """
+    count = 0
+    for document in documents:
+        pieces = []
+        _encode_json(document, pieces.append)
+        pieces.append("\n")
+        fp.write("".join(pieces))
+        count += 1
+    return count
+
+
+def load_iter(fp, *args, **kwargs):
+    """Read documents from a file of newline-delimited JSON.
+
+    Yields one document for each non-blank line of `fp`, decoded like
+    :func:`loads`. Only one line at a time is held in memory, so files
+    written by :func:`dump_iter` or ``mongoexport`` can be imported in
+    batches of any size::
+
+      >>> with open('export.json') as fp:
+      ...     db.test.insert_many(list(json_util.load_iter(fp)))
+
+    Extra arguments are passed to :class:`json.JSONDecoder`.
+
+    .. versionadded:: 3.1
+    """
+    kwargs['object_hook'] = lambda dct: object_hook(dct)
+    decode = json.JSONDecoder(*args, **kwargs).decode
+    for line in fp:
+        if PY3 and isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if line:
+            yield decode(line)
+
+
+_JSON_SCALAR_TYPES = set([text_type, str, int, float, bool, type(None), Int64])
+if not PY3:
+    _JSON_SCALAR_TYPES.add(long)
+_encode_json_string = json.encoder.encode_basestring_ascii
+
+
+def _encode_json_scalar(obj):
+    """Encode a string, number, boolean or None like :func:`json.dumps`."""
+    if isinstance(obj, string_type):
+        return _encode_json_string(obj)
+    if obj is None:
+        return "null"
+    if obj is True:
+        return "true"
+    if obj is False:
+        return "false"
+    if isinstance(obj, integer_types):
+        return "%d" % (obj,)
+    if isinstance(obj, float):
+        if obj != obj:
+            return "NaN"
+        if obj == float("inf"):
+            return "Infinity"
+        if obj == -float("inf"):
+            return "-Infinity"
+        return float.__repr__(obj)
+    raise TypeError("%r is not JSON serializable" % (obj,))
+
+
+def _encode_json(obj, append):
+    """Append the JSON for `obj` to a list with `append`.
+
+    Converts BSON types the same way as :func:`_json_convert`, but as they
+    are found, without copying the documents and lists that contain them.
+    """
+    if type(obj) in _JSON_SCALAR_TYPES:
+        append(_encode_json_scalar(obj))
+    elif hasattr(obj, 'iteritems') or hasattr(obj, 'items'):
+        append("{")
+        first = True
+        for key, value in iteritems(obj):
+            if first:
+                first = False
+            else:
+                append(", ")
+            if isinstance(key, string_type):
+                append(_encode_json_string(key))
+            else:
+                append(_encode_json_string(_encode_json_scalar(key)))
+            append(": ")
+            _encode_json(value, append)
+        append("}")
+    elif hasattr(obj, '__iter__') and not isinstance(obj, (text_type, bytes)):
+        append("[")
+        first = True
+        for value in obj:
+            if first:
+                first = False
+            else:
+                append(", ")
+            _encode_json(value, append)
+        append("]")
+    else:
+        try:
+            converted = default(obj)
+        except TypeError:
+            append(_encode_json_scalar(obj))
+        else:
+            _encode_json(converted, append)
+
+
 def _json_convert(obj):
     """Recursive helper method that converts BSON types so they can be
     converted into json.
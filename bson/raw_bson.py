@@ -0,0 +1,130 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tools for representing raw BSON documents.
+
+A :class:`RawBSONDocument` keeps the BSON bytes it was created from and only
+decodes a field when that field is accessed. Use it as the `document_class`
+of a :class:`~bson.codec_options.CodecOptions` to avoid paying for decoding
+fields that an application never reads::
+
+  >>> from bson.codec_options import CodecOptions
+  >>> from bson.raw_bson import RawBSONDocument
+  >>> options = CodecOptions(document_class=RawBSONDocument)
+  >>> coll = client.db.get_collection('test', codec_options=options)
+  >>> doc = coll.find_one()
+  >>> doc['x']  # Decodes "x" only.
+  1
+
+.. versionadded:: 3.1
+"""
+
+import collections
+
+from codecs import utf_8_encode as _utf_8_encode
+
+from bson import _bson_to_dict, _find_element
+from bson.codec_options import (DEFAULT_CODEC_OPTIONS,
+                                _RAW_BSON_DOCUMENT_MARKER,
+                                _raw_document_class)
+from bson.py3compat import iteritems, text_type
+
+
+class RawBSONDocument(collections.Mapping):
+    """Representation for a MongoDB document that provides access to the raw
+    BSON bytes that compose it.
+
+    Fields are decoded lazily: reading a single field decodes that field's
+    value and skips over every other element without creating Python objects
+    for them. Iterating over the document, or calling :func:`len` on it,
+    decodes the whole document once. Decoded values are cached.
+
+    Embedded documents are decoded to :class:`dict` (or to the
+    `document_class` given in `codec_options` if that is not a raw document
+    class).
+    """
+
+    __slots__ = ('__raw', '__inflated_doc', '__decoded', '__codec_options')
+    _type_marker = _RAW_BSON_DOCUMENT_MARKER
+
+    def __init__(self, bson_bytes, codec_options=DEFAULT_CODEC_OPTIONS):
+        """Create a new :class:`RawBSONDocument`.
+
+        :Parameters:
+          - `bson_bytes`: the BSON bytes that compose this document
+          - `codec_options` (optional): An instance of
+            :class:`~bson.codec_options.CodecOptions`.
+        """
+        self.__raw = bson_bytes
+        self.__inflated_doc = None
+        self.__decoded = {}
+        # Don't let codec_options use a raw document class for embedded
+        # documents, decoding them would never end.
+        if _raw_document_class(codec_options.document_class):
+            codec_options = codec_options._replace(document_class=dict)
+        # The raw bytes always hold every field.
+        if codec_options.decode_fields is not None:
+            codec_options = codec_options._replace(decode_fields=None)
+        self.__codec_options = codec_options
+
+    @property
+    def raw(self):
+        """The raw BSON bytes composing this document."""
+        return self.__raw
+
+    def items(self):
+        """Lazily decode and iterate elements in this document."""
+        return iteritems(self.__inflated)
+
+    @property
+    def __inflated(self):
+        if self.__inflated_doc is None:
+            self.__inflated_doc = _bson_to_dict(self.__raw,
+                                                self.__codec_options)
+        return self.__inflated_doc
+
+    def __getitem__(self, item):
+        if self.__inflated_doc is not None:
+            return self.__inflated_doc[item]
+        try:
+            return self.__decoded[item]
+        except KeyError:
+            pass
+        if isinstance(item, text_type):
+            name = _utf_8_encode(item)[0]
+        elif isinstance(item, bytes):
+            name = item
+        else:
+            raise KeyError(item)
+        try:
+            value = _find_element(self.__raw, name, self.__codec_options)
+        except KeyError:
+            raise KeyError(item)
+        self.__decoded[item] = value
+        return value
+
+    def __iter__(self):
+        return iter(self.__inflated)
+
+    def __len__(self):
+        return len(self.__inflated)
+
+    def __eq__(self, other):
+        if isinstance(other, RawBSONDocument):
+            return self.__raw == other.raw
+        return NotImplemented
+
+    def __repr__(self):
+        return ("RawBSONDocument(%r, codec_options=%r)"
+                % (self.__raw, self.__codec_options))
@@ -29,6 +29,9 @@ from bson.py3compat import iteritems
 # This is essentially the same as re._pattern_type
 RE_TYPE = type(re.compile(""))
 
+# Marks the position of a deleted key in SON's list of keys.
+_DELETED = object()
+
 
 class SON(dict):
     """SON data.
@@ -86,8 +89,18 @@ class SON(dict):
        subtype 0.
     """
 
+    # The keys are kept in insertion order in the __keys list, set by
+    # __new__. Deleted keys leave a _DELETED hole so that deleting never
+    # shifts the list. The C extension appends to __keys directly when it
+    # decodes a document into a SON.
+
+    # Maps each key to its position in __keys. Built by the first deletion,
+    # since most SON instances never delete a key.
+    __index = None
+    # No key before this position in __keys is live, see popitem.
+    __first = 0
+
     def __init__(self, data=None, **kwargs):
-        self.__keys = []
         dict.__init__(self)
         self.update(data)
         self.update(kwargs)
@@ -99,21 +112,54 @@ class SON(dict):
 
     def __repr__(self):
         result = []
-        for key in self.__keys:
+        for key in self:
             result.append("(%r, %r)" % (key, self[key]))
         return "SON([%s])" % ", ".join(result)
 
     def __setitem__(self, key, value):
-        if key not in self.__keys:
+        if key not in self:
+            if self.__index is not None:
+                self.__index[key] = len(self.__keys)
             self.__keys.append(key)
         dict.__setitem__(self, key, value)
 
     def __delitem__(self, key):
-        self.__keys.remove(key)
         dict.__delitem__(self, key)
+        keys = self.__keys
+        if self.__index is None:
+            self.__index = dict(
+                (k, i) for i, k in enumerate(keys) if k is not _DELETED)
+        keys[self.__index.pop(key)] = _DELETED
+        # Drop the holes once they make up most of the list.
+        if len(keys) > 2 * len(self) + 8:
+            self.__compact()
+
+    def __compact(self):
+        """Remove the holes left in the list of keys by deletions."""
+        self.__keys = [k for k in self.__keys if k is not _DELETED]
+        self.__index = None
+        self.__first = 0
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop('_SON__index', None)
+        state.pop('_SON__first', None)
+        state['_SON__keys'] = list(self)
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        keys = state.pop('_SON__keys', [])
+        self.__dict__.update(state)
+        # Pickle protocols 0 and 1 restore the items without calling
+        # __new__ or __setitem__, otherwise the keys are already set.
+        if '_SON__keys' not in self.__dict__:
+            self.__keys = list(keys)
 
     def keys(self):
-        return list(self.__keys)
+        if len(self.__keys) == len(self):
+            return list(self.__keys)
+        return list(self)
 
     def copy(self):
         other = SON()
@@ -125,10 +171,11 @@ class SON(dict):
     # second level definitions support higher levels
     def __iter__(self):
         for k in self.__keys:
-            yield k
+            if k is not _DELETED:
+                yield k
 
     def has_key(self, key):
-        return key in self.__keys
+        return key in self
 
     # third level takes advantage of second level definitions
     def iteritems(self):
@@ -151,6 +198,8 @@ class SON(dict):
 
     def clear(self):
         self.__keys = []
+        self.__index = None
+        self.__first = 0
         super(SON, self).clear()
 
     def setdefault(self, key, default=None):
@@ -174,10 +223,15 @@ class SON(dict):
         return value
 
     def popitem(self):
-        try:
-            k, v = next(self.iteritems())
-        except StopIteration:
+        keys = self.__keys
+        first = self.__first
+        while first < len(keys) and keys[first] is _DELETED:
+            first += 1
+        if first == len(keys):
             raise KeyError('container is empty')
+        self.__first = first
+        k = keys[first]
+        v = self[k]
         del self[k]
         return (k, v)
 
@@ -214,9 +268,6 @@ class SON(dict):
     def __ne__(self, other):
         return not self == other
 
-    def __len__(self):
-        return len(self.__keys)
-
     def to_dict(self):
         """Convert a SON document to a normal Python dictionary instance.
 
@@ -18,6 +18,9 @@ import datetime
 import math
 import os
 
+from io import BytesIO
+
+from bson import _HAS_MEMORYVIEW
 from bson.binary import Binary
 from bson.objectid import ObjectId
 from bson.py3compat import text_type, StringIO
@@ -382,7 +385,14 @@ class GridOut(object):
             raise TypeError("root_collection must be an "
                             "instance of Collection")
 
-        self.__chunks = root_collection.chunks
+        # Chunk data is decoded to a memoryview of the reply instead of a
+        # copy, so read() copies each chunk only once, into the data it
+        # returns. The other options must match GridIn's, which encoded the
+        # files_id the chunks are found by.
+        chunks = root_collection.chunks
+        self.__chunks = chunks.with_options(
+            codec_options=chunks.codec_options._replace(
+                binary_as_memoryview=_HAS_MEMORYVIEW))
         self.__files = root_collection.files
         self.__file_id = file_id
         self.__buffer = EMPTY
@@ -419,6 +429,14 @@ class GridOut(object):
         """Reads a chunk at a time. If the current position is within a
         chunk the remainder of the chunk is returned.
         """
+        chunk_data = self.__read_chunk()
+        if not isinstance(chunk_data, bytes):
+            chunk_data = chunk_data.tobytes()
+        return chunk_data
+
+    def __read_chunk(self):
+        """Like readchunk, but may return a memoryview of the chunk data.
+        """
         received = len(self.__buffer)
         chunk_data = EMPTY
         chunk_size = int(self.chunk_size)
@@ -458,9 +476,9 @@ class GridOut(object):
             size = remainder
 
         received = 0
-        data = StringIO()
+        data = BytesIO()
         while received < size:
-            chunk_data = self.readchunk()
+            chunk_data = self.__read_chunk()
             received += len(chunk_data)
             data.write(chunk_data)
 
@@ -584,7 +602,11 @@ class GridOutIterator(object):
         if not chunk:
             raise CorruptGridFile("no chunk #%d" % self.__current_chunk)
         self.__current_chunk += 1
-        return bytes(chunk["data"])
+        chunk_data = chunk["data"]
+        if isinstance(chunk_data, bytes):
+            # A Binary, in Python 2.6.
+            return bytes(chunk_data)
+        return chunk_data.tobytes()
 
     __next__ = next
 
@@ -37,12 +37,6 @@ struct module_state {
 static struct module_state _state;
 #endif
 
-#if PY_MAJOR_VERSION >= 3
-#define BYTES_FORMAT_STRING "y#"
-#else
-#define BYTES_FORMAT_STRING "s#"
-#endif
-
 #define DOC_TOO_LARGE_FMT "BSON document too large (%d bytes)" \
                           " - the connected server supports" \
                           " BSON document sizes up to %ld bytes."
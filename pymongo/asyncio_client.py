@@ -0,0 +1,1500 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.  You
+# may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.  See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""A MongoDB client for :mod:`asyncio`. Requires Python 3.5 or later.
+
+:class:`AsyncMongoClient` discovers and monitors servers, and pools
+connections, in tasks on the event loop instead of in threads. Its
+operations are coroutines::
+
+    async def main():
+        client = AsyncMongoClient('mongodb://localhost:27017/')
+        await client.db.test.insert_one({'x': 1})
+        async for doc in client.db.test.find({'x': 1}):
+            print(doc)
+
+Several operations are sent on one connection at once if the
+``maxRequestsPerSocket`` option is greater than 1, each reply is handed
+to the operation waiting for it. So one event loop thread can run
+thousands of operations concurrently with a small pool.
+
+Messages are encoded, and replies decoded, by the same code as
+:class:`~pymongo.mongo_client.MongoClient`, and servers are selected by the
+same :class:`~pymongo.topology.Topology` logic. The client requires MongoDB
+2.6 or later, and does not support authentication or exhaust cursors.
+"""
+
+import asyncio
+import collections
+import collections.abc
+import contextlib
+import random
+import socket
+import warnings
+import weakref
+
+from functools import partial
+
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from bson.py3compat import string_type, _unicode
+from bson.son import SON
+from pymongo import common, helpers, message
+from pymongo.bulk import (_Bulk,
+                          _COMMANDS,
+                          _merge_command,
+                          _new_ids,
+                          _prepare_insert,
+                          _raw_document)
+from pymongo.client_options import ClientOptions
+from pymongo.collection import _check_name as _check_collection_name
+from pymongo.compression_support import _NO_COMPRESSION
+from pymongo.database import _check_name
+from pymongo.errors import (AutoReconnect,
+                            BulkWriteError,
+                            ConfigurationError,
+                            ConnectionFailure,
+                            ExceededMaxWaiters,
+                            InvalidOperation,
+                            NetworkTimeout,
+                            NotMasterError,
+                            OperationFailure,
+                            ServerSelectionTimeoutError)
+from pymongo.helpers import _check_write_command_response
+from pymongo.ismaster import IsMaster
+from pymongo.message import _INSERT, _UPDATE, _DELETE, _GetMore, _Query
+from pymongo.mongo_client import MongoClient, _parse_hosts
+from pymongo.monotonic import time as _time
+from pymongo.network import (_command_reply_codec_options,
+                             _decompress_message)
+from pymongo.operations import _WriteOp
+from pymongo.pool import (CertificateError,
+                          SocketInfo,
+                          _ismaster_command,
+                          _raise_connection_failure,
+                          match_hostname)
+from pymongo.read_preferences import MovingAverage, ReadPreference
+from pymongo.results import (BulkWriteResult,
+                             DeleteResult,
+                             InsertManyResult,
+                             InsertOneResult,
+                             UpdateResult)
+from pymongo.server_description import ServerDescription
+from pymongo.server_selectors import (address_server_selector,
+                                      writable_server_selector)
+from pymongo.server_type import SERVER_TYPE
+from pymongo.settings import TopologySettings
+from pymongo.topology import Topology
+from pymongo.topology_description import TOPOLOGY_TYPE
+
+
+@contextlib.contextmanager
+def _translate_network_errors(address):
+    """Convert errors reading or writing an asyncio stream to
+    ConnectionFailure, like :func:`~pymongo.pool._raise_connection_failure`
+    converts socket errors.
+    """
+    try:
+        yield
+    except asyncio.TimeoutError:
+        _raise_connection_failure(address, socket.timeout('timed out'))
+    except asyncio.IncompleteReadError:
+        _raise_connection_failure(address, socket.error('connection closed'))
+    except CertificateError:
+        raise
+    except socket.error as error:
+        _raise_connection_failure(address, error)
+
+
+async def _read_message(reader):
+    """Read the next message from a StreamReader.
+
+    Returns its responseTo, its opcode and the message after its header.
+    An **OP_COMPRESSED** message is decompressed.
+    """
+    header = await reader.readexactly(16)
+    length, _, response_to, op_code = message._UNPACK_HEADER(header)
+    op_code, data = _decompress_message(
+        op_code, await reader.readexactly(length - 16))
+    return response_to, op_code, data
+
+
+class _StreamSocket(object):
+    """The socket a SocketInfo writes to, for an asyncio StreamWriter.
+
+    Writes go to the transport's buffer and never block. Lists of buffers
+    from :func:`~pymongo.network.sendall_buffers` are written together.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def sendall(self, data):
+        self.writer.write(data)
+
+    def sendmsg(self, buffers):
+        self.writer.writelines(buffers)
+        return sum(len(buf) for buf in buffers)
+
+    def close(self):
+        self.writer.close()
+
+
+class _AsyncConnection(SocketInfo):
+    """A connection to a server, shared by coroutines awaiting replies.
+
+    Like :class:`~pymongo.pool.SocketInfo`, except that :meth:`command`,
+    :meth:`send_message`, :meth:`receive_message` and :meth:`write_command`
+    are coroutines. A reader task reads replies as they arrive and hands
+    each one to the coroutine awaiting it, by responseTo.
+
+    :Parameters:
+      - `reader`: the connection's StreamReader
+      - `writer`: the connection's StreamWriter
+      - `pool`: an _AsyncPool instance
+      - `ismaster`: optional IsMaster instance, the handshake's response
+      - `address`: the server's (host, port)
+    """
+
+    def __init__(self, reader, writer, pool, ismaster, address):
+        super(_AsyncConnection, self).__init__(
+            _StreamSocket(writer), pool, ismaster, address)
+        self.socket_timeout = pool.opts.socket_timeout
+        self._writer = writer
+        # Concurrent drain() calls are not allowed.
+        self._drain_lock = asyncio.Lock()
+        # A future for the reply to each request in flight, by request id.
+        self._replies = {}
+        # Why the connection closed, raised to coroutines awaiting replies.
+        self._error = None
+        self._reader_task = asyncio.ensure_future(self._read_replies(reader))
+
+    async def command(self, dbname, spec, slave_ok=False,
+                      read_preference=ReadPreference.PRIMARY,
+                      codec_options=DEFAULT_CODEC_OPTIONS, check=True,
+                      allowable_errors=None):
+        """Execute a command or raise ConnectionFailure or OperationFailure.
+
+        A coroutine. See :meth:`pymongo.pool.SocketInfo.command`.
+        """
+        name = next(iter(spec))
+        ns = dbname + '.$cmd'
+        flags = 4 if slave_ok else 0
+        if self.is_mongos:
+            spec = message._maybe_add_read_preference(spec, read_preference)
+        request_id, msg, max_doc_size = message.query(
+            flags, ns, 0, -1, spec, None, codec_options)
+        if name.lower() in _NO_COMPRESSION:
+            self._check_open()
+            self.sock.sendall(msg)
+            await self._sent(request_id)
+        else:
+            await self.send_message(msg, max_doc_size, request_id)
+        response = await self.receive_message(1, request_id)
+        unpacked = helpers._unpack_response(
+            response,
+            codec_options=_command_reply_codec_options(codec_options))
+        response_doc = unpacked['data'][0]
+        msg = "command %s on namespace %s failed: %%s" % (
+            repr(spec).replace("%", "%%"), ns)
+        if check:
+            helpers._check_command_response(response_doc, msg,
+                                            allowable_errors)
+        return response_doc
+
+    async def send_message(self, message, max_doc_size, request_id=None):
+        """Send a raw BSON message or raise ConnectionFailure. A coroutine.
+
+        Pass the `request_id` whose reply will be read with
+        :meth:`receive_message`, if any.
+        """
+        self._check_open()
+        # Writes the message, compressed if agreed on, to the transport.
+        super(_AsyncConnection, self).send_message(message, max_doc_size)
+        await self._sent(request_id)
+
+    async def receive_message(self, operation, request_id):
+        """Receive the reply to `request_id` or raise ConnectionFailure.
+
+        A coroutine. Closes the connection if the reply doesn't arrive
+        within socket_timeout.
+        """
+        future = self._replies.get(request_id)
+        if future is None:
+            self._check_open()
+            raise AutoReconnect("no request %r in flight" % (request_id,))
+        try:
+            with _translate_network_errors(self.address):
+                try:
+                    op_code, data = await asyncio.wait_for(
+                        future, self.socket_timeout)
+                except asyncio.TimeoutError:
+                    self.close()
+                    raise
+        finally:
+            self._replies.pop(request_id, None)
+        assert operation == op_code
+        return data
+
+    async def write_command(self, request_id, msg):
+        """Send "insert" etc. command, returning response as a dict.
+
+        A coroutine. Can raise ConnectionFailure or OperationFailure.
+        """
+        await self.send_message(msg, 0, request_id)
+        response = helpers._unpack_response(
+            await self.receive_message(1, request_id))
+        assert response['number_returned'] == 1
+        result = response['data'][0]
+
+        # Raises NotMasterError or OperationFailure.
+        helpers._check_command_response(result)
+        return result
+
+    def close(self):
+        super(_AsyncConnection, self).close()
+        if not self._reader_task.done():
+            self._reader_task.cancel()
+        error = self._error or AutoReconnect(
+            "%s:%d: connection closed" % self.address)
+        replies, self._replies = self._replies, {}
+        for future in replies.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def _check_open(self):
+        if self.closed:
+            raise self._error or AutoReconnect(
+                "%s:%d: connection closed" % self.address)
+
+    async def _sent(self, request_id):
+        """Expect a reply to `request_id`, if any, and wait until the
+        transport can take more data.
+        """
+        if request_id is not None:
+            self._replies[request_id] = (
+                asyncio.get_event_loop().create_future())
+        try:
+            with _translate_network_errors(self.address):
+                async with self._drain_lock:
+                    await self._writer.drain()
+        except ConnectionFailure as error:
+            self._replies.pop(request_id, None)
+            self._error = self._error or error
+            self.close()
+            raise
+
+    async def _read_replies(self, reader):
+        try:
+            with _translate_network_errors(self.address):
+                while True:
+                    response_to, op_code, data = await _read_message(reader)
+                    future = self._replies.get(response_to)
+                    # The future is cancelled if its coroutine gave up.
+                    if future is not None and not future.done():
+                        future.set_result((op_code, data))
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            self._error = error
+            self.close()
+
+
+class _AsyncPool(object):
+    """A pool of :class:`_AsyncConnection` to one server.
+
+    Up to `max_requests_per_socket` coroutines share each connection.
+    Coroutines wait for a connection if `max_pool_size` connections are
+    in use.
+
+    :Parameters:
+      - `address`: a (hostname, port) tuple
+      - `options`: a PoolOptions instance
+      - `handshake`: whether to call ismaster for each new connection
+    """
+
+    def __init__(self, address, options, handshake=True):
+        self.address = address
+        self.opts = options
+        self.handshake = handshake
+        # Keep track of resets, so we notice connections created before the
+        # most recent reset and close them.
+        self.pool_id = 0
+        # Maps each connection, idle or not, to its number of users.
+        self.connections = {}
+        # Connections being opened count toward max_pool_size.
+        self._opening = 0
+        # A future for each coroutine waiting for a connection, in order.
+        self._waiters = collections.deque()
+        if (self.opts.wait_queue_multiple is None or
+                self.opts.max_pool_size is None):
+            self._max_waiters = None
+        else:
+            self._max_waiters = (
+                self.opts.max_pool_size * self.opts.wait_queue_multiple)
+
+    def reset(self):
+        self.pool_id += 1
+        # Connections in use are closed when they're checked in.
+        for conn, users in list(self.connections.items()):
+            if not users:
+                del self.connections[conn]
+                conn.close()
+        self._wake()
+
+    async def connect(self):
+        """Connect to the server and return a new :class:`_AsyncConnection`.
+
+        A coroutine. Can raise ConnectionFailure or CertificateError.
+        """
+        host, port = self.address
+        ssl_context = self.opts.ssl_context
+        kwargs = {}
+        if ssl_context is not None:
+            kwargs = {'ssl': ssl_context, 'server_hostname': host}
+        with _translate_network_errors(self.address):
+            if host.endswith('.sock'):
+                if not hasattr(socket, "AF_UNIX"):
+                    raise ConnectionFailure("UNIX-sockets are not supported "
+                                            "on this system")
+                opening = asyncio.open_unix_connection(host, **kwargs)
+            else:
+                opening = asyncio.open_connection(host, port, **kwargs)
+            reader, writer = await asyncio.wait_for(
+                opening, self.opts.connect_timeout)
+
+        try:
+            sock = writer.get_extra_info('socket')
+            if sock.family != getattr(socket, "AF_UNIX", None):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE,
+                                self.opts.socket_keepalive)
+            if (ssl_context is not None and ssl_context.verify_mode and
+                    self.opts.ssl_match_hostname):
+                match_hostname(writer.get_extra_info('peercert'),
+                               hostname=host)
+            if self.handshake:
+                ismaster = IsMaster(await self._handshake(reader, writer))
+            else:
+                ismaster = None
+        except BaseException:
+            writer.close()
+            raise
+        return _AsyncConnection(reader, writer, self, ismaster, self.address)
+
+    async def checkout(self):
+        """Get a connection, sharing one with other coroutines if possible.
+
+        A coroutine. Call :meth:`checkin` when done with the connection.
+        Can raise ConnectionFailure or ExceededMaxWaiters.
+        """
+        max_users = max(1, self.opts.max_requests_per_socket)
+        timeout = self.opts.wait_queue_timeout
+        deadline = None if timeout is None else _time() + timeout
+        while True:
+            best = None
+            for conn, users in list(self.connections.items()):
+                if conn.closed or conn.pool_id != self.pool_id:
+                    if not users:
+                        del self.connections[conn]
+                        conn.close()
+                elif (users < max_users and
+                        (best is None or users < self.connections[best])):
+                    best = conn
+            if best is not None:
+                self.connections[best] += 1
+                best.last_checkout = _time()
+                if self.connections[best] < max_users:
+                    # Another waiter may share it too.
+                    self._wake()
+                return best
+
+            max_size = self.opts.max_pool_size
+            if (max_size is None or
+                    len(self.connections) + self._opening < max_size):
+                break
+            if (self._max_waiters is not None and
+                    len(self._waiters) >= self._max_waiters):
+                raise ExceededMaxWaiters()
+            await self._wait(deadline)
+
+        self._opening += 1
+        try:
+            conn = await self.connect()
+            self.connections[conn] = 1
+        finally:
+            self._opening -= 1
+            # A waiter may share the new connection, or open one instead.
+            self._wake()
+        return conn
+
+    def checkin(self, conn):
+        """Stop using a connection got from :meth:`checkout`."""
+        users = self.connections.pop(conn, 1) - 1
+        if users:
+            self.connections[conn] = users
+        elif conn.closed or conn.pool_id != self.pool_id:
+            conn.close()
+        else:
+            self.connections[conn] = 0
+        self._wake()
+
+    async def _handshake(self, reader, writer):
+        """Call ismaster on a new connection, returning the response."""
+        request_id, msg, _ = message.query(
+            0, 'admin.$cmd', 0, -1, _ismaster_command(self.opts), None,
+            DEFAULT_CODEC_OPTIONS)
+        with _translate_network_errors(self.address):
+            writer.write(msg)
+            response_to, _, data = await asyncio.wait_for(
+                _read_message(reader), self.opts.socket_timeout)
+        assert request_id == response_to
+        response = helpers._unpack_response(data)['data'][0]
+        helpers._check_command_response(response)
+        return response
+
+    async def _wait(self, deadline):
+        """Wait to be woken by :meth:`_wake`, or until the deadline."""
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        timeout = None if deadline is None else max(0, deadline - _time())
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self._raise_wait_queue_timeout()
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Woken, but gone. Pass it on.
+                self._wake()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _wake(self):
+        """Wake the coroutine that has waited longest for a connection."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def _raise_wait_queue_timeout(self):
+        raise ConnectionFailure(
+            'Timed out waiting for socket from pool with max_size %r and'
+            ' wait_queue_timeout %r' % (
+                self.opts.max_pool_size, self.opts.wait_queue_timeout))
+
+
+class _AsyncMonitor(object):
+    def __init__(
+            self,
+            server_description,
+            topology,
+            pool,
+            topology_settings):
+        """Monitor a MongoDB server in a task on the event loop.
+
+        Like :class:`~pymongo.monitor.Monitor`. Pass an initial
+        ServerDescription, a Topology, an _AsyncPool, and TopologySettings.
+
+        The Topology is weakly referenced. The pool must be exclusive to this
+        monitor.
+        """
+        self._server_description = server_description
+        self._pool = pool
+        self._settings = topology_settings
+        self._avg_round_trip_time = MovingAverage()
+        self._topology = weakref.proxy(topology)
+        self._task = None
+        self._event = None
+
+    def open(self):
+        """Start monitoring. Multiple calls have no effect.
+
+        Call it from a coroutine or callback on the event loop.
+        """
+        if self._task is None or self._task.done():
+            self._event = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    def close(self):
+        """Close and stop monitoring.
+
+        open() restarts the monitor after closing.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        # Increment the pool_id and maybe close the connection. If the task
+        # has the connection checked out, it will be closed when checked in.
+        self._pool.reset()
+
+    def request_check(self):
+        """If the monitor is sleeping, wake and check the server soon."""
+        if self._event is not None:
+            self._event.set()
+
+    async def _run(self):
+        while True:
+            try:
+                self._server_description = await self._check_with_retry()
+                self._topology.on_change(self._server_description)
+            except ReferenceError:
+                # Topology was garbage-collected.
+                self._pool.reset()
+                return
+
+            deadline = _time() + common.HEARTBEAT_FREQUENCY
+
+            # Avoid checking too often if request_check() is called very
+            # often.
+            await asyncio.sleep(common.MIN_HEARTBEAT_INTERVAL)
+            try:
+                await asyncio.wait_for(self._event.wait(),
+                                       max(0, deadline - _time()))
+            except asyncio.TimeoutError:
+                pass
+            self._event.clear()
+
+    async def _check_with_retry(self):
+        """Call ismaster once or twice. Reset server's pool on error.
+
+        Returns a ServerDescription.
+        """
+        # According to the spec, if an ismaster call fails we reset the
+        # server's pool. If a server was once connected, change its type
+        # to Unknown only after retrying once.
+        address = self._server_description.address
+        retry = self._server_description.server_type != SERVER_TYPE.Unknown
+
+        try:
+            return await self._check_once()
+        except (ReferenceError, asyncio.CancelledError):
+            raise
+        except Exception as error:
+            self._topology.reset_pool(address)
+            default = ServerDescription(address, error=error)
+            if not retry:
+                self._avg_round_trip_time.reset()
+                # Server type defaults to Unknown.
+                return default
+
+            # Try a second and final time. If it fails return original error.
+            try:
+                return await self._check_once()
+            except (ReferenceError, asyncio.CancelledError):
+                raise
+            except Exception:
+                self._avg_round_trip_time.reset()
+                return default
+
+    async def _check_once(self):
+        """A single attempt to call ismaster.
+
+        Returns a ServerDescription, or raises an exception.
+        """
+        conn = await self._pool.checkout()
+        try:
+            start = _time()
+            response = await conn.command('admin', SON([('ismaster', 1)]))
+            round_trip_time = _time() - start
+        finally:
+            self._pool.checkin(conn)
+
+        self._avg_round_trip_time.add_sample(round_trip_time)
+        return ServerDescription(
+            address=self._server_description.address,
+            ismaster=IsMaster(response),
+            round_trip_time=self._avg_round_trip_time.get())
+
+
+class _AsyncTopology(Topology):
+    """A Topology whose server selection methods are coroutines.
+
+    Its servers are monitored by :class:`_AsyncMonitor` tasks. Every method
+    runs on the event loop thread and none awaits while holding the lock,
+    so the lock is never contended.
+    """
+
+    def __init__(self, topology_settings):
+        super(_AsyncTopology, self).__init__(topology_settings)
+        # Set, then replaced, when the topology description changes.
+        self._changed = None
+
+    async def select_servers(self, selector, server_selection_timeout=None):
+        """Return a list of Servers matching selector, or time out.
+
+        A coroutine. See :meth:`pymongo.topology.Topology.select_servers`.
+        """
+        if server_selection_timeout is None:
+            server_timeout = self._settings.server_selection_timeout
+        else:
+            server_timeout = server_selection_timeout
+
+        end_time = _time() + server_timeout
+        while True:
+            with self._lock:
+                self._description.check_compatible()
+                server_descriptions = self._apply_selector(selector)
+                if server_descriptions:
+                    return [self.get_server_by_address(sd.address)
+                            for sd in server_descriptions]
+
+                # No suitable servers.
+                if server_timeout == 0 or _time() > end_time:
+                    raise ServerSelectionTimeoutError(
+                        self._error_message(selector))
+
+                self._ensure_opened()
+                self._request_check_all()
+                if self._changed is None:
+                    self._changed = asyncio.Event()
+                changed = self._changed
+
+            # Wait for the topology description to change, or for a timeout.
+            try:
+                await asyncio.wait_for(changed.wait(),
+                                       common.MIN_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def select_server(self, selector, server_selection_timeout=None):
+        """Like select_servers, but choose a random server if several match."""
+        return random.choice(await self.select_servers(
+            selector, server_selection_timeout))
+
+    async def select_server_by_address(self, address,
+                                       server_selection_timeout=None):
+        """Return a Server for "address", reconnecting if necessary.
+
+        A coroutine. See
+        :meth:`pymongo.topology.Topology.select_server_by_address`.
+        """
+        selector = partial(address_server_selector, address)
+        return await self.select_server(selector, server_selection_timeout)
+
+    def on_change(self, server_description):
+        """Process a new ServerDescription after an ismaster call completes."""
+        super(_AsyncTopology, self).on_change(server_description)
+        # Wake coroutines in select_servers().
+        changed, self._changed = self._changed, None
+        if changed is not None:
+            changed.set()
+
+
+class _ConnectionContext(object):
+    """Select a server and check out a connection, for ``async with``.
+
+    Returns (connection, slave_ok). On a network error or a "not master"
+    error, resets the server as :class:`~pymongo.mongo_client.MongoClient`
+    does.
+    """
+
+    def __init__(self, client, read_preference, address=None):
+        self._client = client
+        self._read_preference = read_preference
+        self._address = address
+        self._server = None
+        self._conn = None
+
+    async def __aenter__(self):
+        topology = self._client._topology
+        if self._address is not None:
+            server = await topology.select_server_by_address(self._address)
+        else:
+            server = await topology.select_server(
+                self._read_preference or writable_server_selector)
+        self._server = server
+        try:
+            self._conn = await server.pool.checkout()
+        except BaseException as error:
+            self._handle_error(error)
+            raise
+
+        # Server Selection Spec: "slaveOK must be sent to mongods with
+        # topology type Single."
+        single = topology.description.topology_type == TOPOLOGY_TYPE.Single
+        preference = self._read_preference or ReadPreference.PRIMARY
+        slave_ok = (single and not self._conn.is_mongos) or (
+            preference != ReadPreference.PRIMARY)
+        return self._conn, slave_ok
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._server.pool.checkin(self._conn)
+        if exc_val is not None:
+            self._handle_error(exc_val)
+
+    def _handle_error(self, error):
+        topology = self._client._topology
+        address = self._server.description.address
+        if isinstance(error, NetworkTimeout):
+            # The connection has been closed. Don't reset the server.
+            return
+        elif isinstance(error, NotMasterError):
+            topology.reset_server_and_request_check(address)
+        elif isinstance(error, ConnectionFailure):
+            topology.reset_server(address)
+
+
+class _WriteCommandBatches(object):
+    """Stands in for a connection in message._do_batched_write_command,
+    recording each batch of the write command instead of sending it.
+
+    The batches are then sent by a coroutine, and the placeholder result of
+    each batch is updated with the server's reply.
+    """
+
+    def __init__(self, conn):
+        self.max_bson_size = conn.max_bson_size
+        self.max_message_size = conn.max_message_size
+        self.max_write_batch_size = conn.max_write_batch_size
+        self.batches = []
+
+    def write_command(self, request_id, msg):
+        self.batches.append((request_id, msg))
+        return {}
+
+
+async def _batched_write_command(conn, namespace, operation, command,
+                                 docs, check_keys, codec_options):
+    """Execute a batch of insert, update, or delete commands. A coroutine.
+
+    Returns a list of (offset, result), like
+    :func:`~pymongo.message._do_batched_write_command`.
+    """
+    if conn.max_wire_version < 2:
+        raise ConfigurationError(
+            "AsyncMongoClient requires MongoDB 2.6 or later")
+    recorder = _WriteCommandBatches(conn)
+    results = message._do_batched_write_command(
+        namespace, operation, command, docs, check_keys, codec_options,
+        recorder)
+    ordered = command.get('ordered', True)
+    for i, (request_id, msg) in enumerate(recorder.batches):
+        result = results[i][1]
+        result.update(await conn.write_command(request_id, msg))
+        if ordered and "writeErrors" in result:
+            del results[i + 1:]
+            break
+    return results
+
+
+class AsyncMongoClient(common.BaseObject):
+
+    HOST = MongoClient.HOST
+    PORT = MongoClient.PORT
+
+    def __init__(
+            self,
+            host=None,
+            port=None,
+            document_class=dict,
+            tz_aware=False,
+            **kwargs):
+        """Client for a MongoDB instance, a replica set, or a set of mongoses,
+        for :mod:`asyncio`.
+
+        Takes the same `host`, `port`, `document_class`, `tz_aware` and
+        keyword arguments as :class:`~pymongo.mongo_client.MongoClient`, and
+        the same MongoDB URI options. Use the client on one event loop.
+
+        The client connects in the background when its first operation is
+        awaited, then monitors the servers in tasks on the event loop until
+        :meth:`close` is called.
+
+        Raises :class:`~pymongo.errors.ConfigurationError` if credentials
+        are given, authentication is not supported.
+
+        .. versionadded:: 3.1
+        """
+        if host is None:
+            host = self.HOST
+        if isinstance(host, string_type):
+            host = [host]
+        if port is None:
+            port = self.PORT
+        if not isinstance(port, int):
+            raise TypeError("port must be an instance of int")
+
+        seeds, username, password, dbase, opts = _parse_hosts(host, port)
+
+        kwargs['document_class'] = document_class
+        kwargs['tz_aware'] = tz_aware
+        opts.update(kwargs)
+        self.__options = options = ClientOptions(
+            username, password, dbase, opts)
+        if options.credentials:
+            raise ConfigurationError(
+                "AsyncMongoClient does not support authentication")
+
+        super(AsyncMongoClient, self).__init__(options.codec_options,
+                                               options.read_preference,
+                                               options.write_concern)
+
+        self._topology = _AsyncTopology(TopologySettings(
+            seeds=seeds,
+            replica_set_name=options.replica_set_name,
+            pool_class=_AsyncPool,
+            pool_options=options.pool_options,
+            monitor_class=_AsyncMonitor,
+            local_threshold_ms=options.local_threshold_ms,
+            server_selection_timeout=options.server_selection_timeout))
+
+        # The event loop the client is used on, once an operation starts.
+        self.__loop = None
+
+    def close(self):
+        """Disconnect from MongoDB.
+
+        Close all connections and stop the monitor tasks. If this instance
+        is used again it will be automatically re-opened.
+        """
+        self._topology.close()
+
+    def _get_connection(self, read_preference=None, address=None):
+        """Check out a connection for ``async with``, to a server matching
+        `read_preference`, or to `address`, or else to a writable server.
+        """
+        self.__loop = asyncio.get_event_loop()
+        return _ConnectionContext(self, read_preference, address)
+
+    def _kill_cursors_soon(self, cursor_ids, address):
+        """Kill cursors on the server soon.
+
+        This is called from cursor destructors during garbage collection, so
+        it only schedules a task on the client's event loop.
+        """
+        loop = self.__loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(
+                asyncio.ensure_future,
+                self._kill_cursors(cursor_ids, address))
+
+    async def _kill_cursors(self, cursor_ids, address):
+        """Send a kill cursors message. A coroutine."""
+        try:
+            async with self._get_connection(address=address) as (conn, _):
+                _, msg = message.kill_cursors(cursor_ids)
+                await conn.send_message(msg, 0)
+        except ConnectionFailure as exc:
+            warnings.warn("couldn't close cursor on %s: %s"
+                          % (address, exc))
+
+    def __repr__(self):
+        server_descriptions = self._topology.description.server_descriptions()
+        if len(server_descriptions) == 1:
+            description, = server_descriptions.values()
+            return "AsyncMongoClient(%r, %r)" % description.address
+        else:
+            return "AsyncMongoClient(%r)" % [
+                "%s:%d" % address for address in server_descriptions]
+
+    def __getattr__(self, name):
+        """Get a database by name.
+
+        Raises :class:`~pymongo.errors.InvalidName` if an invalid
+        database name is used.
+        """
+        if name.startswith('_'):
+            raise AttributeError(
+                "AsyncMongoClient has no attribute %r. To access the %s"
+                " database, use client[%r]." % (name, name, name))
+        return self.__getitem__(name)
+
+    def __getitem__(self, name):
+        """Get an :class:`AsyncDatabase` by name.
+
+        Raises :class:`~pymongo.errors.InvalidName` if an invalid
+        database name is used.
+        """
+        return AsyncDatabase(self, name)
+
+
+class AsyncDatabase(common.BaseObject):
+    """A MongoDB database, got from an :class:`AsyncMongoClient`."""
+
+    def __init__(self, client, name):
+        super(AsyncDatabase, self).__init__(client.codec_options,
+                                            client.read_preference,
+                                            client.write_concern)
+
+        if not isinstance(name, string_type):
+            raise TypeError("name must be an instance "
+                            "of %s" % (string_type.__name__,))
+        _check_name(name)
+
+        self.__name = _unicode(name)
+        self.__client = client
+
+    @property
+    def client(self):
+        """The :class:`AsyncMongoClient` for this database."""
+        return self.__client
+
+    @property
+    def name(self):
+        """The name of this database."""
+        return self.__name
+
+    def __repr__(self):
+        return "AsyncDatabase(%r, %r)" % (self.__client, self.__name)
+
+    def __getattr__(self, name):
+        """Get a collection of this database by name.
+
+        Raises InvalidName if an invalid collection name is used.
+        """
+        if name.startswith('_'):
+            raise AttributeError(
+                "AsyncDatabase has no attribute %r. To access the %s"
+                " collection, use database[%r]." % (name, name, name))
+        return self.__getitem__(name)
+
+    def __getitem__(self, name):
+        """Get an :class:`AsyncCollection` of this database by name."""
+        return AsyncCollection(self, name)
+
+    async def command(self, command, value=1,
+                      read_preference=ReadPreference.PRIMARY,
+                      codec_options=DEFAULT_CODEC_OPTIONS, **kwargs):
+        """Issue a MongoDB command. A coroutine.
+
+        Takes the same arguments as
+        :meth:`pymongo.database.Database.command`, except `check` and
+        `allowable_errors`.
+        """
+        if isinstance(command, string_type):
+            command = SON([(command, value)])
+        command.update(kwargs)
+        async with self.__client._get_connection(
+                read_preference) as (conn, slave_ok):
+            return await conn.command(self.__name, command, slave_ok,
+                                      read_preference, codec_options)
+
+
+class AsyncCollection(common.BaseObject):
+    """A MongoDB collection, got from an :class:`AsyncDatabase`.
+
+    Its methods have the same parameters and results as those of
+    :class:`~pymongo.collection.Collection`, and are coroutines, except
+    :meth:`find`.
+    """
+
+    def __init__(self, database, name):
+        super(AsyncCollection, self).__init__(database.codec_options,
+                                              database.read_preference,
+                                              database.write_concern)
+
+        _check_collection_name(name)
+        self.__database = database
+        self.__name = _unicode(name)
+        self.__full_name = "%s.%s" % (database.name, self.__name)
+
+    @property
+    def database(self):
+        """The :class:`AsyncDatabase` this collection is a part of."""
+        return self.__database
+
+    @property
+    def name(self):
+        """The name of this collection."""
+        return self.__name
+
+    @property
+    def full_name(self):
+        """The full name of this collection, "<database>.<collection>"."""
+        return self.__full_name
+
+    def __repr__(self):
+        return "AsyncCollection(%r, %r)" % (self.__database, self.__name)
+
+    def __getattr__(self, name):
+        """Get a sub-collection of this collection by name."""
+        if name.startswith('_'):
+            raise AttributeError(
+                "AsyncCollection has no attribute %r. To access the %s.%s"
+                " collection, use database['%s.%s']." % (
+                    name, self.__name, name, self.__name, name))
+        return self.__getitem__(name)
+
+    def __getitem__(self, name):
+        return AsyncCollection(self.__database,
+                               "%s.%s" % (self.__name, name))
+
+    def find(self, *args, **kwargs):
+        """Query the database, returning an :class:`AsyncCursor`.
+
+        Takes `filter`, `projection`, `skip`, `limit`, `sort` and
+        `batch_size`, like :meth:`pymongo.collection.Collection.find`.
+        """
+        return AsyncCursor(self, *args, **kwargs)
+
+    async def find_one(self, filter=None, *args, **kwargs):
+        """Get a single document from the database, or ``None``.
+
+        A coroutine. See :meth:`pymongo.collection.Collection.find_one`.
+        """
+        if (filter is not None and not
+                isinstance(filter, collections.abc.Mapping)):
+            filter = {"_id": filter}
+
+        async for result in self.find(filter, *args, **kwargs).limit(-1):
+            return result
+        return None
+
+    async def count(self, filter=None, **kwargs):
+        """Get the number of documents in this collection. A coroutine.
+
+        See :meth:`pymongo.collection.Collection.count`.
+        """
+        cmd = SON([("count", self.__name)])
+        if filter is not None:
+            if "query" in kwargs:
+                raise ConfigurationError("can't pass both filter and query")
+            kwargs["query"] = filter
+        if "hint" in kwargs and not isinstance(kwargs["hint"], string_type):
+            kwargs["hint"] = helpers._index_document(kwargs["hint"])
+        cmd.update(kwargs)
+        async with self.__database.client._get_connection(
+                self.read_preference) as (conn, slave_ok):
+            res = await conn.command(self.__database.name, cmd, slave_ok,
+                                     self.read_preference,
+                                     self.codec_options,
+                                     allowable_errors=["ns missing"])
+        if res.get("errmsg", "") == "ns missing":
+            return 0
+        return int(res["n"])
+
+    async def insert_one(self, document):
+        """Insert a single document. A coroutine.
+
+        Returns an instance of :class:`~pymongo.results.InsertOneResult`.
+        """
+        document = _prepare_insert(document)
+        await self._write(_INSERT, [document])
+        return InsertOneResult(document["_id"],
+                               self.write_concern.acknowledged)
+
+    async def insert_many(self, documents, ordered=True, check_keys=True):
+        """Insert a list of documents. A coroutine.
+
+        Returns an instance of :class:`~pymongo.results.InsertManyResult`.
+        """
+        if not isinstance(documents, list) or not documents:
+            raise TypeError("documents must be a non-empty list")
+        new_id = partial(next, _new_ids(len(documents)))
+        blk = _Bulk(self, ordered, check_keys)
+        blk.ops = [(_INSERT, _prepare_insert(document, new_id))
+                   for document in documents]
+        await self._execute_bulk(blk)
+        return InsertManyResult([doc["_id"] for _, doc in blk.ops],
+                                self.write_concern.acknowledged)
+
+    async def replace_one(self, filter, replacement, upsert=False):
+        """Replace a single document matching the filter. A coroutine.
+
+        Returns an instance of :class:`~pymongo.results.UpdateResult`.
+        """
+        replacement = _raw_document(replacement)
+        common.validate_ok_for_replace(replacement)
+        return await self._update(filter, replacement, upsert)
+
+    async def update_one(self, filter, update, upsert=False):
+        """Update a single document matching the filter. A coroutine.
+
+        Returns an instance of :class:`~pymongo.results.UpdateResult`.
+        """
+        common.validate_ok_for_update(update)
+        return await self._update(filter, update, upsert, check_keys=False)
+
+    async def update_many(self, filter, update, upsert=False):
+        """Update one or more documents that match the filter. A coroutine.
+
+        Returns an instance of :class:`~pymongo.results.UpdateResult`.
+        """
+        common.validate_ok_for_update(update)
+        return await self._update(filter, update, upsert, check_keys=False,
+                                  multi=True)
+
+    async def delete_one(self, filter):
+        """Delete a single document matching the filter. A coroutine.
+
+        Returns an instance of :class:`~pymongo.results.DeleteResult`.
+        """
+        return await self._delete(filter, False)
+
+    async def delete_many(self, filter):
+        """Delete one or more documents matching the filter. A coroutine.
+
+        Returns an instance of :class:`~pymongo.results.DeleteResult`.
+        """
+        return await self._delete(filter, True)
+
+    async def bulk_write(self, requests, ordered=True):
+        """Send a batch of write operations to the server. A coroutine.
+
+        See :meth:`pymongo.collection.Collection.bulk_write`. Returns an
+        instance of :class:`~pymongo.results.BulkWriteResult`.
+        """
+        if not isinstance(requests, list):
+            raise TypeError("requests must be a list")
+
+        blk = _Bulk(self, ordered)
+        for request in requests:
+            if not isinstance(request, _WriteOp):
+                raise TypeError("%r is not a valid request" % (request,))
+            request._add_to_bulk(blk)
+
+        bulk_api_result = await self._execute_bulk(blk)
+        if self.write_concern.acknowledged:
+            return BulkWriteResult(bulk_api_result, True)
+        return BulkWriteResult({}, False)
+
+    async def _update(self, filter, document, upsert=False,
+                      check_keys=True, multi=False):
+        """Internal update / replace helper."""
+        common.validate_is_mapping("filter", filter)
+        common.validate_boolean("upsert", upsert)
+        docs = [SON([('q', filter), ('u', document),
+                     ('multi', multi), ('upsert', upsert)])]
+        result = await self._write(_UPDATE, docs, check_keys)
+        # Add the updatedExisting field for compatibility.
+        if result.get('n') and 'upserted' not in result:
+            result['updatedExisting'] = True
+        else:
+            result['updatedExisting'] = False
+            # MongoDB >= 2.6.0 returns the upsert _id in an array
+            # element. Break it out for backward compatibility.
+            if 'upserted' in result:
+                result['upserted'] = result['upserted'][0]['_id']
+        return UpdateResult(result, self.write_concern.acknowledged)
+
+    async def _delete(self, filter, multi):
+        """Internal delete helper."""
+        common.validate_is_mapping("filter", filter)
+        docs = [SON([('q', filter), ('limit', int(not multi))])]
+        result = await self._write(_DELETE, docs, False)
+        return DeleteResult(result, self.write_concern.acknowledged)
+
+    async def _write(self, operation, docs, check_keys=True):
+        """Send an insert, update or delete command for `docs`, returning
+        the result of the first batch. A coroutine.
+        """
+        command = SON([(_COMMANDS[operation], self.__name)])
+        concern = self.write_concern.document
+        if concern:
+            command['writeConcern'] = concern
+        async with self.__database.client._get_connection() as (conn, _):
+            results = await _batched_write_command(
+                conn, self.__database.name + '.$cmd', operation, command,
+                docs, check_keys, self.codec_options)
+        _check_write_command_response(results)
+        return results[0][1]
+
+    async def _execute_bulk(self, blk):
+        """Execute a _Bulk's operations with write commands. A coroutine.
+
+        Like :meth:`pymongo.bulk._Bulk.execute_command`.
+        """
+        if not blk.ops:
+            raise InvalidOperation('No operations to execute')
+        if blk.executed:
+            raise InvalidOperation('Bulk operations can '
+                                   'only be executed once.')
+        blk.executed = True
+        if blk.ordered:
+            generator = blk.gen_ordered()
+        else:
+            generator = blk.gen_unordered()
+
+        full_result = {
+            "writeErrors": [],
+            "writeConcernErrors": [],
+            "nInserted": 0,
+            "nUpserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "nRemoved": 0,
+            "upserted": [],
+        }
+        concern = self.write_concern.document
+        async with self.__database.client._get_connection() as (conn, _):
+            for run in generator:
+                cmd = SON([(_COMMANDS[run.op_type], self.__name),
+                           ('ordered', blk.ordered)])
+                if concern:
+                    cmd['writeConcern'] = concern
+
+                results = await _batched_write_command(
+                    conn, blk.namespace, run.op_type, cmd, run.ops,
+                    blk.check_keys, self.codec_options)
+
+                _merge_command(run, full_result, results)
+                # We're supposed to continue if errors are
+                # at the write concern level (e.g. wtimeout)
+                if blk.ordered and full_result['writeErrors']:
+                    break
+
+        if full_result["writeErrors"] or full_result["writeConcernErrors"]:
+            if full_result['writeErrors']:
+                full_result['writeErrors'].sort(
+                    key=lambda error: error['index'])
+            raise BulkWriteError(full_result)
+        return full_result
+
+
+class AsyncCursor(object):
+    """An asynchronous cursor over the results of a query.
+
+    Iterate it with ``async for``, or get all its results with
+    :meth:`to_list`. Created by :meth:`AsyncCollection.find`.
+    """
+
+    def __init__(self, collection, filter=None, projection=None, skip=0,
+                 limit=0, sort=None, batch_size=0):
+        self.__id = None
+        self.__killed = False
+        self.__retrieved = 0
+
+        spec = filter
+        if spec is None:
+            spec = {}
+
+        common.validate_is_mapping("filter", spec)
+        if not isinstance(skip, int):
+            raise TypeError("skip must be an instance of int")
+        if not isinstance(limit, int):
+            raise TypeError("limit must be an instance of int")
+        if projection is not None:
+            if not projection:
+                projection = {"_id": 1}
+            projection = helpers._fields_list_to_dict(projection, "projection")
+
+        self.__collection = collection
+        self.__spec = spec
+        self.__projection = projection
+        self.__skip = skip
+        self.__limit = limit
+        self.__batch_size = 0
+        self.batch_size(batch_size)
+        self.__ordering = sort and helpers._index_document(sort) or None
+
+        self.__data = collections.deque()
+        self.__address = None
+
+        self.__codec_options = collection.codec_options
+        self.__read_preference = collection.read_preference
+        self.__query_flags = 0
+        if self.__read_preference != ReadPreference.PRIMARY:
+            self.__query_flags |= 4
+
+    def __del__(self):
+        if self.__id and not self.__killed:
+            self.__collection.database.client._kill_cursors_soon(
+                [self.__id], self.__address)
+
+    def __check_okay_to_chain(self):
+        """Check if it is okay to chain more options onto this cursor.
+        """
+        if self.__retrieved or self.__id is not None:
+            raise InvalidOperation("cannot set options after executing query")
+
+    def limit(self, limit):
+        """Limits the number of results to be returned by this cursor.
+
+        See :meth:`pymongo.cursor.Cursor.limit`.
+        """
+        if not isinstance(limit, int):
+            raise TypeError("limit must be an integer")
+        self.__check_okay_to_chain()
+        self.__limit = limit
+        return self
+
+    def skip(self, skip):
+        """Skips the first `skip` results of this cursor.
+
+        See :meth:`pymongo.cursor.Cursor.skip`.
+        """
+        if not isinstance(skip, int):
+            raise TypeError("skip must be an integer")
+        if skip < 0:
+            raise ValueError("skip must be >= 0")
+        self.__check_okay_to_chain()
+        self.__skip = skip
+        return self
+
+    def batch_size(self, batch_size):
+        """Limits the number of documents returned in one batch.
+
+        See :meth:`pymongo.cursor.Cursor.batch_size`.
+        """
+        if not isinstance(batch_size, int):
+            raise TypeError("batch_size must be an integer")
+        if batch_size < 0:
+            raise ValueError("batch_size must be >= 0")
+        self.__check_okay_to_chain()
+        self.__batch_size = batch_size == 1 and 2 or batch_size
+        return self
+
+    def sort(self, key_or_list, direction=None):
+        """Sorts this cursor's results.
+
+        See :meth:`pymongo.cursor.Cursor.sort`.
+        """
+        self.__check_okay_to_chain()
+        keys = helpers._index_list(key_or_list, direction)
+        self.__ordering = helpers._index_document(keys)
+        return self
+
+    @property
+    def cursor_id(self):
+        """The id of the cursor on the server, or None before the query."""
+        return self.__id
+
+    @property
+    def address(self):
+        """The (host, port) of the server used, or None."""
+        return self.__address
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if len(self.__data) or await self._refresh():
+            return self.__data.popleft()
+        raise StopAsyncIteration
+
+    async def to_list(self):
+        """Get a list of all the remaining results. A coroutine."""
+        results = []
+        async for doc in self:
+            results.append(doc)
+        return results
+
+    async def close(self):
+        """Kill this cursor on the server, if it's open. A coroutine."""
+        cursor_id, self.__killed = self.__id, True
+        if cursor_id:
+            client = self.__collection.database.client
+            await client._kill_cursors([cursor_id], self.__address)
+
+    async def _refresh(self):
+        """Refreshes the cursor with more data from the server. A coroutine.
+
+        Returns the length of self.__data after refresh.
+        """
+        if len(self.__data) or self.__killed:
+            return len(self.__data)
+
+        if self.__id is None:  # Query
+            await self.__send_message(_Query(self.__query_flags,
+                                             self.__collection.full_name,
+                                             self.__skip,
+                                             self.__ntoreturn(),
+                                             self.__query_spec(),
+                                             self.__projection,
+                                             self.__codec_options,
+                                             self.__read_preference))
+            if not self.__id:
+                self.__killed = True
+        elif self.__id:  # Get More
+            if self.__limit:
+                limit = self.__limit - self.__retrieved
+                if self.__batch_size:
+                    limit = min(limit, self.__batch_size)
+            else:
+                limit = self.__batch_size
+            await self.__send_message(_GetMore(self.__collection.full_name,
+                                               limit,
+                                               self.__id))
+        else:  # Cursor id is zero nothing else to return
+            self.__killed = True
+
+        return len(self.__data)
+
+    def __ntoreturn(self):
+        """Get the number of documents to return in the first batch.
+        """
+        if self.__limit:
+            if self.__batch_size:
+                return min(self.__limit, self.__batch_size)
+            return self.__limit
+        return self.__batch_size
+
+    def __query_spec(self):
+        """Get the spec to use for a query.
+        """
+        if self.__ordering:
+            spec = self.__spec
+            # $query has to come first
+            if "$query" not in spec:
+                spec = SON([("$query", spec)])
+            spec = SON(spec)
+            spec["$orderby"] = self.__ordering
+            return spec
+        # Have to wrap with $query if "query" is the first key.
+        elif ("query" in self.__spec and
+              (len(self.__spec) == 1 or
+               next(iter(self.__spec)) == "query")):
+            return SON({"$query": self.__spec})
+
+        return self.__spec
+
+    async def __send_message(self, operation):
+        """Send a query or getmore operation and handles the response.
+
+        A coroutine. Can raise ConnectionFailure.
+        """
+        client = self.__collection.database.client
+        try:
+            async with client._get_connection(
+                    self.__read_preference,
+                    self.__address) as (conn, slave_ok):
+                msg = operation.get_message(slave_ok, conn.is_mongos)
+                request_id, data = msg[:2]
+                max_doc_size = msg[2] if len(msg) == 3 else 0
+                await conn.send_message(data, max_doc_size, request_id)
+                response = await conn.receive_message(1, request_id)
+                self.__address = conn.address
+        except AutoReconnect:
+            # Don't try to send kill cursors on another connection or to
+            # another server.
+            self.__killed = True
+            raise
+
+        try:
+            doc = helpers._unpack_response(response=response,
+                                           cursor_id=self.__id,
+                                           codec_options=self.__codec_options)
+        except NotMasterError:
+            # Don't send kill cursors to another server after a "not master"
+            # error. It's completely pointless.
+            self.__killed = True
+            client._topology.reset_server_and_request_check(self.__address)
+            raise
+        except OperationFailure:
+            self.__killed = True
+            raise
+        self.__id = doc["cursor_id"]
+
+        assert doc["starting_from"] == self.__retrieved, (
+            "Result batch started from %s, expected %s" % (
+                doc['starting_from'], self.__retrieved))
+
+        self.__retrieved += doc["number_returned"]
+        self.__data = collections.deque(doc["data"])
+
+        if self.__limit and self.__id and self.__limit <= self.__retrieved:
+            await self.close()
@@ -17,11 +17,14 @@
 .. versionadded:: 2.7
 """
 
+from bson import BSON, _PACK_INT, _to_bytes
+from bson.codec_options import _raw_document_class
 from bson.objectid import ObjectId
 from bson.py3compat import u
+from bson.raw_bson import RawBSONDocument
 from bson.son import SON
-from pymongo.common import (validate_is_mapping,
-                            validate_is_mutable_mapping,
+from pymongo.common import (validate_is_document_type,
+                            validate_is_mapping,
                             validate_ok_for_replace,
                             validate_ok_for_update)
 from pymongo.errors import (BulkWriteError,
@@ -54,6 +57,44 @@ _UINDEX = u("index")
 _UOP = u("op")
 
 
+def _raw_document(document):
+    """Wrap an encoded :class:`~bson.BSON` document in a RawBSONDocument.
+
+    Raw documents are copied to the wire as is, without being decoded.
+    """
+    if isinstance(document, BSON):
+        return RawBSONDocument(document)
+    return document
+
+
+def _prepare_insert(document, new_id=ObjectId):
+    """Validate a document to insert and generate its _id client side.
+
+    Returns the document to send, which is a new RawBSONDocument if
+    `document` is a raw document missing _id. `new_id` is called for a new
+    ObjectId.
+    """
+    document = _raw_document(document)
+    validate_is_document_type("document", document)
+    if '_id' not in document:
+        if _raw_document_class(document):
+            # Raw documents are immutable, prepend _id to a copy of the bytes.
+            data = _to_bytes(document.raw)
+            id_element = b"\x07_id\x00" + new_id().binary
+            document = RawBSONDocument(
+                _PACK_INT(len(data) + len(id_element)) + id_element + data[4:])
+        else:
+            document['_id'] = new_id()
+    return document
+
+
+def _new_ids(count):
+    """Yield up to `count` new ObjectIds, generated together on first use.
+    """
+    for oid in ObjectId.generate_many(count):
+        yield oid
+
+
 class _Run(object):
     """Represents a batch of write operations.
     """
@@ -195,11 +236,12 @@ def _merge_command(run, full_result, results):
 class _Bulk(object):
     """The private guts of the bulk write API.
     """
-    def __init__(self, collection, ordered):
+    def __init__(self, collection, ordered, check_keys=True):
         """Initialize a _Bulk instance.
         """
         self.collection = collection
         self.ordered = ordered
+        self.check_keys = check_keys
         self.ops = []
         self.name = "%s.%s" % (collection.database.name, collection.name)
         self.namespace = collection.database.name + '.$cmd'
@@ -208,11 +250,7 @@ class _Bulk(object):
     def add_insert(self, document):
         """Add an insert document to the list of ops.
         """
-        validate_is_mutable_mapping("document", document)
-        # Generate ObjectId client side.
-        if '_id' not in document:
-            document['_id'] = ObjectId()
-        self.ops.append((_INSERT, document))
+        self.ops.append((_INSERT, _prepare_insert(document)))
 
     def add_update(self, selector, update, multi=False, upsert=False):
         """Create an update document and add it to the list of ops.
@@ -225,6 +263,7 @@ class _Bulk(object):
     def add_replace(self, selector, replacement, upsert=False):
         """Create a replace document and add it to the list of ops.
         """
+        replacement = _raw_document(replacement)
         validate_ok_for_replace(replacement)
         cmd = SON([('q', selector), ('u', replacement),
                    ('multi', False), ('upsert', upsert)])
@@ -284,7 +323,8 @@ class _Bulk(object):
 
             results = _do_batched_write_command(
                 self.namespace, run.op_type, cmd,
-                run.ops, True, self.collection.codec_options, sock_info)
+                run.ops, self.check_keys, self.collection.codec_options,
+                sock_info)
 
             _merge_command(run, full_result, results)
             # We're supposed to continue if errors are
@@ -313,6 +353,7 @@ class _Bulk(object):
                     coll._insert(sock_info,
                                  run.ops,
                                  self.ordered,
+                                 check_keys=self.check_keys,
                                  write_concern=write_concern)
                 elif run.op_type == _UPDATE:
                     for operation in run.ops:
@@ -359,7 +400,8 @@ class _Bulk(object):
                     # will be slower here than calling Collection.insert()
                     if run.op_type == _INSERT:
                         coll._insert(sock_info,
-                                     operation,
+                                     [operation],
+                                     check_keys=self.check_keys,
                                      write_concern=write_concern)
                         result = {}
                     elif run.op_type == _UPDATE:
@@ -15,6 +15,7 @@
 """Collection level utilities for Mongo."""
 
 import collections
+import functools
 import warnings
 
 from bson.code import Code
@@ -28,13 +29,18 @@ from bson.son import SON
 from pymongo import (common,
                      helpers,
                      message)
-from pymongo.bulk import BulkOperationBuilder, _Bulk
+from pymongo.bulk import (BulkOperationBuilder,
+                          _Bulk,
+                          _new_ids,
+                          _prepare_insert,
+                          _raw_document)
 from pymongo.command_cursor import CommandCursor
 from pymongo.cursor import Cursor
 from pymongo.errors import ConfigurationError, InvalidName, OperationFailure
 from pymongo.helpers import _check_write_command_response
 from pymongo.message import _INSERT, _UPDATE, _DELETE
 from pymongo.operations import _WriteOp, IndexModel
+from pymongo.prepared import PreparedQuery
 from pymongo.read_preferences import ReadPreference
 from pymongo.results import (BulkWriteResult,
                              DeleteResult,
@@ -66,6 +72,27 @@ class ReturnDocument(object):
     """Return the updated/replaced or inserted document."""
 
 
+def _check_name(name):
+    """Check if a collection name is valid.
+    """
+    if not isinstance(name, string_type):
+        raise TypeError("name must be an instance "
+                        "of %s" % (string_type.__name__,))
+
+    if not name or ".." in name:
+        raise InvalidName("collection names cannot be empty")
+    if "$" in name and not (name.startswith("oplog.$main") or
+                            name.startswith("$cmd")):
+        raise InvalidName("collection names must not "
+                          "contain '$': %r" % name)
+    if name[0] == "." or name[-1] == ".":
+        raise InvalidName("collection names must not start "
+                          "or end with '.': %r" % name)
+    if "\x00" in name:
+        raise InvalidName("collection names must not contain the "
+                          "null character")
+
+
 class Collection(common.BaseObject):
     """A Mongo collection.
     """
@@ -130,22 +157,7 @@ class Collection(common.BaseObject):
             read_preference or database.read_preference,
             write_concern or database.write_concern)
 
-        if not isinstance(name, string_type):
-            raise TypeError("name must be an instance "
-                            "of %s" % (string_type.__name__,))
-
-        if not name or ".." in name:
-            raise InvalidName("collection names cannot be empty")
-        if "$" in name and not (name.startswith("oplog.$main") or
-                                name.startswith("$cmd")):
-            raise InvalidName("collection names must not "
-                              "contain '$': %r" % name)
-        if name[0] == "." or name[-1] == ".":
-            raise InvalidName("collection names must not start "
-                              "or end with '.': %r" % name)
-        if "\x00" in name:
-            raise InvalidName("collection names must not contain the "
-                              "null character")
+        _check_name(name)
 
         self.__database = database
         self.__name = _unicode(name)
@@ -452,22 +464,25 @@ class Collection(common.BaseObject):
 
         :Parameters:
           - `document`: The document to insert. Must be a mutable mapping
-            type. If the document does not have an _id field one will be
-            added automatically.
+            type, a :class:`~bson.raw_bson.RawBSONDocument` or an encoded
+            :class:`~bson.BSON` document. If the document does not have an
+            _id field one will be added automatically.
 
         :Returns:
           - An instance of :class:`~pymongo.results.InsertOneResult`.
 
+        .. versionchanged:: 3.1
+           Accept :class:`~bson.raw_bson.RawBSONDocument` and
+           :class:`~bson.BSON` documents, which are sent without re-encoding.
+
         .. versionadded:: 3.0
         """
-        common.validate_is_mutable_mapping("document", document)
-        if "_id" not in document:
-            document["_id"] = ObjectId()
+        document = _prepare_insert(document)
         with self._socket_for_writes() as sock_info:
-            return InsertOneResult(self._insert(sock_info, document),
+            return InsertOneResult(self._insert(sock_info, [document])[0],
                                    self.write_concern.acknowledged)
 
-    def insert_many(self, documents, ordered=True):
+    def insert_many(self, documents, ordered=True, check_keys=True):
         """Insert a list of documents.
 
           >>> db.test.count()
@@ -479,16 +494,27 @@ class Collection(common.BaseObject):
           2
 
         :Parameters:
-          - `documents`: A list of documents to insert.
+          - `documents`: A list of documents to insert. Raw documents
+            (:class:`~bson.raw_bson.RawBSONDocument` or encoded
+            :class:`~bson.BSON`) are copied into the message without being
+            decoded and re-encoded. An _id is only generated for raw documents
+            that do not already have one.
           - `ordered` (optional): If ``True`` (the default) documents will be
             inserted on the server serially, in the order provided. If an error
             occurs all remaining inserts are aborted. If ``False``, documents
             will be inserted on the server in arbitrary order, possibly in
             parallel, and all document inserts will be attempted.
+          - `check_keys` (optional): If ``True`` (the default) check that no
+            key starts with '$' or contains '.'. Only pass ``False`` for
+            documents built by trusted code, to skip the check.
 
         :Returns:
           An instance of :class:`~pymongo.results.InsertManyResult`.
 
+        .. versionchanged:: 3.1
+           Accept :class:`~bson.raw_bson.RawBSONDocument` and
+           :class:`~bson.BSON` documents. Added the `check_keys` parameter.
+
         .. versionadded:: 3.0
         """
         if not isinstance(documents, list) or not documents:
@@ -496,14 +522,13 @@ class Collection(common.BaseObject):
         inserted_ids = []
         def gen():
             """A generator that validates documents and handles _ids."""
+            new_id = functools.partial(next, _new_ids(len(documents)))
             for document in documents:
-                common.validate_is_mutable_mapping("document", document)
-                if "_id" not in document:
-                    document["_id"] = ObjectId()
+                document = _prepare_insert(document, new_id)
                 inserted_ids.append(document["_id"])
                 yield (_INSERT, document)
 
-        blk = _Bulk(self, ordered)
+        blk = _Bulk(self, ordered, check_keys)
         blk.ops = [doc for doc in gen()]
         blk.execute(self.write_concern.document)
         return InsertManyResult(inserted_ids, self.write_concern.acknowledged)
@@ -586,15 +611,22 @@ class Collection(common.BaseObject):
 
         :Parameters:
           - `filter`: A query that matches the document to replace.
-          - `replacement`: The new document.
+          - `replacement`: The new document. A
+            :class:`~bson.raw_bson.RawBSONDocument` or an encoded
+            :class:`~bson.BSON` document is sent without re-encoding.
           - `upsert` (optional): If ``True``, perform an insert if no documents
             match the filter.
 
         :Returns:
           - An instance of :class:`~pymongo.results.UpdateResult`.
 
+        .. versionchanged:: 3.1
+           Accept :class:`~bson.raw_bson.RawBSONDocument` and
+           :class:`~bson.BSON` replacement documents.
+
         .. versionadded:: 3.0
         """
+        replacement = _raw_document(replacement)
         common.validate_ok_for_replace(replacement)
         with self._socket_for_writes() as sock_info:
             result = self._update(sock_info, filter, replacement, upsert)
@@ -923,6 +955,28 @@ class Collection(common.BaseObject):
         """
         return Cursor(self, *args, **kwargs)
 
+    def prepare(self, *args, **kwargs):
+        """Prepare a query to run many times with different parameter values.
+
+        Takes the same arguments as :meth:`find`. Values in the `filter`
+        can be :class:`~pymongo.prepared.Param` placeholders, which are
+        given a value each time the query runs. The namespace, skip, limit,
+        projection, sort and other query options are encoded once, so each
+        run only encodes the filter:
+
+          >>> from pymongo.prepared import Param
+          >>> query = db.test.prepare({'age': {'$gte': Param('min_age')},
+          ...                          'city': Param('city')},
+          ...                         sort=[('age', ASCENDING)], limit=10)
+          >>> for doc in query.find(min_age=21, city='Paris'):
+          ...     print(doc)
+
+        Returns an instance of :class:`~pymongo.prepared.PreparedQuery`.
+
+        .. versionadded:: 3.1
+        """
+        return PreparedQuery(self, *args, **kwargs)
+
     def parallel_scan(self, num_cursors):
         """Scan this entire collection in parallel.
 
@@ -19,9 +19,11 @@ import collections
 
 from bson.binary import (STANDARD, PYTHON_LEGACY,
                          JAVA_LEGACY, CSHARP_LEGACY)
-from bson.codec_options import CodecOptions
+from bson.codec_options import CodecOptions, _raw_document_class
 from bson.py3compat import string_type, integer_types
 from pymongo.auth import MECHANISMS
+from pymongo.compression_support import (validate_compressors,
+                                         validate_zlib_compression_level)
 from pymongo.errors import ConfigurationError
 from pymongo.read_preferences import (read_pref_mode_from_name,
                                       _ServerMode)
@@ -149,6 +151,16 @@ def validate_positive_integer(option, value):
     return val
 
 
+def validate_positive_integer_nonzero(option, value):
+    """Validate that 'value' is an integer greater than zero.
+    """
+    val = validate_integer(option, value)
+    if val < 1:
+        raise ValueError("The value of %s must be "
+                         "an integer greater than 0" % (option,))
+    return val
+
+
 def validate_readable(option, value):
     """Validates that 'value' is file-like and readable.
     """
@@ -325,8 +337,10 @@ def validate_auth_mechanism_properties(option, value):
 
 def validate_document_class(option, value):
     """Validate the document_class option."""
-    if not issubclass(value, collections.MutableMapping):
-        raise TypeError("%s must be dict, bson.son.SON, or another "
+    if not (issubclass(value, collections.MutableMapping) or
+            _raw_document_class(value)):
+        raise TypeError("%s must be dict, bson.son.SON, "
+                        "bson.raw_bson.RawBSONDocument, or a "
                         "sublass of collections.MutableMapping" % (option,))
     return value
 
@@ -347,11 +361,26 @@ def validate_is_mutable_mapping(option, value):
                         "collections.MutableMapping" % (option,))
 
 
+def validate_is_document_type(option, value):
+    """Validate the type of method arguments that expect a MongoDB document."""
+    if not (isinstance(value, collections.MutableMapping) or
+            _raw_document_class(value)):
+        raise TypeError("%s must be an instance of dict, bson.son.SON, "
+                        "bson.raw_bson.RawBSONDocument, or "
+                        "a type that inherits from "
+                        "collections.MutableMapping" % (option,))
+
+
 def validate_ok_for_replace(replacement):
     """Validate a replacement document."""
     validate_is_mapping("replacement", replacement)
+    if _raw_document_class(replacement):
+        # Check the first key without decoding the document.
+        raw = replacement.raw
+        if raw[4:5] != b"\x00" and raw[5:6] == b"$":
+            raise ValueError('replacement can not include $ operators')
     # Replacement can be {}
-    if replacement:
+    elif replacement:
         first = next(iter(replacement))
         if first.startswith('$'):
             raise ValueError('replacement can not include $ operators')
@@ -384,6 +413,10 @@ VALIDATORS = {
     'sockettimeoutms': validate_timeout_or_none,
     'waitqueuetimeoutms': validate_timeout_or_none,
     'waitqueuemultiple': validate_positive_integer_or_none,
+    'maxrequestspersocket': validate_positive_integer_nonzero,
+    'compressors': validate_compressors,
+    'zlibcompressionlevel': validate_zlib_compression_level,
+    'compressionminsize': validate_positive_integer,
     'ssl': validate_boolean_or_string,
     'ssl_keyfile': validate_readable,
     'ssl_certfile': validate_readable,
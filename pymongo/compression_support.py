@@ -0,0 +1,179 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.  You
+# may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.  See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""Support for compressing messages with OP_COMPRESSED in PyMongo."""
+
+import warnings
+
+HAVE_ZLIB = True
+try:
+    import zlib
+except ImportError:
+    HAVE_ZLIB = False
+
+HAVE_SNAPPY = False
+try:
+    import snappy
+    HAVE_SNAPPY = True
+except ImportError:
+    pass
+
+from bson.py3compat import integer_types, string_type, PY3
+
+_SUPPORTED_COMPRESSORS = frozenset(['snappy', 'zlib'])
+
+# Commands sent before or during authentication, which are never compressed.
+_NO_COMPRESSION = frozenset([
+    'ismaster',
+    'saslstart',
+    'saslcontinue',
+    'getnonce',
+    'authenticate',
+    'createuser',
+    'updateuser',
+    'copydbsaslstart',
+    'copydbgetnonce',
+    'copydb',
+])
+
+
+def validate_compressors(dummy, value):
+    """Validate a list of compressor names, or a comma separated string of
+    them. Compressors that are unknown or not installed are dropped with a
+    warning.
+    """
+    if isinstance(value, string_type):
+        compressors = [name for name in value.split(',') if name]
+    else:
+        compressors = list(value)
+
+    for compressor in compressors[:]:
+        if compressor not in _SUPPORTED_COMPRESSORS:
+            compressors.remove(compressor)
+            warnings.warn("Unsupported compressor: %s" % (compressor,))
+        elif compressor == 'snappy' and not HAVE_SNAPPY:
+            compressors.remove(compressor)
+            warnings.warn(
+                "Wire protocol compression with snappy is not available. "
+                "You must install the python-snappy module for snappy "
+                "support.")
+        elif compressor == 'zlib' and not HAVE_ZLIB:
+            compressors.remove(compressor)
+            warnings.warn(
+                "Wire protocol compression with zlib is not available. "
+                "The zlib module is not available.")
+    return compressors
+
+
+def validate_zlib_compression_level(option, value):
+    """Validate a zlib compression level, an integer from -1 to 9."""
+    if isinstance(value, string_type):
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError("The value of %s must be "
+                             "an integer" % (option,))
+    elif not isinstance(value, integer_types):
+        raise TypeError("Wrong type for %s, value must be "
+                        "an integer" % (option,))
+    if not -1 <= value <= 9:
+        raise ValueError("The value of %s must be "
+                         "between -1 and 9" % (option,))
+    return value
+
+
+class CompressionSettings(object):
+    """The compressors the client offers in the ismaster handshake.
+
+    :Parameters:
+      - `compressors`: compressor names, in order of preference
+      - `zlib_compression_level`: the zlib compression level, -1 to 9
+      - `min_size`: messages smaller than this many bytes are not compressed
+    """
+
+    __slots__ = ('__compressors', '__zlib_compression_level', '__min_size')
+
+    def __init__(self, compressors, zlib_compression_level=-1, min_size=0):
+        self.__compressors = compressors
+        self.__zlib_compression_level = zlib_compression_level
+        self.__min_size = min_size
+
+    @property
+    def compressors(self):
+        """The list of compressor names, in order of preference."""
+        return self.__compressors
+
+    @property
+    def zlib_compression_level(self):
+        """The zlib compression level, -1 to 9."""
+        return self.__zlib_compression_level
+
+    @property
+    def min_size(self):
+        """The size in bytes of the smallest message that is compressed."""
+        return self.__min_size
+
+    def get_compression_context(self, server_compressors):
+        """Get a context for the first of our compressors the server
+        supports, or None.
+        """
+        for compressor in self.__compressors:
+            if compressor in server_compressors:
+                if compressor == 'snappy':
+                    return SnappyContext(self.__min_size)
+                return ZlibContext(self.__zlib_compression_level,
+                                   self.__min_size)
+        return None
+
+
+class SnappyContext(object):
+    """Compress messages with snappy."""
+
+    compressor_id = 1
+
+    def __init__(self, min_size):
+        self.min_size = min_size
+
+    @staticmethod
+    def compress(data):
+        return snappy.compress(bytes(data))
+
+
+class ZlibContext(object):
+    """Compress messages with zlib."""
+
+    compressor_id = 2
+
+    def __init__(self, level, min_size):
+        self.level = level
+        self.min_size = min_size
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+
+def decompress(data, compressor_id):
+    """Decompress the body of an OP_COMPRESSED message, a bytes-like
+    object.
+    """
+    if compressor_id == SnappyContext.compressor_id:
+        if not HAVE_SNAPPY:
+            raise ValueError("Received a message compressed with snappy, "
+                             "but the python-snappy module is not installed")
+        return snappy.uncompress(bytes(data))
+    elif compressor_id == ZlibContext.compressor_id:
+        # Python 2's zlib only accepts str.
+        return zlib.decompress(data if PY3 else bytes(data))
+    else:
+        raise ValueError("Unknown compressorId %d" % (compressor_id,))
@@ -17,8 +17,10 @@
 import copy
 from collections import deque
 
-from bson import RE_TYPE
+from bson import RE_TYPE, _validate_column_fields
 from bson.code import Code
+from bson.codec_options import CodecOptions
+from bson.columns import _concat_columns
 from bson.py3compat import (iteritems,
                             integer_types,
                             string_type)
@@ -30,7 +32,7 @@ from pymongo.errors import (AutoReconnect,
                             InvalidOperation,
                             NotMasterError,
                             OperationFailure)
-from pymongo.message import _GetMore, _Query
+from pymongo.message import _BoundQuery, _GetMore, _PreparedQuery, _Query
 from pymongo.read_preferences import ReadPreference
 
 _QUERY_OPTIONS = {
@@ -156,6 +158,9 @@ class Cursor(object):
         self.__min = None
         self.__manipulate = manipulate
 
+        # The _PreparedQuery of a cursor returned by PreparedQuery.find.
+        self.__prepared = None
+
         # Exhaust cursor support
         self.__exhaust = False
         self.__exhaust_mgr = None
@@ -180,6 +185,10 @@ class Cursor(object):
         self.__retrieved = 0
         self.__killed = False
 
+        # Batches decoded by to_columns.
+        self.__columns = None
+        self.__column_batches = []
+
         self.__codec_options = collection.codec_options
         self.__read_preference = collection.read_preference
 
@@ -244,7 +253,7 @@ class Cursor(object):
                            "max_time_ms", "comment", "max", "min",
                            "ordering", "explain", "hint", "batch_size",
                            "max_scan", "manipulate", "query_flags",
-                           "modifiers")
+                           "modifiers", "codec_options")
         data = dict((k, v) for k, v in iteritems(self.__dict__)
                     if k.startswith('_Cursor__') and k[9:] in values_to_clone)
         if deepcopy:
@@ -329,11 +338,63 @@ class Cursor(object):
 
         return self.__spec
 
+    def __ntoreturn(self):
+        """Get the number of documents to return in the first batch.
+        """
+        if self.__limit:
+            if self.__batch_size:
+                return min(self.__limit, self.__batch_size)
+            return self.__limit
+        return self.__batch_size
+
+    def _prepare(self):
+        """Encode the options of this unevaluated cursor once, for
+        :class:`~pymongo.prepared.PreparedQuery`.
+
+        Returns None if the query spec can't be split into the filter and
+        the other options.
+        """
+        spec = self.__query_spec()
+        if spec is self.__spec:
+            wrap, operators = False, None
+        elif "$query" in self.__spec:
+            # The operators are merged into the filter.
+            return None
+        else:
+            wrap = True
+            operators = SON((key, value) for key, value in iteritems(spec)
+                            if key != "$query")
+        return _PreparedQuery(self.__query_flags,
+                              self.__collection.full_name,
+                              self.__skip,
+                              self.__ntoreturn(),
+                              wrap,
+                              operators,
+                              self.__projection,
+                              self.__codec_options,
+                              self.__read_preference,
+                              list(self.__spec))
+
+    def _bind(self, spec, prepared):
+        """Get an unevaluated copy of this cursor that queries with `spec`
+        and the prepared query `prepared`.
+        """
+        cursor = self.__class__.__new__(self.__class__)
+        cursor.__dict__.update(self.__dict__)
+        cursor.__spec = spec
+        cursor.__prepared = prepared
+        cursor.__modifiers = self.__modifiers.copy()
+        cursor.__data = deque()
+        cursor.__column_batches = []
+        return cursor
+
     def __check_okay_to_chain(self):
         """Check if it is okay to chain more options onto this cursor.
         """
         if self.__retrieved or self.__id is not None:
             raise InvalidOperation("cannot set options after executing query")
+        # The prepared query message no longer matches the options.
+        self.__prepared = None
 
     def add_option(self, mask):
         """Set arbitrary query flags using a bitmask.
@@ -761,6 +822,29 @@ class Cursor(object):
         self.__comment = comment
         return self
 
+    def decode_fields(self, fields):
+        """Only decode some of the fields of the documents returned.
+
+        The server still returns whole documents, but only the fields listed
+        in `fields` are decoded to Python objects; the others are skipped.
+        This is useful when a projection can't be used. Field names may use
+        dot notation to select fields from embedded documents, see the
+        `decode_fields` option of :class:`~bson.codec_options.CodecOptions`.
+
+        Raises :class:`~pymongo.errors.InvalidOperation` if this cursor has
+        already been used.
+
+        :Parameters:
+          - `fields`: a list of field names, or ``None`` to decode every field
+
+        .. versionadded:: 3.1
+        """
+        self.__check_okay_to_chain()
+        options = dict(zip(CodecOptions._fields, self.__codec_options))
+        options["decode_fields"] = fields
+        self.__codec_options = CodecOptions(**options)
+        return self
+
     def where(self, code):
         """Adds a $where clause to this query.
 
@@ -835,7 +919,8 @@ class Cursor(object):
         try:
             doc = helpers._unpack_response(response=data,
                                            cursor_id=self.__id,
-                                           codec_options=self.__codec_options)
+                                           codec_options=self.__codec_options,
+                                           columns=self.__columns)
         except OperationFailure:
             self.__killed = True
 
@@ -868,7 +953,10 @@ class Cursor(object):
                     doc['starting_from'], self.__retrieved))
 
         self.__retrieved += doc["number_returned"]
-        self.__data = deque(doc["data"])
+        if self.__columns is not None:
+            self.__column_batches.append(doc["data"])
+        else:
+            self.__data = deque(doc["data"])
 
         if self.__limit and self.__id and self.__limit <= self.__retrieved:
             self.__die()
@@ -889,20 +977,17 @@ class Cursor(object):
             return len(self.__data)
 
         if self.__id is None:  # Query
-            ntoreturn = self.__batch_size
-            if self.__limit:
-                if self.__batch_size:
-                    ntoreturn = min(self.__limit, self.__batch_size)
-                else:
-                    ntoreturn = self.__limit
-            self.__send_message(_Query(self.__query_flags,
-                                       self.__collection.full_name,
-                                       self.__skip,
-                                       ntoreturn,
-                                       self.__query_spec(),
-                                       self.__projection,
-                                       self.__codec_options,
-                                       self.__read_preference))
+            if self.__prepared is not None:
+                self.__send_message(_BoundQuery(self.__prepared, self.__spec))
+            else:
+                self.__send_message(_Query(self.__query_flags,
+                                           self.__collection.full_name,
+                                           self.__skip,
+                                           self.__ntoreturn(),
+                                           self.__query_spec(),
+                                           self.__projection,
+                                           self.__codec_options,
+                                           self.__read_preference))
             if not self.__id:
                 self.__killed = True
         elif self.__id:  # Get More
@@ -958,6 +1043,40 @@ class Cursor(object):
         """
         return self.__address
 
+    def to_columns(self, fields):
+        """Decode the results of this query to columns.
+
+        Runs the query and decodes `fields` of every result document
+        straight into a :class:`~bson.columns.Column` for each field,
+        without creating a document for each result. Each batch returned
+        by the server is decoded with :func:`bson.decode_columns` as it
+        arrives. SON manipulators are not applied.
+
+        Returns a :class:`dict` mapping each field name to its column.
+
+        Raises :class:`~pymongo.errors.InvalidOperation` if this cursor has
+        already been used or is tailable.
+
+        :Parameters:
+          - `fields`: a list of the names of the fields to decode
+
+        .. versionadded:: 3.1
+        """
+        self.__check_okay_to_chain()
+        if self.__query_flags & _QUERY_OPTIONS["tailable_cursor"]:
+            raise InvalidOperation("cannot decode a tailable cursor to "
+                                   "columns")
+        fields = _validate_column_fields(fields)
+        self.__columns = fields
+        self.__column_batches = []
+        if not self.__empty:
+            while not self.__killed:
+                self._refresh()
+        batches, self.__column_batches = self.__column_batches, []
+        return dict((field, _concat_columns([batch[field]
+                                             for batch in batches]))
+                    for field in fields)
+
     def __iter__(self):
         return self
 
@@ -35,6 +35,16 @@ from pymongo.errors import (CursorNotFound,
 
 _UUNDER = u("_")
 
+# responseFlags, cursorID, startingFrom, numberReturned.
+_UNPACK_REPLY_HEADER = struct.Struct("<iqii").unpack_from
+
+try:
+    _memoryview = memoryview
+except NameError:
+    # Python 2.6 has no memoryview, fall back to slicing (copying) the reply.
+    def _memoryview(data):
+        return data
+
 
 def _gen_index_name(keys):
     """Generate an index name from the set of fields it is over."""
@@ -84,7 +94,8 @@ def _index_document(index_list):
     return index
 
 
-def _unpack_response(response, cursor_id=None, codec_options=CodecOptions()):
+def _unpack_response(response, cursor_id=None, codec_options=CodecOptions(),
+                     columns=None):
     """Unpack a response from the database.
 
     Check the response for errors and unpack, returning a dictionary
@@ -100,8 +111,11 @@ def _unpack_response(response, cursor_id=None, codec_options=CodecOptions()):
         valid at server response
       - `codec_options` (optional): an instance of
         :class:`~bson.codec_options.CodecOptions`
+      - `columns` (optional): a tuple of field names to decode with
+        :func:`bson.decode_columns` instead of decoding whole documents
     """
-    response_flag = struct.unpack("<i", response[:4])[0]
+    (response_flag, reply_cursor_id,
+     starting_from, number_returned) = _UNPACK_REPLY_HEADER(response)
     if response_flag & 1:
         # Shouldn't get this response if we aren't doing a getMore
         assert cursor_id is not None
@@ -122,10 +136,17 @@ def _unpack_response(response, cursor_id=None, codec_options=CodecOptions()):
                                error_object)
 
     result = {}
-    result["cursor_id"] = struct.unpack("<q", response[4:12])[0]
-    result["starting_from"] = struct.unpack("<i", response[12:16])[0]
-    result["number_returned"] = struct.unpack("<i", response[16:20])[0]
-    result["data"] = bson.decode_all(response[20:], codec_options)
+    result["cursor_id"] = reply_cursor_id
+    result["starting_from"] = starting_from
+    result["number_returned"] = number_returned
+    # Decode the documents in place, slicing a memoryview doesn't copy the
+    # (possibly 48MB) batch.
+    if columns is not None:
+        result["data"] = bson.decode_columns(_memoryview(response)[20:],
+                                             columns, codec_options)
+        return result
+    result["data"] = bson.decode_all(_memoryview(response)[20:],
+                                     codec_options)
     assert len(result["data"]) == result["number_returned"]
     return result
 
@@ -235,7 +256,7 @@ def _first_batch(sock_info, namespace, query,
         0, namespace, 0, limit, query, None, codec_options, read_preference)
     request_id, msg, max_doc_size = query.get_message(slave_ok,
                                                       sock_info.is_mongos)
-    sock_info.send_message(msg, max_doc_size)
+    sock_info.send_message(msg, max_doc_size, request_id)
     response = sock_info.receive_message(1, request_id)
     return _unpack_response(response, None, codec_options)
 
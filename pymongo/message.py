@@ -25,7 +25,7 @@ import struct
 
 import bson
 from bson.codec_options import DEFAULT_CODEC_OPTIONS
-from bson.py3compat import b, StringIO
+from bson.py3compat import b, PY3
 from bson.son import SON
 try:
     from pymongo import _cmessage
@@ -56,9 +56,24 @@ _OP_MAP = {
     _DELETE: b'\x04deletes\x00\x00\x00\x00\x00',
 }
 
+_OP_COMPRESSED = 2012
+_UNPACK_HEADER = struct.Struct("<iiii").unpack_from
+# The message header, then the original opcode, the uncompressed size of
+# the message after its header, and the compressor id.
+_PACK_COMPRESSED_HEADER = struct.Struct("<iiiiiiB").pack
+_UNPACK_COMPRESSED_HEADER = struct.Struct("<iiB").unpack_from
 
-def _maybe_add_read_preference(spec, read_preference):
-    """Add $readPreference to spec when appropriate."""
+if PY3:
+    # Messages are sliced through a memoryview, without being copied.
+    _buffer = memoryview
+else:
+    # Python 2 can't join memoryviews, slice (copy) the messages instead.
+    def _buffer(data):
+        return data
+
+
+def _needs_read_preference(read_preference):
+    """Should $readPreference be sent to mongos with this read preference?"""
     mode = read_preference.mode
     tag_sets = read_preference.tag_sets
     # Only add $readPreference if it's something other than primary to avoid
@@ -66,15 +81,25 @@ def _maybe_add_read_preference(spec, read_preference):
     # for maximum backwards compatibility, don't add $readPreference for
     # secondaryPreferred unless tags are in use (setting the slaveOkay bit
     # has the same effect).
-    if mode and (
-        mode != ReadPreference.SECONDARY_PREFERRED.mode or tag_sets != [{}]):
+    return bool(mode and (
+        mode != ReadPreference.SECONDARY_PREFERRED.mode or tag_sets != [{}]))
+
 
+def _maybe_add_read_preference(spec, read_preference):
+    """Add $readPreference to spec when appropriate."""
+    if _needs_read_preference(read_preference):
         if "query" not in spec:
             spec = SON([("$query", spec)])
         spec["$readPreference"] = read_preference.document
     return spec
 
 
+def _append_elements(encoded, elements):
+    """Append encoded BSON elements to an encoded BSON document."""
+    return (struct.pack("<i", len(encoded) + len(elements)) +
+            encoded[4:-1] + elements + _ZERO_8)
+
+
 class _Query(object):
     """A query operation."""
 
@@ -107,6 +132,79 @@ class _Query(object):
                      self.ntoreturn, spec, self.fields, self.codec_options)
 
 
+class _PreparedQuery(object):
+    """The parts of a query message that are the same for every filter.
+
+    The namespace, skip, limit, projection and query operators such as
+    $orderby are encoded once. Each message then only encodes its filter.
+    """
+
+    __slots__ = ('flags', 'wrap', 'codec_options', 'prefix', 'operators',
+                 'fields', 'read_preference', 'append_read_preference')
+
+    def __init__(self, flags, ns, ntoskip, ntoreturn, wrap, operators,
+                 fields, codec_options, read_preference, filter_keys):
+        self.flags = flags
+        # Is the filter sent as {"$query": filter, <operators>}?
+        self.wrap = wrap
+        self.codec_options = codec_options
+        self.prefix = (bson._make_c_string(ns) +
+                       struct.pack("<ii", ntoskip, ntoreturn))
+        self.operators = _EMPTY
+        if operators:
+            self.operators = bson.BSON.encode(
+                operators, False, codec_options)[4:-1]
+        self.fields = _EMPTY
+        if fields is not None:
+            self.fields = bson.BSON.encode(fields, False, codec_options)
+        self.read_preference = None
+        if _needs_read_preference(read_preference):
+            self.read_preference = (
+                b"\x03$readPreference\x00" +
+                bson.BSON.encode(read_preference.document))
+        # See _maybe_add_read_preference.
+        self.append_read_preference = not wrap and "query" in filter_keys
+
+    def get_message(self, spec, set_slave_ok, is_mongos):
+        """Get a query message for the filter `spec`."""
+        if self.wrap:
+            encoded = bson.BSON.encode({"$query": spec}, False,
+                                       self.codec_options)
+            if self.operators:
+                encoded = _append_elements(encoded, self.operators)
+        else:
+            encoded = bson.BSON.encode(spec, False, self.codec_options)
+        if is_mongos and self.read_preference:
+            if self.append_read_preference:
+                encoded = _append_elements(encoded, self.read_preference)
+            else:
+                encoded = _append_elements(
+                    _ZERO_32 + _ZERO_8,
+                    b"\x03$query\x00" + encoded + self.read_preference)
+        flags = self.flags
+        if set_slave_ok:
+            # Set the slaveOk bit.
+            flags |= 4
+        data = struct.pack("<I", flags) + self.prefix + encoded + self.fields
+        request_id = random.randint(MIN_INT32, MAX_INT32)
+        header = struct.pack("<iiii", 16 + len(data), request_id, 0, 2004)
+        return (request_id, header + data, max(len(encoded), len(self.fields)))
+
+
+class _BoundQuery(object):
+    """A prepared query operation with its filter."""
+
+    __slots__ = ('prepared', 'spec')
+
+    def __init__(self, prepared, spec):
+        self.prepared = prepared
+        self.spec = spec
+
+    def get_message(self, set_slave_ok, is_mongos):
+        """Get a query message, possibly setting the slaveOk bit."""
+        return self.prepared.get_message(self.spec, set_slave_ok, is_mongos)
+
+
 class _GetMore(object):
     """A getmore operation."""
 
@@ -269,43 +367,85 @@ def kill_cursors(cursor_ids):
     return __pack_message(2007, data)
 
 
+def _compress(msg, ctx):
+    """Wrap each message in `msg` in an **OP_COMPRESSED** message.
+
+    `msg` is bytes or a list of buffers holding one or more messages, for
+    example an insert followed by getlasterror. Messages smaller than
+    `ctx.min_size` bytes, or that compression doesn't make smaller, are
+    left as they are. Returns bytes.
+    """
+    if isinstance(msg, list):
+        msg = _EMPTY.join(msg)
+    if len(msg) < ctx.min_size:
+        return msg
+
+    view = _buffer(msg)
+    parts = []
+    position = 0
+    while position < len(msg):
+        length, request_id, response_to, op_code = _UNPACK_HEADER(
+            msg, position)
+        end = position + length
+        if length >= ctx.min_size:
+            compressed = ctx.compress(view[position + 16:end])
+            if len(compressed) + 9 < length - 16:
+                parts.append(_PACK_COMPRESSED_HEADER(
+                    25 + len(compressed), request_id, response_to,
+                    _OP_COMPRESSED, op_code, length - 16, ctx.compressor_id))
+                parts.append(compressed)
+                position = end
+                continue
+        parts.append(view[position:end])
+        position = end
+    return _EMPTY.join(parts)
+
+
 def _do_batched_insert(collection_name, docs, check_keys,
                        safe, last_error_args, continue_on_error, opts,
                        sock_info):
     """Insert `docs` using multiple batches.
     """
-    def _insert_message(insert_message, send_safe):
-        """Build the insert message with header and GLE.
+    def _insert_message(batch, batch_length, send_safe):
+        """Build the buffers of the insert message with header and GLE.
         """
-        request_id, final_message = __pack_message(2002, insert_message)
+        request_id = random.randint(MIN_INT32, MAX_INT32)
+        buffers = [struct.pack("<iiii", 16 + len(prefix) + batch_length,
+                               request_id, 0, 2002),
+                   prefix]
+        buffers.extend(batch)
         if send_safe:
             request_id, error_message, _ = __last_error(collection_name,
                                                         last_error_args)
-            final_message += error_message
-        return request_id, final_message
+            buffers.append(error_message)
+        return request_id, buffers
 
     send_safe = safe or not continue_on_error
     last_error = None
-    data = StringIO()
-    data.write(struct.pack("<i", int(continue_on_error)))
-    data.write(bson._make_c_string(collection_name))
-    message_length = begin_loc = data.tell()
-    has_docs = False
+    prefix = struct.pack("<i", int(continue_on_error))
+    prefix += bson._make_c_string(collection_name)
+    # The encoded documents of the current batch, sent as separate buffers
+    # rather than being copied into the message.
+    batch = []
+    message_length = len(prefix)
     for doc in docs:
-        encoded = bson.BSON.encode(doc, check_keys, opts)
-        encoded_length = len(encoded)
+        # Size the document first so one that's too large isn't encoded.
+        encoded_length = bson.encoded_size(doc, opts)
         too_large = (encoded_length > sock_info.max_bson_size)
+        if not too_large:
+            encoded = bson.BSON.encode(doc, check_keys, opts)
 
         message_length += encoded_length
         if message_length < sock_info.max_message_size and not too_large:
-            data.write(encoded)
-            has_docs = True
+            batch.append(encoded)
             continue
 
-        if has_docs:
+        if batch:
             # We have enough data, send this message.
             try:
-                request_id, msg = _insert_message(data.getvalue(), send_safe)
+                request_id, msg = _insert_message(
+                    batch, message_length - len(prefix) - encoded_length,
+                    send_safe)
                 sock_info.legacy_write(request_id, msg, 0, send_safe)
             # Exception type could be OperationFailure or a subtype
             # (e.g. DuplicateKeyError)
@@ -328,15 +468,14 @@ def _do_batched_insert(collection_name, docs, check_keys,
                                    " bytes." %
                                    (encoded_length, sock_info.max_bson_size))
 
-        message_length = begin_loc + encoded_length
-        data.seek(begin_loc)
-        data.truncate()
-        data.write(encoded)
+        message_length = len(prefix) + encoded_length
+        batch = [encoded]
 
-    if not has_docs:
+    if not batch:
         raise InvalidOperation("cannot do an empty bulk insert")
 
-    request_id, msg = _insert_message(data.getvalue(), safe)
+    request_id, msg = _insert_message(
+        batch, message_length - len(prefix), safe)
     sock_info.legacy_write(request_id, msg, 0, safe)
 
     # Re-raise any exception stored due to continue_on_error
@@ -358,56 +497,41 @@ def _do_batched_write_command(namespace, operation, command,
 
     ordered = command.get('ordered', True)
 
-    buf = StringIO()
-    # Save space for message length and request id
-    buf.write(_ZERO_64)
-    # responseTo, opCode
-    buf.write(b"\x00\x00\x00\x00\xd4\x07\x00\x00")
-    # No options
-    buf.write(_ZERO_32)
-    # Namespace as C string
-    buf.write(b(namespace))
-    buf.write(_ZERO_8)
-    # Skip: 0, Limit: -1
-    buf.write(_SKIPLIM)
-
-    # Where to write command document length
-    command_start = buf.tell()
-    buf.write(bson.BSON.encode(command))
-
-    # Start of payload
-    buf.seek(-1, 2)
-    # Work around some Jython weirdness.
-    buf.truncate()
+    # The OP_QUERY after its message length and request id: responseTo,
+    # opCode, no options, the namespace, skip 0 and limit -1.
+    prefix = b"".join([b"\x00\x00\x00\x00\xd4\x07\x00\x00", _ZERO_32,
+                       bson._make_c_string(namespace), _SKIPLIM])
     try:
-        buf.write(_OP_MAP[operation])
+        op_element = _OP_MAP[operation]
     except KeyError:
         raise InvalidOperation('Unknown command')
+    # The command's elements followed by the name of the array of
+    # operations, without the command or array length.
+    command_elements = bson.BSON.encode(command)[4:-1] + op_element[:-4]
 
     if operation in (_UPDATE, _DELETE):
         check_keys = False
 
-    # Where to write list document length
-    list_start = buf.tell() - 4
+    # Where the array of operations starts in the message.
+    list_start = 8 + len(prefix) + 4 + len(command_elements)
+    # Each operation is the element header and the encoded document, sent
+    # together with the message header in one vectored write instead of
+    # being copied into a single buffer.
+    elements = []
 
     def send_message():
         """Finalize and send the current OP_QUERY message.
         """
         # Close list and command documents
-        buf.write(_ZERO_16)
-
-        # Write document lengths and request id
-        length = buf.tell()
-        buf.seek(list_start)
-        buf.write(struct.pack('<i', length - list_start - 1))
-        buf.seek(command_start)
-        buf.write(struct.pack('<i', length - command_start))
-        buf.seek(4)
+        length = message_length + 2
         request_id = random.randint(MIN_INT32, MAX_INT32)
-        buf.write(struct.pack('<i', request_id))
-        buf.seek(0)
-        buf.write(struct.pack('<i', length))
-        return sock_info.write_command(request_id, buf.getvalue())
+        buffers = [struct.pack("<ii", length, request_id), prefix,
+                   struct.pack("<i", length - 8 - len(prefix)),
+                   command_elements,
+                   struct.pack("<i", length - list_start - 1)]
+        buffers.extend(elements)
+        buffers.append(_ZERO_16)
+        return sock_info.write_command(request_id, buffers)
 
     # If there are multiple batches we'll
     # merge results in the caller.
@@ -415,41 +539,45 @@ def _do_batched_write_command(namespace, operation, command,
 
     idx = 0
     idx_offset = 0
+    message_length = list_start + 4
     has_docs = False
     for doc in docs:
         has_docs = True
-        # Encode the current operation
         key = b(str(idx))
-        value = bson.BSON.encode(doc, check_keys, opts)
+        # Size the current operation first so one that's too large isn't
+        # encoded.
+        value_length = bson.encoded_size(doc, opts)
         # Send a batch?
-        enough_data = (buf.tell() + len(key) + len(value) + 2) >= max_cmd_size
+        enough_data = (message_length + len(key) + value_length + 2 >=
+                       max_cmd_size)
         enough_documents = (idx >= max_write_batch_size)
+        if (enough_data or enough_documents) and not idx:
+            if operation == _INSERT:
+                raise DocumentTooLarge("BSON document too large (%d bytes)"
+                                       " - the connected server supports"
+                                       " BSON document sizes up to %d"
+                                       " bytes." % (value_length,
+                                                    max_bson_size))
+            # There's nothing intelligent we can say
+            # about size for update and remove
+            raise DocumentTooLarge("command document too large")
+        # Encode the current operation
+        value = bson.BSON.encode(doc, check_keys, opts)
         if enough_data or enough_documents:
-            if not idx:
-                if operation == _INSERT:
-                    raise DocumentTooLarge("BSON document too large (%d bytes)"
-                                           " - the connected server supports"
-                                           " BSON document sizes up to %d"
-                                           " bytes." % (len(value),
-                                                        max_bson_size))
-                # There's nothing intelligent we can say
-                # about size for update and remove
-                raise DocumentTooLarge("command document too large")
             result = send_message()
             results.append((idx_offset, result))
             if ordered and "writeErrors" in result:
                 return results
 
-            # Truncate back to the start of list elements
-            buf.seek(list_start + 4)
-            buf.truncate()
+            # Start a new batch of list elements
+            elements = []
+            message_length = list_start + 4
             idx_offset += idx
             idx = 0
             key = b'0'
-        buf.write(_BSONOBJ)
-        buf.write(key)
-        buf.write(_ZERO_8)
-        buf.write(value)
+        elements.append(_BSONOBJ + key + _ZERO_8)
+        elements.append(value)
+        message_length += len(key) + 2 + value_length
         idx += 1
 
     if not has_docs:
@@ -64,6 +64,37 @@ from pymongo.topology_description import TOPOLOGY_TYPE
 from pymongo.settings import TopologySettings
 
 
+def _parse_hosts(host, port):
+    """Parse the hostnames and MongoDB URIs in the list `host`.
+
+    Returns (seeds, username, password, database, options). `port` is the
+    default port.
+    """
+    seeds = set()
+    username = None
+    password = None
+    dbase = None
+    opts = {}
+    for entity in host:
+        if "://" in entity:
+            if entity.startswith("mongodb://"):
+                res = uri_parser.parse_uri(entity, port, False)
+                seeds.update(res["nodelist"])
+                username = res["username"] or username
+                password = res["password"] or password
+                dbase = res["database"] or dbase
+                opts = res["options"]
+            else:
+                idx = entity.find("://")
+                raise InvalidURI("Invalid URI scheme: "
+                                 "%s" % (entity[:idx],))
+        else:
+            seeds.update(uri_parser.split_hosts(entity, port))
+    if not seeds:
+        raise ConfigurationError("need to specify at least one host")
+    return seeds, username, password, dbase, opts
+
+
 class MongoClient(common.BaseObject):
     HOST = "localhost"
     PORT = 27017
@@ -133,6 +164,21 @@ class MongoClient(common.BaseObject):
           - `socketKeepAlive`: (boolean) Whether to send periodic keep-alive
             packets on connected sockets. Defaults to ``False`` (do not send
             keep-alive packets).
+          - `maxRequestsPerSocket`: (integer) How many threads can share a
+            connection, each with a request in flight. Replies are matched to
+            requests by their responseTo, so fewer connections serve many
+            threads. Exhaust cursors and authentication still use a
+            connection of their own. Defaults to ``1`` (each operation has
+            the connection to itself). Must be at least 1.
+          - `compressors`: (list or comma separated string) The compressors
+            to offer the server, in order of preference: "zlib", and
+            "snappy" if python-snappy is installed. Messages are compressed
+            with the first one the server supports. Defaults to ``[]`` (no
+            compression).
+          - `zlibCompressionLevel`: (integer) The zlib compression level,
+            from -1 to 9. Defaults to ``-1`` (zlib's default level).
+          - `compressionMinSize`: (integer) Messages smaller than this many
+            bytes are sent uncompressed. Defaults to ``0``.
 
           | **Write Concern options:**
           | (Only set if passed. No default values.)
@@ -210,6 +256,11 @@ class MongoClient(common.BaseObject):
 
         .. mongodoc:: connections
 
+        .. versionchanged:: 3.1
+           Added the ``maxRequestsPerSocket``, ``compressors``,
+           ``zlibCompressionLevel`` and ``compressionMinSize`` keyword
+           arguments.
+
         .. versionchanged:: 3.0
            :class:`~pymongo.mongo_client.MongoClient` is now the one and only
            client class for a standalone server, mongos, or replica set.
@@ -278,28 +329,7 @@ class MongoClient(common.BaseObject):
         if not isinstance(port, int):
             raise TypeError("port must be an instance of int")
 
-        seeds = set()
-        username = None
-        password = None
-        dbase = None
-        opts = {}
-        for entity in host:
-            if "://" in entity:
-                if entity.startswith("mongodb://"):
-                    res = uri_parser.parse_uri(entity, port, False)
-                    seeds.update(res["nodelist"])
-                    username = res["username"] or username
-                    password = res["password"] or password
-                    dbase = res["database"] or dbase
-                    opts = res["options"]
-                else:
-                    idx = entity.find("://")
-                    raise InvalidURI("Invalid URI scheme: "
-                                     "%s" % (entity[:idx],))
-            else:
-                seeds.update(uri_parser.split_hosts(entity, port))
-        if not seeds:
-            raise ConfigurationError("need to specify at least one host")
+        seeds, username, password, dbase, opts = _parse_hosts(host, port)
 
         # _pool_class, _monitor_class, and _condition_class are for deep
         # customization of PyMongo, e.g. Motor.
@@ -384,9 +414,12 @@ class MongoClient(common.BaseObject):
                 writable_preferred_server_selector)
 
             # get_socket() logs out of the database if logged in with old
-            # credentials, and logs in with new ones.
-            with server.get_socket(all_credentials) as sock_info:
+            # credentials, and logs in with new ones. Check the socket out,
+            # so no other thread shares it while it logs in.
+            with server.get_socket(all_credentials,
+                                   checkout=True) as sock_info:
                 sock_info.authenticate(credentials)
+            server.pool.return_socket(sock_info)
 
         # If several threads run _cache_credentials at once, last one wins.
         self.__all_credentials[source] = credentials
@@ -15,16 +15,29 @@
 """Internal network layer helper methods."""
 
 import select
+import socket
 import struct
+import threading
 
 from pymongo import helpers, message
+from pymongo.compression_support import decompress, _NO_COMPRESSION
 from pymongo.errors import AutoReconnect
 
-_UNPACK_INT = struct.Struct("<i").unpack
+_UNPACK_HEADER = struct.Struct("<iiii").unpack_from
+
+try:
+    _memoryview = memoryview
+except NameError:
+    # Python 2.6 has no memoryview, receive into the buffer a chunk at a time.
+    _memoryview = None
+
+# The most buffers a single sendmsg call accepts (IOV_MAX on Linux and OS X).
+_MAX_SENDMSG_BUFFERS = 1024
 
 
 def command(sock, dbname, spec, slave_ok, is_mongos, read_preference,
-            codec_options, check=True, allowable_errors=None):
+            codec_options, check=True, allowable_errors=None,
+            multiplexer=None, compression_ctx=None):
     """Execute a command over the socket, or raise socket.error.
 
     :Parameters:
@@ -37,16 +50,30 @@ def command(sock, dbname, spec, slave_ok, is_mongos, read_preference,
       - `codec_options`: a CodecOptions instance
       - `check`: raise OperationFailure if there are errors
       - `allowable_errors`: errors to ignore if `check` is True
+      - `multiplexer` (optional): a :class:`SocketMultiplexer` for `sock`,
+        if it is shared by several threads
+      - `compression_ctx` (optional): a compression context, to send the
+        command compressed unless it is part of the handshake or
+        authentication
     """
+    name = next(iter(spec))
     ns = dbname + '.$cmd'
     flags = 4 if slave_ok else 0
     if is_mongos:
         spec = message._maybe_add_read_preference(spec, read_preference)
     request_id, msg, _ = message.query(flags, ns, 0, -1, spec,
                                        None, codec_options)
-    sock.sendall(msg)
-    response = receive_message(sock, 1, request_id)
-    unpacked = helpers._unpack_response(response, codec_options=codec_options)
+    if (compression_ctx is not None and
+            name.lower() not in _NO_COMPRESSION):
+        msg = message._compress(msg, compression_ctx)
+    if multiplexer is None:
+        sock.sendall(msg)
+        response = receive_message(sock, 1, request_id)
+    else:
+        multiplexer.send(msg, request_id)
+        response = multiplexer.receive_message(1, request_id)
+    unpacked = helpers._unpack_response(
+        response, codec_options=_command_reply_codec_options(codec_options))
     response_doc = unpacked['data'][0]
     msg = "command %s on namespace %s failed: %%s" % (
         repr(spec).replace("%", "%%"), ns)
@@ -55,32 +82,239 @@ def command(sock, dbname, spec, slave_ok, is_mongos, read_preference,
     return response_doc
 
 
+def _command_reply_codec_options(codec_options):
+    """The codec options to decode a command reply with.
+
+    decode_fields only applies to query results. A command reply is always
+    decoded whole, it needs its "ok" field for one thing.
+    """
+    if codec_options.decode_fields is None:
+        return codec_options
+    return codec_options._replace(decode_fields=None)
+
+
 def receive_message(sock, operation, request_id):
-    """Receive a raw BSON message or raise socket.error."""
-    header = _receive_data_on_socket(sock, 16)
-    length = _UNPACK_INT(header[:4])[0]
+    """Receive a raw BSON message or raise socket.error.
+
+    Returns a :class:`bytearray` holding the message after its header, or
+    :class:`bytes` if the message was compressed.
+    """
+    response_to, data = _receive_reply(sock, operation)
 
     # No request_id for exhaust cursor "getMore".
     if request_id is not None:
-        response_id = _UNPACK_INT(header[8:12])[0]
-        assert request_id == response_id, "ids don't match %r %r" % (
-            request_id, response_id)
+        assert request_id == response_to, "ids don't match %r %r" % (
+            request_id, response_to)
 
-    assert operation == _UNPACK_INT(header[12:])[0]
-    return _receive_data_on_socket(sock, length - 16)
+    return data
+
+
+def _receive_reply(sock, operation):
+    """Receive the next message, returning its responseTo and the message
+    after its header. Decompresses an **OP_COMPRESSED** message.
+    """
+    header = _receive_data_on_socket(sock, 16)
+    length, _, response_to, op_code = _UNPACK_HEADER(header)
+    op_code, data = _decompress_message(
+        op_code, _receive_data_on_socket(sock, length - 16))
+    assert operation == op_code
+    return response_to, data
+
+
+def _decompress_message(op_code, data):
+    """Decompress the message after its header if it's an **OP_COMPRESSED**
+    message. Returns the original opcode and message.
+    """
+    if op_code == message._OP_COMPRESSED:
+        op_code, _, compressor_id = message._UNPACK_COMPRESSED_HEADER(data)
+        data = decompress(data[9:], compressor_id)
+    return op_code, data
 
 
 def _receive_data_on_socket(sock, length):
-    msg = b""
-    while length:
-        chunk = sock.recv(length)
-        if chunk == b"":
+    """Receive exactly `length` bytes into one preallocated buffer."""
+    buf = bytearray(length)
+    i = 0
+    if _memoryview is None:
+        while i < length:
+            chunk = sock.recv(length - i)
+            if chunk == b"":
+                raise AutoReconnect("connection closed")
+            buf[i:i + len(chunk)] = chunk
+            i += len(chunk)
+        return buf
+
+    view = _memoryview(buf)
+    while i < length:
+        chunk_length = sock.recv_into(view[i:])
+        if chunk_length == 0:
             raise AutoReconnect("connection closed")
+        i += chunk_length
+    return buf
+
+
+def sendall_buffers(sock, buffers):
+    """Send a list of bytes-like buffers or raise socket.error.
+
+    Uses vectored writes (:meth:`socket.socket.sendmsg`) where the socket
+    supports them, so the buffers are not first joined into one bytes
+    object. Otherwise joins them and calls :meth:`~socket.socket.sendall`.
+    """
+    sendmsg = getattr(sock, 'sendmsg', None)
+    if sendmsg is not None:
+        remaining = list(buffers)
+        try:
+            while remaining:
+                sent = sendmsg(remaining[:_MAX_SENDMSG_BUFFERS])
+                # Drop the buffers that were sent completely, and the sent
+                # part of the next one.
+                i = 0
+                while i < len(remaining) and sent >= len(remaining[i]):
+                    sent -= len(remaining[i])
+                    i += 1
+                del remaining[:i]
+                if sent:
+                    remaining[0] = _memoryview(remaining[0])[sent:]
+            return
+        except NotImplementedError:
+            # SSL sockets refuse sendmsg before sending anything.
+            pass
+    sock.sendall(b"".join(buffers))
+
+
+class SocketMultiplexer(object):
+    """Lets several threads share a socket, each waiting for its own reply.
+
+    Messages are sent whole, one thread at a time. The first thread waiting
+    for a reply reads from the socket. It hands each reply to another request
+    to the thread waiting for it, by the reply's responseTo, until its own
+    reply arrives. Then one of the threads still waiting takes over reading.
+
+    :Parameters:
+      - `sock`: a raw socket instance
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.__send_lock = threading.Lock()
+        self.__cond = threading.Condition()
+        # Ids of the requests that have been sent and not yet answered.
+        self.__in_flight = set()
+        # Replies read by another thread, by responseTo.
+        self.__replies = {}
+        # A locked lock for each thread waiting while another one reads,
+        # by request id. Released to wake the thread.
+        self.__waiters = {}
+        self.__reading = False
+        self.__failed = False
+
+    def send(self, msg, request_id=None):
+        """Send a message (bytes or a list of buffers) or raise socket.error.
+
+        If `request_id` is given, its reply will be read with
+        :meth:`receive_message`. Sending waits while another request with
+        the same id is in flight, so the replies can't be mixed up.
+        """
+        if request_id is not None:
+            with self.__cond:
+                while request_id in self.__in_flight and not self.__failed:
+                    self.__cond.wait()
+                self.__in_flight.add(request_id)
+        try:
+            with self.__send_lock:
+                if isinstance(msg, list):
+                    sendall_buffers(self.sock, msg)
+                else:
+                    self.sock.sendall(msg)
+        except:
+            self.__done(request_id)
+            raise
+
+    def receive_message(self, operation, request_id):
+        """Receive the reply to `request_id` or raise socket.error.
+
+        Raises :class:`~pymongo.errors.AutoReconnect` if the thread reading
+        for it failed.
+        """
+        try:
+            while True:
+                with self.__cond:
+                    if request_id in self.__replies:
+                        return self.__replies.pop(request_id)
+                    if self.__failed:
+                        raise AutoReconnect("connection closed")
+                    if not self.__reading:
+                        self.__reading = True
+                        break
+                    waiter = threading.Lock()
+                    waiter.acquire()
+                    self.__waiters[request_id] = waiter
+                waiter.acquire()
+
+            try:
+                while True:
+                    response_to, data = _receive_reply(self.sock, operation)
+                    # No request_id for exhaust cursor "getMore".
+                    if request_id is None or response_to == request_id:
+                        return data
+                    with self.__cond:
+                        # Drop replies to requests whose thread gave up.
+                        if response_to in self.__in_flight:
+                            self.__replies[response_to] = data
+                        waiter = self.__waiters.pop(response_to, None)
+                    if waiter is not None:
+                        waiter.release()
+            except:
+                # The socket can't be read any more, wake the other threads.
+                with self.__cond:
+                    self.__failed = True
+                raise
+            finally:
+                with self.__cond:
+                    self.__reading = False
+                    if self.__failed:
+                        waiters = list(self.__waiters.values())
+                        self.__waiters.clear()
+                    elif self.__waiters:
+                        # Wake a thread still waiting for its reply to read.
+                        waiters = [self.__waiters.popitem()[1]]
+                    else:
+                        waiters = []
+                for waiter in waiters:
+                    waiter.release()
+        finally:
+            self.__done(request_id)
 
-        length -= len(chunk)
-        msg += chunk
+    def close(self):
+        """Close the socket, waking the threads waiting for replies."""
+        with self.__cond:
+            self.__failed = True
+            waiters = list(self.__waiters.values())
+            self.__waiters.clear()
+            self.__cond.notify_all()
+        for waiter in waiters:
+            waiter.release()
+        # Unlike close(), shutdown() interrupts a thread reading the socket.
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
 
-    return msg
+    def __done(self, request_id):
+        if request_id is not None:
+            waiter = None
+            with self.__cond:
+                self.__in_flight.discard(request_id)
+                # If the thread raised before its reply came, forget it.
+                self.__replies.pop(request_id, None)
+                self.__waiters.pop(request_id, None)
+                if not self.__reading and self.__waiters:
+                    # It may have been woken to read, wake another thread.
+                    waiter = self.__waiters.popitem()[1]
+                self.__cond.notify_all()
+            if waiter is not None:
+                waiter.release()
 
 
 def socket_closed(sock):
@@ -43,7 +43,9 @@ class InsertOne(_WriteOp):
 
         :Parameters:
           - `document`: The document to insert. If the document is missing an
-            _id field one will be added.
+            _id field one will be added. A
+            :class:`~bson.raw_bson.RawBSONDocument` or an encoded
+            :class:`~bson.BSON` document is sent without re-encoding.
         """
         super(InsertOne, self).__init__(doc=document)
 
@@ -107,7 +109,9 @@ class ReplaceOne(_WriteOp):
 
         :Parameters:
           - `filter`: A query that matches the document to replace.
-          - `replacement`: The new document.
+          - `replacement`: The new document. A
+            :class:`~bson.raw_bson.RawBSONDocument` or an encoded
+            :class:`~bson.BSON` document is sent without re-encoding.
           - `upsert` (optional): If ``True``, perform an insert if no documents
             match the filter.
         """
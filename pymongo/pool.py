@@ -18,7 +18,8 @@ import socket
 import threading
 
 from bson import DEFAULT_CODEC_OPTIONS
-from bson.py3compat import u, itervalues
+from bson.py3compat import u, itervalues, iteritems
+from bson.son import SON
 from pymongo import auth, helpers, thread_util
 from pymongo.errors import (AutoReconnect,
                             ConnectionFailure,
@@ -27,10 +28,13 @@ from pymongo.errors import (AutoReconnect,
                             NotMasterError,
                             OperationFailure)
 from pymongo.ismaster import IsMaster
+from pymongo.message import _compress
 from pymongo.monotonic import time as _time
 from pymongo.network import (command,
                              receive_message,
-                             socket_closed)
+                             sendall_buffers,
+                             socket_closed,
+                             SocketMultiplexer)
 from pymongo.read_preferences import ReadPreference
 from pymongo.server_type import SERVER_TYPE
 
@@ -58,16 +62,30 @@ def _raise_connection_failure(address, error):
         raise AutoReconnect(msg)
 
 
+def _ismaster_command(options):
+    """The ismaster command that opens a connection, offering the
+    compressors in PoolOptions `options`.
+    """
+    spec = SON([('ismaster', 1)])
+    compression_settings = options.compression_settings
+    if compression_settings and compression_settings.compressors:
+        # The server replies with those it supports too.
+        spec['compression'] = compression_settings.compressors
+    return spec
+
+
 class PoolOptions(object):
 
     __slots__ = ('__max_pool_size', '__connect_timeout', '__socket_timeout',
                  '__wait_queue_timeout', '__wait_queue_multiple',
-                 '__ssl_context', '__ssl_match_hostname', '__socket_keepalive')
+                 '__ssl_context', '__ssl_match_hostname', '__socket_keepalive',
+                 '__max_requests_per_socket', '__compression_settings')
 
     def __init__(self, max_pool_size=100, connect_timeout=None,
                  socket_timeout=None, wait_queue_timeout=None,
                  wait_queue_multiple=None, ssl_context=None,
-                 ssl_match_hostname=True, socket_keepalive=False):
+                 ssl_match_hostname=True, socket_keepalive=False,
+                 max_requests_per_socket=1, compression_settings=None):
 
         self.__max_pool_size = max_pool_size
         self.__connect_timeout = connect_timeout
@@ -77,6 +95,8 @@ class PoolOptions(object):
         self.__ssl_context = ssl_context
         self.__ssl_match_hostname = ssl_match_hostname
         self.__socket_keepalive = socket_keepalive
+        self.__max_requests_per_socket = max_requests_per_socket
+        self.__compression_settings = compression_settings
 
     @property
     def max_pool_size(self):
@@ -131,6 +151,20 @@ class PoolOptions(object):
         """
         return self.__socket_keepalive
 
+    @property
+    def max_requests_per_socket(self):
+        """How many threads can share a connection, each with a request in
+        flight. If more than 1, sockets are multiplexed.
+        """
+        return self.__max_requests_per_socket
+
+    @property
+    def compression_settings(self):
+        """A :class:`~pymongo.compression_support.CompressionSettings`
+        instance or None.
+        """
+        return self.__compression_settings
+
 
 class SocketInfo(object):
     """Store a socket with some metadata.
@@ -140,9 +174,12 @@ class SocketInfo(object):
       - `pool`: a Pool instance
       - `ismaster`: optional IsMaster instance, response to ismaster on `sock`
       - `address`: the server's (host, port)
+      - `multiplex` (optional): whether several threads may share `sock`
     """
-    def __init__(self, sock, pool, ismaster, address):
+    def __init__(self, sock, pool, ismaster, address, multiplex=False):
         self.sock = sock
+        # Sends and receives go through the multiplexer if sock is shared.
+        self.multiplexer = SocketMultiplexer(sock) if multiplex else None
         self.address = address
         self.authset = set()
         self.closed = False
@@ -159,6 +196,14 @@ class SocketInfo(object):
         else:
             self.is_mongos = None
 
+        # The compressor agreed on in the ismaster handshake, if any.
+        self.compression_context = None
+        compression_settings = pool.opts.compression_settings
+        if ismaster and ismaster.compressors and compression_settings:
+            self.compression_context = (
+                compression_settings.get_compression_context(
+                    ismaster.compressors))
+
         # The pool's pool_id changes with each reset() so we can close sockets
         # created before the last reset.
         self.pool_id = pool.pool_id
@@ -181,16 +226,23 @@ class SocketInfo(object):
         try:
             return command(self.sock, dbname, spec,
                            slave_ok, self.is_mongos, read_preference,
-                           codec_options, check, allowable_errors)
+                           codec_options, check, allowable_errors,
+                           self.multiplexer, self.compression_context)
         except OperationFailure:
             raise
         # Catch socket.error, KeyboardInterrupt, etc. and close ourselves.
         except BaseException as error:
             self._raise_connection_failure(error)
 
-    def send_message(self, message, max_doc_size):
+    def send_message(self, message, max_doc_size, request_id=None):
         """Send a raw BSON message or raise ConnectionFailure.
 
+        `message` is bytes, or a list of bytes-like buffers that are sent
+        together with :func:`~pymongo.network.sendall_buffers`. Pass the
+        `request_id` whose reply will be read with :meth:`receive_message`,
+        if any. The message is compressed if a compressor was agreed on
+        with the server.
+
         If a network exception is raised, the socket is closed.
         """
         if (self.max_bson_size is not None
@@ -200,8 +252,16 @@ class SocketInfo(object):
                 "supports BSON document sizes up to %d bytes." %
                 (max_doc_size, self.max_bson_size))
 
+        if self.compression_context is not None:
+            message = _compress(message, self.compression_context)
+
         try:
-            self.sock.sendall(message)
+            if self.multiplexer is not None:
+                self.multiplexer.send(message, request_id)
+            elif isinstance(message, list):
+                sendall_buffers(self.sock, message)
+            else:
+                self.sock.sendall(message)
         except BaseException as error:
             self._raise_connection_failure(error)
 
@@ -211,6 +271,8 @@ class SocketInfo(object):
         If any exception is raised, the socket is closed.
         """
         try:
+            if self.multiplexer is not None:
+                return self.multiplexer.receive_message(operation, request_id)
             return receive_message(self.sock, operation, request_id)
         except BaseException as error:
             self._raise_connection_failure(error)
@@ -222,8 +284,8 @@ class SocketInfo(object):
 
         :Parameters:
           - `request_id`: an int.
-          - `msg`: bytes, an OP_INSERT, OP_UPDATE, or OP_DELETE message,
-            perhaps with a getlasterror command appended.
+          - `msg`: bytes or a list of buffers, an OP_INSERT, OP_UPDATE, or
+            OP_DELETE message, perhaps with a getlasterror command appended.
           - `max_doc_size`: size in bytes of the largest document in `msg`.
           - `with_last_error`: True if a getlasterror command is appended.
         """
@@ -231,7 +293,8 @@ class SocketInfo(object):
             # Write won't succeed, bail as if we'd done a getlasterror.
             raise NotMasterError("not master")
 
-        self.send_message(msg, max_doc_size)
+        self.send_message(msg, max_doc_size,
+                          request_id if with_last_error else None)
         if with_last_error:
             response = self.receive_message(1, request_id)
             return helpers._check_gle_response(response)
@@ -243,9 +306,9 @@ class SocketInfo(object):
 
         :Parameters:
           - `request_id`: an int.
-          - `msg`: bytes, the command message.
+          - `msg`: bytes or a list of buffers, the command message.
         """
-        self.send_message(msg, 0)
+        self.send_message(msg, 0, request_id)
         response = helpers._unpack_response(self.receive_message(1, request_id))
         assert response['number_returned'] == 1
         result = response['data'][0]
@@ -291,7 +354,10 @@ class SocketInfo(object):
         self.closed = True
         # Avoid exceptions on interpreter shutdown.
         try:
-            self.sock.close()
+            if self.multiplexer is not None:
+                self.multiplexer.close()
+            else:
+                self.sock.close()
         except:
             pass
 
@@ -448,6 +514,13 @@ class Pool:
         self._socket_semaphore = thread_util.create_semaphore(
             self.opts.max_pool_size, max_waiters)
 
+        # With max_requests_per_socket > 1, maps each SocketInfo in use by
+        # one or more threads to its number of users. Notified when a socket
+        # has a user fewer.
+        self._multiplex = self.opts.max_requests_per_socket > 1
+        self._shared = {}
+        self._shared_cond = threading.Condition()
+
     def reset(self):
         with self.lock:
             self.pool_id += 1
@@ -469,13 +542,15 @@ class Pool:
         try:
             sock = _configured_socket(self.address, self.opts)
             if self.handshake:
-                ismaster = IsMaster(command(sock, 'admin', {'ismaster': 1},
+                ismaster = IsMaster(command(sock, 'admin',
+                                            _ismaster_command(self.opts),
                                             False, False,
                                             ReadPreference.PRIMARY,
                                             DEFAULT_CODEC_OPTIONS))
             else:
                 ismaster = None
-            return SocketInfo(sock, self, ismaster, self.address)
+            return SocketInfo(sock, self, ismaster, self.address,
+                              self._multiplex)
         except socket.error as error:
             if sock is not None:
                 sock.close()
@@ -498,12 +573,23 @@ class Pool:
         using the correct authentication mechanism for the server's wire
         protocol version.
 
+        If the pool's `max_requests_per_socket` is more than 1, the socket
+        may be shared with other threads, unless `checkout` is True.
+
         Can raise ConnectionFailure or OperationFailure.
 
         :Parameters:
           - `all_credentials`: dict, maps auth source to MongoCredential.
           - `checkout` (optional): keep socket checked out.
         """
+        if self._multiplex and not checkout:
+            sock_info = self._get_shared_socket(all_credentials)
+            try:
+                yield sock_info
+            finally:
+                self._return_shared_socket(sock_info)
+            return
+
         # First get a socket, then attempt authentication. Simplifies
         # semaphore management in the face of network errors during auth.
         sock_info = self._get_socket_no_auth()
@@ -518,8 +604,73 @@ class Pool:
             if not checkout:
                 self.return_socket(sock_info)
 
-    def _get_socket_no_auth(self):
-        """Get or create a SocketInfo. Can raise ConnectionFailure."""
+    def _get_shared_socket(self, all_credentials):
+        """Get a SocketInfo that other threads may be using too.
+
+        Shares the least used socket that has fewer than
+        `max_requests_per_socket` users and is logged in with exactly
+        `all_credentials`. Otherwise gets a socket of its own from the pool
+        and authenticates it before sharing it, so sockets in use by other
+        threads are never logged in or out.
+
+        Can raise ConnectionFailure or OperationFailure.
+        """
+        if self.pid != os.getpid():
+            self.reset()
+
+        credentials = set(itervalues(all_credentials))
+        timeout = self.opts.wait_queue_timeout
+        deadline = None if timeout is None else _time() + timeout
+        with self._shared_cond:
+            while True:
+                best = None
+                for sock_info, users in iteritems(self._shared):
+                    if (users < self.opts.max_requests_per_socket
+                            and not sock_info.closed
+                            and sock_info.pool_id == self.pool_id
+                            and sock_info.authset == credentials
+                            and (best is None or users < self._shared[best])):
+                        best = sock_info
+                if best is not None:
+                    self._shared[best] += 1
+                    return best
+                if self._socket_semaphore.acquire(False):
+                    break
+                if deadline is None:
+                    self._shared_cond.wait()
+                else:
+                    remaining = deadline - _time()
+                    if remaining <= 0:
+                        self._raise_wait_queue_timeout()
+                    self._shared_cond.wait(remaining)
+
+        sock_info = self._get_socket_no_auth(acquired=True)
+        try:
+            sock_info.check_auth(all_credentials)
+        except:
+            self.return_socket(sock_info)
+            raise
+        sock_info.last_checkout = _time()
+        with self._shared_cond:
+            self._shared[sock_info] = 1
+        return sock_info
+
+    def _return_shared_socket(self, sock_info):
+        """Stop using a socket got from _get_shared_socket."""
+        with self._shared_cond:
+            users = self._shared.get(sock_info, 1) - 1
+            if users:
+                self._shared[sock_info] = users
+            else:
+                self._shared.pop(sock_info, None)
+                self.return_socket(sock_info)
+            self._shared_cond.notify_all()
+
+    def _get_socket_no_auth(self, acquired=False):
+        """Get or create a SocketInfo. Can raise ConnectionFailure.
+
+        Pass `acquired` if the pool's semaphore has already been acquired.
+        """
         # We use the pid here to avoid issues with fork / multiprocessing.
         # See test.test_client:TestClient.test_fork for an example of
         # what could go wrong otherwise
@@ -527,7 +678,7 @@ class Pool:
             self.reset()
 
         # Get a free socket or create one.
-        if not self._socket_semaphore.acquire(
+        if not acquired and not self._socket_semaphore.acquire(
                 True, self.opts.wait_queue_timeout):
             self._raise_wait_queue_timeout()
 
@@ -565,6 +716,10 @@ class Pool:
                     self.sockets.add(sock_info)
 
         self._socket_semaphore.release()
+        if self._multiplex:
+            # A thread waiting to share a socket may open one now.
+            with self._shared_cond:
+                self._shared_cond.notify_all()
 
     def _check(self, sock_info):
         """This side-effecty function checks if this pool has been reset since
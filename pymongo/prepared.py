@@ -0,0 +1,148 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prepared queries, run many times with different parameter values."""
+
+from collections import Mapping
+
+from bson.py3compat import iteritems, string_type
+from bson.son import SON
+from pymongo.cursor import Cursor
+
+
+class Param(object):
+    """A placeholder for a value in the filter of a prepared query.
+
+    :Parameters:
+      - `name`: the name of the parameter
+
+    .. versionadded:: 3.1
+    """
+
+    __slots__ = ('__name',)
+
+    def __init__(self, name):
+        if not isinstance(name, string_type):
+            raise TypeError("name must be an instance "
+                            "of %s" % (string_type.__name__,))
+        self.__name = name
+
+    @property
+    def name(self):
+        """The name of this parameter."""
+        return self.__name
+
+    def __repr__(self):
+        return "Param(%r)" % (self.__name,)
+
+    def __eq__(self, other):
+        if isinstance(other, Param):
+            return self.__name == other.name
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.__name)
+
+
+def _compile(value, names):
+    """Get a function that copies `value` with each :class:`Param` replaced
+    by its value, or None if `value` has no :class:`Param`.
+
+    The parameter names are added to the set `names`. Only the documents and
+    lists that contain a :class:`Param` are copied.
+    """
+    if isinstance(value, Param):
+        name = value.name
+        names.add(name)
+        return lambda params: params[name]
+    if isinstance(value, Mapping):
+        items = iteritems(value)
+        # Read-only mappings, like RawBSONDocument, have no copy method.
+        copy = getattr(value, 'copy', None) or (lambda: SON(value))
+    elif isinstance(value, (list, tuple)):
+        items = enumerate(value)
+        copy = lambda: list(value)
+    else:
+        return None
+
+    binders = []
+    for key, item in items:
+        binder = _compile(item, names)
+        if binder is not None:
+            binders.append((key, binder))
+    if not binders:
+        return None
+
+    def bind(params):
+        bound = copy()
+        for key, binder in binders:
+            bound[key] = binder(params)
+        return bound
+    return bind
+
+
+class PreparedQuery(object):
+    """A query run many times with different parameter values.
+
+    Created by :meth:`~pymongo.collection.Collection.prepare`.
+    """
+
+    def __init__(self, collection, filter=None, *args, **kwargs):
+        self.__cursor = Cursor(collection, filter, *args, **kwargs)
+        self.__filter = filter
+        if filter is None:
+            self.__filter = {}
+        names = set()
+        self.__bind = _compile(self.__filter, names)
+        self.__names = frozenset(names)
+        self.__prepared = self.__cursor._prepare()
+
+    @property
+    def parameters(self):
+        """The set of parameter names of this query."""
+        return self.__names
+
+    def find(self, **params):
+        """Run this query with the given parameter values.
+
+        Returns an instance of :class:`~pymongo.cursor.Cursor`, like
+        :meth:`~pymongo.collection.Collection.find`::
+
+          >>> query = db.test.prepare({'x': {'$gt': Param('x')}},
+          ...                         sort=[('x', ASCENDING)])
+          >>> for doc in query.find(x=5):
+          ...     print(doc)
+
+        Options can still be set on the returned cursor. The query message
+        is then encoded as usual.
+
+        :Parameters:
+          - `**params`: the value of each parameter, by name
+        """
+        if (len(params) != len(self.__names) or
+                not self.__names.issuperset(params)):
+            missing = self.__names.difference(params)
+            if missing:
+                raise TypeError("missing value for parameter %r"
+                                % (sorted(missing)[0],))
+            raise TypeError("unknown parameter %r"
+                            % (sorted(set(params) - self.__names)[0],))
+        if self.__bind is None:
+            spec = self.__filter
+        else:
+            spec = self.__bind(params)
+        return self.__cursor._bind(spec, self.__prepared)
@@ -84,7 +84,7 @@ class Server(object):
             message = operation.get_message(
                 set_slave_okay, sock_info.is_mongos)
             request_id, data, max_doc_size = self._split_message(message)
-            sock_info.send_message(data, max_doc_size)
+            sock_info.send_message(data, max_doc_size, request_id)
             response_data = sock_info.receive_message(1, request_id)
             if exhaust:
                 return ExhaustResponse(
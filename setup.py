@@ -22,6 +22,7 @@ except ImportError:
 
 from distutils.cmd import Command
 from distutils.command.build_ext import build_ext
+from distutils.command.build_py import build_py
 from distutils.errors import CCompilerError, DistutilsOptionError
 from distutils.errors import DistutilsPlatformError, DistutilsExecError
 from distutils.core import Extension
@@ -233,6 +234,21 @@ http://api.mongodb.org/python/current/installation.html#osx
                                                   "to take advantage of the "
                                                   "extension."))
 
+class custom_build_py(build_py):
+    """Leave out modules that need a newer Python than the one installing.
+
+    The asyncio client uses async/await syntax, added in Python 3.5.
+    """
+
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info[:2] < (3, 5):
+            modules = [(pkg, module, filename)
+                       for pkg, module, filename in modules
+                       if (pkg, module) != ("pymongo", "asyncio_client")]
+        return modules
+
+
 ext_modules = [Extension('bson._cbson',
                          include_dirs=['bson'],
                          sources=['bson/_cbsonmodule.c',
@@ -303,6 +319,7 @@ setup(
         "Programming Language :: Python :: Implementation :: PyPy",
         "Topic :: Database"],
     cmdclass={"build_ext": custom_build_ext,
+              "build_py": custom_build_py,
               "doc": doc,
               "test": test},
     **extra_opts
@@ -19,6 +19,7 @@
 import collections
 import datetime
 import re
+import struct
 import sys
 import uuid
 
@@ -31,13 +32,15 @@ from bson import (BSON,
                   decode_iter,
                   is_valid,
                   Regex)
-from bson.binary import Binary, UUIDLegacy
+from bson.binary import Binary, UUIDLegacy, STANDARD
 from bson.code import Code
 from bson.codec_options import CodecOptions
+from bson.columns import _concat_columns
 from bson.int64 import Int64
 from bson.objectid import ObjectId
 from bson.dbref import DBRef
 from bson.py3compat import PY3, u, text_type, iteritems, StringIO
+from bson.raw_bson import RawBSONDocument
 from bson.son import SON
 from bson.timestamp import Timestamp
 from bson.errors import (InvalidBSON,
@@ -90,6 +93,7 @@ class NotADict(collections.MutableMapping):
 class TestBSON(unittest.TestCase):
     def assertInvalid(self, data):
         self.assertRaises(InvalidBSON, bson.BSON(data).decode)
+        self.assertFalse(is_valid(data))
 
     def check_encode_then_decode(self, doc_class=dict):
 
@@ -179,6 +183,18 @@ class TestBSON(unittest.TestCase):
         self.assertInvalid(b"\x10\x00\x00\x00\x02a\x00"
                            b"\x04\x00\x00\x00abc\xff\x00")
 
+    def test_short_subdocument_lengths(self):
+        # An embedded document and an array declaring a length of 4, less
+        # than the 5 bytes of an empty document.
+        for element_type in (b"\x03", b"\x04"):
+            data = (b"\x0d\x00\x00\x00" + element_type +
+                    b"a\x00\x04\x00\x00\x00\x00\x00")
+            self.assertInvalid(data)
+            # Run the pure Python decoder even when the C extension is built.
+            self.assertRaises(InvalidBSON, bson._elements_to_dict,
+                              data, 4, len(data) - 1,
+                              CodecOptions())
+
     def test_bad_string_lengths(self):
         self.assertInvalid(
             b"\x0c\x00\x00\x00\x02\x00"
@@ -235,6 +251,47 @@ class TestBSON(unittest.TestCase):
         qcheck.check_unittest(self, qcheck.isnt(is_valid),
                               qcheck.gen_string(qcheck.gen_range(0, 40)))
 
+    def test_validate_all(self):
+        docs = [{}, {"a": [1, {"b": u("\xe9")}], "c": Code("x", {"y": 1}),
+                     "d": Regex("a", "i"), "e": Binary(b"ab", 2),
+                     "f": uuid.uuid4(), "g": DBRef("c", 1, "db")},
+                {"h": datetime.datetime(2015, 6, 1)}]
+        encoded = [BSON.encode(doc) for doc in docs]
+        # Valid BSON that needs datetime_as_millis to decode.
+        encoded.append(
+            b"\x10\x00\x00\x00\x09h\x00" + struct.pack("<q", 2 ** 60) +
+            b"\x00")
+        data = b"".join(encoded)
+        offsets = [0]
+        for doc in encoded:
+            offsets.append(offsets[-1] + len(doc))
+        self.assertEqual(offsets, bson.validate_all(data))
+        self.assertEqual(offsets, bson.validate_all(bytearray(data)))
+        self.assertEqual([0], bson.validate_all(b""))
+        self.assertTrue(is_valid(encoded[3]))
+        self.assertFalse(is_valid(data))
+        if PY3:
+            self.assertEqual(offsets[:2],
+                             bson.validate_all(memoryview(data)[:5]))
+
+        bad = BSON.encode({"a": u("x")}).replace(b"a\x00", b"\xff\x00")
+        for invalid, offset in [(data + bad, len(data)),
+                                (data + b"\x05\x00", len(data)),
+                                (bad + data, 0)]:
+            try:
+                bson.validate_all(invalid)
+            except InvalidBSON as exc:
+                self.assertTrue(str(exc).startswith(
+                    "invalid document at offset %d:" % (offset,)), str(exc))
+            else:
+                self.fail("InvalidBSON not raised")
+
+        self.assertFalse(is_valid(
+            BSON.encode({"a": u("\xe9")}).replace(b"\xc3\xa9", b"\xc3(")))
+        self.assertFalse(is_valid(BSON.encode({"a": {"$ref": 1}})))
+        self.assertTrue(is_valid(BSON.encode({"$ref": 1})))
+        self.assertRaises(TypeError, bson.validate_all, 1)
+
     def test_basic_decode(self):
         self.assertEqual({"test": u("hello world")},
                          BSON(b"\x1B\x00\x00\x00\x0E\x74\x65\x73\x74\x00\x0C"
@@ -301,6 +358,244 @@ class TestBSON(unittest.TestCase):
         self.assertRaises(InvalidBSON, list, decode_iter(data))
         self.assertRaises(InvalidBSON, list, decode_file_iter(StringIO(data)))
 
+    def test_decode_bytes_like(self):
+        data = (BSON.encode({"test": u("hello world")}) +
+                BSON.encode({"n": 1}))
+        expected = [{"test": u("hello world")}, {"n": 1}]
+        for bytes_like in (bytearray(data), memoryview(data)):
+            self.assertEqual(expected, decode_all(bytes_like))
+            self.assertEqual(expected, list(decode_iter(bytes_like)))
+
+        # Decode part of a larger buffer, like the documents in a reply.
+        reply = b"\x00" * 20 + data
+        self.assertEqual(expected, decode_all(memoryview(reply)[20:]))
+        self.assertEqual(expected, list(decode_iter(memoryview(reply)[20:])))
+        self.assertRaises(InvalidBSON, decode_all, memoryview(reply)[19:])
+
+        self.assertRaises(TypeError, decode_all, 100)
+        self.assertRaises(TypeError, decode_all, u("test"))
+
+    def test_decode_fields(self):
+        doc = SON([("_id", 1),
+                   ("a", SON([("b", 1), ("c", [1, 2])])),
+                   ("arr", [{"x": 1, "y": 2}, 5, [{"x": 3, "y": 4}]]),
+                   ("s", u("string")),
+                   ("r", Regex("^a", "i")),
+                   ("n", 5)])
+        data = BSON.encode(doc)
+
+        def decode(fields):
+            options = CodecOptions(SON, decode_fields=fields)
+            docs = decode_all(data * 2, options)
+            self.assertEqual(docs[0], docs[1])
+            self.assertEqual(docs[0], BSON(data).decode(options))
+            self.assertEqual(docs, list(decode_iter(data * 2, options)))
+            self.assertIsInstance(docs[0], SON)
+            return docs[0]
+
+        self.assertEqual(SON([("a", {"b": 1}),
+                              ("arr", [{"x": 1}, [{"x": 3}]]),
+                              ("n", 5)]),
+                         decode(["n", "a.b", "arr.x", "s.x", "missing"]))
+        self.assertEqual(SON([("a", doc["a"])]), decode(["a.b", "a"]))
+        self.assertEqual(SON([("a", doc["a"])]), decode(["a", "a.b"]))
+        self.assertEqual(SON([("r", doc["r"])]), decode([u("r")]))
+        self.assertEqual(SON(), decode([]))
+        self.assertEqual(doc, decode(None))
+
+        # Skipped elements are still validated.
+        bad = (b"\x11\x00\x00\x00\x02a\x00d\x00\x00\x00\x00\x00"
+               b"\x10b\x00\x00")
+        self.assertRaises(InvalidBSON, decode_all, bad,
+                          CodecOptions(decode_fields=["b"]))
+
+    def test_key_cache(self):
+        self.assertRaises(TypeError, bson.set_key_cache_size, "1")
+        self.assertRaises(ValueError, bson.set_key_cache_size, -1)
+        self.assertRaises(ValueError, bson.set_key_cache_size, 2 ** 20 + 1)
+        if not bson.has_c():
+            self.assertEqual(0, bson.get_key_cache_size())
+            return
+
+        size = bson.get_key_cache_size()
+        self.addCleanup(bson.set_key_cache_size, size)
+        data = BSON.encode(SON([("key", 1), ("sub", {"key": 2}),
+                                ("k" * 33, 3)]))
+
+        bson.set_key_cache_size(100)
+        self.assertEqual(128, bson.get_key_cache_size())
+        doc1, doc2 = decode_all(data * 2)
+        self.assertEqual(doc1, doc2)
+        keys1 = dict((key, key) for key in doc1)
+        keys2 = dict((key, key) for key in doc2)
+        self.assertIs(keys1["key"], keys2["key"])
+        self.assertIs(keys1["sub"], keys2["sub"])
+        self.assertIs(keys1["key"], list(doc2["sub"])[0])
+        # Too long to be cached.
+        self.assertIsNot(keys1["k" * 33], keys2["k" * 33])
+
+        bson.set_key_cache_size(0)
+        self.assertEqual(0, bson.get_key_cache_size())
+        doc1, doc2 = decode_all(data * 2)
+        self.assertEqual(doc1, doc2)
+        keys1 = dict((key, key) for key in doc1)
+        keys2 = dict((key, key) for key in doc2)
+        self.assertIsNot(keys1["key"], keys2["key"])
+
+    def test_encode_many(self):
+        docs = [{"_id": 1, "a": u("x")}, SON([("b", [1, 2])]), {}]
+        data, offsets = bson.encode_many(iter(docs))
+        self.assertEqual(b"".join(BSON.encode(doc) for doc in docs), data)
+        self.assertEqual(4, len(offsets))
+        for i, doc in enumerate(docs):
+            self.assertEqual(BSON.encode(doc), data[offsets[i]:offsets[i + 1]])
+        self.assertEqual(docs, decode_all(data))
+        self.assertEqual((b"", [0]), bson.encode_many([]))
+
+        self.assertRaises(InvalidDocument, bson.encode_many,
+                          [{"a": 1}, {"$b": 1}], True)
+        bson.encode_many([{"a": 1}, {"$b": 1}], False)
+        self.assertRaises(TypeError, bson.encode_many, [{"a": 1}, 1])
+        self.assertRaises(TypeError, bson.encode_many, 1)
+        self.assertRaises(TypeError, bson.encode_many, [], False, {})
+
+    def test_encode_large_then_small(self):
+        # Documents over the 64 KiB that pooled encoder buffers keep,
+        # mixed with small ones.
+        docs = []
+        for i in range(20):
+            docs.append({"a": i, "b": u("x") * (100 * 1024 + i)})
+            docs.append({"a": i, "b": u("y")})
+            docs.append({"a": i, "b": u("z") * i})
+        encoder = bson.compile_encoder({"a": 0, "b": u("")})
+        opts = CodecOptions(compiled_encoder=encoder)
+        for doc in docs:
+            self.assertEqual(doc, BSON.encode(doc).decode())
+            self.assertEqual(doc, BSON.encode(doc, False, opts).decode())
+        data, offsets = bson.encode_many(docs)
+        self.assertEqual(docs, decode_all(data))
+        self.assertEqual(len(docs) + 1, len(offsets))
+
+    def test_encoded_size(self):
+        docs = [
+            {},
+            {"_id": ObjectId(), "a": 1, "b": 2 ** 40, "c": 1.5,
+             "d": u("\xe9t\xe9"), "e": None, "f": True,
+             "g": datetime.datetime(2015, 6, 2), "h": [1, [u("x")], {}] * 5,
+             "i": SON([("j", {"k": Int64(1)})]), "l": Binary(b"ab", 2),
+             "m": Binary(b"ab"), "n": uuid.uuid4(), "o": Code("x", {"y": 1}),
+             "p": Regex("a", "i"), "q": DBRef("c", 1), "r": Timestamp(1, 2),
+             "s": MinKey(), "t": MaxKey()},
+            collections.OrderedDict([("a", {"b": 1})]),
+        ]
+        for doc in docs:
+            self.assertEqual(len(BSON.encode(doc)), bson.encoded_size(doc))
+        doc = {"u": uuid.uuid4()}
+        opts = CodecOptions(uuid_representation=STANDARD)
+        self.assertEqual(len(BSON.encode(doc, codec_options=opts)),
+                         bson.encoded_size(doc, opts))
+
+        self.assertRaises(OverflowError, bson.encoded_size, {"a": 2 ** 64})
+        self.assertRaises(InvalidDocument, bson.encoded_size, {1: 1})
+        self.assertRaises(InvalidDocument, bson.encoded_size, {"a": object()})
+        self.assertRaises(TypeError, bson.encoded_size, 1)
+        self.assertRaises(TypeError, bson.encoded_size, {}, {})
+
+    def test_compile_encoder(self):
+        encoder = bson.compile_encoder({"_id": 1, "a": 1, "b": u("x")})
+        self.assertEqual(["a", "b"], encoder.keys)
+        opts = CodecOptions(compiled_encoder=encoder)
+        docs = [
+            {"a": 1, "b": u("y")},
+            {"_id": ObjectId(), "a": 2 ** 40, "b": {"c": [1, {"d": None}]}},
+            {"b": 1, "a": 2},
+            {"a": 1},
+            {"a": 1, "b": 2, "c": 3},
+            {"_id": 1, "a": 1, "c": 2},
+            {},
+            SON([("a", 1), ("b", 2)]),
+        ]
+        for doc in docs:
+            expected = BSON.encode(doc)
+            self.assertEqual(expected, encoder.encode(doc))
+            self.assertEqual(expected, BSON.encode(doc, codec_options=opts))
+            self.assertEqual(expected,
+                             bson.encode_many([doc], False, opts)[0])
+
+        self.assertRaises(InvalidDocument, encoder.encode,
+                          {"a": {"$b": 1}, "b": 1}, True)
+        self.assertRaises(InvalidDocument, BSON.encode,
+                          {"a": {"$b": 1}, "b": 1}, True, opts)
+        self.assertRaises(InvalidDocument, encoder.encode,
+                          {"a": object(), "b": 1})
+        self.assertRaises(TypeError, encoder.encode, 1)
+        self.assertRaises(TypeError, encoder.encode, {}, False, {})
+
+        # Templates with keys that check_keys rejects.
+        encoder = bson.compile_encoder({"$a": 1})
+        opts = CodecOptions(compiled_encoder=encoder)
+        self.assertEqual(BSON.encode({"$a": 1}), encoder.encode({"$a": 1}))
+        self.assertRaises(InvalidDocument, encoder.encode, {"$a": 1}, True)
+        self.assertRaises(InvalidDocument, BSON.encode, {"$a": 1}, True, opts)
+
+        self.assertRaises(InvalidDocument, bson.compile_encoder, {1: 1})
+        self.assertRaises(TypeError, CodecOptions, compiled_encoder=1)
+
+    def test_decode_columns(self):
+        oid = ObjectId()
+        when = datetime.datetime(2015, 3, 1, 12, 30, 15, 123000)
+        docs = [SON([("i", 1), ("f", 1.5), ("l", Int64(2 ** 40)),
+                     ("b", True), ("d", when), ("o", oid), ("s", "x")]),
+                SON([("i", 2), ("f", 2), ("l", None), ("b", False)]),
+                SON([("x", 1)])]
+        data = b"".join(BSON.encode(doc) for doc in docs)
+        fields = ["i", "f", "l", "b", "d", "o", u("missing")]
+        columns = bson.decode_columns(data, fields)
+        self.assertEqual(columns, bson.decode_columns(memoryview(data),
+                                                      fields))
+        self.assertEqual(set(fields), set(columns))
+
+        self.assertEqual(bson.INT64, columns["i"].dtype)
+        self.assertEqual([1, 2, None], columns["i"].tolist())
+        self.assertEqual(bson.FLOAT64, columns["f"].dtype)
+        self.assertEqual([1.5, 2.0, None], columns["f"].tolist())
+        self.assertEqual(bson.INT64, columns["l"].dtype)
+        self.assertEqual([2 ** 40, None, None], list(columns["l"]))
+        self.assertEqual(bson.BOOL, columns["b"].dtype)
+        self.assertEqual(bytearray(b"\x01\x00\x00"), columns["b"].data)
+        self.assertEqual(bson.DATETIME_MS, columns["d"].dtype)
+        self.assertEqual(1425213015123, columns["d"][0])
+        self.assertEqual(bson.OBJECTID, columns["o"].dtype)
+        self.assertEqual(oid.binary, bytes(columns["o"].data[:12]))
+        self.assertEqual(oid, columns["o"][0])
+        self.assertEqual(None, columns["o"][-1])
+        self.assertEqual(bytearray(b"\x00\x01\x01"), columns["o"].mask)
+        self.assertEqual(36, len(columns["o"].data))
+        self.assertEqual(bson.FLOAT64, columns["missing"].dtype)
+        self.assertEqual([None] * 3, columns["missing"].tolist())
+
+        self.assertEqual({}, bson.decode_columns(data, []))
+        self.assertEqual([], bson.decode_columns(b"", ["a"])["a"].tolist())
+        self.assertRaises(ValueError, bson.decode_columns, data, ["s"])
+        self.assertRaises(ValueError, bson.decode_columns,
+                          BSON.encode({"a": 1}) + BSON.encode({"a": True}),
+                          ["a"])
+        self.assertRaises(TypeError, bson.decode_columns, data, "i")
+        self.assertRaises(TypeError, bson.decode_columns, data, [1])
+        self.assertRaises(ValueError, bson.decode_columns, data, ["i", "i"])
+        self.assertRaises(InvalidBSON, bson.decode_columns, data[:-1], ["i"])
+
+    def test_concat_columns(self):
+        first = bson.decode_columns(BSON.encode({"a": 1}), ["a"])["a"]
+        second = bson.decode_columns(BSON.encode({"a": 2.5}), ["a"])["a"]
+        empty = bson.decode_columns(BSON.encode({}), ["a"])["a"]
+        column = _concat_columns([first, empty, second])
+        self.assertEqual(bson.FLOAT64, column.dtype)
+        self.assertEqual([1.0, None, 2.5], column.tolist())
+        self.assertEqual(bson.INT64, _concat_columns([first, empty]).dtype)
+        other = bson.decode_columns(BSON.encode({"a": False}), ["a"])["a"]
+        self.assertRaises(ValueError, _concat_columns, [first, other])
+
     def test_data_timestamp(self):
         self.assertEqual({"test": Timestamp(4, 20)},
                          BSON(b"\x13\x00\x00\x00\x11\x74\x65\x73\x74\x00\x14"
@@ -437,6 +732,69 @@ class TestBSON(unittest.TestCase):
         self.assertEqual(utc, after.tzinfo)
         self.assertEqual(as_utc, after)
 
+    def test_datetime_decode_dates(self):
+        # Leap days, century boundaries and dates before the epoch.
+        start = datetime.datetime(1, 1, 1)
+        for days in range(0, 3652059, 997):
+            dt = start + datetime.timedelta(days=days, milliseconds=days)
+            self.assertEqual(dt, BSON.encode({"d": dt}).decode()["d"])
+        for dt in [datetime.datetime(1600, 2, 29, 23, 59, 59, 999000),
+                   datetime.datetime(1900, 3, 1),
+                   datetime.datetime(1969, 12, 31, 23, 59, 59, 999000),
+                   datetime.datetime(1970, 1, 1),
+                   datetime.datetime(2000, 2, 29, 12),
+                   datetime.datetime(2100, 2, 28, 0, 0, 0, 1000)]:
+            self.assertEqual(dt, BSON.encode({"d": dt}).decode()["d"])
+
+        # Outside of the range of datetime.datetime.
+        for millis in [-62135596800001, 253402300800000]:
+            data = b"\x10\x00\x00\x00\x09d\x00" + struct.pack("<q", millis)
+            self.assertRaises(InvalidBSON, BSON(data + b"\x00").decode)
+
+    def test_datetime_as_millis(self):
+        opts = CodecOptions(datetime_as_millis=True)
+        for dt, millis in [(datetime.datetime(1970, 1, 1), 0),
+                           (datetime.datetime(2015, 6, 1, 0, 0, 0, 1000),
+                            1433116800001),
+                           (datetime.datetime(1969, 12, 31, 23, 59, 59), -1000)]:
+            decoded = BSON.encode({"d": dt}).decode(opts)["d"]
+            self.assertEqual(millis, decoded)
+            # int, not long, on Python 2, as the pure Python decoder does.
+            self.assertIs(type(millis), type(decoded))
+        # tz_aware is ignored.
+        opts = CodecOptions(tz_aware=True, datetime_as_millis=True)
+        self.assertEqual(
+            0,
+            BSON.encode({"d": datetime.datetime(1970, 1, 1)}).decode(opts)["d"])
+        self.assertRaises(TypeError, CodecOptions, datetime_as_millis=1)
+
+    def test_binary_as_memoryview(self):
+        if sys.version_info[:2] < (2, 7):
+            raise SkipTest("memoryview requires Python 2.7")
+        opts = CodecOptions(binary_as_memoryview=True)
+        data = BSON.encode(SON([("a", Binary(b"abc")),
+                                ("b", Binary(b"def", 5)),
+                                ("c", [{"d": Binary(b"gh")}])]))
+        for decoded in (data.decode(opts),
+                        bson.decode_all(data, opts)[0],
+                        RawBSONDocument(data, opts)):
+            self.assertIsInstance(decoded["a"], memoryview)
+            self.assertEqual(b"abc", decoded["a"].tobytes())
+            # Other subtypes are decoded as usual.
+            self.assertEqual(Binary(b"def", 5), decoded["b"])
+            self.assertEqual(b"gh", decoded["c"][0]["d"].tobytes())
+        # Memoryviews are encoded as binary subtype 0.
+        self.assertEqual(BSON.encode({"a": Binary(b"abc")}),
+                         BSON.encode({"a": memoryview(b"abc")}))
+
+        if bson.has_c():
+            # Not copied: the values see changes to the data.
+            buf = bytearray(data)
+            decoded = bson.decode_all(memoryview(buf), opts)[0]
+            buf[data.index(b"abc")] = ord(b"x")
+            self.assertEqual(b"xbc", decoded["a"].tobytes())
+        self.assertRaises(TypeError, CodecOptions, binary_as_memoryview=1)
+
     def test_naive_decode(self):
         aware = datetime.datetime(1993, 4, 4, 2,
                                   tzinfo=FixedOffset(555, "SomeZone"))
@@ -607,6 +965,49 @@ class TestBSON(unittest.TestCase):
         self.assertIsInstance(
             x.decode(CodecOptions(document_class=SON))["x"][0], SON)
 
+    def test_decode_son(self):
+        opts = CodecOptions(document_class=SON)
+        son = SON([("z", 1), ("a", SON([("c", 2), ("b", 3)])), ("m", 4)])
+        decoded = BSON.encode(son).decode(opts)
+        self.assertEqual(son, decoded)
+        self.assertEqual(["z", "a", "m"], decoded.keys())
+        self.assertEqual(["c", "b"], decoded["a"].keys())
+        decoded["b"] = 5
+        del decoded["z"]
+        self.assertEqual(["a", "m", "b"], decoded.keys())
+
+        # A repeated key keeps its first position and its last value.
+        data = (b"\x1a\x00\x00\x00\x10a\x00\x01\x00\x00\x00"
+                b"\x10b\x00\x02\x00\x00\x00\x10a\x00\x03\x00\x00\x00\x00")
+        decoded = BSON(data).decode(opts)
+        self.assertEqual(SON([("a", 3), ("b", 2)]), decoded)
+        self.assertEqual(2, len(decoded))
+
+    def test_from_bson_items(self):
+        class ItemsDocument(dict):
+            calls = []
+
+            @classmethod
+            def _from_bson_items(cls, items):
+                cls.calls.append(items)
+                return cls(items)
+
+        opts = CodecOptions(document_class=ItemsDocument)
+        doc = SON([("b", 1), ("a", {"c": 2}), ("d", [{"e": 3}])])
+        decoded = BSON.encode(doc).decode(opts)
+        self.assertEqual(doc, decoded)
+        self.assertIsInstance(decoded, ItemsDocument)
+        self.assertIsInstance(decoded["a"], ItemsDocument)
+        self.assertIsInstance(decoded["d"][0], ItemsDocument)
+        self.assertEqual([("b", 1), ("a", {"c": 2}), ("d", [{"e": 3}])],
+                         ItemsDocument.calls[-1])
+
+        del ItemsDocument.calls[:]
+        opts = CodecOptions(document_class=ItemsDocument,
+                            decode_fields=["a"])
+        self.assertEqual({"a": {"c": 2}}, BSON.encode(doc).decode(opts))
+        self.assertEqual([("a", {"c": 2})], ItemsDocument.calls[-1])
+
     def test_subclasses(self):
         # make sure we can serialize subclasses of native Python types.
         class _myint(int):
@@ -638,6 +1039,12 @@ class TestBSON(unittest.TestCase):
             d,
             BSON.encode(d).decode(CodecOptions(document_class=OrderedDict)))
 
+        d["five"] = [OrderedDict([("b", 1), ("a", 2)])]
+        decoded = BSON.encode(d).decode(
+            CodecOptions(document_class=OrderedDict))
+        self.assertEqual(d, decoded)
+        self.assertIs(OrderedDict, type(decoded["five"][0]))
+
     def test_bson_regex(self):
         # Invalid Python regex, though valid PCRE.
         bson_re1 = Regex(r'[\w-\.]')
@@ -768,6 +1175,23 @@ class TestBSON(unittest.TestCase):
                           {"_id": {'$oid': "52d0b971b3ba219fdeb4170e"}}, True)
         BSON.encode({"_id": {'$oid': "52d0b971b3ba219fdeb4170e"}})
 
+    def test_check_keys_repeated(self):
+        # Keys already checked for one document must still be checked the
+        # same way in the next, whether or not check_keys is set.
+        for _ in range(3):
+            self.assertEqual(BSON.encode({"a.b": 1}),
+                             BSON.encode({"a.b": 1}, False))
+            self.assertRaises(InvalidDocument, BSON.encode,
+                              {"a.b": 1}, True)
+            self.assertRaises(InvalidDocument, BSON.encode,
+                              {"x": {"$y": 1}}, True)
+            self.assertEqual({"x": {"$y": 1}},
+                             BSON.encode({"x": {"$y": 1}}).decode())
+            self.assertEqual({"x": {"y": 1}},
+                             BSON.encode({"x": {"y": 1}}, True).decode())
+            self.assertRaises(InvalidDocument, BSON.encode, {8.9: 1}, True)
+            self.assertRaises(InvalidDocument, BSON.encode, {"a\x00": 1})
+
 
 class TestCodecOptions(unittest.TestCase):
     def test_document_class(self):
@@ -784,10 +1208,35 @@ class TestCodecOptions(unittest.TestCase):
         self.assertRaises(ValueError, CodecOptions, uuid_representation=7)
         self.assertRaises(ValueError, CodecOptions, uuid_representation=2)
 
+    def test_decode_fields(self):
+        self.assertIsNone(CodecOptions().decode_fields)
+        self.assertEqual(("a", "b.c"),
+                         CodecOptions(decode_fields=["a", "b.c"]).decode_fields)
+        self.assertRaises(TypeError, CodecOptions, decode_fields="a")
+        self.assertRaises(TypeError, CodecOptions, decode_fields=1)
+        self.assertRaises(TypeError, CodecOptions, decode_fields=[1])
+        self.assertRaises(ValueError, CodecOptions, decode_fields=[""])
+        self.assertRaises(ValueError, CodecOptions, decode_fields=["a."])
+
     def test_codec_options_repr(self):
         r = ('CodecOptions(document_class=dict, tz_aware=False, '
              'uuid_representation=PYTHON_LEGACY)')
         self.assertEqual(r, repr(CodecOptions()))
+        r = ('CodecOptions(document_class=dict, tz_aware=False, '
+             'uuid_representation=PYTHON_LEGACY, decode_fields=(%r,))'
+             % (u("a"),))
+        self.assertEqual(r, repr(CodecOptions(decode_fields=[u("a")])))
+        r = ('CodecOptions(document_class=dict, tz_aware=False, '
+             'uuid_representation=PYTHON_LEGACY, datetime_as_millis=True)')
+        self.assertEqual(r, repr(CodecOptions(datetime_as_millis=True)))
+        r = ('CodecOptions(document_class=dict, tz_aware=False, '
+             'uuid_representation=PYTHON_LEGACY, '
+             'compiled_encoder=CompiledEncoder(keys=[%r]))' % (u("a"),))
+        encoder = bson.compile_encoder({u("a"): 1})
+        self.assertEqual(r, repr(CodecOptions(compiled_encoder=encoder)))
+        r = ('CodecOptions(document_class=dict, tz_aware=False, '
+             'uuid_representation=PYTHON_LEGACY, binary_as_memoryview=True)')
+        self.assertEqual(r, repr(CodecOptions(binary_as_memoryview=True)))
 
     def test_decode_all_defaults(self):
         # Test decode_all()'s default document_class is dict and tz_aware is
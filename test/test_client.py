@@ -112,6 +112,17 @@ class ClientUnitTest(unittest.TestCase):
         self.assertEqual(ReadPreference.PRIMARY, client.read_preference)
         self.assertAlmostEqual(12, client.server_selection_timeout)
 
+    def test_max_requests_per_socket(self):
+        client = MongoClient(maxRequestsPerSocket=8, connect=False)
+        pool_opts = client._MongoClient__options.pool_options
+        self.assertEqual(8, pool_opts.max_requests_per_socket)
+        for value in (0, -1, "0"):
+            self.assertRaises(ValueError, MongoClient,
+                              maxRequestsPerSocket=value, connect=False)
+        self.assertRaises(ValueError, MongoClient,
+                          "mongodb://localhost/?maxRequestsPerSocket=0",
+                          connect=False)
+
     def test_types(self):
         self.assertRaises(TypeError, MongoClient, 1)
         self.assertRaises(TypeError, MongoClient, 1.14)
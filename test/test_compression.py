@@ -0,0 +1,243 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test wire protocol compression against a stand-in server."""
+
+import socket
+import struct
+import sys
+import threading
+import warnings
+
+sys.path[0:0] = [""]
+
+import bson
+from pymongo import MongoClient, message
+from pymongo.compression_support import (decompress,
+                                         validate_compressors,
+                                         validate_zlib_compression_level,
+                                         ZlibContext)
+from test import unittest
+
+
+class MockCompressionServer(object):
+    """Answers ismaster, insert commands and queries on one collection.
+
+    Like mongod, it offers the compressors it has in common with the client
+    in ismaster, and compresses the reply to a compressed request with the
+    same compressor. Records the opcode and original opcode of each request.
+    """
+
+    def __init__(self, compressors=('zlib',)):
+        self.compressors = list(compressors)
+        self.documents = []
+        self.requests = []
+        self._listener = socket.socket()
+        self._listener.bind(('localhost', 0))
+        self._listener.listen(5)
+        self.port = self._listener.getsockname()[1]
+
+    def start(self):
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self._listener.accept()
+            except socket.error:
+                return
+            thread = threading.Thread(target=self._serve, args=(sock,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, sock):
+        try:
+            while True:
+                header = self._receive(sock, 16)
+                length, request_id, _, op_code = struct.unpack("<iiii", header)
+                data = self._receive(sock, length - 16)
+                original_op_code = op_code
+                compressor_id = None
+                if op_code == message._OP_COMPRESSED:
+                    original_op_code, _, compressor_id = struct.unpack(
+                        "<iiB", data[:9])
+                    data = decompress(data[9:], compressor_id)
+                self.requests.append((op_code, original_op_code))
+                self._handle(sock, request_id, original_op_code,
+                             compressor_id, data)
+        except socket.error:
+            pass
+        finally:
+            sock.close()
+
+    def _handle(self, sock, request_id, op_code, compressor_id, data):
+        if op_code == 2004:
+            self._reply(sock, request_id, compressor_id, self._query(data))
+
+    def _receive(self, sock, length):
+        data = b""
+        while len(data) < length:
+            chunk = sock.recv(length - len(data))
+            if not chunk:
+                raise socket.error("connection closed")
+            data += chunk
+        return data
+
+    def _query(self, data):
+        end = data.index(b"\x00", 4)
+        ns = data[4:end].decode("utf-8")
+        spec = bson.BSON(data[end + 9:]).decode()
+        if not ns.endswith(".$cmd"):
+            return self.documents
+        spec = spec.get("$query", spec)
+        name = next(iter(spec)).lower()
+        if name == "ismaster":
+            reply = {"ok": 1, "ismaster": True, "maxWireVersion": 3}
+            if "compression" in spec:
+                reply["compression"] = [c for c in spec["compression"]
+                                        if c in self.compressors]
+            return [reply]
+        if name == "insert":
+            self.documents.extend(spec["documents"])
+            return [{"ok": 1, "n": len(spec["documents"])}]
+        return [{"ok": 1}]
+
+    def _reply(self, sock, request_id, compressor_id, documents,
+               cursor_id=0, starting_from=0):
+        data = struct.pack("<iqii", 0, cursor_id, starting_from,
+                           len(documents))
+        data += b"".join(bson.BSON.encode(doc) for doc in documents)
+        if compressor_id is None:
+            sock.sendall(struct.pack("<iiii", 16 + len(data), 0,
+                                     request_id, 1) + data)
+        else:
+            compressed = ZlibContext(-1, 0).compress(data)
+            sock.sendall(struct.pack(
+                "<iiiiiiB", 25 + len(compressed), 0, request_id,
+                message._OP_COMPRESSED, 1, len(data), compressor_id) +
+                compressed)
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockCompressionServer()
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def client(self, **kwargs):
+        client = MongoClient('localhost', self.server.port, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def round_trip(self, client):
+        documents = [{"_id": i, "s": "compressible " * 20}
+                     for i in range(100)]
+        client.db.test.insert_many(documents)
+        # A filter big enough to be worth compressing.
+        spec = {"_id": {"$nin": list(range(1000, 1100))}}
+        self.assertEqual(documents, list(client.db.test.find(spec)))
+
+    def test_compressed(self):
+        self.round_trip(self.client(compressors="zlib"))
+        # Handshakes are never compressed.
+        self.assertIn((2004, 2004), self.server.requests)
+        # The insert command and the query.
+        self.assertEqual(2, self.server.requests.count((2012, 2004)))
+
+    def test_no_common_compressor(self):
+        self.server.compressors = []
+        self.round_trip(self.client(compressors="zlib"))
+        self.assertNotIn((2012, 2004), self.server.requests)
+
+    def test_not_compressed_by_default(self):
+        self.round_trip(self.client())
+        self.assertNotIn((2012, 2004), self.server.requests)
+
+    def test_min_size(self):
+        self.round_trip(self.client(compressors="zlib",
+                                    compressionMinSize=1024 * 1024))
+        self.assertNotIn((2012, 2004), self.server.requests)
+
+    def test_compress_messages(self):
+        ctx = ZlibContext(-1, 0)
+        _, msg, _ = message.insert(
+            "db.test", [{"s": "compressible " * 20}], False, True,
+            {}, False, bson.codec_options.DEFAULT_CODEC_OPTIONS)
+        insert_length = struct.unpack_from("<i", msg)[0]
+
+        # The insert is compressed. The getlasterror after it is too small
+        # to get smaller, so it is left as it is.
+        compressed = message._compress(msg, ctx)
+        length, _, _, op_code = struct.unpack_from("<iiii", compressed)
+        self.assertEqual((msg[4:8], message._OP_COMPRESSED),
+                         (compressed[4:8], op_code))
+        original_op_code, size, compressor_id = struct.unpack_from(
+            "<iiB", compressed, 16)
+        self.assertEqual((2002, insert_length - 16, 2),
+                         (original_op_code, size, compressor_id))
+        self.assertEqual(msg[16:insert_length],
+                         decompress(compressed[25:length], compressor_id))
+        self.assertEqual(msg[insert_length:], compressed[length:])
+        self.assertLess(len(compressed), len(msg))
+
+        # Lists of buffers are joined.
+        self.assertEqual(compressed, message._compress(
+            [msg[:insert_length], msg[insert_length:]], ctx))
+
+        # Messages smaller than the minimum size are left as they are.
+        self.assertEqual(msg, message._compress(msg, ZlibContext(-1, 4096)))
+
+    def test_validate_compressors(self):
+        self.assertEqual(["zlib"], validate_compressors("compressors", "zlib"))
+        self.assertEqual([], validate_compressors("compressors", ""))
+        with warnings.catch_warnings(record=True) as ctx:
+            warnings.simplefilter("always")
+            self.assertEqual(["zlib"],
+                             validate_compressors("compressors", "foo,zlib"))
+        self.assertEqual(1, len(ctx))
+
+    def test_validate_zlib_compression_level(self):
+        self.assertEqual(-1, validate_zlib_compression_level("level", "-1"))
+        self.assertEqual(9, validate_zlib_compression_level("level", 9))
+        self.assertRaises(ValueError,
+                          validate_zlib_compression_level, "level", 10)
+        self.assertRaises(ValueError,
+                          validate_zlib_compression_level, "level", "x")
+        self.assertRaises(TypeError,
+                          validate_zlib_compression_level, "level", 1.5)
+
+    def test_uri_options(self):
+        client = MongoClient(
+            "mongodb://localhost/?compressors=zlib&zlibCompressionLevel=6"
+            "&compressionMinSize=512", connect=False)
+        options = client._MongoClient__options
+        settings = options.pool_options.compression_settings
+        self.assertEqual(["zlib"], settings.compressors)
+        self.assertEqual(6, settings.zlib_compression_level)
+        self.assertEqual(512, settings.min_size)
+        self.assertRaises(ValueError, MongoClient,
+                          "mongodb://localhost/?zlibCompressionLevel=10",
+                          connect=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
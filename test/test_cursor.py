@@ -18,11 +18,14 @@ import itertools
 import random
 import re
 import sys
+from collections import Mapping
 
 sys.path[0:0] = [""]
 
+from bson import BSON
 from bson.code import Code
-from bson.py3compat import u, PY3
+from bson.py3compat import iteritems, u, PY3
+from bson.raw_bson import RawBSONDocument
 from bson.son import SON
 from pymongo import (MongoClient,
                      ASCENDING,
@@ -32,6 +35,8 @@ from pymongo import (MongoClient,
 from pymongo.command_cursor import CommandCursor
 from pymongo.cursor import CursorType
 from pymongo.cursor_manager import CursorManager
+from pymongo.prepared import Param
+from pymongo.read_preferences import ReadPreference
 from pymongo.errors import (InvalidOperation,
                             OperationFailure,
                             ExecutionTimeout)
@@ -141,6 +146,134 @@ class TestCursorNoConnect(unittest.TestCase):
         cursor.remove_option(128)
         self.assertEqual(0, cursor._Cursor__query_flags)
 
+    def test_decode_fields(self):
+        cursor = self.db.test.find().decode_fields(["a", "b.c"])
+        self.assertEqual(("a", "b.c"),
+                         cursor._Cursor__codec_options.decode_fields)
+        self.assertEqual(self.db.test.codec_options.document_class,
+                         cursor._Cursor__codec_options.document_class)
+        self.assertEqual(("a", "b.c"),
+                         cursor.clone()._Cursor__codec_options.decode_fields)
+        cursor.decode_fields(None)
+        self.assertIsNone(cursor._Cursor__codec_options.decode_fields)
+        self.assertRaises(TypeError, cursor.decode_fields, "a")
+        self.assertRaises(ValueError, cursor.decode_fields, ["a..b"])
+
+    def test_to_columns_tailable(self):
+        cursor = self.db.test.find(cursor_type=CursorType.TAILABLE)
+        self.assertRaises(InvalidOperation, cursor.to_columns, ["a"])
+        self.assertRaises(TypeError, self.db.test.find().to_columns, "a")
+
+    def _first_message(self, cursor, set_slave_ok, is_mongos):
+        """Get the first message of cursor, without its request id."""
+        operations = []
+
+        class Sent(Exception):
+            pass
+
+        def send_message_with_response(operation, **kwargs):
+            operations.append(operation)
+            raise Sent()
+
+        client = cursor.collection.database.client
+        client._send_message_with_response = send_message_with_response
+        try:
+            self.assertRaises(Sent, next, cursor)
+        finally:
+            del client._send_message_with_response
+        message = operations[0].get_message(set_slave_ok, is_mongos)[1]
+        return type(operations[0]).__name__, message[:4] + message[8:]
+
+    def test_prepare(self):
+        secondary = self.db.get_collection(
+            "test", read_preference=ReadPreference.SECONDARY)
+        cases = [
+            (self.db.test, {"x": Param("x")}, {}, {"x": 1}),
+            (self.db.test, None, {"limit": 2}, {}),
+            (self.db.test,
+             {"a": {"$in": [1, Param("x")]}, "_id": Param("y")},
+             {"sort": [("a", 1)], "projection": ["a"], "skip": 2,
+              "limit": 3, "batch_size": 2, "modifiers": {"$comment": "c"}},
+             {"x": [2], "y": 3}),
+            (self.db.test, {"query": Param("x")}, {}, {"x": {"a": 1}}),
+            (secondary, {"x": Param("x")}, {"sort": [("x", 1)]}, {"x": 1}),
+            (secondary, SON([("x", 1), ("query", Param("x"))]), {}, {"x": 2}),
+        ]
+        for collection, template, kwargs, params in cases:
+            query = collection.prepare(template, **kwargs)
+            self.assertEqual(set(params), query.parameters)
+            spec = template
+            if template is not None:
+                spec = copy.deepcopy(template)
+                for key, value in params.items():
+                    for doc in (spec, spec.get("a")):
+                        for k, v in list(iteritems(doc or {})):
+                            if v == Param(key):
+                                doc[k] = value
+                            elif isinstance(v, list):
+                                doc[k] = [value if x == Param(key) else x
+                                          for x in v]
+            for args in [(False, False), (True, False), (True, True)]:
+                name, expected = self._first_message(
+                    collection.find(spec, **kwargs), *args)
+                self.assertEqual("_Query", name)
+                name, message = self._first_message(query.find(**params),
+                                                    *args)
+                self.assertEqual("_BoundQuery", name)
+                self.assertEqual(expected, message)
+            # The template is not modified.
+            self.assertEqual(set(params), collection.prepare(
+                template, **kwargs).parameters)
+
+        # Options set on the cursor, or merged into the filter, fall back
+        # to the generic query message.
+        query = self.db.test.prepare({"x": Param("x")})
+        cursor = query.find(x=1).limit(1)
+        self.assertEqual(
+            self._first_message(self.db.test.find({"x": 1}).limit(1),
+                                False, False),
+            self._first_message(cursor, False, False))
+        query = self.db.test.prepare({"$query": {"x": Param("x")}},
+                                     sort=[("x", 1)])
+        self.assertEqual(
+            "_Query", self._first_message(query.find(x=1), False, False)[0])
+
+        query = self.db.test.prepare({"x": Param("x")})
+        self.assertEqual({"x": 1}, query.find(x=1)._Cursor__spec)
+        self.assertEqual({"x": 2}, query.find(x=2).clone()._Cursor__spec)
+        self.assertRaises(TypeError, query.find)
+        self.assertRaises(TypeError, query.find, x=1, y=2)
+        self.assertRaises(TypeError, query.find, y=2)
+        self.assertRaises(TypeError, Param, 1)
+        self.assertRaises(TypeError, self.db.test.prepare, 1)
+
+    def test_prepare_read_only_mapping(self):
+        class ReadOnly(Mapping):
+            def __init__(self, *args):
+                self.__son = SON(*args)
+
+            def __getitem__(self, key):
+                return self.__son[key]
+
+            def __iter__(self):
+                return iter(self.__son)
+
+            def __len__(self):
+                return len(self.__son)
+
+        raw = RawBSONDocument(BSON.encode(SON([("x", 1), ("y", 2)])))
+        cases = [
+            (ReadOnly([("x", Param("x")), ("y", 2)]), {"x": 1},
+             SON([("x", 1), ("y", 2)])),
+            (raw, {}, raw),
+        ]
+        for template, params, spec in cases:
+            query = self.db.test.prepare(template)
+            self.assertEqual(set(params), query.parameters)
+            self.assertEqual(
+                self._first_message(self.db.test.find(spec), False, False)[1],
+                self._first_message(query.find(**params), False, False)[1])
+
 
 class TestCursor(IntegrationTest):
 
@@ -1026,6 +1159,24 @@ class TestCursor(IntegrationTest):
         self.assertFalse(c2.alive)
         self.assertTrue(c1.alive)
 
+    def test_decode_fields(self):
+        self.db.test.drop()
+        self.db.test.insert_one({"_id": 1, "a": 1, "b": {"c": 2, "d": 3},
+                                 "e": [{"c": 4, "d": 5}]})
+        doc = next(self.db.test.find().decode_fields(["a", "b.c", "e.c"]))
+        self.assertEqual({"a": 1, "b": {"c": 2}, "e": [{"c": 4}]}, doc)
+
+    @client_context.require_no_mongos
+    def test_to_columns(self):
+        self.db.test.drop()
+        self.db.test.insert_many([{"_id": i, "x": i * 0.5} for i in range(10)])
+        self.db.test.insert_one({"_id": 10})
+        columns = self.db.test.find().sort("_id").batch_size(3).to_columns(
+            ["_id", "x"])
+        self.assertEqual(list(range(11)), columns["_id"].tolist())
+        self.assertEqual([i * 0.5 for i in range(10)] + [None],
+                         columns["x"].tolist())
+
     @client_context.require_no_mongos
     def test_comment(self):
         if server_started_with_auth(self.db.client):
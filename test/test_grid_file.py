@@ -21,6 +21,9 @@ import datetime
 import sys
 sys.path[0:0] = [""]
 
+from bson import _HAS_MEMORYVIEW
+from bson.binary import STANDARD
+from bson.codec_options import CodecOptions
 from bson.objectid import ObjectId
 from bson.py3compat import u, StringIO
 from gridfs import GridFS
@@ -72,6 +75,14 @@ class TestGridFileNoConnect(unittest.TestCase):
         self.assertEqual(1000, b.chunk_size)
         self.assertEqual(100, b.baz)
 
+    def test_grid_out_chunks_codec_options(self):
+        opts = CodecOptions(tz_aware=True, uuid_representation=STANDARD)
+        db = self.db.client.get_database("pymongo_test", codec_options=opts)
+        chunks = GridOut(db.fs, 5)._GridOut__chunks
+        self.assertEqual(
+            opts._replace(binary_as_memoryview=_HAS_MEMORYVIEW),
+            chunks.codec_options)
+
     def test_grid_out_cursor_options(self):
         self.assertRaises(TypeError, GridOutCursor.__init__, self.db.fs, {},
                           projection={"filename": 1})
@@ -22,7 +22,7 @@ import uuid
 
 sys.path[0:0] = [""]
 
-from bson import json_util, EPOCH_AWARE
+from bson import json_util, EPOCH_AWARE, SON
 from bson.binary import Binary, MD5_SUBTYPE, USER_DEFINED_SUBTYPE
 from bson.code import Code
 from bson.dbref import DBRef
@@ -33,11 +33,17 @@ from bson.objectid import ObjectId
 from bson.regex import Regex
 from bson.timestamp import Timestamp
 from bson.tz_util import utc
+from bson.py3compat import u
 
 from test import unittest, IntegrationTest
 
 PY3 = sys.version_info[0] == 3
 
+if PY3:
+    from io import StringIO
+else:
+    from io import BytesIO as StringIO
+
 
 class TestJsonUtil(unittest.TestCase):
     def round_tripped(self, doc):
@@ -216,6 +222,37 @@ class TestJsonUtil(unittest.TestCase):
         self.assertEqual(json_util.loads(json)['weight'],
                          Int64(65535))
 
+    def test_dump_iter(self):
+        docs = [
+            SON([("_id", ObjectId()), ("b", [1, 2.5, None, True, u("\xe9")])]),
+            {"date": datetime.datetime(2015, 1, 1, 0, 0, 0, 5000),
+             "regex": Regex("a", re.I), "bin": Binary(b"\x00\x01", 5)},
+            {"ref": DBRef("c", 5, "db"), "ts": Timestamp(1, 2),
+             "min": MinKey(), "max": MaxKey(), "long": Int64(2 ** 40),
+             "code": Code("return z", z={"y": 1}), "tuple": (1, 2)},
+            {1: 2, None: 3},
+            {},
+        ]
+        fp = StringIO()
+        self.assertEqual(len(docs), json_util.dump_iter(iter(docs), fp))
+        lines = fp.getvalue().split("\n")
+        self.assertEqual("", lines.pop())
+        self.assertEqual([json_util.dumps(doc) for doc in docs], lines)
+        self.assertEqual(0, json_util.dump_iter([], StringIO()))
+        self.assertRaises(TypeError, json_util.dump_iter, [{"a": object()}],
+                          StringIO())
+
+    def test_load_iter(self):
+        docs = [{"_id": ObjectId(), "a": [1, {"b": Int64(5)}]},
+                {"date": datetime.datetime(2015, 1, 1, tzinfo=utc)}]
+        fp = StringIO()
+        json_util.dump_iter(docs, fp)
+        fp = StringIO(fp.getvalue() + "\n  \n")
+        self.assertEqual(docs, list(json_util.load_iter(fp)))
+        self.assertEqual([], list(json_util.load_iter(StringIO())))
+        self.assertRaises(ValueError, list,
+                          json_util.load_iter(StringIO('{"a": 1}\n{"b"\n')))
+
 
 class TestJsonUtilRoundtrip(IntegrationTest):
     def test_cursor(self):
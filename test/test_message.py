@@ -0,0 +1,142 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test splitting writes into batches, without a server."""
+
+import struct
+import sys
+
+sys.path[0:0] = [""]
+
+import bson
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from bson.errors import InvalidDocument
+from pymongo import message
+from pymongo.errors import DocumentTooLarge
+from test import SkipTest, unittest
+
+
+class FakeSocketInfo(object):
+    """Records the messages that would be sent."""
+
+    max_bson_size = 16 * 1024 * 1024
+    max_write_batch_size = 1000
+
+    def __init__(self, max_message_size):
+        self.max_message_size = max_message_size
+        self.messages = []
+
+    def _record(self, msg):
+        if isinstance(msg, list):
+            msg = b"".join(bytes(buf) for buf in msg)
+        self.messages.append(msg)
+
+    def legacy_write(self, request_id, msg, max_doc_size, with_last_error):
+        self._record(msg)
+
+    def write_command(self, request_id, msg):
+        self._record(msg)
+        return {"ok": 1, "n": 0}
+
+
+def documents(count, invalid_at=None, consumed=None):
+    """Generate `count` 1KB documents, the one at `invalid_at` with an
+    invalid key. Appends the index of each document generated to `consumed`.
+    """
+    for i in range(count):
+        if consumed is not None:
+            consumed.append(i)
+        if i == invalid_at:
+            yield {"$invalid": i}
+        else:
+            yield {"_id": i, "s": "x" * 1000}
+
+
+class TestBatchedWrites(unittest.TestCase):
+
+    def insert(self, docs, max_message_size):
+        sock_info = FakeSocketInfo(max_message_size)
+        message._do_batched_insert("db.test", docs, True, True, {}, False,
+                                   DEFAULT_CODEC_OPTIONS, sock_info)
+        return sock_info
+
+    def inserted(self, msg):
+        """The documents of an OP_INSERT message with getlasterror."""
+        length = struct.unpack_from("<i", msg)[0]
+        end = msg.index(b"\x00", 20)
+        return bson.decode_all(msg[end + 1:length])
+
+    def test_insert_batches(self):
+        sock_info = self.insert(documents(100), 10 * 1024)
+        self.assertGreater(len(sock_info.messages), 1)
+        inserted = []
+        for msg in sock_info.messages:
+            inserted.extend(self.inserted(msg))
+        self.assertEqual(list(documents(100)), inserted)
+
+    def test_insert_invalid_document(self):
+        # Like the C extension, batches before the invalid document are sent
+        # and the documents after it are never generated.
+        consumed = []
+        sock_info = FakeSocketInfo(10 * 1024)
+        self.assertRaises(InvalidDocument, message._do_batched_insert,
+                          "db.test", documents(100, 25, consumed), True, True,
+                          {}, False, DEFAULT_CODEC_OPTIONS, sock_info)
+        self.assertEqual(list(range(26)), consumed)
+        inserted = []
+        for msg in sock_info.messages:
+            inserted.extend(self.inserted(msg))
+        self.assertTrue(0 < len(inserted) < 25)
+        self.assertEqual(list(documents(len(inserted))), inserted)
+
+    def test_write_command_invalid_document(self):
+        consumed = []
+        sock_info = FakeSocketInfo(0)
+        sock_info.max_write_batch_size = 10
+        self.assertRaises(InvalidDocument, message._do_batched_write_command,
+                          "db.$cmd", message._INSERT, {"insert": "test"},
+                          documents(100, 25, consumed), True,
+                          DEFAULT_CODEC_OPTIONS, sock_info)
+        self.assertEqual(list(range(26)), consumed)
+        self.assertEqual(2, len(sock_info.messages))
+        inserted = []
+        for msg in sock_info.messages:
+            command = bson.BSON(msg[msg.index(b"\x00", 20) + 9:]).decode()
+            inserted.extend(command["documents"])
+        self.assertEqual(list(documents(20)), inserted)
+
+    def test_too_large_document_not_encoded(self):
+        if message._use_c:
+            raise SkipTest("The C extension encodes before checking size.")
+        # Encoding the document would raise InvalidDocument for its key.
+        too_large = {"$invalid": "x" * 20000}
+        sock_info = FakeSocketInfo(48 * 1000 * 1000)
+        sock_info.max_bson_size = 1024
+        self.assertRaises(DocumentTooLarge, message._do_batched_insert,
+                          "db.test", [{"_id": 0}, too_large], True, True, {},
+                          False, DEFAULT_CODEC_OPTIONS, sock_info)
+        # The batch before it is sent.
+        self.assertEqual([[{"_id": 0}]],
+                         [self.inserted(msg) for msg in sock_info.messages])
+
+        sock_info = FakeSocketInfo(0)
+        sock_info.max_bson_size = 1024
+        self.assertRaises(DocumentTooLarge, message._do_batched_write_command,
+                          "db.$cmd", message._INSERT, {"insert": "test"},
+                          [too_large], True, DEFAULT_CODEC_OPTIONS, sock_info)
+        self.assertEqual([], sock_info.messages)
+
+
+if __name__ == "__main__":
+    unittest.main()
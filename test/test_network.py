@@ -0,0 +1,247 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the network module over socketpairs, without a server."""
+
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path[0:0] = [""]
+
+import bson
+from bson.codec_options import CodecOptions, DEFAULT_CODEC_OPTIONS
+from pymongo import helpers, message, network
+from pymongo.errors import AutoReconnect
+from pymongo.read_preferences import ReadPreference
+from test import unittest
+
+
+def reply(response_to, documents, cursor_id=0, starting_from=0):
+    """An OP_REPLY message answering the request `response_to`."""
+    data = struct.pack("<iqii", 0, cursor_id, starting_from, len(documents))
+    data += b"".join(bson.BSON.encode(doc) for doc in documents)
+    return struct.pack("<iiii", 16 + len(data), 0, response_to, 1) + data
+
+
+def receive_request(sock):
+    """Read one message from `sock`, returning its requestID."""
+    header = network._receive_data_on_socket(sock, 16)
+    length, request_id, _, _ = struct.unpack("<iiii", header)
+    network._receive_data_on_socket(sock, length - 16)
+    return request_id
+
+
+class FakeSocket(object):
+    """Records what is sent. sendmsg sends at most `max_send` bytes per call,
+    like a socket whose send buffer is nearly full.
+    """
+
+    def __init__(self, max_send=None):
+        self.max_send = max_send
+        self.data = b""
+        self.sendmsg_calls = []
+
+    def sendmsg(self, buffers):
+        self.sendmsg_calls.append(len(buffers))
+        data = b"".join(memoryview(buf).tobytes() for buf in buffers)
+        if self.max_send is not None:
+            data = data[:self.max_send]
+        self.data += data
+        return len(data)
+
+    def sendall(self, data):
+        self.data += data
+
+
+class NoSendmsgSocket(FakeSocket):
+    """A socket whose sendmsg raises NotImplementedError, like SSLSocket."""
+
+    def sendmsg(self, buffers):
+        raise NotImplementedError
+
+
+class NetworkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client_sock, self.server_sock = socket.socketpair()
+        self.addCleanup(self.client_sock.close)
+        self.addCleanup(self.server_sock.close)
+
+    def send_in_pieces(self, data, piece_size, close=False):
+        """Send `data` from the server side a few bytes at a time, in a
+        thread, then close the server side if `close` is True.
+        """
+        def target():
+            for i in range(0, len(data), piece_size):
+                self.server_sock.sendall(data[i:i + piece_size])
+                time.sleep(0.001)
+            if close:
+                self.server_sock.close()
+
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def answer(self, documents):
+        """Answer the next request on the server side, in a thread."""
+        def target():
+            request_id = receive_request(self.server_sock)
+            self.server_sock.sendall(reply(request_id, documents))
+
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join)
+
+
+class TestCommand(NetworkTestCase):
+
+    def test_reply_not_filtered_by_decode_fields(self):
+        self.answer([{"ok": 1, "n": 5}])
+        opts = CodecOptions(decode_fields=["x"])
+        response = network.command(
+            self.client_sock, "db", {"count": "test"}, False, False,
+            ReadPreference.PRIMARY, opts)
+        self.assertEqual({"ok": 1, "n": 5}, response)
+
+
+class TestReceive(NetworkTestCase):
+
+    def test_short_reads(self):
+        documents = [{"_id": i, "s": "x" * 100} for i in range(10)]
+        self.send_in_pieces(reply(5, documents), 7)
+        data = network.receive_message(self.client_sock, 1, 5)
+        self.assertEqual(documents, helpers._unpack_response(data)["data"])
+
+    def test_closed_in_header(self):
+        self.send_in_pieces(reply(5, [{"s": "x" * 100}])[:10], 3, close=True)
+        self.assertRaises(AutoReconnect, network.receive_message,
+                          self.client_sock, 1, 5)
+
+    def test_closed_in_body(self):
+        self.send_in_pieces(reply(5, [{"s": "x" * 100}])[:-10], 3, close=True)
+        self.assertRaises(AutoReconnect, network.receive_message,
+                          self.client_sock, 1, 5)
+
+
+class TestSocketMultiplexer(NetworkTestCase):
+
+    def request(self, request_id):
+        """An OP_QUERY message for a ping command with this request id."""
+        _, msg, _ = message.query(0, "db.$cmd", 0, -1, {"ping": 1}, None,
+                                  DEFAULT_CODEC_OPTIONS)
+        return msg[:4] + struct.pack("<i", request_id) + msg[8:]
+
+    def start_requests(self, multiplexer, request_ids):
+        """Send a request for each id and wait for its reply, each in a
+        thread. Returns a dict, filled with the reply or the exception each
+        thread gets by request id, and the threads.
+        """
+        results = {}
+
+        def target(request_id):
+            try:
+                multiplexer.send(self.request(request_id), request_id)
+                data = multiplexer.receive_message(1, request_id)
+                results[request_id] = helpers._unpack_response(data)["data"]
+            except Exception as exc:
+                results[request_id] = exc
+
+        threads = [threading.Thread(target=target, args=(request_id,))
+                   for request_id in request_ids]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        return results, threads
+
+    def test_replies_out_of_order(self):
+        multiplexer = network.SocketMultiplexer(self.client_sock)
+        request_ids = list(range(1, 11))
+        results, threads = self.start_requests(multiplexer, request_ids)
+        received = [receive_request(self.server_sock) for _ in request_ids]
+        self.assertEqual(sorted(request_ids), sorted(received))
+        for request_id in reversed(received):
+            self.server_sock.sendall(reply(request_id, [{"id": request_id}]))
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(dict((request_id, [{"id": request_id}])
+                              for request_id in request_ids), results)
+
+    def test_reader_fails(self):
+        multiplexer = network.SocketMultiplexer(self.client_sock)
+        request_ids = list(range(1, 11))
+        results, threads = self.start_requests(multiplexer, request_ids)
+        for _ in request_ids:
+            receive_request(self.server_sock)
+        # Answer one request, then close the connection.
+        self.server_sock.sendall(reply(5, [{"id": 5}]))
+        self.server_sock.close()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual([{"id": 5}], results.pop(5))
+        for request_id in results:
+            self.assertIsInstance(results[request_id], AutoReconnect)
+        self.assertEqual(9, len(results))
+        self.assertRaises(AutoReconnect, multiplexer.receive_message, 1, 11)
+
+    def test_abandoned_reply_dropped(self):
+        multiplexer = network.SocketMultiplexer(self.client_sock)
+        multiplexer.send(self.request(1), 1)
+        multiplexer.send(self.request(2), 2)
+        receive_request(self.server_sock)
+        receive_request(self.server_sock)
+        # The thread waiting for request 1 raised before its reply came.
+        multiplexer._SocketMultiplexer__done(1)
+        self.server_sock.sendall(reply(1, [{"id": 1}]))
+        self.server_sock.sendall(reply(2, [{"id": 2}]))
+        data = multiplexer.receive_message(1, 2)
+        self.assertEqual([{"id": 2}], helpers._unpack_response(data)["data"])
+        self.assertEqual({}, multiplexer._SocketMultiplexer__replies)
+
+
+class TestSendallBuffers(unittest.TestCase):
+
+    def test_partial_sends(self):
+        buffers = [b"header", b"", b"x" * 100, b"y" * 7, b"z"]
+        for max_send in (1, 3, 5, 6, 7, 100, 1000):
+            sock = FakeSocket(max_send)
+            network.sendall_buffers(sock, buffers)
+            self.assertEqual(b"".join(buffers), sock.data)
+
+    def test_buffer_limit(self):
+        buffers = [struct.pack("<i", i) for i in range(3000)]
+        sock = FakeSocket()
+        network.sendall_buffers(sock, buffers)
+        self.assertEqual(b"".join(buffers), sock.data)
+        self.assertEqual([1024, 1024, 952], sock.sendmsg_calls)
+
+    def test_partial_sends_over_buffer_limit(self):
+        buffers = [struct.pack("<i", i) for i in range(3000)]
+        sock = FakeSocket(1000 * 4 + 2)
+        network.sendall_buffers(sock, buffers)
+        self.assertEqual(b"".join(buffers), sock.data)
+        self.assertTrue(all(n <= 1024 for n in sock.sendmsg_calls))
+
+    def test_sendmsg_not_implemented(self):
+        sock = NoSendmsgSocket()
+        network.sendall_buffers(sock, [b"a", b"bc", b"d"])
+        self.assertEqual(b"abcd", sock.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -116,6 +116,27 @@ class TestObjectId(unittest.TestCase):
         oid = ObjectId.from_datetime(aware)
         self.assertEqual(as_utc, oid.generation_time)
 
+    def test_generate_many(self):
+        class MyObjectId(ObjectId):
+            pass
+
+        oids = ObjectId.generate_many(100)
+        self.assertEqual(100, len(oids))
+        self.assertEqual(100, len(set(oids)))
+        for oid in oids:
+            self.assertIsInstance(oid, ObjectId)
+            self.assertEqual(oid, ObjectId(str(oid)))
+            self.assertTrue(oid_generated_on_client(oid))
+        # The counter values are consecutive.
+        first = int(str(oids[0])[-6:], 16)
+        last = int(str(oids[-1])[-6:], 16)
+        self.assertEqual((first + 99) % 0xFFFFFF, last)
+        self.assertNotIn(ObjectId(), oids)
+
+        self.assertEqual([], ObjectId.generate_many(0))
+        self.assertIsInstance(MyObjectId.generate_many(1)[0], MyObjectId)
+        self.assertRaises(ValueError, ObjectId.generate_many, -1)
+
     def test_pickling(self):
         orig = ObjectId()
         for protocol in [0, 1, 2, -1]:
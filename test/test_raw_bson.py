@@ -0,0 +1,240 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the raw_bson module."""
+
+import datetime
+import struct
+import sys
+import uuid
+
+sys.path[0:0] = [""]
+
+from bson import BSON, decode_all, decode_iter, _find_element
+from bson.binary import Binary, JAVA_LEGACY
+from bson.code import Code
+from bson.codec_options import CodecOptions
+from bson.dbref import DBRef
+from bson.errors import InvalidBSON
+from bson.int64 import Int64
+from bson.max_key import MaxKey
+from bson.min_key import MinKey
+from bson.objectid import ObjectId
+from bson.py3compat import b, u
+from bson.raw_bson import RawBSONDocument
+from bson.regex import Regex
+from bson.son import SON
+from bson.timestamp import Timestamp
+from bson.tz_util import utc
+from pymongo import MongoClient
+from pymongo.bulk import _Bulk
+from pymongo.operations import InsertOne, ReplaceOne
+from pymongo.write_concern import WriteConcern
+from test import client_context, unittest
+from test.test_message import FakeSocketInfo
+
+
+class TestRawBSONDocument(unittest.TestCase):
+
+    # {u'_id': ObjectId('556df68b6e32ab21a95e0785'),
+    #  u'name': u'Sherlock',
+    #  u'addresses': [{u'street': u'Baker Street'}]}
+    bson_string = (
+        b'Z\x00\x00\x00\x07_id\x00Um\xf6\x8bn2\xab!\xa9^\x07\x85\x02name\x00\t'
+        b'\x00\x00\x00Sherlock\x00\x04addresses\x00&\x00\x00\x00\x030\x00\x1e'
+        b'\x00\x00\x00\x02street\x00\r\x00\x00\x00Baker Street\x00\x00\x00\x00'
+    )
+    document = RawBSONDocument(bson_string)
+
+    def test_decode(self):
+        self.assertEqual('Sherlock', self.document['name'])
+        first_address = self.document['addresses'][0]
+        self.assertIsInstance(first_address, dict)
+        self.assertEqual('Baker Street', first_address['street'])
+
+    def test_raw(self):
+        self.assertEqual(self.bson_string, self.document.raw)
+
+    def test_missing_field(self):
+        document = RawBSONDocument(self.bson_string)
+        self.assertRaises(KeyError, lambda: document['not here'])
+        self.assertRaises(KeyError, lambda: document[1])
+        self.assertFalse('not here' in document)
+        self.assertEqual(None, document.get('not here'))
+
+    def test_iteration(self):
+        document = RawBSONDocument(self.bson_string)
+        self.assertEqual(3, len(document))
+        self.assertEqual(set(['_id', 'name', 'addresses']),
+                         set(document))
+        self.assertEqual(
+            ObjectId('556df68b6e32ab21a95e0785'), dict(document.items())['_id'])
+
+    def test_equality(self):
+        self.assertEqual(self.document, RawBSONDocument(self.bson_string))
+        self.assertNotEqual(self.document,
+                            RawBSONDocument(BSON.encode({'name': 'Watson'})))
+
+    def test_all_types(self):
+        raw = BSON.encode(SON([
+            ('float', 1.5),
+            ('string', u('\xe9')),
+            ('doc', {'a': 1}),
+            ('array', [1, 'b']),
+            ('binary', Binary(b('\x01\x02'), 128)),
+            ('oid', ObjectId('556df68b6e32ab21a95e0785')),
+            ('bool', True),
+            ('date', datetime.datetime(2015, 6, 2, 12, 0)),
+            ('null', None),
+            ('regex', Regex('^a', 'i')),
+            ('dbref', DBRef('coll', 1)),
+            ('code', Code('x')),
+            ('code_w_scope', Code('y', {'z': 1})),
+            ('int', 42),
+            ('timestamp', Timestamp(1, 2)),
+            ('long', Int64(2 ** 40)),
+            ('min', MinKey()),
+            ('max', MaxKey()),
+            ('last', 'found')]))
+        expected = BSON(raw).decode()
+        for key, value in expected.items():
+            document = RawBSONDocument(raw)
+            self.assertEqual(value, document[key])
+
+    def test_codec_options(self):
+        raw = BSON.encode(SON([
+            ('uuid', uuid.UUID(int=1)),
+            ('date', datetime.datetime(2015, 6, 2)),
+            ('doc', SON([('b', 1), ('a', 2)]))]),
+            codec_options=CodecOptions(uuid_representation=JAVA_LEGACY))
+        options = CodecOptions(document_class=SON, tz_aware=True,
+                               uuid_representation=JAVA_LEGACY)
+        document = RawBSONDocument(raw, options)
+        self.assertEqual(uuid.UUID(int=1), document['uuid'])
+        self.assertEqual(utc, document['date'].tzinfo)
+        self.assertIsInstance(document['doc'], SON)
+        self.assertEqual(['b', 'a'], list(document['doc']))
+
+    def test_invalid_bson(self):
+        self.assertRaises(InvalidBSON, _find_element, b'\x05\x00\x00\x00',
+                          b'a', CodecOptions())
+        # Claims the string is 100 bytes long.
+        bad = b'\x11\x00\x00\x00\x02a\x00d\x00\x00\x00\x00\x00\x10b\x00\x00'
+        self.assertRaises(InvalidBSON, _find_element, bad, b'b',
+                          CodecOptions())
+        # Unknown element type.
+        bad = b'\x0c\x00\x00\x00\x99a\x00\x10b\x00\x00'
+        self.assertRaises(InvalidBSON, _find_element, bad, b'b',
+                          CodecOptions())
+
+    def test_decode_all(self):
+        options = CodecOptions(document_class=RawBSONDocument)
+        docs = decode_all(self.bson_string * 3, options)
+        self.assertEqual(3, len(docs))
+        for doc in docs:
+            self.assertIsInstance(doc, RawBSONDocument)
+            self.assertEqual(self.bson_string, doc.raw)
+        docs = list(decode_iter(self.bson_string * 2, options))
+        self.assertEqual(self.document, docs[1])
+        self.assertEqual(self.document, BSON(self.bson_string).decode(options))
+
+    def test_encode(self):
+        # Round trip using Mapping encoding.
+        self.assertEqual(BSON(self.bson_string).decode(),
+                         BSON.encode(self.document).decode())
+
+    def test_encode_raw(self):
+        # Raw documents are copied as is, embedded or not.
+        self.assertEqual(self.bson_string, BSON.encode(self.document))
+        raw = BSON.encode(SON([('a', 1), ('doc', self.document)]))
+        self.assertEqual(self.bson_string, raw[raw.index(b'Z'):-1])
+        self.assertEqual(
+            {'a': 1, 'doc': BSON(self.bson_string).decode()},
+            BSON(raw).decode())
+
+    def test_repr(self):
+        self.assertTrue(repr(self.document).startswith('RawBSONDocument('))
+
+    def test_codec_options_document_class(self):
+        options = CodecOptions(document_class=RawBSONDocument)
+        self.assertEqual(RawBSONDocument, options.document_class)
+
+    @client_context.require_connection
+    def test_with_codec_options(self):
+        db = client_context.client.pymongo_test
+        db.test_raw.drop()
+        db.test_raw.insert_one(BSON(self.bson_string).decode())
+        coll = db.get_collection(
+            'test_raw',
+            codec_options=CodecOptions(document_class=RawBSONDocument))
+        document = coll.find_one()
+        self.assertIsInstance(document, RawBSONDocument)
+        self.assertEqual('Sherlock', document['name'])
+        self.assertEqual(self.bson_string, document.raw)
+        db.test_raw.drop()
+
+    @client_context.require_connection
+    def test_raw_writes(self):
+        db = client_context.client.pymongo_test
+        db.test_raw.drop()
+        result = db.test_raw.insert_many(
+            [self.document, BSON.encode({'name': 'Watson'})])
+        self.assertEqual(ObjectId('556df68b6e32ab21a95e0785'),
+                         result.inserted_ids[0])
+        self.assertIsInstance(result.inserted_ids[1], ObjectId)
+        self.assertEqual(
+            'Watson', db.test_raw.find_one(result.inserted_ids[1])['name'])
+        self.assertEqual(BSON(self.bson_string).decode(),
+                         db.test_raw.find_one(result.inserted_ids[0]))
+
+        db.test_raw.replace_one({'name': 'Watson'},
+                                BSON.encode({'name': 'Mycroft'}))
+        self.assertEqual(1, db.test_raw.count({'name': 'Mycroft'}))
+        self.assertRaises(ValueError, db.test_raw.replace_one, {},
+                          BSON.encode({'$set': {'name': 'Mycroft'}}))
+
+        db.test_raw.bulk_write([
+            InsertOne(BSON.encode({'name': 'Hudson'})),
+            ReplaceOne({'name': 'Mycroft'}, RawBSONDocument(
+                BSON.encode({'name': 'Moriarty'})))])
+        self.assertEqual(
+            ['Hudson', 'Moriarty', 'Sherlock'],
+            sorted(doc['name'] for doc in db.test_raw.find()))
+        db.test_raw.drop()
+
+    def test_raw_writes_legacy_bulk(self):
+        # Servers before wire version 2 get one OP_INSERT per document.
+        coll = MongoClient(connect=False).pymongo_test.test_raw
+        sock_info = FakeSocketInfo(48 * 1000 * 1000)
+        sock_info.max_wire_version = 0
+        bulk = _Bulk(coll, ordered=True)
+        bulk.add_insert(self.document)
+        bulk.add_insert(BSON.encode({'name': 'Watson'}))
+        result = bulk.execute_legacy(
+            sock_info, bulk.gen_ordered(), WriteConcern())
+        self.assertEqual(2, result['nInserted'])
+        self.assertEqual(2, len(sock_info.messages))
+        inserted = []
+        for msg in sock_info.messages:
+            # The OP_INSERT, without the getlasterror command after it.
+            length = struct.unpack_from('<i', msg)[0]
+            end = msg.index(b'\x00', 20)
+            inserted.extend(decode_all(msg[end + 1:length]))
+        self.assertEqual(BSON(self.bson_string).decode(), inserted[0])
+        self.assertEqual('Watson', inserted[1]['name'])
+        self.assertIsInstance(inserted[1]['_id'], ObjectId)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test sharing pooled sockets between threads against a stand-in server."""
+
+import sys
+import threading
+import time
+
+sys.path[0:0] = [""]
+
+import bson
+from pymongo import MongoClient, auth
+from pymongo.errors import ConnectionFailure
+from pymongo.pool import Pool, PoolOptions
+from pymongo.server_selectors import writable_server_selector
+from test import unittest
+from test.test_compression import MockCompressionServer
+
+
+class MockAuthServer(MockCompressionServer):
+    """Also accepts any user and password with MONGODB-CR."""
+
+    def _query(self, data):
+        end = data.index(b"\x00", 4)
+        spec = bson.BSON(data[end + 9:]).decode()
+        if next(iter(spec)).lower() == "getnonce":
+            return [{"ok": 1, "nonce": "2375531c32080ae8"}]
+        return MockCompressionServer._query(self, data)
+
+
+class TestSocketSharing(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockAuthServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def pool(self, **kwargs):
+        pool = Pool(('localhost', self.server.port), PoolOptions(**kwargs))
+        self.addCleanup(pool.reset)
+        return pool
+
+    def test_shares_sockets(self):
+        pool = self.pool(max_pool_size=2, max_requests_per_socket=2)
+        with pool.get_socket({}) as first:
+            with pool.get_socket({}) as second:
+                self.assertIs(first, second)
+                self.assertIsNotNone(first.multiplexer)
+                with pool.get_socket({}) as third:
+                    self.assertIsNot(first, third)
+                    # The least used socket is shared.
+                    with pool.get_socket({}) as fourth:
+                        self.assertIs(third, fourth)
+        self.assertEqual(2, len(pool.sockets))
+
+    def test_exhaust_socket_not_shared(self):
+        pool = self.pool(max_pool_size=2, max_requests_per_socket=2)
+        with pool.get_socket({}, checkout=True) as checked_out:
+            with pool.get_socket({}) as shared:
+                self.assertIsNot(checked_out, shared)
+        pool.return_socket(checked_out)
+
+    def test_wait_queue_timeout(self):
+        pool = self.pool(max_pool_size=1, max_requests_per_socket=2,
+                         wait_queue_timeout=0.2)
+        with pool.get_socket({}):
+            with pool.get_socket({}):
+                start = time.time()
+                with self.assertRaises(ConnectionFailure):
+                    with pool.get_socket({}):
+                        pass
+                self.assertTrue(0.15 < time.time() - start < 5)
+
+            # A user fewer, the socket can be shared again.
+            with pool.get_socket({}):
+                pass
+
+    def test_waiter_woken(self):
+        pool = self.pool(max_pool_size=1, max_requests_per_socket=2,
+                         wait_queue_timeout=5)
+        got = []
+
+        def target():
+            with pool.get_socket({}) as sock_info:
+                got.append(sock_info)
+
+        with pool.get_socket({}) as sock_info:
+            with pool.get_socket({}):
+                thread = threading.Thread(target=target)
+                thread.daemon = True
+                thread.start()
+                time.sleep(0.1)
+                self.assertEqual([], got)
+            thread.join(5)
+            self.assertEqual([sock_info], got)
+
+    def test_not_shared_across_credentials(self):
+        credentials = auth._build_credentials_tuple(
+            'MONGODB-CR', 'admin', 'user', 'pass', {})
+        other = auth._build_credentials_tuple(
+            'MONGODB-CR', 'admin', 'other', 'pass', {})
+        pool = self.pool(max_pool_size=3, max_requests_per_socket=10,
+                         wait_queue_timeout=0.1)
+        with pool.get_socket({}) as anonymous:
+            with pool.get_socket({'admin': credentials}) as logged_in:
+                self.assertIsNot(anonymous, logged_in)
+                self.assertEqual(set([credentials]), logged_in.authset)
+                with pool.get_socket({'admin': credentials}) as sock_info:
+                    self.assertIs(logged_in, sock_info)
+                with pool.get_socket({}) as sock_info:
+                    self.assertIs(anonymous, sock_info)
+                with pool.get_socket({'admin': other}) as sock_info:
+                    self.assertNotIn(sock_info, (anonymous, logged_in))
+                    # No socket is logged in with both, and there is none
+                    # left to log in.
+                    with self.assertRaises(ConnectionFailure):
+                        with pool.get_socket({'admin': credentials,
+                                              'test': other}):
+                            pass
+
+    def test_authenticate_on_own_socket(self):
+        client = MongoClient('localhost', self.server.port,
+                             maxRequestsPerSocket=2)
+        self.addCleanup(client.close)
+        server = client._get_topology().select_server(
+            writable_server_selector)
+        errors = []
+
+        def target():
+            try:
+                client.admin.authenticate('user', 'pass',
+                                          mechanism='MONGODB-CR')
+            except Exception as exc:
+                errors.append(exc)
+
+        with server.get_socket({}) as shared:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            thread.join(10)
+            self.assertEqual([], errors)
+            # The socket another thread is using isn't logged in.
+            self.assertEqual(set(), shared.authset)
+        self.assertEqual(2, len(server.pool.sockets))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -196,5 +196,44 @@ class TestSON(unittest.TestCase):
         test_son.popitem()
         self.assertEqual(2, len(test_son))
 
+    def test_deletion(self):
+        test_son = SON((str(i), i) for i in range(100))
+        for i in range(0, 100, 2):
+            del test_son[str(i)]
+        expected = [(str(i), i) for i in range(1, 100, 2)]
+        self.assertEqual(expected, list(test_son.items()))
+        self.assertEqual([k for k, _ in expected], test_son.keys())
+        self.assertEqual(50, len(test_son))
+        self.assertRaises(KeyError, test_son.__delitem__, "0")
+
+        # Deleted keys are added back at the end.
+        test_son["0"] = 0
+        self.assertEqual(["97", "99", "0"], test_son.keys()[-3:])
+        self.assertEqual(99, test_son.pop("99"))
+        self.assertEqual(["95", "97", "0"], test_son.keys()[-3:])
+
+        self.assertEqual([("1", 1), ("3", 3)],
+                         [test_son.popitem() for _ in range(2)])
+        while test_son:
+            test_son.popitem()
+        self.assertRaises(KeyError, test_son.popitem)
+        self.assertEqual([], test_son.keys())
+        test_son["a"] = 1
+        self.assertEqual(SON([("a", 1)]), test_son)
+
+    def test_pickle_after_deletion(self):
+        test_son = SON([("a", 1), ("b", 2), ("c", 3)])
+        del test_son["b"]
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            pickled = pickle.loads(pickle.dumps(test_son, protocol=protocol))
+            self.assertEqual(test_son, pickled)
+            self.assertEqual(["a", "c"], pickled.keys())
+            pickled["b"] = 2
+            self.assertEqual(["a", "c", "b"], pickled.keys())
+        copied = copy.copy(test_son)
+        copied["d"] = 4
+        self.assertEqual(["a", "c"], test_son.keys())
+        self.assertEqual(["a", "c", "d"], copied.keys())
+
 if __name__ == "__main__":
     unittest.main()
@@ -15,12 +15,24 @@
 """MongoDB benchmarking suite."""
 
 import time
+import socket
+import struct
 import sys
+import threading
 sys.path[0:0] = [""]
 
+try:
+    import tracemalloc
+except ImportError:
+    # Python < 3.4.
+    tracemalloc = None
+
 import datetime
 
+import bson
+from pymongo import helpers
 from pymongo import mongo_client
+from pymongo import network
 from pymongo import ASCENDING
 
 trials = 2
@@ -63,7 +75,7 @@ def insert(db, collection, object):
 
 
 def insert_batch(db, collection, object):
-    for i in range(per_trial / batch_size):
+    for i in range(per_trial // batch_size):
         db[collection].insert([object] * batch_size)
 
 
@@ -78,6 +90,83 @@ def find(db, collection, x):
             pass
 
 
+def make_reply(object, count):
+    """An OP_REPLY (without message header) returning count copies of object.
+    """
+    header = struct.pack("<iqii", 0, 0, 0, count)
+    return header + bson.BSON.encode(object) * count
+
+
+def decode_reply_sliced(reply):
+    # What _unpack_response did before decoding from a memoryview.
+    for _ in range(per_trial // batch_size):
+        bson.decode_all(reply[20:])
+
+
+def decode_reply(reply):
+    for _ in range(per_trial // batch_size):
+        helpers._unpack_response(reply)
+
+
+def peak_allocated(function, *args):
+    """The most memory allocated at once while calling function, in bytes.
+    """
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def decode_many(data):
+    for _ in range(per_trial // batch_size):
+        bson.decode_all(data)
+
+
+def decode_python(data):
+    # The pure Python decoder, even if the C extension is built.
+    opts = bson.DEFAULT_CODEC_OPTIONS
+    for _ in range(per_trial):
+        bson._elements_to_dict(data, 4, len(data) - 1, opts)
+
+
+def receive_concat(sock, length):
+    # What network._receive_data_on_socket did before using recv_into.
+    msg = b""
+    while length:
+        chunk = sock.recv(length)
+        length -= len(chunk)
+        msg += chunk
+    return msg
+
+
+def receive_reply_concat(sock, count):
+    for _ in range(count):
+        header = receive_concat(sock, 16)
+        receive_concat(sock, struct.unpack("<i", header[:4])[0] - 16)
+
+
+def receive_reply(sock, count):
+    for _ in range(count):
+        network.receive_message(sock, 1, None)
+
+
+def send_replies(sock, length, count):
+    reply = struct.pack("<iiii", length, 0, 0, 1) + b"\x00" * (length - 16)
+    for _ in range(count):
+        sock.sendall(reply)
+
+
+def key_memory(docs):
+    """Bytes used by the distinct key strings of decoded documents."""
+    sizes = {}
+    for doc in docs:
+        for key in doc:
+            sizes[id(key)] = sys.getsizeof(key)
+    return sum(sizes.values())
+
+
 def timed(name, function, args=[], setup=None):
     times = []
     for _ in range(trials):
@@ -87,11 +176,82 @@ def timed(name, function, args=[], setup=None):
         function(*args)
         times.append(time.time() - start)
     best_time = min(times)
-    print "%s%d" % (name + (60 - len(name)) * ".", per_trial / best_time)
+    report(name, per_trial / best_time)
     return best_time
 
 
+def report(name, value):
+    print("%s%d" % (name + (60 - len(name)) * ".", value))
+
+
+def reply_benchmarks():
+    for name, object in (("small", small),
+                         ("medium", medium),
+                         ("large", large)):
+        reply = make_reply(object, batch_size)
+        if tracemalloc:
+            # Both include the decoded documents, the difference is what
+            # slicing the reply copies.
+            report("peak bytes allocated per getMore (%s, sliced)" % name,
+                   peak_allocated(lambda: bson.decode_all(reply[20:])))
+            report("peak bytes allocated per getMore (%s, memoryview)" % name,
+                   peak_allocated(helpers._unpack_response, reply))
+        timed("decode getMore reply (%s, sliced)" % name,
+              decode_reply_sliced, [reply])
+        timed("decode getMore reply (%s, memoryview)" % name,
+              decode_reply, [reply])
+
+
+def key_cache_benchmarks():
+    cache_size = bson.get_key_cache_size()
+    for name, object in (("medium", medium), ("large", large)):
+        data = bson.BSON.encode(object) * batch_size
+        for label, size in (("key cache on", cache_size),
+                            ("key cache off", 0)):
+            bson.set_key_cache_size(size)
+            docs = bson.decode_all(data * 10)
+            report("key memory (%s, %s, %d docs)" % (name, label, len(docs)),
+                   key_memory(docs))
+            timed("decode (%s, %s)" % (name, label), decode_many, [data])
+    bson.set_key_cache_size(cache_size)
+
+
+def python_decoder_benchmarks():
+    for name, object in (("small", small),
+                         ("medium", medium),
+                         ("large", large)):
+        timed("decode (%s, pure Python)" % name,
+              decode_python, [bson.BSON.encode(object)])
+
+
+def receive_benchmarks():
+    count = 5
+    for megabytes in (16, 48):
+        length = megabytes * 1024 * 1024
+        for label, function in (("concat", receive_reply_concat),
+                                ("recv_into", receive_reply)):
+            times = []
+            for _ in range(trials):
+                reader, writer = socket.socketpair()
+                sender = threading.Thread(target=send_replies,
+                                          args=(writer, length, count))
+                sender.start()
+                start = time.time()
+                function(reader, count)
+                times.append(time.time() - start)
+                sender.join()
+                reader.close()
+                writer.close()
+            report("receive %dMB reply, MB/s (%s)" % (megabytes, label),
+                   count * megabytes / min(times))
+
+
 def main():
+    reply_benchmarks()
+    key_cache_benchmarks()
+    python_decoder_benchmarks()
+    receive_benchmarks()
+
     c = mongo_client.MongoClient(connectTimeoutMS=60*1000)  # jack up timeout
     c.drop_database("benchmark")
     db = c.benchmark
@@ -118,26 +278,26 @@ def main():
           [db, 'large_bulk', large], setup_insert)
 
     timed("find_one (small, no index)", find_one,
-          [db, 'small_none', per_trial / 2])
+          [db, 'small_none', per_trial // 2])
     timed("find_one (medium, no index)", find_one,
-          [db, 'medium_none', per_trial / 2])
+          [db, 'medium_none', per_trial // 2])
     timed("find_one (large, no index)", find_one,
-          [db, 'large_none', per_trial / 2])
+          [db, 'large_none', per_trial // 2])
 
     timed("find_one (small, indexed)", find_one,
-          [db, 'small_index', per_trial / 2])
+          [db, 'small_index', per_trial // 2])
     timed("find_one (medium, indexed)", find_one,
-          [db, 'medium_index', per_trial / 2])
+          [db, 'medium_index', per_trial // 2])
     timed("find_one (large, indexed)", find_one,
-          [db, 'large_index', per_trial / 2])
+          [db, 'large_index', per_trial // 2])
 
-    timed("find (small, no index)", find, [db, 'small_none', per_trial / 2])
-    timed("find (medium, no index)", find, [db, 'medium_none', per_trial / 2])
-    timed("find (large, no index)", find, [db, 'large_none', per_trial / 2])
+    timed("find (small, no index)", find, [db, 'small_none', per_trial // 2])
+    timed("find (medium, no index)", find, [db, 'medium_none', per_trial // 2])
+    timed("find (large, no index)", find, [db, 'large_none', per_trial // 2])
 
-    timed("find (small, indexed)", find, [db, 'small_index', per_trial / 2])
-    timed("find (medium, indexed)", find, [db, 'medium_index', per_trial / 2])
-    timed("find (large, indexed)", find, [db, 'large_index', per_trial / 2])
+    timed("find (small, indexed)", find, [db, 'small_index', per_trial // 2])
+    timed("find (medium, indexed)", find, [db, 'medium_index', per_trial // 2])
+    timed("find (large, indexed)", find, [db, 'large_index', per_trial // 2])
 
 #     timed("find range (small, no index)", find,
 #           [db, 'small_none',
@@ -151,13 +311,13 @@ def main():
 
     timed("find range (small, indexed)", find,
           [db, 'small_index',
-           {"$gt": per_trial / 2, "$lt": per_trial / 2 + batch_size}])
+           {"$gt": per_trial // 2, "$lt": per_trial // 2 + batch_size}])
     timed("find range (medium, indexed)", find,
           [db, 'medium_index',
-           {"$gt": per_trial / 2, "$lt": per_trial / 2 + batch_size}])
+           {"$gt": per_trial // 2, "$lt": per_trial // 2 + batch_size}])
     timed("find range (large, indexed)", find,
           [db, 'large_index',
-           {"$gt": per_trial / 2, "$lt": per_trial / 2 + batch_size}])
+           {"$gt": per_trial // 2, "$lt": per_trial // 2 + batch_size}])
 
 if __name__ == "__main__":
 #    cProfile.run("main()")